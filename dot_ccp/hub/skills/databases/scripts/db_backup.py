@@ -5,16 +5,131 @@ Supports compression, scheduling, and verification.
 """
 
 import argparse
-import gzip
+import hashlib
 import json
 import os
+import re
 import shutil
+import socket
+import sqlite3
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import closing, contextmanager
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+try:
+    from pymongo import MongoClient
+    MONGO_AVAILABLE = True
+except ImportError:
+    MONGO_AVAILABLE = False
+
+try:
+    import boto3
+    BOTO3_AVAILABLE = True
+except ImportError:
+    BOTO3_AVAILABLE = False
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+
+# Compression codecs: file extension, default level and whether the
+# compressor can use multiple threads
+CODECS = {
+    "gzip": {"ext": ".gz", "level": 6, "threaded": False},
+    "pigz": {"ext": ".gz", "level": 6, "threaded": True},
+    "zstd": {"ext": ".zst", "level": 3, "threaded": True},
+    "none": {"ext": "", "level": 0, "threaded": False},
+}
+
+
+def compress_command(codec: str, level: Optional[int] = None,
+                     threads: Optional[int] = None) -> List[str]:
+    """
+    Build a stdin-to-stdout compressor command.
+
+    Args:
+        codec: Codec name from CODECS (not 'none')
+        level: Compression level (codec default if None)
+        threads: Compressor threads (all cores if None)
+
+    Returns:
+        Command list
+    """
+    level = CODECS[codec]["level"] if level is None else level
+    threads = threads or os.cpu_count() or 1
+
+    if codec == "zstd":
+        return ["zstd", f"-{level}", f"-T{threads}", "-q", "-c"]
+    if codec == "pigz":
+        return ["pigz", f"-{level}", "-p", str(threads), "-c"]
+    return ["gzip", f"-{level}", "-c"]
+
+
+def decompress_command(codec: str) -> List[str]:
+    """Build a stdin-to-stdout decompressor command for a codec."""
+    if codec == "zstd":
+        return ["zstd", "-dc", "-q"]
+    if codec == "pigz":
+        return ["pigz", "-dc"]
+    return ["gzip", "-dc"]
+
+
+def codec_from_filename(filename: str) -> str:
+    """Infer codec from a backup filename (for backups without metadata)."""
+    if filename.endswith(".zst"):
+        return "zstd"
+    if filename.endswith(".gz"):
+        return "gzip"
+    return "none"
+
+
+CHECKSUM_BUFFER = 8 * 1024 * 1024
+
+
+def stream_sha256(stream: BinaryIO, buffer_size: int = CHECKSUM_BUFFER) -> str:
+    """SHA-256 of a readable binary stream."""
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(buffer_size), b""):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def file_sha256(path: Path, buffer_size: int = CHECKSUM_BUFFER) -> str:
+    """SHA-256 of a file, read unbuffered into one large reusable buffer."""
+    digest = hashlib.sha256()
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            digest.update(view[:n])
+
+    return digest.hexdigest()
+
+
+def directory_sha256(path: Path) -> str:
+    """SHA-256 over the sorted per-file checksums of a directory."""
+    digest = hashlib.sha256()
+    for item in sorted(p for p in path.rglob("*") if p.is_file()):
+        digest.update(f"{file_sha256(item)}  {item.relative_to(path)}\n".encode())
+    return digest.hexdigest()
 
 
 @dataclass
@@ -28,29 +143,869 @@ class BackupInfo:
     size_bytes: int
     compressed: bool
     verified: bool = False
+    format: str = "plain"
+    codec: str = ""
+    sha256: str = ""
+    row_counts: Optional[Dict[str, int]] = None
+
+    def __post_init__(self):
+        if not self.codec:
+            self.codec = "gzip" if self.compressed else "none"
+
+
+# Content-defined chunk sizes for the deduplicated store
+CHUNK_MIN = 512 * 1024
+CHUNK_AVG = 2 * 1024 * 1024
+CHUNK_MAX = 8 * 1024 * 1024
+
+
+def _find_cut(buf: bytearray, min_size: int, avg_size: int, max_size: int) -> int:
+    """
+    Find the end of the next chunk in buf.
+
+    Chunks end after a line whose CRC-32 falls below a threshold
+    proportional to its length, so boundaries depend only on nearby content
+    and survive inserts or deletes elsewhere in the dump. Lines are split
+    and hashed a window at a time to keep the per-line work in C.
+    """
+    limit = min(len(buf), max_size)
+    if limit <= min_size:
+        return limit
+
+    threshold = (1 << 32) // (avg_size - min_size)
+    pos = buf.rfind(b"\n", 0, min_size - 1) + 1
+
+    while pos < limit:
+        end = buf.rfind(b"\n", pos, min(pos + 64 * 1024, limit))
+        if end == -1:
+            end = buf.find(b"\n", pos, limit)
+            if end == -1:
+                break
+
+        lines = bytes(buf[pos:end]).split(b"\n")
+        for line, crc in zip(lines, map(zlib.crc32, lines)):
+            pos += len(line) + 1
+            if pos >= min_size and crc < (len(line) + 1) * threshold:
+                return pos
+
+    return limit
+
+
+def chunk_stream(
+    stream: BinaryIO,
+    min_size: int = CHUNK_MIN,
+    avg_size: int = CHUNK_AVG,
+    max_size: int = CHUNK_MAX,
+    read_size: int = 1024 * 1024
+) -> Iterator[bytes]:
+    """
+    Split a stream into content-defined chunks.
+
+    Args:
+        stream: Binary stream to read
+        min_size: Minimum chunk size (except for the last chunk)
+        avg_size: Target average chunk size
+        max_size: Maximum chunk size
+
+    Yields:
+        Chunk bytes
+    """
+    buf = bytearray()
+    eof = False
+
+    while not eof:
+        block = stream.read(read_size)
+        eof = not block
+        buf += block
+
+        while len(buf) >= max_size or (eof and buf):
+            cut = _find_cut(buf, min_size, avg_size, max_size)
+            yield bytes(buf[:cut])
+            del buf[:cut]
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting bytes per second across writers."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """
+        Initialize token bucket.
+
+        Args:
+            rate: Sustained bytes per second
+            burst: Bucket capacity in bytes (default: one second of rate)
+        """
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount: int):
+        """Take `amount` tokens, sleeping while the bucket is in debt."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if wait:
+            time.sleep(wait)
+
+
+def parse_rate(value: str) -> float:
+    """Parse a byte rate such as '50M' or '1.5G' (binary units) into bytes/s."""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.strip().upper().rstrip("B/S")
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+class ChunkStore:
+    """Deduplicated chunk repository keyed by SHA-256, chunks zlib-compressed."""
+
+    def __init__(self, root: Path):
+        """
+        Initialize chunk store.
+
+        Args:
+            root: Store directory (created on first write)
+        """
+        self.root = root
+        self.chunk_dir = root / "chunks"
+        self.throttle: Optional[TokenBucket] = None
+
+    def _chunk_path(self, digest: str) -> Path:
+        return self.chunk_dir / digest[:2] / digest
+
+    @contextmanager
+    def lock(self, exclusive: bool = False) -> Iterator[None]:
+        """
+        Hold the store lock: shared for backups, exclusive for pruning.
+
+        A backup holds it from its first dedup hit until its snapshot
+        manifest is written, so prune cannot delete a chunk the backup
+        has counted on. No-op where fcntl is unavailable.
+        """
+        if not FCNTL_AVAILABLE:
+            yield
+            return
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / "lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def has(self, digest: str) -> bool:
+        """Check whether a chunk is stored."""
+        return self._chunk_path(digest).exists()
+
+    def put(self, data: bytes) -> Tuple[str, int]:
+        """
+        Store a chunk unless already present.
+
+        Returns:
+            Tuple of (digest, bytes written; 0 if deduplicated)
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if path.exists():
+            return digest, 0
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        compressed = zlib.compress(data, 6)
+        if self.throttle:
+            self.throttle.consume(len(compressed))
+        tmp = path.with_name(f".{digest}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp, path)
+        return digest, len(compressed)
+
+    def get(self, digest: str) -> bytes:
+        """Read a chunk, checking its digest."""
+        with open(self._chunk_path(digest), "rb") as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Chunk {digest} is corrupt")
+        return data
+
+    def store_stream(self, stream: BinaryIO) -> Dict:
+        """
+        Chunk and store a stream.
+
+        Returns:
+            Manifest dict with chunk list and dedup statistics
+        """
+        chunks = []
+        size_bytes = 0
+        stored_bytes = 0
+        new_chunks = 0
+        stream_digest = hashlib.sha256()
+
+        for data in chunk_stream(stream):
+            stream_digest.update(data)
+            digest, written = self.put(data)
+            chunks.append([digest, len(data)])
+            size_bytes += len(data)
+            stored_bytes += written
+            new_chunks += 1 if written else 0
+
+        return {
+            "chunks": chunks,
+            "size_bytes": size_bytes,
+            "stored_bytes": stored_bytes,
+            "new_chunks": new_chunks,
+            "sha256": stream_digest.hexdigest()
+        }
+
+    def write_stream(self, chunks: List[List], out: BinaryIO):
+        """Reassemble chunks into a writable stream."""
+        for digest, _ in chunks:
+            out.write(self.get(digest))
+
+    def prune(self, referenced: Set[str]) -> Tuple[int, int]:
+        """
+        Delete chunks not referenced by any snapshot.
+
+        Returns:
+            Tuple of (chunks removed, bytes freed)
+        """
+        removed = 0
+        freed = 0
+        if not self.chunk_dir.exists():
+            return removed, freed
+
+        for path in self.chunk_dir.glob("*/*"):
+            if path.name not in referenced:
+                freed += path.stat().st_size
+                path.unlink()
+                removed += 1
+
+        return removed, freed
+
+
+# S3 multipart limits: every part but the last must be at least 5 MiB,
+# at most 5 GiB, and an upload has at most 10,000 parts
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+S3_MAX_PART_SIZE = 5 * 1024 * 1024 * 1024
+S3_MAX_PARTS = 10_000
+S3_DEFAULT_PART_SIZE = 16 * 1024 * 1024
+
+# Part size doubles after every this many parts, so streams of unknown
+# length fit in S3_MAX_PARTS (16 MiB start: ~16 TiB, past S3's 5 TiB object cap)
+S3_PARTS_PER_SIZE_STEP = 1000
+
+
+class LocalWriter:
+    """Write a backup file; abort() removes the partial file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.file = open(path, "wb")
+
+    def write(self, data: bytes):
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+    def abort(self):
+        self.file.close()
+        self.path.unlink(missing_ok=True)
+
+
+class MultipartWriter:
+    """
+    Upload a stream to S3 as concurrent multipart parts.
+
+    Data is buffered into parts; at most max_in_flight parts are
+    uploading at once and write() blocks while all slots are busy, so
+    memory stays bounded at about (max_in_flight + 1) * the current part
+    size. Parts start at part_size and double every S3_PARTS_PER_SIZE_STEP
+    parts (up to S3_MAX_PART_SIZE), since the stream length is not known
+    up front. Streams smaller than one part are sent with a single put_object.
+    """
+
+    def __init__(self, client, bucket: str, key: str, part_size: int, max_in_flight: int):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.upload_id: Optional[str] = None
+        self.parts = []
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+    def _next_part_size(self) -> int:
+        step = len(self.parts) // S3_PARTS_PER_SIZE_STEP
+        return min(self.part_size * 2 ** step, S3_MAX_PART_SIZE)
+
+    def write(self, data: bytes):
+        self.buffer += data
+        size = self._next_part_size()
+        while len(self.buffer) >= size:
+            self._submit(bytes(self.buffer[:size]))
+            del self.buffer[:size]
+            size = self._next_part_size()
+
+    def _submit(self, body: bytes):
+        if len(self.parts) >= S3_MAX_PARTS:
+            raise ValueError(
+                f"Upload exceeds S3's {S3_MAX_PARTS}-part limit "
+                f"(start with a larger --part-size)"
+            )
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key
+            )["UploadId"]
+
+        # Fail fast instead of uploading the rest of a doomed object
+        for future in self.parts:
+            if future.done() and future.exception():
+                raise future.exception()
+
+        self.slots.acquire()
+        future = self.executor.submit(self._upload_part, len(self.parts) + 1, body)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.parts.append(future)
+
+    def _upload_part(self, number: int, body: bytes) -> Dict[str, Any]:
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            PartNumber=number, Body=body
+        )
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    def close(self):
+        try:
+            if self.upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+                return
+
+            if self.buffer:
+                self._submit(bytes(self.buffer))
+                self.buffer.clear()
+            parts = [future.result() for future in self.parts]
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+        finally:
+            self.executor.shutdown()
+
+    def abort(self):
+        self.executor.shutdown()
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+            )
+
+
+class StorageBackend(ABC):
+    """
+    Where backup files live.
+
+    Metadata JSON and the catalog always stay in backup_dir; only the
+    backup data goes to the backend.
+    """
+
+    remote = False
+
+    @abstractmethod
+    def open_writer(self, name: str):
+        """Writer with write(), close() and abort()."""
+
+    @abstractmethod
+    def open_reader(self, name: str) -> BinaryIO:
+        """Binary stream of the backup's data."""
+
+    @abstractmethod
+    def exists(self, name: str) -> bool:
+        """Whether the backup's data exists."""
+
+    @abstractmethod
+    def size(self, name: str) -> int:
+        """Stored size in bytes."""
+
+    @abstractmethod
+    def delete(self, name: str):
+        """Remove the backup's data (no error if missing)."""
+
+    @abstractmethod
+    def location(self, name: str) -> str:
+        """Human-readable path or URL of the backup."""
+
+
+class LocalStorage(StorageBackend):
+    """Backups as files in a local directory."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def open_writer(self, name: str) -> LocalWriter:
+        return LocalWriter(self.root / name)
+
+    def open_reader(self, name: str) -> BinaryIO:
+        return open(self.root / name, "rb")
+
+    def exists(self, name: str) -> bool:
+        return (self.root / name).exists()
+
+    def size(self, name: str) -> int:
+        return (self.root / name).stat().st_size
+
+    def delete(self, name: str):
+        (self.root / name).unlink(missing_ok=True)
+
+    def location(self, name: str) -> str:
+        return str(self.root / name)
+
+
+def _s3_error_code(error: Exception) -> Optional[str]:
+    return getattr(error, "response", {}).get("Error", {}).get("Code")
+
+
+class S3Storage(StorageBackend):
+    """Backups as objects in an S3-compatible bucket (AWS, MinIO, Ceph...)."""
+
+    remote = True
+
+    def __init__(
+        self,
+        url: str,
+        endpoint_url: Optional[str] = None,
+        part_size: int = S3_DEFAULT_PART_SIZE,
+        max_in_flight: int = 4,
+        client=None
+    ):
+        """
+        Initialize S3 storage.
+
+        Args:
+            url: s3://bucket/optional/prefix
+            endpoint_url: Endpoint for S3-compatible servers (e.g. MinIO)
+            part_size: Multipart upload part size in bytes
+            max_in_flight: Concurrent part uploads per backup
+            client: Preconfigured S3 client (boto3 client created if None)
+        """
+        parsed = urlparse(url)
+        if parsed.scheme != "s3" or not parsed.netloc:
+            raise ValueError(f"Invalid storage URL: {url} (expected s3://bucket/prefix)")
+
+        self.bucket = parsed.netloc
+        self.prefix = parsed.path.strip("/")
+        self.part_size = part_size
+        self.max_in_flight = max_in_flight
+        if client is None:
+            if not BOTO3_AVAILABLE:
+                raise RuntimeError("boto3 not installed (needed for S3 storage)")
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client = client
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def open_writer(self, name: str) -> MultipartWriter:
+        return MultipartWriter(
+            self.client, self.bucket, self._key(name), self.part_size, self.max_in_flight
+        )
+
+    def open_reader(self, name: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(name))["Body"]
+
+    def exists(self, name: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+            return True
+        except Exception as e:
+            if _s3_error_code(e) in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def size(self, name: str) -> int:
+        return self.client.head_object(Bucket=self.bucket, Key=self._key(name))["ContentLength"]
+
+    def delete(self, name: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def location(self, name: str) -> str:
+        return f"s3://{self.bucket}/{self._key(name)}"
+
+
+# pg_restore TOC entry types, longest first so multi-word types match whole
+TOC_TYPES = sorted([
+    "TABLE", "TABLE DATA", "CONSTRAINT", "FK CONSTRAINT", "INDEX", "INDEX ATTACH",
+    "SEQUENCE", "SEQUENCE SET", "SEQUENCE OWNED BY", "DEFAULT", "TRIGGER",
+    "POLICY", "ROW SECURITY", "RULE", "COMMENT", "ACL", "SCHEMA", "VIEW",
+    "MATERIALIZED VIEW", "MATERIALIZED VIEW DATA", "STATISTICS", "DEFAULT ACL",
+], key=len, reverse=True)
+
+# Entry types whose first tag word is the owning table
+TABLE_SCOPED_TYPES = {
+    "TABLE", "TABLE DATA", "CONSTRAINT", "FK CONSTRAINT", "DEFAULT",
+    "TRIGGER", "POLICY", "ROW SECURITY", "RULE",
+}
+
+
+@dataclass
+class TocEntry:
+    """One line of a `pg_restore -l` listing."""
+
+    line: str
+    kind: str
+    schema: str
+    tag: List[str]
+
+    @property
+    def qualified(self) -> str:
+        """schema.name of the object (or of its table for table-scoped types)."""
+        return f"{self.schema}.{self.tag[0]}" if self.tag else self.schema
+
+
+def parse_toc(listing: str) -> List[TocEntry]:
+    """
+    Parse `pg_restore -l` output.
+
+    Args:
+        listing: TOC listing text
+
+    Returns:
+        List of TocEntry (comments and unknown entry types skipped)
+    """
+    entries = []
+    for line in listing.splitlines():
+        match = re.match(r"^\d+; \d+ \d+ (.*)$", line)
+        if not match:
+            continue
+        rest = match.group(1)
+        kind = next((t for t in TOC_TYPES if rest.startswith(t + " ")), None)
+        if not kind:
+            continue
+        words = rest[len(kind) + 1:].split()
+        entries.append(TocEntry(line=line, kind=kind, schema=words[0], tag=words[1:]))
+    return entries
+
+
+# A plain or double-quoted SQL identifier, and a dotted chain of them
+SQL_IDENT = r'(?:"(?:[^"]|"")*"|[A-Za-z_][\w$]*)'
+SQL_QUALIFIED = rf"{SQL_IDENT}(?:\.{SQL_IDENT})*"
+
+
+def _ident_parts(name: str) -> List[str]:
+    """Split a (possibly quoted) dotted identifier into unquoted parts."""
+    return [
+        part[1:-1].replace('""', '"') if part.startswith('"') else part
+        for part in re.findall(SQL_IDENT, name)
+    ]
+
+
+def _unquote(name: str) -> str:
+    return ".".join(_ident_parts(name))
+
+
+# \gexec runs one count(*) per user table in a single psql session
+PG_ROW_COUNT_QUERY = (
+    "SELECT format('SELECT %L, count(*) FROM %I.%I', "
+    "schemaname || '.' || tablename, schemaname, tablename) "
+    "FROM pg_tables "
+    "WHERE schemaname NOT IN ('pg_catalog', 'information_schema') "
+    "ORDER BY 1\n\\gexec\n"
+)
+
+
+def _parse_row_counts(output: str) -> Dict[str, int]:
+    """Parse tab-separated `table<TAB>count` lines from psql."""
+    counts = {}
+    for line in output.splitlines():
+        table, _, count = line.rpartition("\t")
+        if table:
+            counts[table] = int(count)
+    return counts
+
+
+# GFS retention buckets: strftime format per granularity; weeks use the
+# ISO year so the week spanning New Year is one bucket
+RETENTION_BUCKETS = {
+    "hourly": "%Y-%m-%d %H",
+    "daily": "%Y-%m-%d",
+    "weekly": "%G-%V",
+    "monthly": "%Y-%m",
+}
+
+
+def _time_bucket(bucket_format: str, timestamp: str) -> str:
+    """SQL function: format an ISO timestamp (SQLite's strftime lacks %G/%V)."""
+    return datetime.fromisoformat(timestamp).strftime(bucket_format)
+
+
+class BackupCatalog:
+    """SQLite index of backup metadata for listing and retention queries."""
+
+    COLUMNS = (
+        "filename", "database_type", "database_name", "timestamp", "size_bytes",
+        "compressed", "verified", "format", "codec", "sha256", "row_counts"
+    )
+
+    def __init__(self, path: Path):
+        """
+        Initialize catalog, creating the schema if needed.
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        self.created = not path.exists()
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS backups (
+                    filename TEXT PRIMARY KEY,
+                    database_type TEXT NOT NULL,
+                    database_name TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    compressed INTEGER NOT NULL,
+                    verified INTEGER NOT NULL DEFAULT 0,
+                    format TEXT,
+                    codec TEXT,
+                    sha256 TEXT,
+                    row_counts TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_backups_database
+                    ON backups (database_type, database_name, timestamp);
+                CREATE INDEX IF NOT EXISTS idx_backups_timestamp ON backups (timestamp);
+                CREATE INDEX IF NOT EXISTS idx_backups_size ON backups (size_bytes);
+                CREATE INDEX IF NOT EXISTS idx_backups_sha256 ON backups (sha256);
+            """)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One short-lived connection per operation, so worker threads can share a catalog
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            conn.create_function("time_bucket", 2, _time_bucket, deterministic=True)
+            with conn:
+                yield conn
+
+    def upsert(self, backup_info: "BackupInfo"):
+        """Insert or replace a backup entry."""
+        row = (
+            backup_info.filename,
+            backup_info.database_type,
+            backup_info.database_name,
+            backup_info.timestamp.isoformat(),
+            backup_info.size_bytes,
+            int(backup_info.compressed),
+            int(backup_info.verified),
+            backup_info.format,
+            backup_info.codec,
+            backup_info.sha256,
+            json.dumps(backup_info.row_counts) if backup_info.row_counts is not None else None
+        )
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO backups ({', '.join(self.COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                row
+            )
+
+    def remove(self, filename: str):
+        """Delete a backup entry."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM backups WHERE filename = ?", (filename,))
+
+    def list(
+        self,
+        database: Optional[str] = None,
+        before: Optional[datetime] = None
+    ) -> List["BackupInfo"]:
+        """
+        Query backups ordered by timestamp.
+
+        Args:
+            database: Only backups of this database
+            before: Only backups recorded before this time
+
+        Returns:
+            List of BackupInfo objects
+        """
+        query = f"SELECT {', '.join(self.COLUMNS)} FROM backups"
+        clauses = []
+        params = []
+        if database:
+            clauses.append("database_name = ?")
+            params.append(database)
+        if before:
+            clauses.append("timestamp < ?")
+            params.append(before.isoformat())
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY timestamp"
+
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        return [
+            BackupInfo(
+                filename=row[0],
+                database_type=row[1],
+                database_name=row[2],
+                timestamp=datetime.fromisoformat(row[3]),
+                size_bytes=row[4],
+                compressed=bool(row[5]),
+                verified=bool(row[6]),
+                format=row[7] or "plain",
+                codec=row[8] or "",
+                sha256=row[9] or "",
+                row_counts=json.loads(row[10]) if row[10] else None
+            )
+            for row in rows
+        ]
+
+    def databases(self) -> List[Tuple[str, str]]:
+        """Distinct (database_type, database_name) pairs."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT DISTINCT database_type, database_name FROM backups"
+            ).fetchall()
+
+    def newest_per_bucket(
+        self,
+        database_type: str,
+        database_name: str,
+        bucket_format: str,
+        limit: int
+    ) -> Set[str]:
+        """Newest backup in each of the latest `limit` time buckets."""
+        # SQLite returns the row holding MAX() for bare columns in an aggregate
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT filename, MAX(timestamp) FROM backups "
+                "WHERE database_type = ? AND database_name = ? "
+                "GROUP BY time_bucket(?, timestamp) "
+                "ORDER BY MAX(timestamp) DESC LIMIT ?",
+                (database_type, database_name, bucket_format, limit)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def count(self) -> int:
+        """Number of catalogued backups."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM backups").fetchone()[0]
+
+    def clear(self):
+        """Delete all entries."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM backups")
+
+
+# Formats compared by the benchmark command: (label, codec, jobs)
+BENCHMARK_FORMATS = {
+    "postgres": [
+        ("plain", "none", 1),
+        ("plain+gzip", "gzip", 1),
+        ("plain+zstd", "zstd", 1),
+        ("directory", "gzip", os.cpu_count() or 1),
+    ],
+    "mongodb": [
+        ("archive", "none", os.cpu_count() or 1),
+        ("archive+gzip", "gzip", os.cpu_count() or 1),
+        ("archive+zstd", "zstd", os.cpu_count() or 1),
+    ],
+}
+
+
+def _pg_bin(name: str) -> str:
+    """Locate a PostgreSQL server binary (Debian keeps them off PATH)."""
+    found = shutil.which(name)
+    if found:
+        return found
+    candidates = sorted(
+        Path("/usr/lib/postgresql").glob(f"*/bin/{name}"),
+        key=lambda p: int(p.parts[-3]) if p.parts[-3].isdigit() else 0
+    )
+    if not candidates:
+        raise RuntimeError(f"{name} not found")
+    return str(candidates[-1])
+
+
+def _free_port() -> int:
+    """Pick an unused local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, proc: subprocess.Popen, timeout: float = 60):
+    """Wait until a local server accepts connections."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server did not start within {timeout:.0f}s")
 
 
 class BackupManager:
     """Manages database backups for MongoDB and PostgreSQL."""
 
-    def __init__(self, db_type: str, backup_dir: str = "./backups"):
+    def __init__(
+        self,
+        db_type: str,
+        backup_dir: str = "./backups",
+        storage: Optional[StorageBackend] = None
+    ):
         """
         Initialize backup manager.
 
         Args:
             db_type: Database type ('mongodb' or 'postgres')
-            backup_dir: Directory to store backups
+            backup_dir: Directory to store backups (and metadata/catalog
+                when storage is remote)
+            storage: Backend for backup data (backup_dir if None)
         """
         self.db_type = db_type.lower()
         self.backup_dir = Path(backup_dir)
-        self.backup_dir.mkdir(exist_ok=True)
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        self.chunk_store = ChunkStore(self.backup_dir / ".dedup")
+        self.catalog = BackupCatalog(self.backup_dir / "catalog.db")
+        if self.catalog.created:
+            self.rebuild_catalog()
+        self.throttle: Optional[TokenBucket] = None
+        self.storage = storage or LocalStorage(self.backup_dir)
+        # Exported snapshot pg_dump should read from (set while counting rows)
+        self._dump_snapshot: Optional[str] = None
+
+    def set_throttle(self, throttle: Optional[TokenBucket]):
+        """
+        Limit backup write bandwidth (streamed and deduplicated backups).
+
+        Directory-format pg_dump (jobs > 1) writes its files directly and is
+        not throttled; FleetRunner dumps with one job when a limit is set.
+        """
+        self.throttle = throttle
+        self.chunk_store.throttle = throttle
 
     def create_backup(
         self,
         uri: str,
         database: Optional[str] = None,
         compress: bool = True,
-        verify: bool = True
+        verify: bool = True,
+        jobs: int = 1,
+        compression: str = "gzip",
+        compression_level: Optional[int] = None,
+        dedup: bool = False,
+        capture_counts: bool = False
     ) -> Optional[BackupInfo]:
         """
         Create database backup.
@@ -60,17 +1015,144 @@ class BackupManager:
             database: Database name (optional for MongoDB)
             compress: Compress backup file
             verify: Verify backup after creation
+            jobs: Parallel dump jobs (PostgreSQL: >1 uses directory format;
+                MongoDB: collections dumped in parallel)
+            compression: Codec name from CODECS
+            compression_level: Codec level (codec default if None)
+            dedup: Store in the deduplicated chunk store instead of a
+                standalone file (compression and jobs are ignored)
+            capture_counts: Record per-table row counts for restore checks.
+                PostgreSQL counts are taken in the snapshot pg_dump reads, so
+                they match the dump exactly. mongodump has no snapshot, so
+                MongoDB counts are taken just before the dump starts and
+                writes made during the dump show up as mismatches.
 
         Returns:
             BackupInfo if successful, None otherwise
         """
+        args = (uri, database, compress, verify, jobs, compression, compression_level, dedup)
+        if not capture_counts:
+            return self._create_backup(*args)
+
+        if self.db_type == "postgres":
+            with self._pg_snapshot(uri) as session:
+                if session is None:
+                    return None
+                snapshot, psql = session
+                self._dump_snapshot = snapshot
+                try:
+                    backup_info = self._create_backup(*args)
+                finally:
+                    self._dump_snapshot = None
+                row_counts = self._snapshot_row_counts(psql) if backup_info else None
+        else:
+            row_counts = self._row_counts(uri, database)
+            backup_info = self._create_backup(*args)
+
+        if backup_info:
+            backup_info.row_counts = row_counts
+            self._save_metadata(backup_info)
+
+        return backup_info
+
+    @contextmanager
+    def _pg_snapshot(self, uri: str) -> Iterator[Optional[Tuple[str, subprocess.Popen]]]:
+        """
+        Hold a REPEATABLE READ transaction open and export its snapshot.
+
+        Yields (snapshot id, psql process) for `pg_dump --snapshot`, or None
+        if the transaction could not be started. The transaction stays open
+        until the context exits, so the snapshot remains importable.
+        """
+        proc = subprocess.Popen(
+            ["psql", uri, "-X", "-q", "-At", "-F", "\t", "-v", "ON_ERROR_STOP=1"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        try:
+            proc.stdin.write(
+                "SET idle_in_transaction_session_timeout = 0;\n"
+                "BEGIN ISOLATION LEVEL REPEATABLE READ, READ ONLY;\n"
+                "SELECT pg_export_snapshot();\n"
+            )
+            proc.stdin.flush()
+            snapshot = proc.stdout.readline().strip()
+            if not snapshot:
+                _, stderr = proc.communicate()
+                print(f"Error exporting snapshot: {stderr}")
+                yield None
+            else:
+                yield snapshot, proc
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+    def _snapshot_row_counts(self, proc: subprocess.Popen) -> Optional[Dict[str, int]]:
+        """Count rows in the exported snapshot's transaction, then end it."""
+        stdout, stderr = proc.communicate(PG_ROW_COUNT_QUERY + "COMMIT;\n")
+        if proc.returncode != 0:
+            print(f"Error counting rows: {stderr}")
+            return None
+        return _parse_row_counts(stdout)
+
+    def _pg_dump_command(self, *args: str) -> List[str]:
+        """pg_dump command line, reading from the exported snapshot if one is set."""
+        cmd = ["pg_dump"]
+        if self._dump_snapshot:
+            cmd.append(f"--snapshot={self._dump_snapshot}")
+        return cmd + list(args)
+
+    def _create_backup(
+        self,
+        uri: str,
+        database: Optional[str],
+        compress: bool,
+        verify: bool,
+        jobs: int,
+        compression: str,
+        compression_level: Optional[int],
+        dedup: bool
+    ) -> Optional[BackupInfo]:
+        """Dispatch backup creation by database type and storage mode."""
+        if self.storage.remote and (dedup or (self.db_type == "postgres" and jobs > 1)):
+            # Remote backups are streamed as one object; no local directory or chunk store
+            print("Error: Remote storage needs a single-file backup (no --dedup; -j 1 for PostgreSQL)")
+            return None
+
+        if dedup:
+            date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+            return self._backup_dedup(uri, database, date_str, verify)
+
+        codec = compression if compress else "none"
+        if codec not in CODECS:
+            print(f"Error: Unsupported compression: {codec}")
+            return None
+
+        # pg_dump (directory format) and mongodump (--gzip) compress internally
+        external = not (
+            (self.db_type == "postgres" and jobs > 1)
+            or (self.db_type == "mongodb" and codec == "gzip")
+        )
+        if codec != "none" and external:
+            tool = compress_command(codec)[0]
+            if not shutil.which(tool):
+                print(f"Error: {tool} not found in PATH")
+                return None
+
         timestamp = datetime.now()
         date_str = timestamp.strftime("%Y%m%d_%H%M%S")
 
         if self.db_type == "mongodb":
-            return self._backup_mongodb(uri, database, date_str, compress, verify)
+            return self._backup_mongodb(
+                uri, database, date_str, codec, compression_level, verify, jobs
+            )
         elif self.db_type == "postgres":
-            return self._backup_postgres(uri, database, date_str, compress, verify)
+            return self._backup_postgres(
+                uri, database, date_str, codec, compression_level, verify, jobs
+            )
         else:
             print(f"Error: Unsupported database type: {self.db_type}")
             return None
@@ -80,37 +1162,49 @@ class BackupManager:
         uri: str,
         database: Optional[str],
         date_str: str,
-        compress: bool,
-        verify: bool
+        codec: str,
+        level: Optional[int],
+        verify: bool,
+        jobs: int = 1
     ) -> Optional[BackupInfo]:
-        """Create MongoDB backup using mongodump."""
+        """
+        Create MongoDB backup as a single streamed mongodump archive.
+
+        gzip uses mongodump's own --gzip (restored with mongorestore --gzip);
+        other codecs compress the archive stream on its way to disk, so no
+        uncompressed copy is ever written.
+        """
         db_name = database or "all"
-        filename = f"mongodb_{db_name}_{date_str}"
+        filename = f"mongodb_{db_name}_{date_str}.archive{CODECS[codec]['ext']}"
         backup_path = self.backup_dir / filename
 
         try:
-            cmd = ["mongodump", "--uri", uri, "--out", str(backup_path)]
+            cmd = ["mongodump", "--uri", uri]
 
             if database:
                 cmd.extend(["--db", database])
+            if jobs > 1:
+                cmd.extend(["--numParallelCollections", str(jobs)])
 
             print(f"Creating MongoDB backup: {filename}")
-            result = subprocess.run(cmd, capture_output=True, text=True)
 
-            if result.returncode != 0:
-                print(f"Error: {result.stderr}")
-                return None
+            cmd.append("--archive")
+            if codec in ("none", "gzip"):
+                if codec == "gzip":
+                    # Compressed per block inside the archive; no outer stream to check
+                    cmd.append("--gzip")
+                written = self._stream_to_file(cmd, backup_path)
+            else:
+                written = self._stream_to_file(
+                    cmd, backup_path, compress_command(codec, level), check_codec=codec
+                )
 
-            # Compress if requested
-            if compress:
-                archive_path = backup_path.with_suffix(".tar.gz")
-                print(f"Compressing backup...")
-                shutil.make_archive(str(backup_path), "gztar", backup_path)
-                shutil.rmtree(backup_path)
-                backup_path = archive_path
-                filename = archive_path.name
+            if not written:
+                print("Error: mongodump failed")
+                return None
 
-            size_bytes = self._get_size(backup_path)
+            checksum, intact = written
+            size_bytes = self._stored_size(backup_path)
 
             backup_info = BackupInfo(
                 filename=filename,
@@ -118,11 +1212,14 @@ class BackupManager:
                 database_name=db_name,
                 timestamp=datetime.now(),
                 size_bytes=size_bytes,
-                compressed=compress
+                compressed=codec != "none",
+                format="archive",
+                codec=codec,
+                sha256=checksum
             )
 
             if verify:
-                backup_info.verified = self._verify_backup(backup_info)
+                backup_info.verified = self._verify_backup(backup_info, intact)
 
             self._save_metadata(backup_info)
             print(f"✓ Backup created: {filename} ({self._format_size(size_bytes)})")
@@ -138,45 +1235,109 @@ class BackupManager:
         uri: str,
         database: str,
         date_str: str,
-        compress: bool,
-        verify: bool
+        codec: str,
+        level: Optional[int],
+        verify: bool,
+        jobs: int = 1
     ) -> Optional[BackupInfo]:
         """Create PostgreSQL backup using pg_dump."""
         if not database:
             print("Error: Database name required for PostgreSQL backup")
             return None
 
-        ext = ".sql.gz" if compress else ".sql"
-        filename = f"postgres_{database}_{date_str}{ext}"
+        if jobs > 1:
+            return self._backup_postgres_directory(
+                uri, database, date_str, codec, level, verify, jobs
+            )
+
+        filename = f"postgres_{database}_{date_str}.sql{CODECS[codec]['ext']}"
         backup_path = self.backup_dir / filename
 
         try:
-            cmd = ["pg_dump", uri]
-
-            if compress:
-                # Use pg_dump with gzip
-                with open(backup_path, "wb") as f:
-                    dump_proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-                    gzip_proc = subprocess.Popen(
-                        ["gzip"],
-                        stdin=dump_proc.stdout,
-                        stdout=f
-                    )
-                    dump_proc.stdout.close()
-                    gzip_proc.communicate()
+            cmd = self._pg_dump_command(uri)
 
-                    if dump_proc.returncode != 0:
-                        print("Error: pg_dump failed")
-                        return None
+            if codec != "none":
+                written = self._stream_to_file(
+                    cmd, backup_path, compress_command(codec, level), check_codec=codec
+                )
             else:
-                with open(backup_path, "w") as f:
-                    result = subprocess.run(cmd, stdout=f, stderr=subprocess.PIPE, text=True)
+                written = self._stream_to_file(cmd, backup_path)
+
+            if not written:
+                print("Error: pg_dump failed")
+                return None
+
+            checksum, intact = written
+            size_bytes = self._stored_size(backup_path)
+
+            backup_info = BackupInfo(
+                filename=filename,
+                database_type="postgres",
+                database_name=database,
+                timestamp=datetime.now(),
+                size_bytes=size_bytes,
+                compressed=codec != "none",
+                format="plain",
+                codec=codec,
+                sha256=checksum
+            )
+
+            if verify:
+                backup_info.verified = self._verify_backup(backup_info, intact)
+
+            self._save_metadata(backup_info)
+            print(f"✓ Backup created: {filename} ({self._format_size(size_bytes)})")
+
+            return backup_info
+
+        except Exception as e:
+            print(f"Error creating PostgreSQL backup: {e}")
+            return None
+
+    def _backup_postgres_directory(
+        self,
+        uri: str,
+        database: str,
+        date_str: str,
+        codec: str,
+        level: Optional[int],
+        verify: bool,
+        jobs: int
+    ) -> Optional[BackupInfo]:
+        """
+        Create PostgreSQL backup using parallel directory-format pg_dump.
+
+        Each table is dumped to its own file by one of `jobs` workers, so
+        both dumping and per-table compression run in parallel. pg_dump
+        compresses internally: zstd needs PostgreSQL 16+, and pigz is
+        stored as gzip since pg_dump has no pigz support.
+        """
+        filename = f"postgres_{database}_{date_str}.dir"
+        backup_path = self.backup_dir / filename
+
+        if codec == "pigz":
+            codec = "gzip"
+        level = CODECS[codec]["level"] if level is None else level
+        compress_arg = f"zstd:{level}" if codec == "zstd" else str(level)
+
+        try:
+            cmd = self._pg_dump_command(
+                "-Fd", "-j", str(jobs),
+                "-f", str(backup_path),
+                "-Z", compress_arg,
+                uri
+            )
+
+            print(f"Creating PostgreSQL backup: {filename} ({jobs} jobs)")
+            result = subprocess.run(cmd, capture_output=True, text=True)
 
-                    if result.returncode != 0:
-                        print(f"Error: {result.stderr}")
-                        return None
+            if result.returncode != 0:
+                print(f"Error: {result.stderr}")
+                if backup_path.is_dir():
+                    shutil.rmtree(backup_path)
+                return None
 
-            size_bytes = backup_path.stat().st_size
+            size_bytes = self._get_size(backup_path)
 
             backup_info = BackupInfo(
                 filename=filename,
@@ -184,22 +1345,228 @@ class BackupManager:
                 database_name=database,
                 timestamp=datetime.now(),
                 size_bytes=size_bytes,
-                compressed=compress
+                compressed=codec != "none",
+                format="directory",
+                codec=codec,
+                # pg_dump writes the files itself, so they are hashed afterwards
+                sha256=directory_sha256(backup_path)
+            )
+
+            if verify:
+                backup_info.verified = self._verify_backup(backup_info)
+
+            self._save_metadata(backup_info)
+            print(f"✓ Backup created: {filename} ({self._format_size(size_bytes)})")
+
+            return backup_info
+
+        except Exception as e:
+            print(f"Error creating PostgreSQL backup: {e}")
+            return None
+
+    def _backup_dedup(
+        self,
+        uri: str,
+        database: Optional[str],
+        date_str: str,
+        verify: bool
+    ) -> Optional[BackupInfo]:
+        """
+        Create a deduplicated backup in the chunk store.
+
+        The dump is streamed uncompressed (plain SQL or a serial mongodump
+        archive, so output order is stable between runs) and split into
+        content-defined chunks; only chunks not already stored are written.
+        The backup file itself is a small snapshot manifest.
+        """
+        if self.db_type == "postgres":
+            if not database:
+                print("Error: Database name required for PostgreSQL backup")
+                return None
+            cmd = self._pg_dump_command(uri)
+            db_name = database
+        elif self.db_type == "mongodb":
+            cmd = ["mongodump", "--uri", uri, "--archive", "--numParallelCollections", "1"]
+            if database:
+                cmd.extend(["--db", database])
+            db_name = database or "all"
+        else:
+            print(f"Error: Unsupported database type: {self.db_type}")
+            return None
+
+        filename = f"{self.db_type}_{db_name}_{date_str}.snapshot"
+        backup_path = self.backup_dir / filename
+
+        try:
+            print(f"Creating deduplicated backup: {filename}")
+            with self.chunk_store.lock(), tempfile.TemporaryFile() as stderr:
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+                manifest = self.chunk_store.store_stream(proc.stdout)
+                proc.stdout.close()
+
+                if proc.wait() != 0:
+                    stderr.seek(0)
+                    print(f"Error: {stderr.read().decode(errors='replace')}")
+                    return None
+
+                with open(backup_path, "w") as f:
+                    json.dump(manifest, f)
+
+            backup_info = BackupInfo(
+                filename=filename,
+                database_type=self.db_type,
+                database_name=db_name,
+                timestamp=datetime.now(),
+                size_bytes=manifest["size_bytes"],
+                compressed=True,
+                format="dedup",
+                codec="zlib",
+                sha256=manifest["sha256"]
             )
 
-            if verify:
-                backup_info.verified = self._verify_backup(backup_info)
+            if verify:
+                backup_info.verified = self._verify_backup(backup_info)
+
+            self._save_metadata(backup_info)
+            print(f"✓ Backup created: {filename} ({self._format_size(manifest['size_bytes'])}, "
+                  f"{manifest['new_chunks']}/{len(manifest['chunks'])} new chunks, "
+                  f"{self._format_size(manifest['stored_bytes'])} written)")
+
+            return backup_info
+
+        except Exception as e:
+            print(f"Error creating deduplicated backup: {e}")
+            return None
+
+    def _stream_to_file(
+        self,
+        producer: List[str],
+        output: Path,
+        compressor: Optional[List[str]] = None,
+        check_codec: Optional[str] = None
+    ) -> Optional[Tuple[str, Optional[bool]]]:
+        """
+        Stream a producer command, optionally through a compressor, into a file.
+
+        With remote storage the stream goes straight to the backend (e.g.
+        S3 multipart upload) and nothing is written locally.
+
+        The SHA-256 is computed as the bytes are written. With check_codec,
+        the same bytes are also fed to a decompressor, so a truncated or
+        corrupt compressed stream is caught without reading the file back.
+
+        Args:
+            producer: Command writing data to stdout
+            output: Destination file
+            compressor: Command compressing stdin to stdout
+            check_codec: Codec to integrity-check the written stream with
+
+        Returns:
+            Tuple of (sha256, stream intact or None if unchecked), or None
+            if a command failed
+        """
+        digest = hashlib.sha256()
+        buf = bytearray(1024 * 1024)
+        view = memoryview(buf)
 
-            self._save_metadata(backup_info)
-            print(f"✓ Backup created: {filename} ({self._format_size(size_bytes)})")
+        if self.storage.remote:
+            writer = self.storage.open_writer(output.name)
+        else:
+            writer = LocalWriter(output)
 
-            return backup_info
+        try:
+            with tempfile.TemporaryFile() as stderr:
+                producer_proc = subprocess.Popen(producer, stdout=subprocess.PIPE, stderr=stderr)
+                procs = [producer_proc]
+                source = producer_proc.stdout
+
+                if compressor:
+                    compress_proc = subprocess.Popen(
+                        compressor,
+                        stdin=producer_proc.stdout,
+                        stdout=subprocess.PIPE
+                    )
+                    producer_proc.stdout.close()
+                    procs.append(compress_proc)
+                    source = compress_proc.stdout
+
+                checker = None
+                if check_codec:
+                    checker = subprocess.Popen(
+                        decompress_command(check_codec),
+                        stdin=subprocess.PIPE,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL
+                    )
+                check_stream = checker.stdin if checker else None
+
+                while True:
+                    n = source.readinto(buf)
+                    if not n:
+                        break
+                    if self.throttle:
+                        self.throttle.consume(n)
+                    writer.write(view[:n])
+                    digest.update(view[:n])
+                    if check_stream:
+                        try:
+                            check_stream.write(view[:n])
+                        except BrokenPipeError:
+                            check_stream = None  # checker already rejected the stream
+
+                source.close()
+                returncodes = [proc.wait() for proc in procs]
+
+                intact = None
+                if checker:
+                    try:
+                        checker.stdin.close()
+                    except BrokenPipeError:
+                        pass
+                    intact = checker.wait() == 0
+
+                if any(returncodes):
+                    stderr.seek(0)
+                    message = stderr.read().decode(errors="replace").strip()
+                    if message:
+                        print(f"Error: {message}")
+                    writer.abort()
+                    return None
+        except Exception:
+            # Don't leave a partial file or an open multipart upload behind
+            writer.abort()
+            raise
 
+        try:
+            writer.close()
         except Exception as e:
-            print(f"Error creating PostgreSQL backup: {e}")
+            print(f"Error: Could not store {output.name}: {e}")
+            writer.abort()
             return None
 
-    def restore_backup(self, filename: str, uri: str, dry_run: bool = False) -> bool:
+        return digest.hexdigest(), intact
+
+    def _stored_size(self, backup_path: Path) -> int:
+        """Size of a backup in the storage backend."""
+        if self.storage.remote:
+            return self.storage.size(backup_path.name)
+        return self._get_size(backup_path)
+
+    def _backup_codec(self, filename: str) -> str:
+        """Codec of a backup: from its metadata, else inferred from the filename."""
+        metadata = self._load_metadata(filename) or {}
+        return metadata.get("codec") or codec_from_filename(filename)
+
+    def restore_backup(
+        self,
+        filename: str,
+        uri: str,
+        dry_run: bool = False,
+        jobs: int = 1,
+        no_owner: bool = False,
+        tables: Optional[List[str]] = None,
+        schemas: Optional[List[str]] = None
+    ) -> bool:
         """
         Restore database from backup.
 
@@ -207,35 +1574,49 @@ class BackupManager:
             filename: Backup filename
             uri: Database connection string
             dry_run: If True, only show what would be done
+            jobs: Parallel pg_restore jobs (directory format) or mongorestore
+                insertion workers per collection
+            no_owner: Skip ownership and privileges (pg_restore --no-owner --no-acl)
+            tables: Restore only these tables (schema.table or table; PostgreSQL
+                directory/custom-format backups)
+            schemas: Restore only these schemas (same formats as tables)
 
         Returns:
             True if successful, False otherwise
         """
         backup_path = self.backup_dir / filename
 
-        if not backup_path.exists():
+        if not self.storage.exists(filename):
             print(f"Error: Backup not found: {filename}")
             return False
 
-        # Load metadata
-        metadata_path = backup_path.with_suffix(".json")
-        if metadata_path.exists():
-            with open(metadata_path) as f:
-                metadata = json.load(f)
-                print(f"Restoring backup from {metadata['timestamp']}")
-                print(f"Database: {metadata['database_name']}")
+        metadata = self._load_metadata(filename)
+        if metadata:
+            print(f"Restoring backup from {metadata['timestamp']}")
+            print(f"Database: {metadata['database_name']}")
 
         if dry_run:
-            print(f"Would restore from: {backup_path}")
+            print(f"Would restore from: {self.storage.location(filename)}")
             return True
 
         print(f"Restoring backup: {filename}")
 
         try:
-            if self.db_type == "mongodb":
-                return self._restore_mongodb(backup_path, uri)
+            if self.storage.remote:
+                if tables or schemas:
+                    print("Error: Selective restore needs a local directory or custom-format backup")
+                    return False
+                return self._restore_remote(filename, uri, jobs)
+            elif backup_path.suffix == ".snapshot":
+                return self._restore_dedup(backup_path, uri, jobs)
+            elif self.db_type == "mongodb":
+                return self._restore_mongodb(backup_path, uri, jobs)
             elif self.db_type == "postgres":
-                return self._restore_postgres(backup_path, uri)
+                if tables or schemas:
+                    return self._restore_postgres_selective(
+                        backup_path, uri, tables or [], schemas or [], jobs, no_owner
+                    )
+                return self._restore_postgres(backup_path, uri, jobs, no_owner)
             else:
                 print(f"Error: Unsupported database type: {self.db_type}")
                 return False
@@ -244,17 +1625,102 @@ class BackupManager:
             print(f"Error restoring backup: {e}")
             return False
 
-    def _restore_mongodb(self, backup_path: Path, uri: str) -> bool:
+    def _restore_remote(self, filename: str, uri: str, jobs: int = 1) -> bool:
+        """
+        Stream a backup down from remote storage into psql or mongorestore.
+
+        The object is read in CHECKSUM_BUFFER blocks and piped through the
+        decompressor, so it is never written to local disk.
+        """
+        codec = self._backup_codec(filename)
+
+        if self.db_type == "mongodb":
+            cmd = [
+                "mongorestore", "--uri", uri, "--archive",
+                "--numInsertionWorkersPerCollection", str(jobs)
+            ]
+            if codec == "gzip":
+                cmd.append("--gzip")
+                codec = "none"
+        else:
+            cmd = ["psql", uri]
+
+        with tempfile.TemporaryFile() as stderr:
+            consumer = subprocess.Popen(
+                cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr
+            )
+            procs = [consumer]
+            sink = consumer.stdin
+
+            if codec != "none":
+                decompress_proc = subprocess.Popen(
+                    decompress_command(codec),
+                    stdin=subprocess.PIPE,
+                    stdout=consumer.stdin,
+                    stderr=stderr
+                )
+                consumer.stdin.close()
+                procs.insert(0, decompress_proc)
+                sink = decompress_proc.stdin
+
+            try:
+                with closing(self.storage.open_reader(filename)) as stream:
+                    shutil.copyfileobj(stream, sink, CHECKSUM_BUFFER)
+            except BrokenPipeError:
+                pass  # consumer exited early; its exit status says why
+            finally:
+                try:
+                    sink.close()
+                except BrokenPipeError:
+                    pass
+
+            if any(proc.wait() for proc in procs):
+                stderr.seek(0)
+                print(f"Error: {stderr.read().decode(errors='replace')}")
+                return False
+
+        print("✓ Restore completed")
+        return True
+
+    def _restore_mongodb(self, backup_path: Path, uri: str, jobs: int = 1) -> bool:
         """Restore MongoDB backup using mongorestore."""
         try:
+            metadata = self._load_metadata(backup_path.name) or {}
+            if metadata.get("format") == "archive" or ".archive" in backup_path.name:
+                return self._restore_mongodb_archive(backup_path, uri, jobs)
+
+            # Legacy dump directories and tarballs
+            codec = self._backup_codec(backup_path.name)
+
             # Extract if compressed
             restore_path = backup_path
-            if backup_path.suffix == ".gz":
+            if codec == "gzip":
                 print("Extracting backup...")
                 extract_path = backup_path.with_suffix("")
-                shutil.unpack_archive(backup_path, extract_path)
+                shutil.unpack_archive(backup_path, extract_path, "gztar")
+                restore_path = extract_path
+            elif codec != "none":
+                print(f"Extracting backup ({codec})...")
+                extract_path = backup_path.with_suffix("")
+                extract_path.mkdir(exist_ok=True)
+                with open(backup_path, "rb") as f:
+                    decompress_proc = subprocess.Popen(
+                        decompress_command(codec), stdin=f, stdout=subprocess.PIPE
+                    )
+                    tar_result = subprocess.run(
+                        ["tar", "-xf", "-", "-C", str(extract_path)],
+                        stdin=decompress_proc.stdout,
+                        capture_output=True
+                    )
+                    decompress_proc.stdout.close()
+                    decompress_proc.wait()
                 restore_path = extract_path
 
+                if tar_result.returncode != 0 or decompress_proc.returncode != 0:
+                    shutil.rmtree(extract_path)
+                    print("Error: Could not extract backup")
+                    return False
+
             cmd = ["mongorestore", "--uri", uri, str(restore_path)]
 
             result = subprocess.run(cmd, capture_output=True, text=True)
@@ -274,19 +1740,311 @@ class BackupManager:
             print(f"Error restoring MongoDB: {e}")
             return False
 
-    def _restore_postgres(self, backup_path: Path, uri: str) -> bool:
-        """Restore PostgreSQL backup using psql."""
+    def _restore_mongodb_archive(self, backup_path: Path, uri: str, jobs: int = 1) -> bool:
+        """Stream a mongodump archive into mongorestore without extracting it."""
+        codec = self._backup_codec(backup_path.name)
+        cmd = [
+            "mongorestore", "--uri", uri,
+            "--numInsertionWorkersPerCollection", str(jobs)
+        ]
+
+        if codec in ("none", "gzip"):
+            cmd.append(f"--archive={backup_path}")
+            if codec == "gzip":
+                cmd.append("--gzip")
+            result = subprocess.run(cmd, capture_output=True, text=True)
+        else:
+            cmd.append("--archive")
+            with open(backup_path, "rb") as f:
+                decompress_proc = subprocess.Popen(
+                    decompress_command(codec), stdin=f, stdout=subprocess.PIPE
+                )
+                result = subprocess.run(
+                    cmd,
+                    stdin=decompress_proc.stdout,
+                    capture_output=True,
+                    text=True
+                )
+                decompress_proc.stdout.close()
+                if decompress_proc.wait() != 0:
+                    print(f"Error: {codec} decompression failed")
+                    return False
+
+        if result.returncode != 0:
+            print(f"Error: {result.stderr}")
+            return False
+
+        print("✓ Restore completed")
+        return True
+
+    def _restore_dedup(self, backup_path: Path, uri: str, jobs: int = 1) -> bool:
+        """Reassemble a deduplicated backup straight into psql or mongorestore."""
+        with open(backup_path) as f:
+            manifest = json.load(f)
+
+        if self.db_type == "mongodb":
+            cmd = [
+                "mongorestore", "--uri", uri, "--archive",
+                "--numInsertionWorkersPerCollection", str(jobs)
+            ]
+        else:
+            cmd = ["psql", uri]
+
+        with tempfile.TemporaryFile() as stderr:
+            proc = subprocess.Popen(
+                cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr
+            )
+            try:
+                self.chunk_store.write_stream(manifest["chunks"], proc.stdin)
+            except (OSError, ValueError) as e:
+                print(f"Error: {e}")
+                proc.kill()
+                proc.wait()
+                return False
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+            if proc.wait() != 0:
+                stderr.seek(0)
+                print(f"Error: {stderr.read().decode(errors='replace')}")
+                return False
+
+        print("✓ Restore completed")
+        return True
+
+    def _is_pg_archive(self, backup_path: Path) -> bool:
+        """Directory or custom-format dump that pg_restore can read."""
+        if backup_path.is_dir():
+            return True
+        with open(backup_path, "rb") as f:
+            return f.read(5) == b"PGDMP"
+
+    def _restore_postgres_selective(
+        self,
+        backup_path: Path,
+        uri: str,
+        tables: List[str],
+        schemas: List[str],
+        jobs: int = 1,
+        no_owner: bool = False
+    ) -> bool:
+        """
+        Restore selected tables or schemas from a directory/custom-format dump.
+
+        Builds a filtered `pg_restore -L` list of the selected tables with
+        their data, sequences, defaults, constraints, indexes and triggers,
+        then restores it in three passes: schema (pre-data), data with
+        `jobs` parallel workers, and indexes/constraints (post-data) with
+        `jobs` workers once all data is loaded. Foreign keys pointing at
+        tables outside the selection are skipped.
+        """
+        if not self._is_pg_archive(backup_path):
+            print("Error: Selective restore needs a directory or custom-format backup")
+            return False
+
+        result = subprocess.run(
+            ["pg_restore", "-l", str(backup_path)], capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            print(f"Error: {result.stderr}")
+            return False
+
+        entries = parse_toc(result.stdout)
+        selected = self._select_tables(entries, tables, schemas)
+        if not selected:
+            print("Error: No matching tables in backup")
+            return False
+
+        refs = self._toc_references(backup_path, entries)
+        chosen = self._filter_toc(entries, selected, set(schemas), refs)
+        print(f"Restoring {len(selected)} table(s), {len(chosen)} TOC entries")
+
+        with tempfile.NamedTemporaryFile("w", suffix=".list", delete=False) as f:
+            f.write("\n".join(e.line for e in chosen) + "\n")
+            list_path = f.name
+
+        try:
+            for section, section_jobs in (("pre-data", 1), ("data", jobs), ("post-data", jobs)):
+                cmd = [
+                    "pg_restore", "-L", list_path, f"--section={section}",
+                    "-j", str(section_jobs), "-d", uri, str(backup_path)
+                ]
+                if no_owner:
+                    cmd[1:1] = ["--no-owner", "--no-acl"]
+
+                start = time.perf_counter()
+                result = subprocess.run(cmd, capture_output=True, text=True)
+                if result.returncode != 0:
+                    print(f"Error in {section}: {result.stderr}")
+                    return False
+                print(f"  {section}: {time.perf_counter() - start:.1f}s")
+        finally:
+            os.unlink(list_path)
+
+        print("✓ Restore completed")
+        return True
+
+    def _select_tables(
+        self,
+        entries: List[TocEntry],
+        tables: List[str],
+        schemas: List[str]
+    ) -> Set[str]:
+        """Resolve table/schema selections to qualified table names."""
+        all_tables = {e.qualified for e in entries if e.kind == "TABLE"}
+        selected = set()
+
+        for table in tables:
+            if "." in table:
+                selected |= {table} & all_tables
+            else:
+                selected |= {t for t in all_tables if t.split(".", 1)[1] == table}
+        for schema in schemas:
+            selected |= {t for t in all_tables if t.split(".", 1)[0] == schema}
+
+        return selected
+
+    def _toc_references(self, backup_path: Path, entries: List[TocEntry]) -> Dict[str, Dict]:
+        """
+        Find which table each index, sequence and foreign key belongs to.
+
+        The listing does not say, so the DDL of just those entries is
+        printed with `pg_restore -f -` (no data is read) and parsed.
+        Sequences are linked to tables through nextval() defaults,
+        identity columns and OWNED BY.
+        """
+        refs = {"index_table": {}, "table_sequences": {}, "fk_target": {}}
+        ddl_entries = [e for e in entries if e.kind in (
+            "INDEX", "DEFAULT", "FK CONSTRAINT", "SEQUENCE", "SEQUENCE OWNED BY"
+        )]
+        if not ddl_entries:
+            return refs
+
+        with tempfile.NamedTemporaryFile("w", suffix=".list", delete=False) as f:
+            f.write("\n".join(e.line for e in ddl_entries) + "\n")
+            list_path = f.name
+        try:
+            result = subprocess.run(
+                ["pg_restore", "-f", "-", "-L", list_path, str(backup_path)],
+                capture_output=True, text=True
+            )
+        finally:
+            os.unlink(list_path)
+
+        sql = result.stdout
+        for index, table in re.findall(
+            rf"CREATE (?:UNIQUE )?INDEX ({SQL_IDENT}) ON (?:ONLY )?({SQL_QUALIFIED})", sql
+        ):
+            schema = _ident_parts(table)[0]
+            refs["index_table"][f"{schema}.{_unquote(index)}"] = _unquote(table)
+
+        owned = [
+            (_unquote(table), _unquote(sequence.replace("''", "'")))
+            for table, sequence in re.findall(
+                rf"ALTER TABLE (?:ONLY )?({SQL_QUALIFIED}) ALTER COLUMN {SQL_IDENT} "
+                rf"SET DEFAULT nextval\('((?:[^']|'')+)'", sql
+            )
+        ]
+        owned += [
+            (_unquote(table), _unquote(sequence))
+            for table, sequence in re.findall(
+                rf"ALTER TABLE (?:ONLY )?({SQL_QUALIFIED}) ALTER COLUMN {SQL_IDENT} "
+                rf"ADD GENERATED (?:ALWAYS|BY DEFAULT) AS IDENTITY \(\s*SEQUENCE NAME ({SQL_QUALIFIED})", sql
+            )
+        ]
+        owned += [
+            (".".join(_ident_parts(column)[:-1]), _unquote(sequence))
+            for sequence, column in re.findall(
+                rf"ALTER SEQUENCE ({SQL_QUALIFIED}) OWNED BY ({SQL_QUALIFIED})", sql
+            )
+        ]
+        for table, sequence in owned:
+            refs["table_sequences"].setdefault(table, set()).add(sequence)
+
+        for table, constraint, target in re.findall(
+            rf"ALTER TABLE (?:ONLY )?({SQL_QUALIFIED})\s+ADD CONSTRAINT ({SQL_IDENT}) "
+            rf"FOREIGN KEY .*? REFERENCES ({SQL_QUALIFIED})", sql
+        ):
+            refs["fk_target"][f"{_unquote(table)} {_unquote(constraint)}"] = _unquote(target)
+
+        return refs
+
+    def _filter_toc(
+        self,
+        entries: List[TocEntry],
+        selected: Set[str],
+        schemas: Set[str],
+        refs: Dict[str, Dict]
+    ) -> List[TocEntry]:
+        """Keep the TOC entries needed to rebuild the selected tables."""
+        sequences = set()
+        for table in selected:
+            sequences |= refs["table_sequences"].get(table, set())
+
+        chosen = []
+        for entry in entries:
+            if entry.kind == "FK CONSTRAINT":
+                key = f"{entry.qualified} {entry.tag[1] if len(entry.tag) > 1 else ''}"
+                target = refs["fk_target"].get(key)
+                keep = entry.qualified in selected and target in selected
+                if entry.qualified in selected and not keep:
+                    print(f"  Skipping foreign key {key} (references {target or 'unknown table'})")
+            elif entry.kind in TABLE_SCOPED_TYPES:
+                keep = entry.qualified in selected
+            elif entry.kind == "INDEX":
+                keep = refs["index_table"].get(entry.qualified) in selected
+            elif entry.kind.startswith("SEQUENCE"):
+                keep = entry.qualified in sequences or entry.schema in schemas
+            elif entry.kind in ("COMMENT", "ACL"):
+                keep = len(entry.tag) > 1 and entry.tag[0] == "TABLE" and \
+                    f"{entry.schema}.{entry.tag[1]}" in selected
+            elif entry.kind == "SCHEMA":
+                keep = bool(entry.tag) and entry.tag[0] in schemas
+            else:
+                keep = entry.schema in schemas
+
+            if keep:
+                chosen.append(entry)
+
+        return chosen
+
+    def _restore_postgres(
+        self,
+        backup_path: Path,
+        uri: str,
+        jobs: int = 1,
+        no_owner: bool = False
+    ) -> bool:
+        """Restore PostgreSQL backup using pg_restore (directory) or psql (plain)."""
         try:
-            if backup_path.suffix == ".gz":
+            codec = self._backup_codec(backup_path.name)
+
+            if self._is_pg_archive(backup_path):
+                cmd = ["pg_restore", "-j", str(jobs), "-d", uri, str(backup_path)]
+                if no_owner:
+                    cmd[1:1] = ["--no-owner", "--no-acl"]
+                print(f"Running pg_restore with {jobs} job(s)")
+                result = subprocess.run(cmd, capture_output=True, text=True)
+            elif codec != "none":
                 # Decompress and restore
-                with gzip.open(backup_path, "rb") as f:
+                with open(backup_path, "rb") as f:
+                    decompress_proc = subprocess.Popen(
+                        decompress_command(codec), stdin=f, stdout=subprocess.PIPE
+                    )
                     cmd = ["psql", uri]
                     result = subprocess.run(
                         cmd,
-                        stdin=f,
+                        stdin=decompress_proc.stdout,
                         capture_output=True,
                         text=False
                     )
+                    decompress_proc.stdout.close()
+                    if decompress_proc.wait() != 0:
+                        print(f"Error: {codec} decompression failed")
+                        return False
             else:
                 with open(backup_path) as f:
                     cmd = ["psql", uri]
@@ -308,14 +2066,27 @@ class BackupManager:
             print(f"Error restoring PostgreSQL: {e}")
             return False
 
-    def list_backups(self) -> List[BackupInfo]:
+    def list_backups(self, database: Optional[str] = None) -> List[BackupInfo]:
         """
-        List all backups.
+        List backups from the catalog, oldest first.
+
+        Args:
+            database: Only backups of this database
 
         Returns:
             List of BackupInfo objects
         """
-        backups = []
+        return self.catalog.list(database)
+
+    def rebuild_catalog(self) -> int:
+        """
+        Rebuild the catalog from the metadata JSON files.
+
+        Returns:
+            Number of backups indexed
+        """
+        self.catalog.clear()
+        indexed = 0
 
         for metadata_file in sorted(self.backup_dir.glob("*.json")):
             try:
@@ -329,18 +2100,25 @@ class BackupManager:
                     timestamp=datetime.fromisoformat(data["timestamp"]),
                     size_bytes=data["size_bytes"],
                     compressed=data["compressed"],
-                    verified=data.get("verified", False)
+                    verified=data.get("verified", False),
+                    format=data.get("format", "plain"),
+                    codec=data.get("codec", ""),
+                    sha256=data.get("sha256", ""),
+                    row_counts=data.get("row_counts")
                 )
-                backups.append(backup_info)
+                self.catalog.upsert(backup_info)
+                indexed += 1
             except Exception as e:
                 print(f"Error reading metadata {metadata_file}: {e}")
 
-        return backups
+        return indexed
 
     def cleanup_old_backups(self, retention_days: int, dry_run: bool = False) -> int:
         """
         Remove backups older than retention period.
 
+        Age comes from the recorded backup timestamp, not file mtime.
+
         Args:
             retention_days: Number of days to retain backups
             dry_run: If True, only show what would be deleted
@@ -348,49 +2126,380 @@ class BackupManager:
         Returns:
             Number of backups removed
         """
-        cutoff = datetime.now().timestamp() - (retention_days * 24 * 3600)
-        removed = 0
+        cutoff = datetime.fromtimestamp(datetime.now().timestamp() - retention_days * 24 * 3600)
+        expired = [b.filename for b in self.catalog.list(before=cutoff)]
+        return self._remove_backups(expired, dry_run)
 
-        for backup_file in self.backup_dir.glob("*"):
-            if backup_file.suffix == ".json":
-                continue
+    def apply_retention(
+        self,
+        hourly: int = 0,
+        daily: int = 0,
+        weekly: int = 0,
+        monthly: int = 0,
+        dry_run: bool = False
+    ) -> int:
+        """
+        Grandfather-father-son retention per database.
 
-            if backup_file.stat().st_mtime < cutoff:
-                if dry_run:
-                    print(f"Would remove: {backup_file.name}")
-                else:
-                    print(f"Removing: {backup_file.name}")
-                    backup_file.unlink()
-                    # Remove metadata
-                    metadata_file = backup_file.with_suffix(".json")
-                    if metadata_file.exists():
-                        metadata_file.unlink()
-                removed += 1
+        Keeps the newest backup in each of the latest N hours, days, weeks
+        and months; everything else is removed.
+
+        Args:
+            hourly: Hourly backups to keep
+            daily: Daily backups to keep
+            weekly: Weekly backups to keep
+            monthly: Monthly backups to keep
+            dry_run: If True, only show what would be deleted
+
+        Returns:
+            Number of backups removed
+        """
+        keep_counts = {"hourly": hourly, "daily": daily, "weekly": weekly, "monthly": monthly}
+        expired = []
+
+        for database_type, database_name in self.catalog.databases():
+            keep = set()
+            for granularity, limit in keep_counts.items():
+                if limit > 0:
+                    keep |= self.catalog.newest_per_bucket(
+                        database_type, database_name, RETENTION_BUCKETS[granularity], limit
+                    )
+            expired.extend(
+                b.filename for b in self.catalog.list(database_name)
+                if b.database_type == database_type and b.filename not in keep
+            )
+
+        return self._remove_backups(expired, dry_run)
 
+    def _remove_backups(self, filenames: List[str], dry_run: bool) -> int:
+        """Remove backups (or report them in dry-run) and prune orphaned chunks."""
+        for filename in filenames:
+            if dry_run:
+                print(f"Would remove: {filename}")
+            else:
+                print(f"Removing: {filename}")
+                self._remove_backup(filename)
+
+        if filenames and not dry_run:
+            self.prune_chunks()
+
+        return len(filenames)
+
+    def prune_chunks(self) -> int:
+        """
+        Remove chunks no longer referenced by any snapshot.
+
+        Returns:
+            Number of chunks removed
+        """
+        # Exclusive: no backup may be between a dedup hit and its manifest
+        with self.chunk_store.lock(exclusive=True):
+            referenced = set()
+            for snapshot in self.backup_dir.glob("*.snapshot"):
+                with open(snapshot) as f:
+                    referenced.update(digest for digest, _ in json.load(f)["chunks"])
+
+            removed, freed = self.chunk_store.prune(referenced)
+        if removed:
+            print(f"Pruned {removed} chunk(s) ({self._format_size(freed)})")
         return removed
 
-    def _verify_backup(self, backup_info: BackupInfo) -> bool:
+    def _verify_backup(self, backup_info: BackupInfo, intact: Optional[bool] = None) -> bool:
         """
-        Verify backup integrity.
+        Verify backup integrity without reading the backup data.
 
         Args:
             backup_info: Backup information
+            intact: Result of the compressed-stream check made while writing
 
         Returns:
             True if backup is valid, False otherwise
         """
         backup_path = self.backup_dir / backup_info.filename
 
-        if not backup_path.exists():
+        if not self.storage.exists(backup_info.filename):
             return False
 
+        if intact is False:
+            print(f"✗ {backup_info.codec} stream failed integrity check")
+            return False
+
+        if self.storage.remote:
+            return self.storage.size(backup_info.filename) > 0
+
+        # Deduplicated snapshots need every referenced chunk
+        if backup_info.format == "dedup":
+            with open(backup_path) as f:
+                chunks = json.load(f)["chunks"]
+            return all(self.chunk_store.has(digest) for digest, _ in chunks)
+
+        # Directory-format dumps are unusable without their table of contents
+        if backup_info.format == "directory" and backup_info.database_type == "postgres":
+            return (backup_path / "toc.dat").is_file()
+
         # Basic verification: file exists and has size > 0
-        if backup_path.stat().st_size == 0:
+        if self._get_size(backup_path) == 0:
             return False
 
-        # Could add more verification here (checksums, test restore, etc.)
         return True
 
+    def verify_backups(
+        self,
+        filenames: Optional[List[str]] = None,
+        workers: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Re-validate backups against their recorded SHA-256 in parallel.
+
+        Args:
+            filenames: Backups to check (all if None)
+            workers: Concurrent checks (CPU count if None)
+
+        Returns:
+            List of result dicts (filename, ok, detail, seconds, size_bytes);
+            requested files missing from the catalog are reported as failed
+        """
+        backups = self.list_backups()
+        unknown = []
+        if filenames:
+            known = {b.filename for b in backups}
+            unknown = [name for name in dict.fromkeys(filenames) if name not in known]
+            backups = [b for b in backups if b.filename in filenames]
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            results = list(executor.map(self._check_backup, backups))
+
+        for backup_info, result in zip(backups, results):
+            if backup_info.verified != result["ok"]:
+                backup_info.verified = result["ok"]
+                self._save_metadata(backup_info)
+
+        return results + [
+            {
+                "filename": name,
+                "ok": False,
+                "detail": "not in catalog (unverified)",
+                "seconds": 0.0,
+                "size_bytes": 0
+            }
+            for name in unknown
+        ]
+
+    def _check_backup(self, backup_info: BackupInfo) -> Dict:
+        """Check one backup's data against its recorded checksum."""
+        backup_path = self.backup_dir / backup_info.filename
+        start = time.perf_counter()
+        ok = False
+
+        try:
+            if not self._verify_backup(backup_info):
+                detail = "missing or incomplete"
+            elif backup_info.format == "dedup":
+                with open(backup_path) as f:
+                    chunks = json.load(f)["chunks"]
+                digest = hashlib.sha256()
+                for chunk_digest, _ in chunks:
+                    digest.update(self.chunk_store.get(chunk_digest))
+                ok = digest.hexdigest() == backup_info.sha256
+                detail = "checksum ok" if ok else "checksum mismatch"
+            elif backup_info.sha256:
+                if self.storage.remote:
+                    with closing(self.storage.open_reader(backup_info.filename)) as stream:
+                        actual = stream_sha256(stream)
+                elif backup_path.is_dir():
+                    actual = directory_sha256(backup_path)
+                else:
+                    actual = file_sha256(backup_path)
+                ok = actual == backup_info.sha256
+                detail = "checksum ok" if ok else "checksum mismatch"
+            else:
+                ok, detail = self._test_stream(backup_path, backup_info)
+        except (OSError, ValueError, zlib.error) as e:
+            detail = str(e)
+
+        return {
+            "filename": backup_info.filename,
+            "ok": ok,
+            "detail": detail,
+            "seconds": time.perf_counter() - start,
+            "size_bytes": backup_info.size_bytes
+        }
+
+    def restore_verify(self, filename: str, jobs: int = 1) -> Dict:
+        """
+        Prove a backup restores by loading it into a throwaway local instance.
+
+        Starts postgres (Unix socket only) or mongod (loopback only) on a
+        temporary data directory, restores with `jobs` parallel workers,
+        compares row counts with those captured at backup time, and tears
+        the instance down.
+
+        Args:
+            filename: Backup filename
+            jobs: pg_restore jobs or mongorestore insertion workers
+
+        Returns:
+            Result dict (filename, ok, detail, seconds, size_bytes, mismatches)
+        """
+        metadata = self._load_metadata(filename) or {}
+        result = {
+            "filename": filename,
+            "ok": False,
+            "detail": "",
+            "seconds": 0.0,
+            "size_bytes": metadata.get("size_bytes", 0),
+            "mismatches": {}
+        }
+
+        database = metadata.get("database_name")
+        instance = self._ephemeral_postgres if self.db_type == "postgres" else self._ephemeral_mongodb
+
+        with tempfile.TemporaryDirectory(prefix="db-verify-") as workdir:
+            try:
+                with instance(Path(workdir)) as uri:
+                    start = time.perf_counter()
+                    restored = self.restore_backup(filename, uri, jobs=jobs, no_owner=True)
+                    result["seconds"] = time.perf_counter() - start
+
+                    if not restored:
+                        result["detail"] = "restore failed"
+                        return result
+
+                    expected = metadata.get("row_counts")
+                    if expected is None:
+                        result["ok"] = True
+                        result["detail"] = "restored (no row counts captured)"
+                        return result
+
+                    scope = None if database == "all" else database
+                    actual = self._row_counts(uri, scope) or {}
+                    result["mismatches"] = {
+                        table: (count, actual.get(table))
+                        for table, count in expected.items()
+                        if actual.get(table) != count
+                    }
+                    result["ok"] = not result["mismatches"]
+                    result["detail"] = (
+                        f"{len(expected)} table(s) match" if result["ok"]
+                        else f"{len(result['mismatches'])} of {len(expected)} table(s) differ"
+                    )
+            except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+                result["detail"] = f"instance error: {e}"
+
+        return result
+
+    def _row_counts(self, uri: str, database: Optional[str] = None) -> Optional[Dict[str, int]]:
+        """Exact row/document count per table or collection."""
+        if self.db_type == "postgres":
+            result = subprocess.run(
+                ["psql", uri, "-X", "-At", "-F", "\t", "-v", "ON_ERROR_STOP=1"],
+                input=PG_ROW_COUNT_QUERY,
+                capture_output=True,
+                text=True
+            )
+            if result.returncode != 0:
+                print(f"Error counting rows: {result.stderr}")
+                return None
+            return _parse_row_counts(result.stdout)
+
+        if not MONGO_AVAILABLE:
+            print("Error: pymongo not installed (needed for document counts)")
+            return None
+
+        client = MongoClient(uri, serverSelectionTimeoutMS=10000)
+        try:
+            names = [database] if database else [
+                name for name in client.list_database_names()
+                if name not in ("admin", "config", "local")
+            ]
+            counts = {}
+            for name in names:
+                for collection in client[name].list_collection_names():
+                    if not collection.startswith("system."):
+                        # Exact scan; estimated_document_count() reads collection
+                        # metadata and can be stale after an unclean shutdown
+                        count = client[name][collection].count_documents({})
+                        counts[f"{name}.{collection}"] = count
+            return counts
+        finally:
+            client.close()
+
+    @contextmanager
+    def _ephemeral_postgres(self, workdir: Path) -> Iterator[str]:
+        """Run a throwaway PostgreSQL cluster reachable only via a Unix socket."""
+        data_dir = workdir / "data"
+        port = _free_port()
+        subprocess.run(
+            [_pg_bin("initdb"), "-D", str(data_dir), "-U", "postgres",
+             "--auth=trust", "--no-sync", "-E", "UTF8"],
+            check=True, capture_output=True
+        )
+        options = (
+            f"-p {port} -k {workdir} -c listen_addresses='' "
+            "-c fsync=off -c full_page_writes=off -c synchronous_commit=off"
+        )
+        pg_ctl = _pg_bin("pg_ctl")
+        subprocess.run(
+            [pg_ctl, "-D", str(data_dir), "-o", options, "-l", str(workdir / "server.log"),
+             "-w", "start"],
+            check=True, capture_output=True
+        )
+        try:
+            admin_uri = f"postgresql://postgres@/postgres?host={workdir}&port={port}"
+            subprocess.run(
+                ["psql", admin_uri, "-X", "-c", "CREATE DATABASE verify"],
+                check=True, capture_output=True
+            )
+            yield f"postgresql://postgres@/verify?host={workdir}&port={port}"
+        finally:
+            subprocess.run(
+                [pg_ctl, "-D", str(data_dir), "-m", "immediate", "stop"],
+                capture_output=True
+            )
+
+    @contextmanager
+    def _ephemeral_mongodb(self, workdir: Path) -> Iterator[str]:
+        """Run a throwaway mongod bound to loopback only."""
+        data_dir = workdir / "data"
+        data_dir.mkdir()
+        port = _free_port()
+        proc = subprocess.Popen(
+            ["mongod", "--dbpath", str(data_dir), "--port", str(port),
+             "--bind_ip", "127.0.0.1", "--nounixsocket",
+             "--logpath", str(workdir / "mongod.log")],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            _wait_for_port(port, proc)
+            yield f"mongodb://127.0.0.1:{port}"
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+    def _test_stream(self, backup_path: Path, backup_info: BackupInfo) -> Tuple[bool, str]:
+        """Decompress a backup without a recorded checksum to check it is intact."""
+        # mongodump --gzip archives compress inside the archive, not as a stream
+        if backup_info.codec in ("none", "zlib") or backup_path.is_dir() or (
+            backup_info.format == "archive" and backup_info.codec == "gzip"
+        ):
+            return True, "no checksum recorded"
+
+        with open(backup_path, "rb") as f:
+            result = subprocess.run(
+                decompress_command(backup_info.codec),
+                stdin=f,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+        if result.returncode != 0:
+            return False, f"{backup_info.codec} stream corrupt"
+        return True, f"{backup_info.codec} stream ok (no checksum recorded)"
+
     def _get_size(self, path: Path) -> int:
         """Get total size of file or directory."""
         if path.is_file():
@@ -403,7 +2512,8 @@ class BackupManager:
             return total
         return 0
 
-    def _format_size(self, size_bytes: int) -> str:
+    @staticmethod
+    def _format_size(size_bytes: int) -> str:
         """Format size in human-readable format."""
         for unit in ["B", "KB", "MB", "GB", "TB"]:
             if size_bytes < 1024:
@@ -411,8 +2521,111 @@ class BackupManager:
             size_bytes /= 1024
         return f"{size_bytes:.2f} PB"
 
+    def benchmark(self, uri: str, database: Optional[str] = None) -> List[Dict]:
+        """
+        Time a backup in each supported format and report throughput.
+
+        Throughput is the uncompressed source size divided by wall time
+        (pg_database_size for PostgreSQL, dbStats dataSize for MongoDB), so
+        formats and engines are comparable regardless of compression ratio.
+        Benchmark backups are removed afterwards.
+
+        Args:
+            uri: Database connection string
+            database: Database name (required for PostgreSQL)
+
+        Returns:
+            List of result dicts (format, jobs, seconds, size_bytes, mb_per_sec)
+        """
+        source_bytes = self._database_size(uri, database)
+        if not source_bytes:
+            print("Error: Could not read the source database size (needed for MB/s)")
+            return []
+        results = []
+
+        for label, codec, jobs in BENCHMARK_FORMATS.get(self.db_type, []):
+            start = time.perf_counter()
+            backup_info = self.create_backup(
+                uri, database, compress=codec != "none", verify=False,
+                jobs=jobs, compression=codec
+            )
+            elapsed = time.perf_counter() - start
+
+            if not backup_info:
+                print(f"✗ {label}: backup failed")
+                continue
+
+            megabytes = source_bytes / (1024 * 1024)
+            results.append({
+                "format": label,
+                "jobs": jobs,
+                "seconds": round(elapsed, 2),
+                "size_bytes": backup_info.size_bytes,
+                "mb_per_sec": round(megabytes / elapsed, 2) if elapsed > 0 else 0.0
+            })
+            self._remove_backup(backup_info.filename)
+
+        return results
+
+    def _database_size(self, uri: str, database: Optional[str] = None) -> Optional[int]:
+        """Get the uncompressed database size in bytes, or None if unavailable."""
+        if self.db_type == "mongodb":
+            if not MONGO_AVAILABLE:
+                return None
+            try:
+                client = MongoClient(uri, serverSelectionTimeoutMS=10000)
+                try:
+                    names = [database] if database else [
+                        name for name in client.list_database_names()
+                        if name not in ("admin", "config", "local")
+                    ]
+                    # dataSize is the uncompressed BSON size (storageSize is compressed)
+                    return sum(int(client[name].command("dbStats")["dataSize"]) for name in names)
+                finally:
+                    client.close()
+            except Exception:
+                return None
+
+        if self.db_type != "postgres":
+            return None
+
+        try:
+            result = subprocess.run(
+                ["psql", uri, "-Atc", "SELECT pg_database_size(current_database())"],
+                capture_output=True,
+                text=True
+            )
+            return int(result.stdout.strip()) if result.returncode == 0 else None
+        except (OSError, ValueError):
+            return None
+
+    def _remove_backup(self, filename: str):
+        """Remove a backup file or directory and its metadata."""
+        backup_path = self.backup_dir / filename
+        if self.storage.remote:
+            self.storage.delete(filename)
+        elif backup_path.is_dir():
+            shutil.rmtree(backup_path)
+        elif backup_path.exists():
+            backup_path.unlink()
+
+        metadata_path = self.backup_dir / f"{filename}.json"
+        if metadata_path.exists():
+            metadata_path.unlink()
+
+        self.catalog.remove(filename)
+
+    def _load_metadata(self, filename: str) -> Optional[Dict]:
+        """Load backup metadata saved alongside a backup, if present."""
+        metadata_path = self.backup_dir / f"{filename}.json"
+        if not metadata_path.exists():
+            return None
+
+        with open(metadata_path) as f:
+            return json.load(f)
+
     def _save_metadata(self, backup_info: BackupInfo):
-        """Save backup metadata to JSON file."""
+        """Save backup metadata to JSON file and index it in the catalog."""
         metadata_path = self.backup_dir / f"{backup_info.filename}.json"
 
         metadata = {
@@ -422,20 +2635,161 @@ class BackupManager:
             "timestamp": backup_info.timestamp.isoformat(),
             "size_bytes": backup_info.size_bytes,
             "compressed": backup_info.compressed,
-            "verified": backup_info.verified
+            "verified": backup_info.verified,
+            "format": backup_info.format,
+            "codec": backup_info.codec,
+            "sha256": backup_info.sha256
         }
+        if backup_info.row_counts is not None:
+            metadata["row_counts"] = backup_info.row_counts
 
         with open(metadata_path, "w") as f:
             json.dump(metadata, f, indent=2)
 
+        self.catalog.upsert(backup_info)
+
+
+class FleetRunner:
+    """Back up many databases concurrently under global and per-host caps."""
+
+    def __init__(
+        self,
+        config: Dict[str, Any],
+        backup_dir: str = "./backups",
+        max_concurrent: Optional[int] = None,
+        per_host: Optional[int] = None,
+        bandwidth: Optional[float] = None
+    ):
+        """
+        Initialize fleet runner.
+
+        Args:
+            config: Fleet config with a "targets" list; each target has
+                name, db, uri and optional database, host, jobs,
+                compression, dedup and capture_counts
+            backup_dir: Base directory; each target gets a subdirectory
+            max_concurrent: Global concurrent backups (overrides config)
+            per_host: Concurrent backups per host (overrides config)
+            bandwidth: Total write bytes/s across all backups (overrides config)
+        """
+        self.targets = config.get("targets", [])
+        self.backup_dir = Path(backup_dir)
+        self.max_concurrent = max_concurrent or config.get("max_concurrent", 4)
+        self.per_host = per_host or config.get("per_host", 1)
+
+        if bandwidth is None and config.get("bandwidth_limit"):
+            bandwidth = parse_rate(str(config["bandwidth_limit"]))
+        self.throttle = TokenBucket(bandwidth) if bandwidth else None
+
+    def _host(self, target: Dict[str, Any]) -> str:
+        """Host a target runs on, used for the per-host cap."""
+        return target.get("host") or urlparse(target["uri"]).hostname or "localhost"
+
+    def run(self) -> List[Dict[str, Any]]:
+        """
+        Run all target backups.
+
+        Targets are submitted to the pool only when their host has a free
+        slot, so a target waiting on a busy host never holds a worker.
+
+        Returns:
+            Result dict per target (name, host, ok, seconds, size_bytes,
+            mb_per_sec, filename, error), in config order
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(self.targets)
+        waiting = list(range(len(self.targets)))
+        active: Dict[str, int] = {}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent) as executor:
+            while waiting or running:
+                for index in list(waiting):
+                    if len(running) >= self.max_concurrent:
+                        break
+                    host = self._host(self.targets[index])
+                    if active.get(host, 0) < self.per_host:
+                        waiting.remove(index)
+                        active[host] = active.get(host, 0) + 1
+                        future = executor.submit(self._backup_target, self.targets[index])
+                        running[future] = (index, host)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, host = running.pop(future)
+                    active[host] -= 1
+                    results[index] = future.result()
+
+        return results
+
+    def _backup_target(self, target: Dict[str, Any]) -> Dict[str, Any]:
+        """Back up one target; the caller enforces the per-host cap."""
+        host = self._host(target)
+        result = {
+            "name": target["name"],
+            "host": host,
+            "ok": False,
+            "seconds": 0.0,
+            "size_bytes": 0,
+            "mb_per_sec": 0.0,
+            "filename": None,
+            "error": None
+        }
+
+        jobs = target.get("jobs", 1)
+        if (self.throttle and jobs > 1 and target["db"].lower() == "postgres"
+                and not target.get("dedup")):
+            # Directory-format pg_dump writes its own files, bypassing the throttle
+            print(f"Warning: {target['name']}: bandwidth limit set, "
+                  f"dumping with 1 job instead of {jobs}")
+            jobs = 1
+
+        start = time.perf_counter()
+        try:
+            manager = BackupManager(target["db"], str(self.backup_dir / target["name"]))
+            manager.set_throttle(self.throttle)
+            backup_info = manager.create_backup(
+                target["uri"],
+                target.get("database"),
+                compress=target.get("compression", "gzip") != "none",
+                jobs=jobs,
+                compression=target.get("compression", "gzip"),
+                dedup=target.get("dedup", False),
+                capture_counts=target.get("capture_counts", False)
+            )
+        except Exception as e:
+            backup_info = None
+            result["error"] = str(e)
+        result["seconds"] = time.perf_counter() - start
+
+        if backup_info:
+            result["ok"] = True
+            result["filename"] = backup_info.filename
+            result["size_bytes"] = backup_info.size_bytes
+            if result["seconds"] > 0:
+                result["mb_per_sec"] = backup_info.size_bytes / (1024 * 1024) / result["seconds"]
+        elif not result["error"]:
+            result["error"] = "backup failed"
+
+        return result
+
 
 def main():
     """Main entry point."""
     parser = argparse.ArgumentParser(description="Database backup tool")
-    parser.add_argument("--db", required=True, choices=["mongodb", "postgres"],
-                       help="Database type")
+    parser.add_argument("--db", choices=["mongodb", "postgres"],
+                       help="Database type (required except for fleet)")
     parser.add_argument("--backup-dir", default="./backups",
                        help="Backup directory")
+    parser.add_argument("--storage",
+                       help="Store backup data remotely, e.g. s3://bucket/prefix "
+                            "(metadata and catalog stay in --backup-dir)")
+    parser.add_argument("--s3-endpoint",
+                       help="Endpoint URL for S3-compatible storage (e.g. MinIO)")
+    parser.add_argument("--part-size", default="16M",
+                       help="Initial S3 multipart part size, 5M-5G; doubles every "
+                            "1000 parts (default: 16M)")
+    parser.add_argument("--upload-concurrency", type=int, default=4,
+                       help="Concurrent part uploads per backup (default: 4)")
 
     subparsers = parser.add_subparsers(dest="command", required=True)
 
@@ -445,8 +2799,19 @@ def main():
     backup_parser.add_argument("--database", help="Database name")
     backup_parser.add_argument("--no-compress", action="store_true",
                               help="Disable compression")
+    backup_parser.add_argument("--compression", default="gzip", choices=list(CODECS),
+                              help="Compression codec; pigz and zstd are multi-threaded (default: gzip)")
+    backup_parser.add_argument("--compression-level", type=int,
+                              help="Compression level (default: codec default)")
+    backup_parser.add_argument("--dedup", action="store_true",
+                              help="Store in the deduplicated chunk store (only new chunks are written)")
+    backup_parser.add_argument("--capture-counts", action="store_true",
+                              help="Record per-table row counts for verify --restore")
     backup_parser.add_argument("--no-verify", action="store_true",
                               help="Skip verification")
+    backup_parser.add_argument("-j", "--jobs", type=int, default=1,
+                              help="Parallel dump jobs: pg_dump directory format when >1, "
+                                   "or mongodump collections (default: 1)")
 
     # Restore command
     restore_parser = subparsers.add_parser("restore", help="Restore backup")
@@ -454,49 +2819,213 @@ def main():
     restore_parser.add_argument("--uri", required=True, help="Database connection string")
     restore_parser.add_argument("--dry-run", action="store_true",
                                help="Show what would be done")
+    restore_parser.add_argument("--table", action="append", dest="tables",
+                               help="Restore only this table (schema.table; repeatable)")
+    restore_parser.add_argument("--schema", action="append", dest="schemas",
+                               help="Restore only this schema (repeatable)")
+    restore_parser.add_argument("--no-owner", action="store_true",
+                               help="Skip ownership and privileges (directory-format PostgreSQL)")
+    restore_parser.add_argument("-j", "--jobs", type=int, default=1,
+                               help="Parallel pg_restore jobs or mongorestore insertion "
+                                    "workers per collection (default: 1)")
 
     # List command
-    subparsers.add_parser("list", help="List backups")
+    list_parser = subparsers.add_parser("list", help="List backups")
+    list_parser.add_argument("--database", help="Only backups of this database")
+
+    # Reindex command
+    subparsers.add_parser("reindex", help="Rebuild the catalog from metadata files")
+
+    # Fleet command
+    fleet_parser = subparsers.add_parser("fleet", help="Back up all targets in a fleet config")
+    fleet_parser.add_argument("config", help="Fleet config JSON file")
+    fleet_parser.add_argument("--max-concurrent", type=int,
+                             help="Global concurrent backups (default: config or 4)")
+    fleet_parser.add_argument("--per-host", type=int,
+                             help="Concurrent backups per host (default: config or 1)")
+    fleet_parser.add_argument("--bandwidth",
+                             help="Total write bandwidth limit, e.g. 200M (default: config or none)")
+    fleet_parser.add_argument("--report", help="Write the consolidated report as JSON")
+
+    # Verify command
+    verify_parser = subparsers.add_parser("verify", help="Re-validate backup checksums")
+    verify_parser.add_argument("filenames", nargs="*", help="Backups to verify (default: all)")
+    verify_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                              help="Parallel checks, or restore workers with --restore (default: CPU count)")
+    verify_parser.add_argument("--restore", action="store_true",
+                              help="Test-restore into a throwaway local instance (default: latest backup)")
+
+    # Benchmark command
+    benchmark_parser = subparsers.add_parser("benchmark", help="Compare backup format throughput")
+    benchmark_parser.add_argument("--uri", required=True, help="Database connection string")
+    benchmark_parser.add_argument("--database", help="Database name")
 
     # Cleanup command
     cleanup_parser = subparsers.add_parser("cleanup", help="Remove old backups")
     cleanup_parser.add_argument("--retention-days", type=int, default=7,
                                help="Days to retain backups (default: 7)")
+    cleanup_parser.add_argument("--keep-hourly", type=int, default=0,
+                               help="GFS: hourly backups to keep per database")
+    cleanup_parser.add_argument("--keep-daily", type=int, default=0,
+                               help="GFS: daily backups to keep per database")
+    cleanup_parser.add_argument("--keep-weekly", type=int, default=0,
+                               help="GFS: weekly backups to keep per database")
+    cleanup_parser.add_argument("--keep-monthly", type=int, default=0,
+                               help="GFS: monthly backups to keep per database "
+                                    "(any --keep-* replaces --retention-days)")
     cleanup_parser.add_argument("--dry-run", action="store_true",
                                help="Show what would be removed")
 
     args = parser.parse_args()
 
-    manager = BackupManager(args.db, args.backup_dir)
+    if args.command == "fleet":
+        with open(args.config) as f:
+            config = json.load(f)
+        for target in config.get("targets", []):
+            target.setdefault("db", args.db)
+        missing = [t.get("name", "?") for t in config.get("targets", []) if not t.get("db")]
+        if missing:
+            parser.error(f"targets without a db type: {', '.join(missing)}")
+
+        runner = FleetRunner(
+            config,
+            args.backup_dir,
+            args.max_concurrent,
+            args.per_host,
+            parse_rate(args.bandwidth) if args.bandwidth else None
+        )
+        start = time.perf_counter()
+        results = runner.run()
+        elapsed = time.perf_counter() - start
+
+        print(f"\n{'Target':<24} {'Host':<20} {'Status':<6} {'Time':>9} {'Size':>12} {'MB/s':>8}")
+        for r in results:
+            status = "✓" if r["ok"] else "✗"
+            print(f"{r['name']:<24} {r['host']:<20} {status:<6} {r['seconds']:>8.1f}s "
+                  f"{BackupManager._format_size(r['size_bytes']):>12} {r['mb_per_sec']:>8.1f}")
+            if r["error"]:
+                print(f"    {r['error']}")
+
+        failed = sum(1 for r in results if not r["ok"])
+        total = sum(r["size_bytes"] for r in results)
+        print(f"\n{len(results) - failed}/{len(results)} succeeded, "
+              f"{BackupManager._format_size(total)} in {elapsed:.1f}s")
+
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump({"elapsed_seconds": elapsed, "targets": results}, f, indent=2)
+
+        sys.exit(1 if failed else 0)
+
+    if not args.db:
+        parser.error("--db is required")
+
+    storage = None
+    if args.storage:
+        part_size = int(parse_rate(args.part_size))
+        if not S3_MIN_PART_SIZE <= part_size <= S3_MAX_PART_SIZE:
+            parser.error("--part-size must be between 5M and 5G")
+        try:
+            storage = S3Storage(
+                args.storage, args.s3_endpoint, part_size, args.upload_concurrency
+            )
+        except (ValueError, RuntimeError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+    manager = BackupManager(args.db, args.backup_dir, storage)
 
     if args.command == "backup":
         backup_info = manager.create_backup(
             args.uri,
             args.database,
             compress=not args.no_compress,
-            verify=not args.no_verify
+            verify=not args.no_verify,
+            jobs=args.jobs,
+            compression=args.compression,
+            compression_level=args.compression_level,
+            dedup=args.dedup,
+            capture_counts=args.capture_counts
         )
         sys.exit(0 if backup_info else 1)
 
     elif args.command == "restore":
-        success = manager.restore_backup(args.filename, args.uri, args.dry_run)
+        success = manager.restore_backup(
+            args.filename, args.uri, args.dry_run, args.jobs, args.no_owner,
+            args.tables, args.schemas
+        )
         sys.exit(0 if success else 1)
 
     elif args.command == "list":
-        backups = manager.list_backups()
+        backups = manager.list_backups(args.database)
         print(f"Total backups: {len(backups)}\n")
         for backup in backups:
             verified_str = "✓" if backup.verified else "?"
             print(f"[{verified_str}] {backup.filename}")
             print(f"    Database: {backup.database_name}")
             print(f"    Created: {backup.timestamp}")
+            print(f"    Format: {backup.format} ({backup.codec})")
             print(f"    Size: {manager._format_size(backup.size_bytes)}")
             print()
 
+    elif args.command == "verify" and args.restore:
+        filenames = args.filenames
+        if not filenames:
+            backups = sorted(manager.list_backups(), key=lambda b: b.timestamp)
+            filenames = [backups[-1].filename] if backups else []
+
+        failed = 0
+        for filename in filenames:
+            print(f"Test-restoring {filename}...")
+            r = manager.restore_verify(filename, args.jobs)
+            status = "✓" if r["ok"] else "✗"
+            rate = r["size_bytes"] / (1024 * 1024) / r["seconds"] if r["seconds"] > 0 else 0
+            print(f"{status} {filename}: {r['detail']} "
+                  f"(restored in {r['seconds']:.1f}s, {rate:.1f} MB/s)")
+            for table, (expected, actual) in sorted(r["mismatches"].items()):
+                print(f"    {table}: expected {expected}, got {actual}")
+            failed += 0 if r["ok"] else 1
+
+        sys.exit(1 if failed or not filenames else 0)
+
+    elif args.command == "verify":
+        start = time.perf_counter()
+        results = manager.verify_backups(args.filenames, args.jobs)
+        elapsed = time.perf_counter() - start
+
+        for r in results:
+            status = "✓" if r["ok"] else "✗"
+            rate = r["size_bytes"] / (1024 * 1024) / r["seconds"] if r["seconds"] > 0 else 0
+            print(f"{status} {r['filename']}: {r['detail']} ({rate:.1f} MB/s)")
+
+        failed = sum(1 for r in results if not r["ok"])
+        total = sum(r["size_bytes"] for r in results)
+        rate = total / (1024 * 1024) / elapsed if elapsed > 0 else 0
+        print(f"\nVerified {len(results)} backup(s), {failed} failed "
+              f"({manager._format_size(total)} at {rate:.1f} MB/s)")
+        sys.exit(1 if failed or not results else 0)
+
+    elif args.command == "benchmark":
+        results = manager.benchmark(args.uri, args.database)
+        if not results:
+            sys.exit(1)
+        print(f"\n{'Format':<12} {'Jobs':>4} {'Time':>9} {'Size':>12} {'MB/s':>9}")
+        for r in results:
+            print(f"{r['format']:<12} {r['jobs']:>4} {r['seconds']:>8.2f}s "
+                  f"{manager._format_size(r['size_bytes']):>12} {r['mb_per_sec']:>9.2f}")
+
     elif args.command == "cleanup":
-        removed = manager.cleanup_old_backups(args.retention_days, args.dry_run)
+        keep = (args.keep_hourly, args.keep_daily, args.keep_weekly, args.keep_monthly)
+        if any(keep):
+            removed = manager.apply_retention(*keep, dry_run=args.dry_run)
+        else:
+            removed = manager.cleanup_old_backups(args.retention_days, args.dry_run)
         print(f"Removed {removed} backup(s)")
 
+    elif args.command == "reindex":
+        indexed = manager.rebuild_catalog()
+        print(f"Indexed {indexed} backup(s)")
+
 
 if __name__ == "__main__":
     main()
@@ -5,13 +5,19 @@ Generates and applies schema migrations with rollback support.
 """
 
 import argparse
+import hashlib
 import json
 import os
+import re
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 try:
     from pymongo import MongoClient
@@ -22,11 +28,502 @@ except ImportError:
 try:
     import psycopg2
     from psycopg2 import sql
+    from psycopg2.extras import execute_values
     POSTGRES_AVAILABLE = True
 except ImportError:
     POSTGRES_AVAILABLE = False
 
 
+# pg_advisory_lock class key shared by every deployer running migrations;
+# the second key is a hash of the schema, so each schema locks separately
+MIGRATION_LOCK_KEY = 724_658_011
+
+# Defaults for online steps; a step's own keys override them
+ONLINE_DEFAULTS = {
+    "lock_timeout": "2s",
+    "statement_timeout": "0",
+    "retries": 5,
+    "retry_delay": 1.0,
+}
+
+# Cached index of migration files, refreshed by mtime and size
+MANIFEST_NAME = ".manifest.json"
+
+# SQLSTATE lock_not_available, raised when lock_timeout expires
+LOCK_NOT_AVAILABLE = "55P03"
+
+# Index name (and table schema) of a CREATE INDEX CONCURRENTLY statement
+CONCURRENT_INDEX = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?'
+    r'("[^"]+"|\w+)\s+ON\s+(?:ONLY\s+)?((?:"[^"]+"|\w+)\.)?',
+    re.IGNORECASE
+)
+
+# Catalog snapshot: one query per object type across all user schemas.
+# Partitions are left out; they are data layout, not schema to diff.
+SNAPSHOT_FILTER = """
+    n.nspname NOT IN ('pg_catalog', 'information_schema')
+    AND n.nspname NOT LIKE 'pg_toast%'
+    AND NOT t.relispartition
+    AND NOT (t.relname = 'migrations' AND n.nspname = current_schema())
+"""
+
+SNAPSHOT_QUERIES = {
+    "columns": f"""
+        SELECT n.nspname || '.' || t.relname, a.attname,
+               format_type(a.atttypid, a.atttypmod), NOT a.attnotnull,
+               pg_get_expr(d.adbin, d.adrelid)
+        FROM pg_attribute a
+        JOIN pg_class t ON t.oid = a.attrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE t.relkind IN ('r', 'p') AND a.attnum > 0 AND NOT a.attisdropped
+          AND {SNAPSHOT_FILTER}
+        ORDER BY 1, a.attnum
+    """,
+    "indexes": f"""
+        SELECT n.nspname || '.' || t.relname, i.relname, pg_get_indexdef(i.oid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        JOIN pg_class t ON t.oid = x.indrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        WHERE t.relkind IN ('r', 'p') AND {SNAPSHOT_FILTER}
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = x.indexrelid
+                          AND k.conrelid = x.indrelid AND k.contype IN ('p', 'u', 'x'))
+    """,
+    "constraints": f"""
+        SELECT n.nspname || '.' || t.relname, k.conname, k.contype,
+               pg_get_constraintdef(k.oid)
+        FROM pg_constraint k
+        JOIN pg_class t ON t.oid = k.conrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        WHERE k.contype IN ('p', 'u', 'c', 'f', 'x') AND {SNAPSHOT_FILTER}
+    """,
+}
+
+# Order constraints are added in: keys before checks, foreign keys last
+CONSTRAINT_ORDER = "pucxf"
+
+SERIAL_TYPES = {"smallint": "smallserial", "integer": "serial", "bigint": "bigserial"}
+
+
+def split_statements(script: str) -> List[str]:
+    """
+    Split a SQL script into statements on top-level semicolons.
+
+    Semicolons inside quotes, dollar-quoted bodies and comments are
+    ignored; comment-only fragments are dropped.
+    """
+    statements = []
+    start = 0
+    has_code = False
+    i = 0
+    n = len(script)
+
+    while i < n:
+        c = script[i]
+        if script.startswith("--", i):
+            end = script.find("\n", i)
+            i = n if end < 0 else end + 1
+            continue
+        if script.startswith("/*", i):
+            end = script.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+
+        if c == ";":
+            if has_code:
+                statements.append(script[start:i].strip())
+            start = i + 1
+            has_code = False
+            i += 1
+            continue
+
+        if not c.isspace():
+            has_code = True
+
+        if c in ("'", '"'):
+            i += 1
+            while i < n:
+                if script[i] == c:
+                    if script[i + 1:i + 2] == c:  # doubled quote escape
+                        i += 2
+                        continue
+                    break
+                i += 1
+            i += 1
+        elif c == "$":
+            tag = re.match(r"\$[A-Za-z_]?[A-Za-z_0-9]*\$", script[i:])
+            if tag:
+                end = script.find(tag.group(0), i + len(tag.group(0)))
+                i = n if end < 0 else end + len(tag.group(0))
+            else:
+                i += 1
+        else:
+            i += 1
+
+    if has_code:
+        statements.append(script[start:].strip())
+    return statements
+
+
+# Dry-run planner cost model: rough sustained rates on typical hardware
+PLAN_RATES = {
+    "scan": 200 * 1024 * 1024,          # bytes/s read for validation scans
+    "index build": 40 * 1024 * 1024,    # bytes/s of heap indexed
+    "rewrite": 60 * 1024 * 1024,        # bytes/s of heap + indexes rewritten
+    "dml": 50_000,                      # rows/s updated or deleted
+}
+
+# Tables above this size are flagged when rewritten or scanned under a blocking lock
+LARGE_TABLE_BYTES = 1024 ** 3
+
+# What each lock level blocks for other sessions
+LOCK_BLOCKS = {
+    "ACCESS EXCLUSIVE": "reads and writes",
+    "EXCLUSIVE": "writes",
+    "SHARE ROW EXCLUSIVE": "writes",
+    "SHARE": "writes",
+    "SHARE UPDATE EXCLUSIVE": "DDL and VACUUM",
+    "ROW EXCLUSIVE": "conflicting DDL",
+}
+
+NAME = r'((?:"[^"]+"|[\w$]+)(?:\.(?:"[^"]+"|[\w$]+))?)'
+VOLATILE_DEFAULT = re.compile(
+    r"DEFAULT\s+(?:random|gen_random_uuid|uuid_generate_v[14]|clock_timestamp|timeofday|nextval)\s*\(",
+    re.I
+)
+
+
+def classify_statement(statement: str) -> Dict[str, Any]:
+    """
+    Classify a SQL statement's lock level and cost driver.
+
+    Returns:
+        Dict with table (or None), lock (or None), operation (one of
+        metadata, scan, index build, rewrite, dml, none) and notes
+    """
+    text = " ".join(statement.split())
+    upper = text.upper()
+    result = {"table": None, "lock": None, "operation": "none", "notes": []}
+
+    def match(pattern: str) -> Optional[str]:
+        m = re.match(pattern, text, re.I)
+        return m.group(m.lastindex) if m else None
+
+    table = match(rf"CREATE (?:UNIQUE )?INDEX (CONCURRENTLY )?(?:IF NOT EXISTS )?(?:\S+ )?ON (?:ONLY )?{NAME}")
+    if table:
+        concurrent = " CONCURRENTLY " in f" {upper} "
+        result.update(table=table, operation="index build",
+                      lock="SHARE UPDATE EXCLUSIVE" if concurrent else "SHARE")
+        if concurrent:
+            result["notes"].append("two table scans; cannot run in a transaction")
+        return result
+
+    table = match(rf"ALTER TABLE (?:IF EXISTS )?(?:ONLY )?{NAME}")
+    if table:
+        result.update(table=table, lock="ACCESS EXCLUSIVE", operation="metadata")
+        rewrite = (
+            re.search(r"ALTER COLUMN \S+ (?:SET DATA )?TYPE ", upper)
+            or re.search(r"SET TABLESPACE|SET (?:UN)?LOGGED|GENERATED ALWAYS AS .* STORED", upper)
+            or (" ADD " in upper and VOLATILE_DEFAULT.search(text))
+        )
+        if rewrite:
+            result["operation"] = "rewrite"
+            if "TYPE " in upper:
+                result["notes"].append("binary-compatible type changes skip the rewrite")
+        elif re.search(r"ADD (?:CONSTRAINT \S+ )?(?:PRIMARY KEY|UNIQUE)\b", upper) \
+                and "USING INDEX" not in upper:
+            result["operation"] = "index build"
+        elif "NOT VALID" in upper:
+            result["notes"].append("NOT VALID: run VALIDATE CONSTRAINT separately")
+        elif re.search(r"ADD (?:CONSTRAINT \S+ )?FOREIGN KEY", upper):
+            result.update(operation="scan", lock="SHARE ROW EXCLUSIVE")
+            result["notes"].append("add NOT VALID, then VALIDATE CONSTRAINT, to avoid blocking writes")
+        elif re.search(r"ADD (?:CONSTRAINT \S+ )?CHECK|SET NOT NULL", upper):
+            result["operation"] = "scan"
+            result["notes"].append("full scan under ACCESS EXCLUSIVE")
+        elif re.search(r"VALIDATE CONSTRAINT", upper):
+            result.update(operation="scan", lock="SHARE UPDATE EXCLUSIVE")
+        return result
+
+    table = match(rf"(?:UPDATE (?:ONLY )?|DELETE FROM (?:ONLY )?){NAME}")
+    if table:
+        result.update(table=table, lock="ROW EXCLUSIVE", operation="dml")
+        return result
+
+    table = match(rf"INSERT INTO {NAME}")
+    if table:
+        result.update(table=table, lock="ROW EXCLUSIVE",
+                      operation="dml" if " SELECT " in f" {upper} " else "none")
+        return result
+
+    table = match(rf"(?:VACUUM FULL|CLUSTER) {NAME}")
+    if table:
+        result.update(table=table, lock="ACCESS EXCLUSIVE", operation="rewrite")
+        return result
+
+    table = match(rf"REFRESH MATERIALIZED VIEW (CONCURRENTLY )?{NAME}")
+    if table:
+        concurrent = "CONCURRENTLY" in upper
+        result.update(table=table, operation="rewrite",
+                      lock="EXCLUSIVE" if concurrent else "ACCESS EXCLUSIVE")
+        return result
+
+    table = match(rf"(?:DROP TABLE (?:IF EXISTS )?|TRUNCATE (?:TABLE )?){NAME}")
+    if table:
+        result.update(table=table, lock="ACCESS EXCLUSIVE", operation="metadata")
+        return result
+
+    if re.match(r"DROP INDEX CONCURRENTLY", upper):
+        result["lock"] = "SHARE UPDATE EXCLUSIVE"
+    elif re.match(r"DROP INDEX", upper):
+        result["lock"] = "ACCESS EXCLUSIVE"
+        result["notes"].append("locks the indexed table; use DROP INDEX CONCURRENTLY")
+    return result
+
+
+def quote_ident(name: str) -> str:
+    """Quote a (possibly schema-qualified) identifier if needed."""
+    parts = []
+    for part in name.split(".", 1):
+        if re.fullmatch(r"[a-z_][a-z0-9_$]*", part):
+            parts.append(part)
+        else:
+            parts.append('"' + part.replace('"', '""') + '"')
+    return ".".join(parts)
+
+
+def _fk_target(definition: str, table: str, candidates: Set[str]) -> Optional[str]:
+    """
+    Snapshot name of the table a foreign key references, if in candidates.
+
+    pg_get_constraintdef only schema-qualifies the target when it is not on
+    the search_path, so unqualified names are tried in the referencing
+    table's schema and then in public.
+    """
+    match = re.search(r'REFERENCES\s+((?:"(?:[^"]|"")*"|[^\s(."]+)(?:\.(?:"(?:[^"]|"")*"|[^\s(."]+))?)',
+                      definition)
+    if not match:
+        return None
+    parts = [
+        part[1:-1].replace('""', '"') if part.startswith('"') else part
+        for part in re.findall(r'"(?:[^"]|"")*"|[^."]+', match.group(1))
+    ]
+    if len(parts) == 2:
+        names = [".".join(parts)]
+    else:
+        names = [f"{table.split('.', 1)[0]}.{parts[0]}", f"public.{parts[0]}"]
+    return next((name for name in names if name in candidates), None)
+
+
+def _drop_order(tables: Dict[str, Any], dropped: Set[str]) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """
+    Order tables for DROP TABLE so referencing tables go first.
+
+    Returns:
+        Tuple of (tables in drop order, (table, constraint) foreign keys to
+        drop beforehand to break reference cycles)
+    """
+    refs = {table: set() for table in dropped}
+    fks = {table: [] for table in dropped}
+    for table in dropped:
+        for name, con in sorted(tables[table].get("constraints", {}).items()):
+            target = _fk_target(con["definition"], table, dropped) if con["type"] == "f" else None
+            if target and target != table:
+                refs[table].add(target)
+                fks[table].append((name, target))
+
+    order: List[str] = []
+    remaining = set(dropped)
+    while remaining:
+        referenced = {target for table in remaining for target in refs[table]}
+        free = sorted(remaining - referenced, reverse=True)
+        if not free:
+            break
+        order.extend(free)
+        remaining -= set(free)
+
+    cycle_fks = [
+        (table, name)
+        for table in sorted(remaining)
+        for name, target in fks[table]
+        if target in remaining
+    ]
+    return order + sorted(remaining, reverse=True), cycle_fks
+
+
+def _column_sql(name: str, column: Dict[str, Any], create: bool = False) -> str:
+    """Column definition for CREATE TABLE or ADD COLUMN."""
+    col_type, default = column["type"], column.get("default")
+    if create and default and default.startswith("nextval(") and col_type in SERIAL_TYPES:
+        # The sequence does not exist yet; serial creates and owns it
+        col_type, default = SERIAL_TYPES[col_type], None
+    definition = f"{quote_ident(name)} {col_type}"
+    if default:
+        definition += f" DEFAULT {default}"
+    if not column.get("nullable", True):
+        definition += " NOT NULL"
+    return definition
+
+
+def diff_postgres_schema(current: Dict[str, Any], desired: Dict[str, Any]) -> List[str]:
+    """
+    Compute ordered statements that turn one schema snapshot into another.
+
+    Dependent objects are dropped before what they depend on and created
+    after it: constraints and indexes are dropped first, tables and
+    columns added next, then indexes, constraints (foreign keys last),
+    and finally columns and tables are dropped, referencing tables
+    before the tables they reference. Column changes for a table are
+    combined into one ALTER TABLE.
+
+    Args:
+        current: Snapshot of the existing schema
+        desired: Snapshot of the target schema
+
+    Returns:
+        List of SQL statements (without trailing semicolons)
+    """
+    have, want = current.get("tables", {}), desired.get("tables", {})
+    kept = sorted(set(have) & set(want))
+    phases = {name: [] for name in (
+        "drop_fk", "drop_constraint", "drop_index", "create_table", "alter_table",
+        "create_index", "add_constraint", "drop_column", "drop_table"
+    )}
+
+    def same(a: Any, b: Any) -> bool:
+        if isinstance(a, str) and isinstance(b, str):
+            return " ".join(a.split()) == " ".join(b.split())
+        return a == b
+
+    for table in kept:
+        old_cons = have[table].get("constraints", {})
+        new_cons = want[table].get("constraints", {})
+        for name, con in sorted(old_cons.items()):
+            if name not in new_cons or not same(con, new_cons[name]):
+                phase = "drop_fk" if con["type"] == "f" else "drop_constraint"
+                phases[phase].append(
+                    f"ALTER TABLE {quote_ident(table)} DROP CONSTRAINT {quote_ident(name)}"
+                )
+
+        new_indexes = want[table].get("indexes", {})
+        schema = table.split(".", 1)[0] + "." if "." in table else ""
+        for name, definition in sorted(have[table].get("indexes", {}).items()):
+            if name not in new_indexes or not same(definition, new_indexes[name]):
+                phases["drop_index"].append(f"DROP INDEX {quote_ident(schema + name)}")
+
+    for table in sorted(set(want) - set(have)):
+        columns = ",\n    ".join(
+            _column_sql(name, column, create=True)
+            for name, column in want[table].get("columns", {}).items()
+        )
+        phases["create_table"].append(f"CREATE TABLE {quote_ident(table)} (\n    {columns}\n)")
+
+    for table in kept:
+        old_cols = have[table].get("columns", {})
+        new_cols = want[table].get("columns", {})
+        actions = []
+        for name, column in new_cols.items():
+            if name not in old_cols:
+                actions.append(f"ADD COLUMN {_column_sql(name, column)}")
+                continue
+            old, col = old_cols[name], quote_ident(name)
+            if not same(old["type"], column["type"]):
+                actions.append(f"ALTER COLUMN {col} TYPE {column['type']}")
+            if not same(old.get("default"), column.get("default")):
+                actions.append(f"ALTER COLUMN {col} SET DEFAULT {column['default']}"
+                               if column.get("default") else f"ALTER COLUMN {col} DROP DEFAULT")
+            if old.get("nullable", True) != column.get("nullable", True):
+                actions.append(f"ALTER COLUMN {col} "
+                               f"{'DROP' if column.get('nullable', True) else 'SET'} NOT NULL")
+        if actions:
+            phases["alter_table"].append(
+                f"ALTER TABLE {quote_ident(table)}\n    " + ",\n    ".join(actions)
+            )
+
+        dropped = [name for name in old_cols if name not in new_cols]
+        if dropped:
+            phases["drop_column"].append(
+                f"ALTER TABLE {quote_ident(table)}\n    "
+                + ",\n    ".join(f"DROP COLUMN {quote_ident(name)}" for name in dropped)
+            )
+
+    additions = []
+    for table in sorted(want):
+        old = have.get(table, {})
+        for name, definition in sorted(want[table].get("indexes", {}).items()):
+            if not same(definition, old.get("indexes", {}).get(name)):
+                phases["create_index"].append(definition)
+        for name, con in sorted(want[table].get("constraints", {}).items()):
+            if not same(con, old.get("constraints", {}).get(name)):
+                additions.append((CONSTRAINT_ORDER.index(con["type"]), table, name, con))
+
+    for _, table, name, con in sorted(additions, key=lambda a: a[:3]):
+        phases["add_constraint"].append(
+            f"ALTER TABLE {quote_ident(table)} ADD CONSTRAINT {quote_ident(name)} {con['definition']}"
+        )
+
+    drop_order, cycle_fks = _drop_order(have, set(have) - set(want))
+    for table, name in cycle_fks:
+        phases["drop_fk"].append(
+            f"ALTER TABLE {quote_ident(table)} DROP CONSTRAINT {quote_ident(name)}"
+        )
+    for table in drop_order:
+        phases["drop_table"].append(f"DROP TABLE {quote_ident(table)}")
+
+    return [statement for statements in phases.values() for statement in statements]
+
+
+def diff_mongo_indexes(current: Dict[str, Any], desired: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Compute index operations that turn one MongoDB snapshot into another.
+
+    Changed indexes are dropped and rebuilt; new indexes for a collection
+    are grouped into one createIndexes build. The _id index is never
+    touched and collections themselves are not dropped.
+
+    Args:
+        current: Snapshot of the existing database
+        desired: Snapshot of the target database
+
+    Returns:
+        List of dropIndex and createIndexes operations
+    """
+    have, want = current.get("collections", {}), desired.get("collections", {})
+    operations = []
+
+    for collection in sorted(set(have) | set(want)):
+        old = have.get(collection, {}).get("indexes", {})
+        new = want.get(collection, {}).get("indexes", {})
+        for name in sorted(old):
+            if name != "_id_" and old[name] != new.get(name):
+                operations.append({"operation": "dropIndex", "collection": collection, "name": name})
+        create = [dict(new[name], name=name) for name in sorted(new)
+                  if name != "_id_" and new[name] != old.get(name)]
+        if create:
+            operations.append({"operation": "createIndexes", "collection": collection,
+                               "indexes": create})
+
+    return operations
+
+
+@dataclass
+class StatementPlan:
+    """Dry-run estimate for one migration statement."""
+
+    statement: str
+    table: Optional[str]
+    lock: Optional[str]
+    operation: str
+    table_bytes: int = 0
+    index_bytes: int = 0
+    rows: int = 0
+    est_seconds: float = 0.0
+    risk: str = "low"
+    notes: Optional[List[str]] = None
+
+
 @dataclass
 class Migration:
     """Represents a database migration."""
@@ -38,12 +535,22 @@ class Migration:
     up_sql: Optional[str] = None
     down_sql: Optional[str] = None
     mongodb_operations: Optional[List[Dict[str, Any]]] = None
+    steps: Optional[List[Dict[str, Any]]] = None
+    checksum: Optional[str] = None
     applied: bool = False
 
 
 class MigrationManager:
     """Manages database migrations for MongoDB and PostgreSQL."""
 
+    # MongoDB "operation" name -> handler method
+    MONGO_OPERATIONS = {
+        "createIndex": "_mongo_create_index",
+        "createIndexes": "_mongo_create_indexes",
+        "dropIndex": "_mongo_drop_index",
+        "updateMany": "_mongo_update_many",
+    }
+
     def __init__(self, db_type: str, connection_string: str, migrations_dir: str = "./migrations"):
         """
         Initialize migration manager.
@@ -61,6 +568,8 @@ class MigrationManager:
         self.client = None
         self.db = None
         self.conn = None
+        self.online_defaults = dict(ONLINE_DEFAULTS)
+        self.poll_interval = 5.0
 
     def connect(self) -> bool:
         """
@@ -116,18 +625,23 @@ class MigrationManager:
                     CREATE TABLE IF NOT EXISTS migrations (
                         id VARCHAR(255) PRIMARY KEY,
                         name VARCHAR(255) NOT NULL,
-                        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                        checksum VARCHAR(64)
                     )
                 """)
+                cur.execute("ALTER TABLE migrations ADD COLUMN IF NOT EXISTS checksum VARCHAR(64)")
             self.conn.commit()
 
-    def generate_migration(self, name: str, dry_run: bool = False) -> Optional[Migration]:
+    def generate_migration(self, name: str, dry_run: bool = False,
+                           content: Optional[Dict[str, Any]] = None) -> Optional[Migration]:
         """
         Generate new migration file.
 
         Args:
             name: Migration name
             dry_run: If True, only show what would be generated
+            content: Generated up_sql/down_sql or mongodb_operations/
+                mongodb_down_operations in place of the stub
 
         Returns:
             Migration object if successful, None otherwise
@@ -157,6 +671,11 @@ class MigrationManager:
             migration.up_sql = "-- Add your SQL here\n"
             migration.down_sql = "-- Add rollback SQL here\n"
 
+        content = dict(content or {})
+        down_operations = content.pop("mongodb_down_operations", None)
+        for key, value in content.items():
+            setattr(migration, key, value)
+
         migration_data = {
             "id": migration.id,
             "name": migration.name,
@@ -166,6 +685,8 @@ class MigrationManager:
             "down_sql": migration.down_sql,
             "mongodb_operations": migration.mongodb_operations
         }
+        if down_operations is not None:
+            migration_data["mongodb_down_operations"] = down_operations
 
         if dry_run:
             print(f"Would create: {filepath}")
@@ -181,10 +702,199 @@ class MigrationManager:
             print(f"Error creating migration: {e}")
             return None
 
+    def snapshot_schema(self) -> Dict[str, Any]:
+        """
+        Snapshot the connected database's schema.
+
+        PostgreSQL reads columns, indexes and constraints for every user
+        table with one catalog query each. MongoDB lists collections and
+        their indexes.
+
+        Returns:
+            Snapshot dict, as written by the snapshot command
+        """
+        if self.db_type == "mongodb":
+            collections = {}
+            for name in sorted(self.db.list_collection_names(filter={"type": "collection"})):
+                if name == "migrations" or name.startswith("system."):
+                    continue
+                indexes = {}
+                for index in self.db[name].list_indexes():
+                    spec = {k: v for k, v in index.items() if k not in ("v", "ns", "name")}
+                    spec["key"] = dict(spec["key"])
+                    indexes[index["name"]] = spec
+                collections[name] = {"indexes": indexes}
+            return {"database_type": "mongodb", "collections": collections}
+
+        tables: Dict[str, Dict[str, Any]] = {}
+
+        def table(name: str) -> Dict[str, Any]:
+            return tables.setdefault(name, {"columns": {}, "indexes": {}, "constraints": {}})
+
+        with self.conn.cursor() as cur:
+            cur.execute(SNAPSHOT_QUERIES["columns"])
+            for name, column, col_type, nullable, default in cur.fetchall():
+                table(name)["columns"][column] = {
+                    "type": col_type, "nullable": nullable, "default": default
+                }
+
+            cur.execute(SNAPSHOT_QUERIES["indexes"])
+            for name, index, definition in cur.fetchall():
+                table(name)["indexes"][index] = definition
+
+            cur.execute(SNAPSHOT_QUERIES["constraints"])
+            for name, constraint, con_type, definition in cur.fetchall():
+                table(name)["constraints"][constraint] = {
+                    "type": con_type, "definition": definition
+                }
+        self.conn.rollback()
+
+        return {"database_type": "postgres", "tables": dict(sorted(tables.items()))}
+
+    def generate_from_schema(
+        self,
+        name: str,
+        desired: Dict[str, Any],
+        current: Optional[Dict[str, Any]] = None,
+        dry_run: bool = False
+    ) -> bool:
+        """
+        Generate a migration that brings the database to a desired schema.
+
+        Args:
+            name: Migration name
+            desired: Target schema snapshot
+            current: Existing schema snapshot (default: snapshot the
+                connected database)
+            dry_run: If True, only show what would be generated
+
+        Returns:
+            True if the schema already matches or a migration was
+            generated, False otherwise
+        """
+        if current is None:
+            current = self.snapshot_schema()
+
+        for snapshot in (current, desired):
+            if snapshot.get("database_type", self.db_type) != self.db_type:
+                print(f"Error: Snapshot is for {snapshot['database_type']}, not {self.db_type}")
+                return False
+
+        if self.db_type == "mongodb":
+            up = diff_mongo_indexes(current, desired)
+            content = {
+                "mongodb_operations": up,
+                "mongodb_down_operations": diff_mongo_indexes(desired, current)
+            }
+        else:
+            up = diff_postgres_schema(current, desired)
+            content = {
+                "up_sql": "".join(f"{statement};\n" for statement in up),
+                "down_sql": "".join(
+                    f"{statement};\n" for statement in diff_postgres_schema(desired, current)
+                )
+            }
+
+        if not up:
+            print("✓ Schema already matches the desired state")
+            return True
+
+        print(f"Schema diff: {len(up)} change(s)")
+        return self.generate_migration(name, dry_run, content) is not None
+
+    def load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Index of migration files (id, name, checksum) keyed by filename.
+
+        Cached in .manifest.json; only files whose mtime or size changed
+        since the last run are read and hashed again.
+
+        Returns:
+            Dict of filename -> manifest entry
+        """
+        manifest_path = self.migrations_dir / MANIFEST_NAME
+        try:
+            with open(manifest_path) as f:
+                cached = json.load(f).get("files", {})
+        except (OSError, ValueError):
+            cached = {}
+
+        files = {}
+        changed = False
+        with os.scandir(self.migrations_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json") or entry.name.startswith("."):
+                    continue
+
+                stat = entry.stat()
+                previous = cached.get(entry.name)
+                if previous and previous["mtime_ns"] == stat.st_mtime_ns \
+                        and previous["size"] == stat.st_size:
+                    files[entry.name] = previous
+                    continue
+
+                try:
+                    with open(entry.path, "rb") as f:
+                        raw = f.read()
+                    data = json.loads(raw)
+                    files[entry.name] = {
+                        "id": data["id"],
+                        "name": data["name"],
+                        "checksum": hashlib.sha256(raw).hexdigest(),
+                        "mtime_ns": stat.st_mtime_ns,
+                        "size": stat.st_size
+                    }
+                    changed = True
+                except Exception as e:
+                    print(f"Error reading {entry.path}: {e}")
+
+        if changed or files.keys() != cached.keys():
+            try:
+                # Unique temp name: fleet runs may refresh from several threads
+                tmp = manifest_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                with open(tmp, "w") as f:
+                    json.dump({"files": files}, f)
+                os.replace(tmp, manifest_path)
+            except OSError as e:
+                print(f"Warning: Could not write {manifest_path}: {e}")
+
+        return files
+
+    def _applied_checksums(self) -> Dict[str, Optional[str]]:
+        """Applied migration ids and their recorded checksums."""
+        if self.db_type == "mongodb":
+            return {
+                doc["id"]: doc.get("checksum")
+                for doc in self.db.migrations.find({}, {"id": 1, "checksum": 1})
+            }
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT id, checksum FROM migrations")
+            return dict(cur.fetchall())
+
+    def _load_migration(self, filename: str, checksum: Optional[str] = None) -> Migration:
+        """Read a migration file."""
+        with open(self.migrations_dir / filename) as f:
+            data = json.load(f)
+
+        return Migration(
+            id=data["id"],
+            name=data["name"],
+            timestamp=datetime.fromisoformat(data["timestamp"]),
+            database_type=data["database_type"],
+            up_sql=data.get("up_sql"),
+            down_sql=data.get("down_sql"),
+            mongodb_operations=data.get("mongodb_operations"),
+            steps=data.get("steps"),
+            checksum=checksum
+        )
+
     def get_pending_migrations(self) -> List[Migration]:
         """
         Get list of pending migrations.
 
+        Applied migrations are matched by id from the manifest, so only
+        pending migration files are read.
+
         Returns:
             List of pending Migration objects
         """
@@ -192,47 +902,53 @@ class MigrationManager:
         applied_ids = set()
 
         try:
-            if self.db_type == "mongodb":
-                applied_ids = {
-                    doc["id"] for doc in self.db.migrations.find({}, {"id": 1})
-                }
-            elif self.db_type == "postgres":
-                with self.conn.cursor() as cur:
-                    cur.execute("SELECT id FROM migrations")
-                    applied_ids = {row[0] for row in cur.fetchall()}
+            applied_ids = set(self._applied_checksums())
         except Exception as e:
             print(f"Error reading applied migrations: {e}")
 
-        # Get all migration files
         pending = []
-        for filepath in sorted(self.migrations_dir.glob("*.json")):
+        for filename, entry in sorted(self.load_manifest().items()):
+            if entry["id"] in applied_ids:
+                continue
             try:
-                with open(filepath) as f:
-                    data = json.load(f)
-
-                if data["id"] not in applied_ids:
-                    migration = Migration(
-                        id=data["id"],
-                        name=data["name"],
-                        timestamp=datetime.fromisoformat(data["timestamp"]),
-                        database_type=data["database_type"],
-                        up_sql=data.get("up_sql"),
-                        down_sql=data.get("down_sql"),
-                        mongodb_operations=data.get("mongodb_operations")
-                    )
-                    pending.append(migration)
+                pending.append(self._load_migration(filename, entry["checksum"]))
             except Exception as e:
-                print(f"Error reading {filepath}: {e}")
+                print(f"Error reading {self.migrations_dir / filename}: {e}")
 
         return pending
 
-    def apply_migration(self, migration: Migration, dry_run: bool = False) -> bool:
+    def verify_migrations(self) -> Dict[str, List[str]]:
+        """
+        Compare applied migrations with the files on disk by checksum.
+
+        Returns:
+            Dict with "modified" (file changed after apply), "missing"
+            (applied but no file) and "unverified" (applied before
+            checksums were recorded) migration ids
+        """
+        applied = self._applied_checksums()
+        on_disk = {entry["id"]: entry["checksum"] for entry in self.load_manifest().values()}
+
+        result = {"modified": [], "missing": [], "unverified": []}
+        for migration_id, checksum in sorted(applied.items()):
+            if migration_id not in on_disk:
+                result["missing"].append(migration_id)
+            elif checksum is None:
+                result["unverified"].append(migration_id)
+            elif checksum != on_disk[migration_id]:
+                result["modified"].append(migration_id)
+        return result
+
+    def apply_migration(self, migration: Migration, dry_run: bool = False,
+                        online: bool = False) -> bool:
         """
         Apply migration.
 
         Args:
             migration: Migration to apply
             dry_run: If True, only show what would be executed
+            online: Run PostgreSQL statements as lock-aware online steps
+                (always the case for migrations that declare "steps")
 
         Returns:
             True if successful, False otherwise
@@ -243,24 +959,33 @@ class MigrationManager:
             if self.db_type == "mongodb":
                 print("MongoDB operations:")
                 print(json.dumps(migration.mongodb_operations, indent=2))
+            elif self.db_type == "postgres" and self.conn:
+                # Covers online steps and backfills as well as plain SQL
+                self.print_plan(self.plan_migration(migration))
+            elif migration.steps:
+                print("Online steps:")
+                print(json.dumps(migration.steps, indent=2))
             elif self.db_type == "postgres":
                 print("SQL to execute:")
                 print(migration.up_sql)
             return True
 
+        if self.db_type == "postgres" and (online or migration.steps):
+            return self._apply_online(migration)
+
         try:
             if self.db_type == "mongodb":
                 for op in migration.mongodb_operations or []:
-                    if op["operation"] == "createIndex":
-                        self.db[op["collection"]].create_index(
-                            list(op["index"].items()),
-                            **op.get("options", {})
-                        )
+                    handler = self.MONGO_OPERATIONS.get(op["operation"])
+                    if not handler:
+                        raise ValueError(f"Unsupported MongoDB operation: {op['operation']}")
+                    getattr(self, handler)(op)
 
                 # Record migration
                 self.db.migrations.insert_one({
                     "id": migration.id,
                     "name": migration.name,
+                    "checksum": migration.checksum,
                     "applied_at": datetime.now()
                 })
 
@@ -270,8 +995,8 @@ class MigrationManager:
 
                     # Record migration
                     cur.execute(
-                        "INSERT INTO migrations (id, name) VALUES (%s, %s)",
-                        (migration.id, migration.name)
+                        "INSERT INTO migrations (id, name, checksum) VALUES (%s, %s, %s)",
+                        (migration.id, migration.name, migration.checksum)
                     )
                 self.conn.commit()
 
@@ -284,6 +1009,511 @@ class MigrationManager:
                 self.conn.rollback()
             return False
 
+    def plan_migration(self, migration: Migration) -> List[StatementPlan]:
+        """
+        Estimate the lock impact and duration of a PostgreSQL migration.
+
+        Each statement is classified by lock level and cost driver (catalog
+        change, validation scan, index build, table rewrite or DML). Sizes
+        of every affected table come from one pg_class/pg_stat_user_tables
+        query; DML row counts come from EXPLAIN. Nothing is executed.
+
+        Args:
+            migration: Migration to plan
+
+        Returns:
+            List of StatementPlan, one per statement or step
+        """
+        statements = []
+        for step in migration.steps or [{"sql": migration.up_sql or ""}]:
+            if step.get("type") == "backfill":
+                statements.append((f"backfill {step['table']} SET {step['set']}", {
+                    "table": step["table"], "lock": "ROW EXCLUSIVE", "operation": "dml",
+                    "notes": [f"{step.get('batch_size', 10000)} rows per transaction"]
+                }))
+            else:
+                statements.extend(
+                    (statement, classify_statement(statement))
+                    for statement in split_statements(step["sql"])
+                )
+
+        stats = self._table_stats([c["table"] for _, c in statements if c["table"]])
+        plans = []
+
+        for statement, info in statements:
+            table_bytes, index_bytes, rows = stats.get(info["table"], (0, 0, 0))
+            plan = StatementPlan(
+                statement=statement,
+                table=info["table"],
+                lock=info["lock"],
+                operation=info["operation"],
+                table_bytes=table_bytes,
+                index_bytes=index_bytes,
+                rows=rows,
+                notes=list(info["notes"])
+            )
+
+            if plan.operation == "dml":
+                if not statement.startswith("backfill "):
+                    plan.rows = self._explain_rows(statement) or 0
+                plan.est_seconds = plan.rows / PLAN_RATES["dml"]
+            elif plan.operation == "scan":
+                plan.est_seconds = table_bytes / PLAN_RATES["scan"]
+            elif plan.operation == "index build":
+                passes = 2 if plan.lock == "SHARE UPDATE EXCLUSIVE" else 1
+                plan.est_seconds = passes * table_bytes / PLAN_RATES["index build"]
+            elif plan.operation == "rewrite":
+                plan.est_seconds = (table_bytes + index_bytes) / PLAN_RATES["rewrite"]
+
+            blocks_writes = plan.lock in ("ACCESS EXCLUSIVE", "EXCLUSIVE",
+                                          "SHARE ROW EXCLUSIVE", "SHARE")
+            if plan.operation == "rewrite" and table_bytes >= LARGE_TABLE_BYTES:
+                plan.risk = "high"
+                plan.notes.insert(0, "rewrites a large table")
+            elif blocks_writes and plan.est_seconds >= 1:
+                plan.risk = "high"
+            elif (blocks_writes and plan.operation != "metadata") or plan.est_seconds >= 60:
+                plan.risk = "medium"
+            plans.append(plan)
+
+        self.conn.rollback()
+        return plans
+
+    def _table_stats(self, tables: List[str]) -> Dict[str, tuple]:
+        """(table bytes, index bytes, estimated rows) per table, in one query."""
+        if not tables:
+            return {}
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    SELECT n, pg_table_size(c.oid), pg_indexes_size(c.oid),
+                           COALESCE(s.n_live_tup, GREATEST(c.reltuples, 0))::bigint
+                    FROM unnest(%s::text[]) AS n
+                    JOIN pg_class c ON c.oid = to_regclass(n)
+                    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+                """, (sorted(set(tables)),))
+                return {row[0]: tuple(row[1:]) for row in cur.fetchall()}
+        except Exception as e:
+            print(f"Warning: Could not read table statistics: {e}")
+            self.conn.rollback()
+            return {}
+
+    def _explain_rows(self, statement: str) -> Optional[int]:
+        """Planner row estimate for a DML statement (not executed)."""
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(f"EXPLAIN (FORMAT JSON) {statement}")
+                return int(cur.fetchone()[0][0]["Plan"]["Plan Rows"])
+        except Exception:
+            # e.g. the table is created earlier in the same migration
+            self.conn.rollback()
+            return None
+
+    def print_plan(self, plans: List[StatementPlan]):
+        """Print a dry-run plan."""
+        for plan in plans:
+            marker = {"high": "✗", "medium": "!", "low": "✓"}[plan.risk]
+            print(f"{marker} [{plan.risk}] {' '.join(plan.statement.split())[:100]}")
+            if plan.lock:
+                print(f"    Lock: {plan.lock} on {plan.table or 'table'} "
+                      f"(blocks {LOCK_BLOCKS.get(plan.lock, 'unknown')})")
+            if plan.table_bytes or plan.rows:
+                print(f"    Table: {self._format_bytes(plan.table_bytes)} heap, "
+                      f"{self._format_bytes(plan.index_bytes)} indexes, ~{plan.rows:,} rows")
+            print(f"    Cost: {plan.operation}, ~{plan.est_seconds:.1f}s estimated")
+            for note in plan.notes or []:
+                print(f"    Note: {note}")
+
+        flagged = [p for p in plans if p.risk == "high"]
+        if flagged:
+            print(f"\n✗ {len(flagged)} statement(s) would block production traffic for a long time")
+
+    @staticmethod
+    def _format_bytes(size: float) -> str:
+        """Format size in human-readable format."""
+        for unit in ["B", "KB", "MB", "GB", "TB"]:
+            if size < 1024:
+                return f"{size:.1f} {unit}"
+            size /= 1024
+        return f"{size:.1f} PB"
+
+    def _mongo_create_index(self, op: Dict[str, Any]):
+        """createIndex: {collection, index, options}."""
+        self.db[op["collection"]].create_index(
+            list(op["index"].items()),
+            **op.get("options", {})
+        )
+
+    def _mongo_create_indexes(self, op: Dict[str, Any]):
+        """
+        createIndexes: {collection, indexes: [{key, name?, ...options}]}.
+
+        All indexes are built in one server-side build (a single scan of
+        the collection). Build progress is polled from currentOp.
+        """
+        collection = op["collection"]
+        indexes = []
+        for spec in op["indexes"]:
+            index = dict(spec)
+            index.setdefault("name", "_".join(f"{k}_{v}" for k, v in spec["key"].items()))
+            indexes.append(index)
+
+        print(f"  Building {len(indexes)} index(es) on {collection}: "
+              f"{', '.join(i['name'] for i in indexes)}")
+        errors = []
+
+        def build():
+            try:
+                self.db.command("createIndexes", collection, indexes=indexes)
+            except Exception as e:
+                errors.append(e)
+
+        builder = threading.Thread(target=build, daemon=True)
+        start = time.perf_counter()
+        builder.start()
+
+        while builder.is_alive():
+            builder.join(self.poll_interval)
+            if builder.is_alive():
+                self._report_index_progress(collection, time.perf_counter() - start)
+
+        if errors:
+            raise errors[0]
+        print(f"    Built in {time.perf_counter() - start:.1f}s")
+
+    def _report_index_progress(self, collection: str, elapsed: float):
+        """Print index build progress for a collection from currentOp."""
+        try:
+            current = self.client.admin.command({
+                "currentOp": True,
+                "command.createIndexes": collection
+            })
+        except Exception as e:
+            print(f"    {elapsed:.0f}s elapsed (progress unavailable: {e})")
+            return
+
+        for op in current.get("inprog", []):
+            progress = op.get("progress")
+            if progress and progress.get("total"):
+                pct = 100 * progress["done"] / progress["total"]
+                print(f"    {elapsed:.0f}s: {pct:.1f}% ({progress['done']:,}/{progress['total']:,}) "
+                      f"{op.get('msg', '')}".rstrip())
+                return
+        print(f"    {elapsed:.0f}s elapsed")
+
+    def _mongo_drop_index(self, op: Dict[str, Any]):
+        """dropIndex: {collection, name}."""
+        self.db[op["collection"]].drop_index(op["name"])
+
+    def _mongo_update_many(self, op: Dict[str, Any]):
+        """
+        updateMany: {collection, filter, update, batch_size?, sleep?}.
+
+        Without batch_size this is a single update_many. With it, matching
+        _ids are read in _id order and updated batch_size at a time, with
+        an optional sleep between batches to throttle load.
+        """
+        collection = self.db[op["collection"]]
+        query = op.get("filter", {})
+        batch_size = op.get("batch_size")
+
+        if not batch_size:
+            result = collection.update_many(query, op["update"])
+            print(f"    Updated {result.modified_count:,} document(s)")
+            return
+
+        pause = float(op.get("sleep", 0))
+        last_id = None
+        done = 0
+        start = time.perf_counter()
+        reported = start
+
+        while True:
+            batch_query = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+            ids = [
+                doc["_id"] for doc in
+                collection.find(batch_query, {"_id": 1}).sort("_id", 1).limit(batch_size)
+            ]
+            if not ids:
+                break
+
+            result = collection.update_many({"_id": {"$in": ids}}, op["update"])
+            done += result.modified_count
+            last_id = ids[-1]
+
+            now = time.perf_counter()
+            if now - reported >= 5:
+                print(f"    {done:,} documents ({done / (now - start):,.0f}/s)")
+                reported = now
+            if pause:
+                time.sleep(pause)
+
+        print(f"    Updated {done:,} document(s) in {time.perf_counter() - start:.1f}s")
+
+    def _apply_online(self, migration: Migration) -> bool:
+        """
+        Apply a PostgreSQL migration as a sequence of short online steps.
+
+        Each statement runs in its own transaction under lock_timeout and
+        statement_timeout, retrying with backoff when the lock wait times
+        out instead of queueing production writes behind it. CONCURRENTLY
+        statements run outside a transaction. Backfill steps update rows in
+        key order, batch_size rows per transaction.
+
+        Steps are not atomic as a whole: if one fails, earlier steps stay
+        applied, so write them to be re-runnable (IF NOT EXISTS etc.).
+        """
+        steps = migration.steps or [
+            {"sql": statement} for statement in split_statements(migration.up_sql or "")
+        ]
+
+        try:
+            for index, step in enumerate(steps, 1):
+                settings = {**self.online_defaults, **step}
+                kind = step.get("type", "sql")
+                if kind == "backfill":
+                    print(f"  Step {index}/{len(steps)}: backfill {step['table']}")
+                    self._run_backfill(step, settings)
+                elif kind == "sql":
+                    print(f"  Step {index}/{len(steps)}: {' '.join(step['sql'].split())[:70]}")
+                    self._run_online_statement(step["sql"], settings)
+                else:
+                    raise ValueError(f"Unknown step type: {kind}")
+
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO migrations (id, name, checksum) VALUES (%s, %s, %s)",
+                    (migration.id, migration.name, migration.checksum)
+                )
+            self.conn.commit()
+
+        except Exception as e:
+            print(f"✗ Error applying migration: {e}")
+            print("  Earlier steps remain applied; fix the failing step and re-run")
+            self.conn.rollback()
+            return False
+
+        print(f"✓ Applied: {migration.id}")
+        return True
+
+    def _run_online_statement(self, statement: str, settings: Dict[str, Any]):
+        """
+        Run one statement with lock/statement timeouts.
+
+        CONCURRENTLY statements run outside a transaction and wait for every
+        older transaction, so lock timeouts are retried with the same
+        backoff; the INVALID index a timed-out CREATE INDEX CONCURRENTLY
+        leaves behind is dropped before each retry.
+        """
+        if "CONCURRENTLY" not in statement.upper():
+            self._in_timed_transaction(lambda cur: cur.execute(statement), settings)
+            return
+
+        match = CONCURRENT_INDEX.search(statement)
+        leftover = f"{match.group(2) or ''}{match.group(1)}" if match else None
+        retries = int(settings["retries"])
+
+        # CONCURRENTLY cannot run inside a transaction block
+        self.conn.commit()
+        self.conn.autocommit = True
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("SET lock_timeout = %s", (settings["lock_timeout"],))
+                cur.execute("SET statement_timeout = %s", (settings["statement_timeout"],))
+                try:
+                    for attempt in range(retries + 1):
+                        try:
+                            cur.execute(statement)
+                            return
+                        except Exception as e:
+                            if getattr(e, "pgcode", None) != LOCK_NOT_AVAILABLE or attempt == retries:
+                                raise RuntimeError(
+                                    f"{e} (a failed CREATE INDEX CONCURRENTLY leaves an INVALID "
+                                    f"index; drop it with DROP INDEX CONCURRENTLY before retrying)"
+                                ) from e
+                        if leftover:
+                            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {leftover}")
+                        delay = float(settings["retry_delay"]) * 2 ** attempt
+                        print(f"    Lock timeout, retry {attempt + 1}/{retries} in {delay:.1f}s")
+                        time.sleep(delay)
+                finally:
+                    cur.execute("RESET lock_timeout")
+                    cur.execute("RESET statement_timeout")
+        finally:
+            self.conn.autocommit = False
+
+    def _in_timed_transaction(self, work, settings: Dict[str, Any]) -> Any:
+        """
+        Run work(cursor) in a transaction with SET LOCAL timeouts.
+
+        Retries with exponential backoff when lock_timeout expires.
+        """
+        retries = int(settings["retries"])
+        for attempt in range(retries + 1):
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute("SET LOCAL lock_timeout = %s", (settings["lock_timeout"],))
+                    cur.execute("SET LOCAL statement_timeout = %s", (settings["statement_timeout"],))
+                    result = work(cur)
+                self.conn.commit()
+                return result
+            except Exception as e:
+                self.conn.rollback()
+                if getattr(e, "pgcode", None) != LOCK_NOT_AVAILABLE or attempt == retries:
+                    raise
+                delay = float(settings["retry_delay"]) * 2 ** attempt
+                print(f"    Lock timeout, retry {attempt + 1}/{retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _run_backfill(self, step: Dict[str, Any], settings: Dict[str, Any]):
+        """
+        Update rows in key order, batch_size rows per transaction.
+
+        Step keys: table, set (SET clause), where (rows still to update,
+        default all), key (default id), batch_size (default 10000) and
+        sleep (seconds between batches, default 0).
+        """
+        table = step["table"]
+        key = step.get("key", "id")
+        where = step.get("where", "TRUE")
+        batch_size = int(step.get("batch_size", 10000))
+        pause = float(step.get("sleep", 0))
+
+        def batch_sql(after: bool) -> str:
+            keyset = f" AND {key} > %s" if after else ""
+            return (
+                f"WITH batch AS ("
+                f"SELECT {key} FROM {table} WHERE ({where}){keyset} "
+                f"ORDER BY {key} LIMIT %s FOR UPDATE"
+                f"), updated AS ("
+                f"UPDATE {table} AS t SET {step['set']} FROM batch WHERE t.{key} = batch.{key}"
+                f") SELECT count(*), max({key}) FROM batch"
+            )
+
+        def run_batch(cur):
+            if last_key is None:
+                cur.execute(batch_sql(False), (batch_size,))
+            else:
+                cur.execute(batch_sql(True), (last_key, batch_size))
+            return cur.fetchone()
+
+        last_key = None
+        done = 0
+        start = time.perf_counter()
+        reported = start
+
+        while True:
+            count, max_key = self._in_timed_transaction(run_batch, settings)
+            if not count:
+                break
+            done += count
+            last_key = max_key
+
+            now = time.perf_counter()
+            if now - reported >= 5:
+                print(f"    {done:,} rows ({done / (now - start):,.0f} rows/s)")
+                reported = now
+            if pause:
+                time.sleep(pause)
+
+        elapsed = time.perf_counter() - start
+        print(f"    Backfilled {done:,} rows in {elapsed:.1f}s")
+
+    @contextmanager
+    def migration_lock(self) -> Iterator[None]:
+        """
+        Hold a session-level advisory lock while applying migrations.
+
+        Concurrent deployers queue on the lock instead of racing to apply
+        the same migrations; read pending migrations after acquiring it.
+        The lock is keyed by the current schema, so schema-per-tenant
+        targets in one database migrate in parallel. MongoDB has no
+        equivalent, so the lock is a no-op there.
+        """
+        if self.db_type != "postgres":
+            yield
+            return
+
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT pg_try_advisory_lock(%s, k), k
+                FROM (SELECT hashtext(COALESCE(current_schema(), '')) AS k) AS schema_key
+            """, (MIGRATION_LOCK_KEY,))
+            acquired, schema_key = cur.fetchone()
+            if not acquired:
+                print("Waiting for another deployer to release the migration lock...")
+                cur.execute("SELECT pg_advisory_lock(%s, %s)", (MIGRATION_LOCK_KEY, schema_key))
+        self.conn.commit()
+
+        try:
+            yield
+        finally:
+            self.conn.rollback()
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s, %s)", (MIGRATION_LOCK_KEY, schema_key))
+            self.conn.commit()
+
+    def apply_batch(
+        self,
+        migrations: List[Migration],
+        group_size: int = 0,
+        dry_run: bool = False
+    ) -> bool:
+        """
+        Apply migrations in as few transactions as possible.
+
+        PostgreSQL runs each group of migrations (all of them when
+        group_size is 0) in one transaction and records the group with a
+        single multi-row insert. A failing migration rolls back its whole
+        group; earlier groups stay committed. MongoDB has no multi-migration
+        transaction, so it falls back to applying one at a time.
+
+        Args:
+            migrations: Pending migrations, in order
+            group_size: Migrations per transaction (0 = all in one)
+            dry_run: If True, only show what would be executed
+
+        Returns:
+            True if all migrations were applied, False otherwise
+        """
+        if self.db_type != "postgres" or dry_run:
+            return all(self.apply_migration(m, dry_run) for m in migrations)
+
+        online = [m.id for m in migrations if m.steps]
+        if online:
+            print(f"Error: Online migrations cannot be batched: {', '.join(online)}")
+            print("  Apply them without --batch")
+            return False
+
+        size = group_size if group_size > 0 else max(len(migrations), 1)
+        groups = [migrations[i:i + size] for i in range(0, len(migrations), size)]
+
+        for number, group in enumerate(groups, 1):
+            print(f"Applying group {number}/{len(groups)}: "
+                  f"{group[0].id}..{group[-1].id} ({len(group)} migrations)")
+            current = None
+            try:
+                with self.conn.cursor() as cur:
+                    for current in group:
+                        cur.execute(current.up_sql)
+                    current = None
+                    execute_values(
+                        cur,
+                        "INSERT INTO migrations (id, name, checksum) VALUES %s",
+                        [(m.id, m.name, m.checksum) for m in group]
+                    )
+                self.conn.commit()
+            except Exception as e:
+                failed = f" in {current.id} - {current.name}" if current else ""
+                print(f"✗ Error{failed}: {e}")
+                print(f"  Rolled back group {number}; {sum(len(g) for g in groups[:number - 1])} "
+                      f"migration(s) from earlier groups remain applied")
+                self.conn.rollback()
+                return False
+
+        print(f"✓ Applied {len(migrations)} migration(s) in {len(groups)} transaction(s)")
+        return True
+
     def rollback_migration(self, migration_id: str, dry_run: bool = False) -> bool:
         """
         Rollback migration.
@@ -297,9 +1527,10 @@ class MigrationManager:
         """
         # Find migration file
         migration_file = None
-        for filepath in self.migrations_dir.glob(f"{migration_id}_*.json"):
-            migration_file = filepath
-            break
+        for filename, entry in self.load_manifest().items():
+            if entry["id"] == migration_id:
+                migration_file = self.migrations_dir / filename
+                break
 
         if not migration_file:
             print(f"Migration not found: {migration_id}")
@@ -315,6 +1546,9 @@ class MigrationManager:
                 if self.db_type == "postgres":
                     print("SQL to execute:")
                     print(data.get("down_sql", "-- No rollback defined"))
+                elif data.get("mongodb_down_operations"):
+                    print("Operations to execute:")
+                    print(json.dumps(data["mongodb_down_operations"], indent=2))
                 return True
 
             if self.db_type == "postgres" and data.get("down_sql"):
@@ -323,6 +1557,8 @@ class MigrationManager:
                     cur.execute("DELETE FROM migrations WHERE id = %s", (migration_id,))
                 self.conn.commit()
             elif self.db_type == "mongodb":
+                for op in data.get("mongodb_down_operations") or []:
+                    getattr(self, self.MONGO_OPERATIONS[op["operation"]])(op)
                 self.db.migrations.delete_one({"id": migration_id})
 
             print(f"✓ Rolled back: {migration_id}")
@@ -335,6 +1571,119 @@ class MigrationManager:
             return False
 
 
+class MigrationFleetRunner:
+    """Apply pending migrations to many databases or schemas concurrently."""
+
+    def __init__(
+        self,
+        config: Dict[str, Any],
+        migrations_dir: str = "./migrations",
+        db_type: Optional[str] = None,
+        max_concurrent: Optional[int] = None,
+        fail_fast: Optional[bool] = None,
+        batch: Optional[bool] = None
+    ):
+        """
+        Initialize fleet runner.
+
+        Args:
+            config: Fleet config with a "targets" list; each target has
+                name, uri and optional db and schema (PostgreSQL
+                search_path, for schema-per-tenant setups)
+            migrations_dir: Migrations shared by every target
+            db_type: Default database type for targets without "db"
+            max_concurrent: Targets migrated at once (overrides config)
+            fail_fast: Stop starting new targets after a failure (overrides
+                config "policy": "fail-fast"; default is to continue)
+            batch: Apply each target's migrations with apply_batch
+        """
+        self.targets = config.get("targets", [])
+        self.migrations_dir = migrations_dir
+        self.db_type = db_type
+        self.max_concurrent = max_concurrent or config.get("max_concurrent", 8)
+        if fail_fast is None:
+            fail_fast = config.get("policy") == "fail-fast"
+        self.fail_fast = fail_fast
+        self.batch = config.get("batch", False) if batch is None else batch
+        self.stop = threading.Event()
+
+    def run(self) -> List[Dict[str, Any]]:
+        """
+        Migrate all targets.
+
+        Returns:
+            Result dict per target (name, status, ok, applied, seconds,
+            error), in config order. status is one of applied,
+            up-to-date, failed or skipped (fail-fast stopped the run).
+        """
+        # Warm the manifest once so workers only read it
+        MigrationManager(self.db_type or "postgres", "", self.migrations_dir).load_manifest()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent) as executor:
+            return list(executor.map(self._migrate_target, self.targets))
+
+    def _migrate_target(self, target: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply pending migrations to one target."""
+        result = {
+            "name": target["name"],
+            "status": "skipped",
+            "ok": False,
+            "applied": 0,
+            "seconds": 0.0,
+            "error": None
+        }
+        if self.stop.is_set():
+            return result
+
+        manager = MigrationManager(
+            target.get("db") or self.db_type, target["uri"], self.migrations_dir
+        )
+        start = time.perf_counter()
+        try:
+            if not manager.connect():
+                raise RuntimeError("connection failed")
+            if target.get("schema") and manager.db_type == "postgres":
+                with manager.conn.cursor() as cur:
+                    cur.execute("SET search_path TO %s", (target["schema"],))
+                manager.conn.commit()
+            manager._ensure_migrations_table()
+
+            with manager.migration_lock():
+                pending = manager.get_pending_migrations()
+                if self.batch:
+                    ok = manager.apply_batch(pending)
+                else:
+                    ok = all(manager.apply_migration(m) for m in pending)
+
+            if not ok:
+                raise RuntimeError("migration failed")
+            result["applied"] = len(pending)
+            result["status"] = "applied" if pending else "up-to-date"
+            result["ok"] = True
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = str(e)
+            if self.fail_fast:
+                self.stop.set()
+        finally:
+            manager.disconnect()
+            result["seconds"] = time.perf_counter() - start
+
+        return result
+
+
+def latency_summary(results: List[Dict[str, Any]]) -> Dict[str, float]:
+    """p50/p95/max seconds over targets that ran (failed or not)."""
+    seconds = sorted(r["seconds"] for r in results if r["status"] != "skipped")
+    if not seconds:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+
+    def percentile(pct: float) -> float:
+        return seconds[min(len(seconds) - 1, int(round(pct / 100 * (len(seconds) - 1))))]
+
+    return {"p50": percentile(50), "p95": percentile(95), "max": seconds[-1]}
+
+
 def main():
     """Main entry point."""
     parser = argparse.ArgumentParser(description="Database migration tool")
@@ -355,7 +1704,19 @@ def main():
     # Apply command
     apply_parser = subparsers.add_parser("apply", help="Apply pending migrations")
     apply_parser.add_argument("--dry-run", action="store_true",
-                             help="Show what would be executed")
+                             help="Show what would be executed (PostgreSQL: lock and duration plan)")
+    apply_parser.add_argument("--batch", action="store_true",
+                             help="Apply in one transaction per group (PostgreSQL)")
+    apply_parser.add_argument("--group-size", type=int, default=0,
+                             help="Migrations per transaction with --batch (default: all)")
+    apply_parser.add_argument("--online", action="store_true",
+                             help="Run each statement as a lock-aware online step (PostgreSQL)")
+    apply_parser.add_argument("--lock-timeout", default=ONLINE_DEFAULTS["lock_timeout"],
+                             help="Online lock wait before retrying (default: 2s)")
+    apply_parser.add_argument("--statement-timeout", default=ONLINE_DEFAULTS["statement_timeout"],
+                             help="Online statement timeout (default: 0, none)")
+    apply_parser.add_argument("--retries", type=int, default=ONLINE_DEFAULTS["retries"],
+                             help="Online retries after a lock timeout (default: 5)")
 
     # Rollback command
     rollback_parser = subparsers.add_parser("rollback", help="Rollback migration")
@@ -366,6 +1727,33 @@ def main():
     # Status command
     subparsers.add_parser("status", help="Show migration status")
 
+    # Verify command
+    subparsers.add_parser("verify", help="Check applied migrations against file checksums")
+
+    # Snapshot command
+    snapshot_parser = subparsers.add_parser("snapshot", help="Write the current schema as JSON")
+    snapshot_parser.add_argument("--output", help="Output file (default: stdout)")
+
+    # Diff command
+    diff_parser = subparsers.add_parser("diff", help="Generate a migration from a schema diff")
+    diff_parser.add_argument("name", help="Migration name")
+    diff_parser.add_argument("--desired", required=True, help="Desired-state snapshot JSON")
+    diff_parser.add_argument("--current",
+                            help="Current-state snapshot JSON (default: snapshot --uri)")
+    diff_parser.add_argument("--dry-run", action="store_true",
+                            help="Show what would be generated")
+
+    # Fleet command
+    fleet_parser = subparsers.add_parser("fleet", help="Apply pending migrations to many targets")
+    fleet_parser.add_argument("config", help="Fleet config JSON file")
+    fleet_parser.add_argument("--max-concurrent", type=int,
+                             help="Targets migrated at once (default: config or 8)")
+    fleet_parser.add_argument("--fail-fast", action="store_true", default=None,
+                             help="Stop starting targets after the first failure")
+    fleet_parser.add_argument("--batch", action="store_true", default=None,
+                             help="Apply each target's migrations with --batch")
+    fleet_parser.add_argument("--report", help="Write per-target results as JSON")
+
     args = parser.parse_args()
 
     # For generate, we don't need connection
@@ -374,6 +1762,48 @@ def main():
         migration = manager.generate_migration(args.name, args.dry_run)
         sys.exit(0 if migration else 1)
 
+    if args.command == "diff" and args.current:
+        with open(args.desired) as f:
+            desired = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        manager = MigrationManager(args.db, "", args.migrations_dir)
+        sys.exit(0 if manager.generate_from_schema(args.name, desired, current, args.dry_run) else 1)
+
+    if args.command == "fleet":
+        with open(args.config) as f:
+            config = json.load(f)
+
+        runner = MigrationFleetRunner(
+            config, args.migrations_dir, args.db,
+            args.max_concurrent, args.fail_fast, args.batch
+        )
+        start = time.perf_counter()
+        results = runner.run()
+        elapsed = time.perf_counter() - start
+
+        print(f"\n{'Target':<30} {'Status':<11} {'Applied':>7} {'Time':>9}")
+        for r in results:
+            print(f"{r['name']:<30} {r['status']:<11} {r['applied']:>7} {r['seconds']:>8.1f}s")
+            if r["error"]:
+                print(f"    {r['error']}")
+
+        counts = {}
+        for r in results:
+            counts[r["status"]] = counts.get(r["status"], 0) + 1
+        latency = latency_summary(results)
+        print(f"\n{', '.join(f'{n} {status}' for status, n in sorted(counts.items()))} "
+              f"in {elapsed:.1f}s")
+        print(f"Per-target latency: p50 {latency['p50']:.1f}s, p95 {latency['p95']:.1f}s, "
+              f"max {latency['max']:.1f}s")
+
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump({"elapsed_seconds": elapsed, "latency": latency, "targets": results},
+                          f, indent=2)
+
+        sys.exit(0 if all(r["ok"] for r in results) else 1)
+
     # Other commands need connection
     if not args.uri:
         print("Error: --uri required for this command")
@@ -394,13 +1824,52 @@ def main():
                 print(f"  {migration.id} - {migration.name}")
 
         elif args.command == "apply":
-            pending = manager.get_pending_migrations()
-            if not pending:
-                print("No pending migrations")
-            else:
-                for migration in pending:
-                    if not manager.apply_migration(migration, args.dry_run):
+            manager.online_defaults.update(
+                lock_timeout=args.lock_timeout,
+                statement_timeout=args.statement_timeout,
+                retries=args.retries
+            )
+            # A plan changes nothing, so it neither waits for nor blocks deployers
+            with nullcontext() if args.dry_run else manager.migration_lock():
+                pending = manager.get_pending_migrations()
+                if not pending:
+                    print("No pending migrations")
+                elif args.batch:
+                    if not manager.apply_batch(pending, args.group_size, args.dry_run):
                         sys.exit(1)
+                else:
+                    for migration in pending:
+                        if not manager.apply_migration(migration, args.dry_run, args.online):
+                            sys.exit(1)
+
+        elif args.command == "snapshot":
+            start = time.perf_counter()
+            snapshot = json.dumps(manager.snapshot_schema(), indent=2)
+            elapsed = time.perf_counter() - start
+            if args.output:
+                with open(args.output, "w") as f:
+                    f.write(snapshot + "\n")
+                print(f"✓ Snapshot written to {args.output} in {elapsed:.2f}s")
+            else:
+                print(snapshot)
+
+        elif args.command == "diff":
+            with open(args.desired) as f:
+                desired = json.load(f)
+            if not manager.generate_from_schema(args.name, desired, dry_run=args.dry_run):
+                sys.exit(1)
+
+        elif args.command == "verify":
+            result = manager.verify_migrations()
+            for migration_id in result["modified"]:
+                print(f"✗ Modified after apply: {migration_id}")
+            for migration_id in result["missing"]:
+                print(f"✗ Applied but file missing: {migration_id}")
+            if result["unverified"]:
+                print(f"? {len(result['unverified'])} migration(s) applied without a checksum")
+            if result["modified"] or result["missing"]:
+                sys.exit(1)
+            print("✓ Applied migrations match their files")
 
         elif args.command == "rollback":
             if not manager.rollback_migration(args.id, args.dry_run):
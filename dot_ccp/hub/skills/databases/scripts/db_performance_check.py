@@ -5,11 +5,15 @@ Analyzes slow queries, recommends indexes, and generates reports.
 """
 
 import argparse
+import hashlib
 import json
+import re
+import sqlite3
 import sys
+import time
 from dataclasses import dataclass, asdict
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 try:
     from pymongo import MongoClient
@@ -25,6 +29,103 @@ except ImportError:
     POSTGRES_AVAILABLE = False
 
 
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# Top-level command fields that vary per call without changing the query shape
+SHAPE_IGNORED_FIELDS = {
+    "$audit", "$client", "$clusterTime", "$db", "$readPreference", "apiVersion",
+    "autocommit", "batchSize", "comment", "cursor", "lsid", "maxTimeMS",
+    "readConcern", "shardVersion", "singleBatch", "startTransaction",
+    "txnNumber", "writeConcern",
+}
+
+# Top-level command fields whose values are part of the shape, not literals
+SHAPE_VERBATIM_FIELDS = {
+    "aggregate", "count", "delete", "distinct", "find", "findAndModify",
+    "findandmodify", "hint", "key", "projection", "sort", "update",
+}
+
+# Aggregation stages whose specs are part of the shape
+SHAPE_VERBATIM_STAGES = {"$project", "$sort"}
+
+# Profiler document fields read when aggregating by shape
+PROFILE_FIELDS = {
+    "command": 1, "query": 1, "op": 1, "ns": 1, "millis": 1,
+    "docsExamined": 1, "keysExamined": 1, "nreturned": 1, "planSummary": 1,
+}
+
+
+def normalize_shape(value: Any) -> Any:
+    """
+    Replace literal values with '?' and sort keys, keeping operators.
+
+    Lists keep their order, with repeated element shapes collapsed, so
+    {"$in": [1, 2, 3]} and {"$in": [4]} share a shape.
+    """
+    if isinstance(value, dict):
+        return {key: normalize_shape(value[key]) for key in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = normalize_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return "?"
+
+
+def normalize_command(command: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normalize a profiled command into its shape.
+
+    Only top-level command fields are dropped or kept verbatim (the
+    collection, sort, projection, hint); user document fields at any
+    depth are normalized, whatever they are named. Aggregation stages
+    keep their order.
+    """
+    shape = {}
+    for key in sorted(command):
+        value = command[key]
+        if key in SHAPE_IGNORED_FIELDS:
+            continue
+        if key in SHAPE_VERBATIM_FIELDS:
+            shape[key] = value
+        elif key == "pipeline" and isinstance(value, list):
+            shape[key] = [
+                {name: spec if name in SHAPE_VERBATIM_STAGES else normalize_shape(spec)
+                 for name, spec in sorted(stage.items())} if isinstance(stage, dict)
+                else normalize_shape(stage)
+                for stage in value
+            ]
+        else:
+            shape[key] = normalize_shape(value)
+    return shape
+
+
+def query_shape(doc: Dict[str, Any]) -> str:
+    """Normalized shape of a system.profile document, as JSON."""
+    command = doc.get("command") or doc.get("query") or {}
+    return json.dumps(
+        {"ns": doc.get("ns"), "op": doc.get("op"), "command": normalize_command(command)},
+        sort_keys=True, default=str
+    )
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def parse_duration(value: str) -> float:
+    """Parse a duration such as '90', '15m', '24h' or '7d' into seconds."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", value)
+    if not match:
+        raise ValueError(f"Invalid duration: {value}")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or "s"]
+
+
 @dataclass
 class SlowQuery:
     """Represents a slow query."""
@@ -34,6 +135,13 @@ class SlowQuery:
     count: int
     collection_or_table: Optional[str] = None
     index_used: Optional[str] = None
+    fingerprint: Optional[str] = None
+    p50_ms: Optional[float] = None
+    p95_ms: Optional[float] = None
+    p99_ms: Optional[float] = None
+    max_ms: Optional[float] = None
+    docs_examined_per_returned: Optional[float] = None
+    keys_examined_per_returned: Optional[float] = None
 
 
 @dataclass
@@ -58,6 +166,211 @@ class PerformanceReport:
     database_metrics: Dict[str, any]
 
 
+@dataclass
+class QueryRegression:
+    """A query whose mean latency rose between two windows."""
+
+    queryid: str
+    query: Optional[str]
+    baseline_ms: float
+    current_ms: float
+    baseline_calls: int
+    current_calls: int
+
+    @property
+    def ratio(self) -> float:
+        """Current over baseline mean latency."""
+        return self.current_ms / self.baseline_ms if self.baseline_ms else float("inf")
+
+    @property
+    def added_ms(self) -> float:
+        """Extra execution time spent in the current window."""
+        return (self.current_ms - self.baseline_ms) * self.current_calls
+
+
+class QueryHistory:
+    """
+    SQLite time series of per-query counter deltas.
+
+    pg_stat_statements counters are cumulative since the last reset, so
+    each sample stores the difference from the previous one per queryid.
+    Query text is stored once per queryid.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS counters (
+            key TEXT PRIMARY KEY,
+            calls INTEGER NOT NULL,
+            total_exec_time REAL NOT NULL,
+            rows INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS samples (
+            ts REAL NOT NULL,
+            queryid TEXT NOT NULL,
+            calls INTEGER NOT NULL,
+            total_exec_time REAL NOT NULL,
+            rows INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts);
+        CREATE TABLE IF NOT EXISTS queries (
+            queryid TEXT PRIMARY KEY,
+            query TEXT
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (or create) a history database.
+
+        Args:
+            path: SQLite file path
+        """
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(self.SCHEMA)
+
+    def close(self):
+        """Close the history database."""
+        self.conn.close()
+
+    def known_queries(self) -> set:
+        """Queryids whose text is already stored."""
+        return {row[0] for row in self.conn.execute("SELECT queryid FROM queries")}
+
+    def record(
+        self,
+        rows: List[Tuple[Any, ...]],
+        stats_reset: Optional[str] = None,
+        texts: Optional[Dict[str, str]] = None,
+        ts: Optional[float] = None
+    ) -> int:
+        """
+        Store the deltas of one sample.
+
+        A queryid seen for the first time only sets its baseline. If
+        stats_reset changed, or a counter went backwards (the entry was
+        reset or evicted and re-added), the current counters are the
+        activity since the reset and are stored as the delta.
+
+        Args:
+            rows: (key, queryid, calls, total_exec_time, rows) per statement;
+                key identifies the entry (user, database and queryid)
+            stats_reset: pg_stat_statements_info.stats_reset, if known
+            texts: Query text for new queryids
+            ts: Sample time (default: now)
+
+        Returns:
+            Number of queries with activity since the previous sample
+        """
+        ts = time.time() if ts is None else ts
+        previous = {
+            key: (calls, exec_time, n)
+            for key, calls, exec_time, n in self.conn.execute("SELECT * FROM counters")
+        }
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'stats_reset'").fetchone()
+        was_reset = stats_reset is not None and row is not None and row[0] != str(stats_reset)
+
+        deltas = {}
+        for key, queryid, calls, exec_time, n in rows:
+            old = previous.get(key)
+            if old is None and not was_reset:
+                continue
+            if was_reset or old is None or calls < old[0] or exec_time < old[1]:
+                delta = (calls, exec_time, n)
+            else:
+                delta = (calls - old[0], exec_time - old[1], n - old[2])
+            if delta[0] > 0:
+                total = deltas.get(str(queryid), (0, 0.0, 0))
+                deltas[str(queryid)] = tuple(a + b for a, b in zip(total, delta))
+
+        with self.conn:
+            # Replace wholesale so evicted entries do not accumulate
+            self.conn.execute("DELETE FROM counters")
+            self.conn.executemany(
+                "INSERT INTO counters VALUES (?, ?, ?, ?)",
+                [(key, calls, exec_time, n) for key, _, calls, exec_time, n in rows]
+            )
+            self.conn.executemany(
+                "INSERT INTO samples VALUES (?, ?, ?, ?, ?)",
+                [(ts, queryid, *delta) for queryid, delta in deltas.items()]
+            )
+            if texts:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO queries VALUES (?, ?)",
+                    [(str(queryid), text) for queryid, text in texts.items()]
+                )
+            if stats_reset is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('stats_reset', ?)", (str(stats_reset),)
+                )
+
+        return len(deltas)
+
+    def prune(self, before: float) -> int:
+        """Delete samples older than a timestamp; returns rows deleted."""
+        with self.conn:
+            return self.conn.execute("DELETE FROM samples WHERE ts < ?", (before,)).rowcount
+
+    def regressions(
+        self,
+        window: float,
+        baseline: Optional[float] = None,
+        ratio: float = 1.5,
+        min_calls: int = 10,
+        min_mean_ms: float = 0,
+        now: Optional[float] = None
+    ) -> List[QueryRegression]:
+        """
+        Find queries that got slower in the latest window.
+
+        Mean latency over the last `window` seconds is compared with the
+        `baseline` seconds before it (default: the same length).
+
+        Args:
+            window: Current window length in seconds
+            baseline: Baseline window length in seconds
+            ratio: Minimum current/baseline mean latency ratio
+            min_calls: Minimum calls in each window
+            min_mean_ms: Minimum current mean latency
+            now: End of the current window (default: now)
+
+        Returns:
+            Regressions, most added execution time first
+        """
+        now = time.time() if now is None else now
+        split = now - window
+        start = split - (baseline or window)
+
+        results = []
+        for queryid, query, cur_calls, cur_time, base_calls, base_time in self.conn.execute("""
+            SELECT s.queryid, q.query,
+                   SUM(CASE WHEN s.ts >= :split THEN s.calls ELSE 0 END),
+                   SUM(CASE WHEN s.ts >= :split THEN s.total_exec_time ELSE 0 END),
+                   SUM(CASE WHEN s.ts < :split THEN s.calls ELSE 0 END),
+                   SUM(CASE WHEN s.ts < :split THEN s.total_exec_time ELSE 0 END)
+            FROM samples s LEFT JOIN queries q ON q.queryid = s.queryid
+            WHERE s.ts >= :start AND s.ts <= :now
+            GROUP BY s.queryid
+        """, {"split": split, "start": start, "now": now}):
+            if cur_calls < min_calls or base_calls < min_calls:
+                continue
+            regression = QueryRegression(
+                queryid=queryid,
+                query=query,
+                baseline_ms=base_time / base_calls,
+                current_ms=cur_time / cur_calls,
+                baseline_calls=base_calls,
+                current_calls=cur_calls
+            )
+            if regression.current_ms >= min_mean_ms and regression.ratio >= ratio:
+                results.append(regression)
+
+        return sorted(results, key=lambda r: r.added_ms, reverse=True)
+
+
 class PerformanceAnalyzer:
     """Analyzes database performance."""
 
@@ -144,21 +457,11 @@ class PerformanceAnalyzer:
         if profiling_level.get("was", 0) == 0:
             self.db.command("profile", 1, slowms=self.threshold_ms)
 
-        # Get slow queries from system.profile
-        for doc in self.db.system.profile.find(
+        # Aggregate slow operations in system.profile by query shape
+        slow_queries = self.aggregate_profile(self.db.system.profile.find(
             {"millis": {"$gte": self.threshold_ms}},
-            limit=50
-        ).sort("millis", -1):
-
-            query_str = json.dumps(doc.get("command", {}), default=str)
-
-            slow_queries.append(SlowQuery(
-                query=query_str,
-                execution_time_ms=doc.get("millis", 0),
-                count=1,
-                collection_or_table=doc.get("ns", "").split(".")[-1] if "ns" in doc else None,
-                index_used=doc.get("planSummary")
-            ))
+            PROFILE_FIELDS
+        ).batch_size(1000))
 
         # Analyze collections for index recommendations
         for coll_name in self.db.list_collection_names():
@@ -219,6 +522,58 @@ class PerformanceAnalyzer:
             database_metrics=metrics
         )
 
+    def aggregate_profile(self, docs) -> List[SlowQuery]:
+        """
+        Group profiler documents by normalized query shape.
+
+        Args:
+            docs: Iterable of system.profile documents (a cursor is
+                consumed in a single streaming pass)
+
+        Returns:
+            One SlowQuery per shape, most total time first
+        """
+        shapes: Dict[str, Dict[str, Any]] = {}
+
+        for doc in docs:
+            shape = query_shape(doc)
+            stats = shapes.get(shape)
+            if stats is None:
+                ns = doc.get("ns")
+                stats = shapes[shape] = {
+                    "millis": [], "docs": 0, "keys": 0, "returned": 0, "plans": {},
+                    "collection": ns.split(".", 1)[-1] if ns else None
+                }
+            stats["millis"].append(doc.get("millis", 0))
+            stats["docs"] += doc.get("docsExamined", 0)
+            stats["keys"] += doc.get("keysExamined", 0)
+            stats["returned"] += doc.get("nreturned", 0)
+            plan = doc.get("planSummary")
+            if plan:
+                stats["plans"][plan] = stats["plans"].get(plan, 0) + 1
+
+        slow_queries = []
+        for shape, stats in shapes.items():
+            millis = sorted(stats["millis"])
+            returned = max(stats["returned"], 1)
+            plans = stats["plans"]
+            slow_queries.append(SlowQuery(
+                query=shape,
+                execution_time_ms=sum(millis) / len(millis),
+                count=len(millis),
+                collection_or_table=stats["collection"],
+                index_used=max(plans, key=plans.get) if plans else None,
+                fingerprint=hashlib.sha1(shape.encode()).hexdigest()[:16],
+                p50_ms=percentile(millis, 50),
+                p95_ms=percentile(millis, 95),
+                p99_ms=percentile(millis, 99),
+                max_ms=millis[-1],
+                docs_examined_per_returned=stats["docs"] / returned,
+                keys_examined_per_returned=stats["keys"] / returned
+            ))
+
+        return sorted(slow_queries, key=lambda q: q.execution_time_ms * q.count, reverse=True)
+
     def _analyze_postgres(self) -> PerformanceReport:
         """Analyze PostgreSQL performance."""
         slow_queries = []
@@ -337,6 +692,94 @@ class PerformanceAnalyzer:
             database_metrics=metrics
         )
 
+    def sample_postgres(self, history: QueryHistory) -> int:
+        """
+        Take one pg_stat_statements sample into a history store.
+
+        Counters are read without query text; text is fetched only for
+        queryids the store has not seen.
+
+        Args:
+            history: Store to record the sample in
+
+        Returns:
+            Number of queries with activity since the previous sample
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT userid::text || ':' || dbid::text || ':' || queryid::text,
+                       queryid::text, calls, total_exec_time, rows
+                FROM pg_stat_statements(false)
+                WHERE queryid IS NOT NULL
+            """)
+            rows = cur.fetchall()
+
+            stats_reset = None
+            try:
+                cur.execute("SELECT stats_reset FROM pg_stat_statements_info")
+                stats_reset = cur.fetchone()[0]
+            except Exception:
+                # pg_stat_statements_info needs PostgreSQL 14
+                self.conn.rollback()
+
+            known = history.known_queries()
+            new = sorted({row[1] for row in rows} - known)
+            texts = {}
+            if new:
+                cur.execute("""
+                    SELECT DISTINCT ON (queryid) queryid::text, query
+                    FROM pg_stat_statements
+                    WHERE queryid::text = ANY(%s)
+                """, (new,))
+                texts = dict(cur.fetchall())
+        self.conn.rollback()
+
+        return history.record(rows, stats_reset, texts)
+
+    def sample(
+        self,
+        history: QueryHistory,
+        interval: float,
+        count: Optional[int] = None,
+        retention: Optional[float] = None
+    ):
+        """
+        Sample query statistics at a fixed interval.
+
+        Args:
+            history: Store to record samples in
+            interval: Seconds between samples
+            count: Number of samples to take (default: until interrupted)
+            retention: Drop samples older than this many seconds
+        """
+        taken = 0
+        while count is None or taken < count:
+            start = time.time()
+            active = self.sample_postgres(history)
+            taken += 1
+            if retention:
+                history.prune(start - retention)
+            print(f"{datetime.fromtimestamp(start):%Y-%m-%d %H:%M:%S} "
+                  f"sample {taken}: {active} active queries")
+
+            if count is None or taken < count:
+                time.sleep(max(0.0, interval - (time.time() - start)))
+
+    def print_regressions(self, regressions: List[QueryRegression]):
+        """Print queries that regressed between windows."""
+        print("\n## Query Regressions")
+        print("-" * 80)
+        if not regressions:
+            print("No regressions found")
+            return
+        for i, r in enumerate(regressions, 1):
+            print(f"\n{i}. {r.baseline_ms:.2f}ms -> {r.current_ms:.2f}ms ({r.ratio:.1f}x) "
+                  f"| Calls: {r.baseline_calls} -> {r.current_calls} "
+                  f"| Added: {r.added_ms / 1000:.1f}s")
+            print(f"   Query ID: {r.queryid}")
+            if r.query:
+                print(f"   Query: {r.query[:200]}...")
+
     def print_report(self, report: PerformanceReport):
         """Print performance report."""
         print("=" * 80)
@@ -358,6 +801,12 @@ class PerformanceAnalyzer:
         if report.slow_queries:
             for i, query in enumerate(report.slow_queries, 1):
                 print(f"\n{i}. Execution Time: {query.execution_time_ms:.2f}ms | Count: {query.count}")
+                if query.p50_ms is not None:
+                    print(f"   Latency: p50 {query.p50_ms:.0f}ms | p95 {query.p95_ms:.0f}ms | "
+                          f"p99 {query.p99_ms:.0f}ms | max {query.max_ms:.0f}ms")
+                if query.docs_examined_per_returned is not None:
+                    print(f"   Examined/Returned: {query.docs_examined_per_returned:.1f} docs, "
+                          f"{query.keys_examined_per_returned:.1f} keys")
                 if query.collection_or_table:
                     print(f"   Collection/Table: {query.collection_or_table}")
                 if query.index_used:
@@ -409,18 +858,71 @@ def main():
     parser = argparse.ArgumentParser(description="Database performance analysis tool")
     parser.add_argument("--db", required=True, choices=["mongodb", "postgres"],
                        help="Database type")
-    parser.add_argument("--uri", required=True, help="Database connection string")
+    parser.add_argument("--uri", help="Database connection string")
     parser.add_argument("--threshold", type=int, default=100,
                        help="Slow query threshold in milliseconds (default: 100)")
     parser.add_argument("--output", help="Save report to JSON file")
+    parser.add_argument("--sample", metavar="INTERVAL",
+                       help="Sample pg_stat_statements every INTERVAL (e.g. 60s, 5m) into --history")
+    parser.add_argument("--samples", type=int, help="Stop after this many samples")
+    parser.add_argument("--retention", default="30d",
+                       help="Keep samples for this long (default: 30d)")
+    parser.add_argument("--history", default="query_history.db",
+                       help="SQLite sample history (default: query_history.db)")
+    parser.add_argument("--regressions", metavar="WINDOW",
+                       help="Report queries slower in the last WINDOW (e.g. 24h) than the window before")
+    parser.add_argument("--baseline", help="Baseline window length (default: same as WINDOW)")
+    parser.add_argument("--ratio", type=float, default=1.5,
+                       help="Regression mean latency ratio (default: 1.5)")
+    parser.add_argument("--min-calls", type=int, default=10,
+                       help="Minimum calls per window for a regression (default: 10)")
+    parser.add_argument("--min-mean-ms", type=float, default=0,
+                       help="Minimum current mean latency for a regression in ms (default: 0)")
 
     args = parser.parse_args()
 
+    if args.regressions:
+        history = QueryHistory(args.history)
+        try:
+            regressions = history.regressions(
+                parse_duration(args.regressions),
+                parse_duration(args.baseline) if args.baseline else None,
+                args.ratio, args.min_calls, args.min_mean_ms
+            )
+        finally:
+            history.close()
+        PerformanceAnalyzer(args.db, "", args.threshold).print_regressions(regressions)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump([dict(asdict(r), ratio=r.ratio) for r in regressions], f, indent=2)
+        sys.exit(1 if regressions else 0)
+
+    if not args.uri:
+        print("Error: --uri required")
+        sys.exit(1)
+
+    if args.sample and args.db != "postgres":
+        print("Error: --sample requires PostgreSQL pg_stat_statements")
+        sys.exit(1)
+
     analyzer = PerformanceAnalyzer(args.db, args.uri, args.threshold)
 
     if not analyzer.connect():
         sys.exit(1)
 
+    if args.sample:
+        history = QueryHistory(args.history)
+        try:
+            print(f"Sampling every {args.sample} into {args.history} (Ctrl+C to stop)...")
+            analyzer.sample(history, parse_duration(args.sample), args.samples,
+                            parse_duration(args.retention))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            history.close()
+            analyzer.disconnect()
+        sys.exit(0)
+
     try:
         print(f"Analyzing {args.db} performance (threshold: {args.threshold}ms)...")
         report = analyzer.analyze()
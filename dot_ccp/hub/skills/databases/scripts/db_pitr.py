@@ -0,0 +1,636 @@
+#!/usr/bin/env python3
+"""
+Point-in-time recovery for PostgreSQL and MongoDB.
+
+PostgreSQL: pg_basebackup base backups plus continuous WAL streaming with
+pg_receivewal; restore unpacks a base backup and replays archived WAL up to
+a target time. MongoDB: mongodump --oplog base backups plus oplog tailing
+into gzip-compressed BSON segments; restore replays segments with
+mongorestore --oplogReplay --oplogLimit.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from bson.raw_bson import RawBSONDocument
+    from bson.timestamp import Timestamp
+    from pymongo import CursorType, MongoClient
+    MONGO_AVAILABLE = True
+except ImportError:
+    MONGO_AVAILABLE = False
+
+from db_backup import parse_rate
+
+
+# Default WAL segment size; the real one is read from the segment's long page header
+WAL_SEGMENT_SIZE = 16 * 1024 * 1024
+
+SEGMENT_PATTERN = re.compile(r"^oplog_(\d+)-(\d+)_(\d+)-(\d+)\.bson\.gz$")
+
+
+@dataclass
+class BaseBackup:
+    """A base backup that archived WAL or oplog segments replay on top of."""
+
+    name: str
+    path: Path
+    database_type: str
+    start: datetime
+    end: datetime
+    oplog_ts: Optional[Tuple[int, int]] = None
+
+
+def read_partial_wal(path: Path) -> bytes:
+    """
+    Read the WAL segment pg_receivewal is still writing, padded to full size.
+
+    A compressed .partial file is an unterminated gzip stream, so it is
+    decompressed incrementally and whatever was flushed is kept. The
+    result is zero-padded to the segment size, which PostgreSQL requires
+    of files in pg_wal.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    if ".gz" in path.name:
+        decompressor = zlib.decompressobj(31)
+        data = decompressor.decompress(raw)
+    else:
+        data = raw
+
+    # xlp_seg_size sits at offset 32 of the long page header opening each segment
+    size = WAL_SEGMENT_SIZE
+    if len(data) >= 40:
+        seg_size = struct.unpack_from("<I", data, 32)[0]
+        if seg_size >= 1024 * 1024 and seg_size & (seg_size - 1) == 0:
+            size = seg_size
+    return data[:size].ljust(size, b"\0")
+
+
+def segment_name(first: Tuple[int, int], last: Tuple[int, int]) -> str:
+    """Oplog segment filename; zero-padded so names sort by time."""
+    return f"oplog_{first[0]:010d}-{first[1]}_{last[0]:010d}-{last[1]}.bson.gz"
+
+
+def parse_segment_name(name: str) -> Optional[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    """(first_ts, last_ts) of an oplog segment, or None if not a segment."""
+    match = SEGMENT_PATTERN.match(name)
+    if not match:
+        return None
+    t1, i1, t2, i2 = (int(g) for g in match.groups())
+    return (t1, i1), (t2, i2)
+
+
+class OplogSegmentWriter:
+    """
+    Write raw oplog entries into gzip-compressed BSON segments.
+
+    A segment is closed once it reaches max_bytes (uncompressed) or
+    max_seconds of age, then renamed to carry its first and last oplog
+    timestamps. The last committed timestamp is saved in state.json so
+    tailing resumes where the last complete segment ended.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 64 * 1024 * 1024,
+                 max_seconds: float = 300, level: int = 6):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.level = level
+        self.tmp_path = directory / "current.bson.gz.tmp"
+        self.file = None
+        self.first: Optional[Tuple[int, int]] = None
+        self.last: Optional[Tuple[int, int]] = None
+        self.bytes = 0
+        self.opened_at = 0.0
+
+        # Entries in an unfinished segment are re-read from the oplog on resume
+        self.tmp_path.unlink(missing_ok=True)
+
+    def write(self, ts: Tuple[int, int], raw: bytes):
+        """Append one BSON-encoded oplog entry."""
+        if self.file is None:
+            self.file = gzip.open(self.tmp_path, "wb", compresslevel=self.level)
+            self.first = ts
+            self.bytes = 0
+            self.opened_at = time.monotonic()
+
+        self.file.write(raw)
+        self.last = ts
+        self.bytes += len(raw)
+
+        if self.bytes >= self.max_bytes:
+            self.rotate()
+
+    def maybe_rotate(self) -> Optional[Path]:
+        """Close the current segment if it is older than max_seconds."""
+        if self.file and time.monotonic() - self.opened_at >= self.max_seconds:
+            return self.rotate()
+        return None
+
+    def rotate(self) -> Optional[Path]:
+        """Close the current segment and commit its last timestamp."""
+        if self.file is None:
+            return None
+
+        self.file.close()
+        self.file = None
+        path = self.directory / segment_name(self.first, self.last)
+        os.replace(self.tmp_path, path)
+        save_state(self.directory, self.last)
+        return path
+
+    def close(self):
+        """Commit any open segment."""
+        self.rotate()
+
+
+def load_state(directory: Path) -> Optional[Tuple[int, int]]:
+    """Last oplog timestamp committed to a segment, if any."""
+    try:
+        with open(directory / "state.json") as f:
+            return tuple(json.load(f)["last_ts"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_state(directory: Path, last_ts: Tuple[int, int]):
+    """Record the last committed oplog timestamp."""
+    tmp = directory / "state.json.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"last_ts": list(last_ts)}, f)
+    os.replace(tmp, directory / "state.json")
+
+
+class PITRManager:
+    """Manages base backups, continuous archiving and point-in-time restore."""
+
+    def __init__(self, db_type: str, archive_dir: str = "./pitr", verbose: bool = False):
+        """
+        Initialize PITR manager.
+
+        Args:
+            db_type: Database type ('mongodb' or 'postgres')
+            archive_dir: Directory holding base backups and WAL/oplog archives
+            verbose: Print commands as they run
+        """
+        self.db_type = db_type.lower()
+        self.archive_dir = Path(archive_dir)
+        self.base_dir = self.archive_dir / "base"
+        self.wal_dir = self.archive_dir / "wal"
+        self.oplog_dir = self.archive_dir / "oplog"
+        self.verbose = verbose
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+
+    def base_backup(self, uri: str) -> Optional[BaseBackup]:
+        """
+        Take a base backup to replay archived changes on top of.
+
+        Args:
+            uri: Database connection string
+
+        Returns:
+            BaseBackup if successful, None otherwise
+        """
+        start = datetime.now(timezone.utc)
+        name = start.strftime("%Y%m%d_%H%M%S")
+        path = self.base_dir / name
+
+        if self.db_type == "postgres":
+            # Tar format with the WAL needed for consistency streamed alongside
+            cmd = ["pg_basebackup", "-d", uri, "-D", str(path), "-Ft", "-z", "-X", "stream",
+                   "-c", "fast"]
+        elif self.db_type == "mongodb":
+            cmd = ["mongodump", "--uri", uri, f"--archive={path / 'dump.archive.gz'}",
+                   "--gzip", "--oplog"]
+        else:
+            print(f"Error: Unsupported database type: {self.db_type}")
+            return None
+
+        # Read before the dump starts: ops written while it runs must be in
+        # the oplog archive too, and replaying ones already in the dump is harmless
+        oplog_ts = self._latest_oplog_ts(uri) if self.db_type == "mongodb" else None
+
+        path.mkdir()
+        print(f"Creating base backup: {name}")
+        if self.verbose:
+            print(f"  {' '.join(cmd)}")
+        result = subprocess.run(cmd, capture_output=True, text=True)
+
+        if result.returncode != 0:
+            print(f"Error: {result.stderr}")
+            shutil.rmtree(path)
+            return None
+
+        base = BaseBackup(
+            name=name,
+            path=path,
+            database_type=self.db_type,
+            start=start,
+            end=datetime.now(timezone.utc),
+            oplog_ts=oplog_ts
+        )
+        self._save_base(base)
+        print(f"✓ Base backup created: {name}")
+        return base
+
+    def archive(
+        self,
+        uri: str,
+        slot: str = "db_pitr",
+        segment_seconds: float = 300,
+        segment_bytes: int = 64 * 1024 * 1024
+    ) -> bool:
+        """
+        Continuously archive WAL (PostgreSQL) or the oplog (MongoDB).
+
+        Runs until interrupted. PostgreSQL streams WAL through a replication
+        slot so no segment is recycled before it is archived.
+
+        Args:
+            uri: Database connection string
+            slot: Replication slot name (PostgreSQL)
+            segment_seconds: Close oplog segments after this many seconds (MongoDB)
+            segment_bytes: Close oplog segments at this uncompressed size (MongoDB)
+
+        Returns:
+            True if archiving stopped cleanly, False on error
+        """
+        if self.db_type == "postgres":
+            return self._archive_wal(uri, slot)
+        elif self.db_type == "mongodb":
+            return self._archive_oplog(uri, segment_seconds, segment_bytes)
+        print(f"Error: Unsupported database type: {self.db_type}")
+        return False
+
+    def _archive_wal(self, uri: str, slot: str) -> bool:
+        """Stream WAL segments into the archive with pg_receivewal."""
+        self.wal_dir.mkdir(parents=True, exist_ok=True)
+
+        create = subprocess.run(
+            ["pg_receivewal", "-d", uri, "--slot", slot, "--create-slot", "--if-not-exists"],
+            capture_output=True, text=True
+        )
+        if create.returncode != 0:
+            print(f"Error: {create.stderr}")
+            return False
+
+        cmd = ["pg_receivewal", "-d", uri, "-D", str(self.wal_dir), "--slot", slot, "-Z", "5"]
+        print(f"Archiving WAL to {self.wal_dir} (Ctrl-C to stop)")
+        if self.verbose:
+            print(f"  {' '.join(cmd)}")
+
+        try:
+            result = subprocess.run(cmd)
+        except KeyboardInterrupt:
+            print("\nStopped")
+            return True
+
+        if result.returncode != 0:
+            print(f"Error: pg_receivewal exited with {result.returncode}")
+            return False
+        return True
+
+    def _archive_oplog(self, uri: str, segment_seconds: float, segment_bytes: int) -> bool:
+        """Tail local.oplog.rs into compressed segments."""
+        if not MONGO_AVAILABLE:
+            print("Error: pymongo not installed")
+            return False
+
+        client = MongoClient(uri, document_class=RawBSONDocument)
+        oplog = client.local["oplog.rs"]
+
+        resume = load_state(self.oplog_dir)
+        if resume is None:
+            bases = [b for b in self.list_base_backups() if b.oplog_ts]
+            resume = bases[-1].oplog_ts if bases else self._latest_oplog_ts(uri)
+        if resume is None:
+            print("Error: Could not read the oplog (is this a replica set?)")
+            return False
+
+        oldest = oplog.find_one(sort=[("$natural", 1)])
+        if oldest and (oldest["ts"].time, oldest["ts"].inc) > tuple(resume):
+            print(f"Warning: oplog no longer reaches {resume}; "
+                  f"take a new base backup to close the recovery gap")
+
+        writer = OplogSegmentWriter(self.oplog_dir, segment_bytes, segment_seconds)
+        last = Timestamp(*resume)
+        print(f"Tailing oplog from {resume} into {self.oplog_dir} (Ctrl-C to stop)")
+
+        try:
+            while True:
+                cursor = oplog.find(
+                    {"ts": {"$gt": last}},
+                    cursor_type=CursorType.TAILABLE_AWAIT
+                ).max_await_time_ms(1000)
+                while cursor.alive:
+                    for doc in cursor:
+                        last = doc["ts"]
+                        writer.write((last.time, last.inc), doc.raw)
+                    segment = writer.maybe_rotate()
+                    if segment and self.verbose:
+                        print(f"  {segment.name}")
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("\nStopped")
+            return True
+        finally:
+            writer.close()
+            client.close()
+
+    def restore(
+        self,
+        target_time: datetime,
+        uri: Optional[str] = None,
+        data_dir: Optional[str] = None,
+        dry_run: bool = False
+    ) -> bool:
+        """
+        Restore to a point in time.
+
+        Picks the newest base backup finished before the target and replays
+        archived changes up to it.
+
+        Args:
+            target_time: Recovery target (naive times are local time)
+            uri: Target MongoDB connection string
+            data_dir: New PostgreSQL data directory to recover into
+            dry_run: If True, only show what would be done
+
+        Returns:
+            True if successful, False otherwise
+        """
+        target = target_time.astimezone(timezone.utc)
+        bases = [b for b in self.list_base_backups() if b.end <= target]
+        if not bases:
+            print(f"Error: No base backup finished before {target.isoformat()}")
+            return False
+        base = bases[-1]
+        print(f"Using base backup {base.name} (finished {base.end.isoformat()})")
+
+        if self.db_type == "postgres":
+            if not data_dir:
+                print("Error: --data-dir required for PostgreSQL restore")
+                return False
+            return self._restore_postgres(base, target, Path(data_dir), dry_run)
+        elif self.db_type == "mongodb":
+            if not uri:
+                print("Error: --uri required for MongoDB restore")
+                return False
+            return self._restore_mongodb(base, target, uri, dry_run)
+        print(f"Error: Unsupported database type: {self.db_type}")
+        return False
+
+    def _restore_postgres(self, base: BaseBackup, target: datetime, data_dir: Path,
+                          dry_run: bool) -> bool:
+        """Unpack a base backup and configure recovery to the target time."""
+        if data_dir.exists() and any(data_dir.iterdir()):
+            print(f"Error: Data directory not empty: {data_dir}")
+            return False
+
+        if dry_run:
+            print(f"Would unpack {base.path} into {data_dir}")
+            print(f"Would replay WAL from {self.wal_dir} to {target.isoformat()}")
+            return True
+
+        data_dir.mkdir(parents=True, exist_ok=True)
+        os.chmod(data_dir, 0o700)
+        shutil.unpack_archive(base.path / "base.tar.gz", data_dir, "gztar")
+        wal_tar = base.path / "pg_wal.tar.gz"
+        if wal_tar.exists():
+            shutil.unpack_archive(wal_tar, data_dir / "pg_wal", "gztar")
+
+        # The segment pg_receivewal is still writing is not in the archive yet
+        for partial in self.wal_dir.glob("*.partial*"):
+            try:
+                data = read_partial_wal(partial)
+            except (OSError, zlib.error) as e:
+                print(f"Warning: Skipping unreadable partial WAL {partial.name}: {e}")
+                print("  Recovery stops at the end of the last complete segment")
+                continue
+            (data_dir / "pg_wal").mkdir(exist_ok=True)
+            with open(data_dir / "pg_wal" / partial.name.split(".")[0], "wb") as dst:
+                dst.write(data)
+
+        wal = str(self.wal_dir.resolve())
+        restore_command = (
+            f'f="{wal}/%f"; if [ -f "$f.gz" ]; then gunzip -c "$f.gz" > "%p"; '
+            f'else cp "$f" "%p"; fi'
+        )
+        with open(data_dir / "postgresql.auto.conf", "a") as f:
+            f.write("\n# Point-in-time recovery (db_pitr.py)\n")
+            f.write(f"restore_command = '{restore_command}'\n")
+            f.write(f"recovery_target_time = '{target.isoformat(sep=' ')}'\n")
+            f.write("recovery_target_action = 'promote'\n")
+        (data_dir / "recovery.signal").touch()
+
+        print(f"✓ Recovery configured in {data_dir}")
+        print(f"Start the server to replay WAL: pg_ctl -D {data_dir} start")
+        return True
+
+    def _restore_mongodb(self, base: BaseBackup, target: datetime, uri: str,
+                         dry_run: bool) -> bool:
+        """Restore the base dump, then replay oplog segments up to the target."""
+        target_epoch = int(target.timestamp())
+        after = base.oplog_ts or (int(base.start.timestamp()), 0)
+        segments = []
+        for path in sorted(self.oplog_dir.glob("oplog_*.bson.gz")):
+            span = parse_segment_name(path.name)
+            if span and span[1] > tuple(after) and span[0][0] <= target_epoch:
+                segments.append(path)
+
+        # Replayed ops are idempotent, so overlap with the base dump is harmless
+        limit = f"{target_epoch + 1}:0"
+        if dry_run:
+            print(f"Would restore {base.path / 'dump.archive.gz'}")
+            print(f"Would replay {len(segments)} oplog segment(s) with --oplogLimit {limit}")
+            return True
+
+        cmd = ["mongorestore", "--uri", uri, f"--archive={base.path / 'dump.archive.gz'}",
+               "--gzip", "--oplogReplay"]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"Error: {result.stderr}")
+            return False
+        print("✓ Base backup restored")
+
+        if not segments:
+            print("No archived oplog to replay")
+            return True
+
+        with tempfile.TemporaryDirectory(prefix="db-pitr-") as workdir:
+            with open(Path(workdir) / "oplog.bson", "wb") as out:
+                for segment in segments:
+                    with gzip.open(segment, "rb") as src:
+                        shutil.copyfileobj(src, out)
+
+            cmd = ["mongorestore", "--uri", uri, "--oplogReplay", "--oplogLimit", limit, workdir]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+
+        if result.returncode != 0:
+            print(f"Error: {result.stderr}")
+            return False
+
+        print(f"✓ Replayed {len(segments)} oplog segment(s) to {target.isoformat()}")
+        return True
+
+    def list_base_backups(self) -> List[BaseBackup]:
+        """
+        List base backups, oldest first.
+
+        Returns:
+            List of BaseBackup objects
+        """
+        bases = []
+        for metadata_path in sorted(self.base_dir.glob("*/base.json")):
+            with open(metadata_path) as f:
+                data = json.load(f)
+            bases.append(BaseBackup(
+                name=data["name"],
+                path=metadata_path.parent,
+                database_type=data["database_type"],
+                start=datetime.fromisoformat(data["start"]),
+                end=datetime.fromisoformat(data["end"]),
+                oplog_ts=tuple(data["oplog_ts"]) if data.get("oplog_ts") else None
+            ))
+        return sorted(bases, key=lambda b: b.end)
+
+    def status(self) -> Dict:
+        """
+        Summarize the recovery window.
+
+        Returns:
+            Dict with base backups, archived segment count and the oldest
+            and newest recoverable times
+        """
+        bases = self.list_base_backups()
+        if self.db_type == "postgres":
+            segments = sorted(self.wal_dir.glob("0*")) if self.wal_dir.exists() else []
+            newest = max((p.stat().st_mtime for p in segments), default=None)
+        else:
+            segments = [p for p in sorted(self.oplog_dir.glob("oplog_*.bson.gz"))
+                        if parse_segment_name(p.name)]
+            newest = parse_segment_name(segments[-1].name)[1][0] if segments else None
+
+        return {
+            "base_backups": [b.name for b in bases],
+            "segments": len(segments),
+            "oldest": bases[0].end.isoformat() if bases else None,
+            "newest": (datetime.fromtimestamp(newest, timezone.utc).isoformat()
+                       if newest and bases else None)
+        }
+
+    def _latest_oplog_ts(self, uri: str) -> Optional[Tuple[int, int]]:
+        """Timestamp of the newest oplog entry, or None if unavailable."""
+        if not MONGO_AVAILABLE:
+            return None
+        try:
+            client = MongoClient(uri)
+            entry = client.local["oplog.rs"].find_one(sort=[("$natural", -1)])
+            client.close()
+        except Exception as e:
+            print(f"Warning: Could not read oplog: {e}")
+            return None
+        return (entry["ts"].time, entry["ts"].inc) if entry else None
+
+    def _save_base(self, base: BaseBackup):
+        """Save base backup metadata next to its files."""
+        with open(base.path / "base.json", "w") as f:
+            json.dump({
+                "name": base.name,
+                "database_type": base.database_type,
+                "start": base.start.isoformat(),
+                "end": base.end.isoformat(),
+                "oplog_ts": list(base.oplog_ts) if base.oplog_ts else None
+            }, f, indent=2)
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Point-in-time recovery tool")
+    parser.add_argument("--db", required=True, choices=["mongodb", "postgres"],
+                       help="Database type")
+    parser.add_argument("--archive-dir", default="./pitr",
+                       help="Directory for base backups and WAL/oplog archives")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Verbose output")
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # Base backup command
+    base_parser = subparsers.add_parser("base", help="Take a base backup")
+    base_parser.add_argument("--uri", required=True, help="Database connection string")
+
+    # Archive command
+    archive_parser = subparsers.add_parser("archive", help="Continuously archive WAL/oplog")
+    archive_parser.add_argument("--uri", required=True, help="Database connection string")
+    archive_parser.add_argument("--slot", default="db_pitr",
+                               help="Replication slot (PostgreSQL, default: db_pitr)")
+    archive_parser.add_argument("--segment-seconds", type=float, default=300,
+                               help="Oplog segment age limit (MongoDB, default: 300)")
+    archive_parser.add_argument("--segment-size", default="64M",
+                               help="Oplog segment size limit (MongoDB, default: 64M)")
+
+    # Restore command
+    restore_parser = subparsers.add_parser("restore", help="Restore to a point in time")
+    restore_parser.add_argument("--target-time", required=True,
+                               help="Recovery target, e.g. '2025-01-15 14:30:00' "
+                                    "(ISO format; local time unless an offset is given)")
+    restore_parser.add_argument("--uri", help="Target connection string (MongoDB)")
+    restore_parser.add_argument("--data-dir", help="New data directory (PostgreSQL)")
+    restore_parser.add_argument("--dry-run", action="store_true",
+                               help="Show what would be done")
+
+    # Status command
+    subparsers.add_parser("status", help="Show the recovery window")
+
+    args = parser.parse_args()
+
+    manager = PITRManager(args.db, args.archive_dir, args.verbose)
+
+    if args.command == "base":
+        sys.exit(0 if manager.base_backup(args.uri) else 1)
+
+    elif args.command == "archive":
+        success = manager.archive(
+            args.uri, args.slot, args.segment_seconds, int(parse_rate(args.segment_size))
+        )
+        sys.exit(0 if success else 1)
+
+    elif args.command == "restore":
+        try:
+            target = datetime.fromisoformat(args.target_time)
+        except ValueError:
+            parser.error(f"Invalid --target-time: {args.target_time}")
+        success = manager.restore(target, args.uri, args.data_dir, args.dry_run)
+        sys.exit(0 if success else 1)
+
+    elif args.command == "status":
+        status = manager.status()
+        print(f"Base backups: {len(status['base_backups'])}")
+        for name in status["base_backups"]:
+            print(f"  {name}")
+        print(f"Archived segments: {status['segments']}")
+        if status["oldest"]:
+            print(f"Recoverable from: {status['oldest']}")
+            print(f"Recoverable to:   {status['newest'] or status['oldest']}")
+        else:
+            print("No recovery window (take a base backup)")
+
+
+if __name__ == "__main__":
+    main()
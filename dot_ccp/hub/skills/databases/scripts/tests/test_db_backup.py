@@ -1,8 +1,14 @@
 """Tests for db_backup.py"""
 
+import hashlib
+import io
 import json
+import os
+import subprocess
 import sys
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
 from pathlib import Path
 from unittest.mock import Mock, patch, MagicMock, call
 
@@ -11,7 +17,21 @@ import pytest
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from db_backup import BackupInfo, BackupManager
+from db_backup import (
+    BackupInfo,
+    BackupManager,
+    ChunkStore,
+    FleetRunner,
+    S3Storage,
+    StorageBackend,
+    TokenBucket,
+    chunk_stream,
+    codec_from_filename,
+    compress_command,
+    decompress_command,
+    parse_rate,
+    parse_toc,
+)
 
 
 @pytest.fixture
@@ -56,6 +76,654 @@ class TestBackupInfo:
         assert info.size_bytes == 1024
         assert not info.compressed
         assert not info.verified
+        assert info.codec == "none"
+
+
+class TestCodecs:
+    """Test compression codec helpers."""
+
+    def test_compress_command(self):
+        """Test threaded codecs get a thread count and level."""
+        assert compress_command("zstd", 9, 4) == ["zstd", "-9", "-T4", "-q", "-c"]
+        assert compress_command("pigz", threads=2) == ["pigz", "-6", "-p", "2", "-c"]
+        assert compress_command("gzip") == ["gzip", "-6", "-c"]
+
+    def test_decompress_command(self):
+        """Test decompressor selection."""
+        assert decompress_command("zstd")[0] == "zstd"
+        assert decompress_command("gzip") == ["gzip", "-dc"]
+
+    def test_codec_from_filename(self):
+        """Test codec inference for backups without metadata."""
+        assert codec_from_filename("db.sql.zst") == "zstd"
+        assert codec_from_filename("db.tar.gz") == "gzip"
+        assert codec_from_filename("db.sql") == "none"
+
+
+def register_backup(manager, filename, timestamp, database="testdb"):
+    """Create a backup file and record it in metadata and the catalog."""
+    (Path(manager.backup_dir) / filename).write_text("backup data")
+    info = BackupInfo(
+        filename=filename,
+        database_type=manager.db_type,
+        database_name=database,
+        timestamp=timestamp,
+        size_bytes=11,
+        compressed=False
+    )
+    manager._save_metadata(info)
+    return info
+
+
+def sql_dump(rows, start=0):
+    """Generate a fake plain SQL dump with one row per line."""
+    lines = [f"{i}\tuser{i}\tuser{i}@example.com\t{i * 7 % 1000}\n" for i in range(start, start + rows)]
+    return ("COPY users FROM stdin;\n" + "".join(lines) + "\\.\n").encode()
+
+
+class TestChunking:
+    """Test content-defined chunking and the chunk store."""
+
+    SIZES = {"min_size": 1024, "avg_size": 4096, "max_size": 16384, "read_size": 3000}
+
+    def test_chunks_reassemble(self):
+        """Test chunks are lossless and respect size limits."""
+        data = sql_dump(5000)
+        chunks = list(chunk_stream(io.BytesIO(data), **self.SIZES))
+
+        assert b"".join(chunks) == data
+        assert all(len(c) <= 16384 for c in chunks)
+        assert all(len(c) >= 1024 for c in chunks[:-1])
+
+    def test_boundaries_survive_insert(self):
+        """Test an insert near the start only changes nearby chunks."""
+        original = sql_dump(5000)
+        edited = original.replace(b"\n100\t", b"\nNEW ROW\n100\t", 1)
+
+        before = set(chunk_stream(io.BytesIO(original), **self.SIZES))
+        after = list(chunk_stream(io.BytesIO(edited), **self.SIZES))
+
+        shared = sum(1 for c in after if c in before)
+        assert shared >= len(after) - 3
+
+    def test_binary_without_newlines(self):
+        """Test data without lines is hard-cut at max size."""
+        data = bytes(range(256)) * 200
+        chunks = list(chunk_stream(io.BytesIO(data), **self.SIZES))
+
+        assert b"".join(chunks) == data
+        assert [len(c) for c in chunks[:-1]] == [16384] * (len(chunks) - 1)
+
+    def test_store_dedup_and_prune(self, tmp_path):
+        """Test repeated chunks are stored once and pruned when unreferenced."""
+        store = ChunkStore(tmp_path / ".dedup")
+
+        digest, written = store.put(b"hello")
+        assert written > 0
+        assert store.put(b"hello") == (digest, 0)
+        assert store.get(digest) == b"hello"
+
+        other, _ = store.put(b"world")
+        removed, _ = store.prune({digest})
+        assert removed == 1
+        assert store.has(digest)
+        assert not store.has(other)
+
+    def test_prune_waits_for_running_backup(self, temp_backup_dir):
+        """Test pruning blocks while a backup holds the store lock."""
+        manager = BackupManager("postgres", temp_backup_dir)
+        digest, _ = manager.chunk_store.put(b"shared chunk")
+        pruned = threading.Event()
+
+        def prune():
+            manager.prune_chunks()
+            pruned.set()
+
+        with manager.chunk_store.lock():
+            # The backup has seen `digest` as a dedup hit but not written its manifest
+            worker = threading.Thread(target=prune)
+            worker.start()
+            assert not pruned.wait(0.2)
+            with open(Path(temp_backup_dir) / "db.snapshot", "w") as f:
+                json.dump({"chunks": [[digest, 12]]}, f)
+
+        worker.join(5)
+        assert pruned.is_set()
+        assert manager.chunk_store.has(digest)
+
+
+class TestFleet:
+    """Test fleet orchestration and bandwidth limiting."""
+
+    def test_parse_rate(self):
+        """Test human-readable byte rates."""
+        assert parse_rate("200M") == 200 * 1024 * 1024
+        assert parse_rate("1.5G") == 1.5 * 1024 ** 3
+        assert parse_rate("64KB/s") == 64 * 1024
+        assert parse_rate("1000") == 1000
+
+    def test_token_bucket_sleeps_on_debt(self):
+        """Test consuming past the burst sleeps for the deficit."""
+        bucket = TokenBucket(rate=1000)
+
+        with patch('db_backup.time.sleep') as mock_sleep:
+            bucket.consume(1000)
+            mock_sleep.assert_not_called()
+            bucket.consume(500)
+
+        assert mock_sleep.call_args[0][0] == pytest.approx(0.5, abs=0.05)
+
+    def test_per_host_and_global_caps(self, tmp_path):
+        """Test concurrency never exceeds per-host or global limits."""
+        import threading
+        import time
+
+        lock = threading.Lock()
+        active = {"total": 0, "peak": 0}
+        per_host = {}
+        peak_host = {}
+
+        def fake_backup(manager, uri, database, **kwargs):
+            host = uri.split("//")[1].split("/")[0]
+            with lock:
+                active["total"] += 1
+                per_host[host] = per_host.get(host, 0) + 1
+                active["peak"] = max(active["peak"], active["total"])
+                peak_host[host] = max(peak_host.get(host, 0), per_host[host])
+            time.sleep(0.05)
+            with lock:
+                active["total"] -= 1
+                per_host[host] -= 1
+            return BackupInfo(
+                filename=f"{database}.sql",
+                database_type="postgres",
+                database_name=database,
+                timestamp=datetime.now(),
+                size_bytes=1024 * 1024,
+                compressed=False
+            )
+
+        config = {
+            "max_concurrent": 3,
+            "per_host": 1,
+            "targets": [
+                {"name": f"db{i}", "db": "postgres",
+                 "uri": f"postgresql://host{i % 2}/db{i}", "database": f"db{i}"}
+                for i in range(6)
+            ]
+        }
+
+        with patch.object(BackupManager, "create_backup", autospec=True, side_effect=fake_backup):
+            results = FleetRunner(config, str(tmp_path)).run()
+
+        assert [r["name"] for r in results] == [f"db{i}" for i in range(6)]
+        assert all(r["ok"] and r["mb_per_sec"] > 0 for r in results)
+        assert peak_host == {"host0": 1, "host1": 1}
+        assert active["peak"] <= 2
+
+    def test_waiting_host_does_not_hold_worker(self, tmp_path):
+        """Test targets on a busy host leave global slots to other hosts."""
+        import threading
+        import time
+
+        lock = threading.Lock()
+        active = {"total": 0, "peak": 0}
+
+        def fake_backup(manager, uri, database, **kwargs):
+            with lock:
+                active["total"] += 1
+                active["peak"] = max(active["peak"], active["total"])
+            time.sleep(0.1)
+            with lock:
+                active["total"] -= 1
+            return BackupInfo(filename="x.sql", database_type="postgres", database_name=database,
+                              timestamp=datetime.now(), size_bytes=1, compressed=False)
+
+        # Four targets on host0 first, then one each on host1..host4
+        hosts = [0, 0, 0, 0, 1, 2, 3, 4]
+        config = {"max_concurrent": 4, "per_host": 1, "targets": [
+            {"name": f"db{i}", "db": "postgres", "uri": f"postgresql://host{h}/db{i}", "database": f"db{i}"}
+            for i, h in enumerate(hosts)
+        ]}
+
+        start = time.perf_counter()
+        with patch.object(BackupManager, "create_backup", autospec=True, side_effect=fake_backup):
+            results = FleetRunner(config, str(tmp_path)).run()
+        elapsed = time.perf_counter() - start
+
+        assert all(r["ok"] for r in results)
+        assert active["peak"] == 4
+        assert elapsed < 0.6
+
+    def test_new_backup_dir(self, tmp_path):
+        """Test a fleet can back up into a directory that does not exist yet."""
+        config = {"targets": [
+            {"name": name, "db": "postgres", "uri": f"postgresql://h/{name}", "database": name}
+            for name in ("a", "b")
+        ]}
+        info = BackupInfo(filename="x.sql", database_type="postgres", database_name="x",
+                          timestamp=datetime.now(), size_bytes=1, compressed=False)
+
+        with patch.object(BackupManager, "create_backup", return_value=info):
+            results = FleetRunner(config, str(tmp_path / "new" / "dir")).run()
+
+        assert [r["error"] for r in results] == [None, None]
+        assert (tmp_path / "new" / "dir" / "a").is_dir()
+
+    def test_bandwidth_limit_forces_streamed_pg_dump(self, tmp_path, capsys):
+        """Test parallel pg_dump targets drop to one job when bandwidth is capped."""
+        config = {"targets": [
+            {"name": "pg", "db": "postgres", "uri": "postgresql://h/pg", "database": "pg", "jobs": 8},
+            {"name": "mongo", "db": "mongodb", "uri": "mongodb://h/m", "jobs": 8},
+        ]}
+        info = BackupInfo(filename="x.sql", database_type="postgres", database_name="x",
+                          timestamp=datetime.now(), size_bytes=1, compressed=False)
+
+        with patch.object(BackupManager, "create_backup", return_value=info) as create:
+            FleetRunner(config, str(tmp_path), max_concurrent=1, bandwidth=1024 ** 2).run()
+            capped = [c.kwargs["jobs"] for c in create.call_args_list]
+            create.reset_mock()
+            FleetRunner(config, str(tmp_path), max_concurrent=1).run()
+            uncapped = [c.kwargs["jobs"] for c in create.call_args_list]
+
+        assert capped == [1, 8]
+        assert uncapped == [8, 8]
+        assert "pg: bandwidth limit set, dumping with 1 job instead of 8" in capsys.readouterr().out
+
+    def test_failed_target_reported(self, tmp_path):
+        """Test failures are reported without stopping the fleet."""
+        config = {
+            "bandwidth_limit": "10M",
+            "targets": [
+                {"name": "broken", "db": "postgres", "uri": "postgresql://h/x", "database": "x"},
+            ]
+        }
+
+        runner = FleetRunner(config, str(tmp_path))
+        with patch.object(BackupManager, "create_backup", return_value=None):
+            results = runner.run()
+
+        assert runner.throttle.rate == 10 * 1024 * 1024
+        assert not results[0]["ok"]
+        assert results[0]["error"] == "backup failed"
+
+
+TOC_LISTING = """;
+; Archive created at 2025-01-01 12:00:00 UTC
+;
+215; 2615 2200 SCHEMA - sales postgres
+220; 1259 16390 TABLE public orders postgres
+221; 1259 16388 SEQUENCE public orders_id_seq postgres
+222; 0 0 SEQUENCE OWNED BY public orders_id_seq postgres
+223; 1259 16384 TABLE public customers postgres
+224; 1259 16400 TABLE public audit postgres
+225; 1259 16410 TABLE sales regions postgres
+226; 1259 16420 TABLE public events postgres
+227; 1259 16419 SEQUENCE public events_id_seq postgres
+230; 2604 16391 DEFAULT public orders id postgres
+240; 0 16390 TABLE DATA public orders postgres
+241; 0 16384 TABLE DATA public customers postgres
+242; 0 16400 TABLE DATA public audit postgres
+243; 0 16410 TABLE DATA sales regions postgres
+244; 0 0 SEQUENCE SET public orders_id_seq postgres
+245; 0 16420 TABLE DATA public events postgres
+246; 0 0 SEQUENCE SET public events_id_seq postgres
+250; 2606 16395 CONSTRAINT public orders orders_pkey postgres
+251; 1259 16396 INDEX public orders_created_idx postgres
+252; 1259 16401 INDEX public audit_ts_idx postgres
+253; 2606 16397 FK CONSTRAINT public orders orders_customer_fkey postgres
+254; 2606 16398 FK CONSTRAINT public audit audit_order_fkey postgres
+260; 0 0 COMMENT public TABLE orders postgres
+"""
+
+TOC_DDL = """
+ALTER TABLE ONLY public.orders ALTER COLUMN id SET DEFAULT nextval('public.orders_id_seq'::regclass);
+CREATE INDEX orders_created_idx ON public.orders USING btree (created);
+CREATE INDEX audit_ts_idx ON public.audit USING btree (ts);
+ALTER TABLE ONLY public.orders
+    ADD CONSTRAINT orders_customer_fkey FOREIGN KEY (customer_id) REFERENCES public.customers(id);
+ALTER TABLE ONLY public.audit
+    ADD CONSTRAINT audit_order_fkey FOREIGN KEY (order_id) REFERENCES public.orders(id);
+ALTER SEQUENCE public.orders_id_seq OWNED BY public.orders.id;
+ALTER TABLE public.events ALTER COLUMN id ADD GENERATED ALWAYS AS IDENTITY (
+    SEQUENCE NAME public.events_id_seq
+    START WITH 1
+    INCREMENT BY 1
+    CACHE 1
+);
+"""
+
+
+class TestSelectiveRestore:
+    """Test table-level PostgreSQL restore."""
+
+    def test_parse_toc(self):
+        """Test multi-word entry types and comment lines."""
+        entries = parse_toc(TOC_LISTING)
+
+        assert len(entries) == 23
+        assert entries[3].kind == "SEQUENCE OWNED BY"
+        assert entries[-3].kind == "FK CONSTRAINT"
+        assert entries[-3].qualified == "public.orders"
+
+    def run_selective(self, temp_backup_dir, tables=None, schemas=None):
+        """Run a selective restore, capturing the list file and commands."""
+        manager = BackupManager("postgres", temp_backup_dir)
+        backup = Path(temp_backup_dir) / "db.dump"
+        backup.write_bytes(b"PGDMP\x01\x0e")
+        lists = []
+        commands = []
+
+        def fake_run(cmd, **kwargs):
+            commands.append(cmd)
+            if "-L" in cmd:
+                lists.append(Path(cmd[cmd.index("-L") + 1]).read_text())
+            stdout = TOC_LISTING if cmd[1] == "-l" else TOC_DDL if "-f" in cmd else ""
+            return MagicMock(returncode=0, stdout=stdout, stderr="")
+
+        with patch("subprocess.run", side_effect=fake_run):
+            result = manager.restore_backup(
+                "db.dump", "postgresql://localhost/db", jobs=4,
+                tables=tables, schemas=schemas
+            )
+        return result, lists, commands
+
+    def test_table_with_dependencies(self, temp_backup_dir, capsys):
+        """Test a table brings its sequence, default, indexes and comment."""
+        result, lists, commands = self.run_selective(
+            temp_backup_dir, tables=["orders", "customers"]
+        )
+
+        assert result is True
+        restore_list = lists[-1]
+        for entry in ("TABLE public orders", "TABLE DATA public customers",
+                      "SEQUENCE SET public orders_id_seq", "DEFAULT public orders id",
+                      "INDEX public orders_created_idx", "orders_customer_fkey",
+                      "COMMENT public TABLE orders"):
+            assert entry in restore_list
+        assert "audit" not in restore_list
+        assert "regions" not in restore_list
+
+    def test_identity_sequence(self, temp_backup_dir):
+        """Test an identity column's sequence and its state come with the table."""
+        _, lists, _ = self.run_selective(temp_backup_dir, tables=["events"])
+
+        assert "SEQUENCE public events_id_seq" in lists[-1]
+        assert "SEQUENCE SET public events_id_seq" in lists[-1]
+        assert "orders_id_seq" not in lists[-1]
+
+    def test_references_quoted_identifiers(self, temp_backup_dir):
+        """Test quoted names with spaces, dots and OWNED BY are resolved."""
+        manager = BackupManager("postgres", temp_backup_dir)
+        entries = parse_toc("1; 1259 1 INDEX public idx postgres\n2; 0 0 SEQUENCE OWNED BY public s postgres")
+        ddl = (
+            'CREATE INDEX "Line Items_sku_idx" ON public."Line Items" USING btree (sku);\n'
+            'ALTER SEQUENCE public."Line Items_id_seq" OWNED BY public."Line Items".id;\n'
+            'ALTER SEQUENCE "My.Schema".seq OWNED BY "My.Schema"."T""q".id;\n'
+        )
+
+        with patch("subprocess.run", return_value=MagicMock(returncode=0, stdout=ddl)):
+            refs = manager._toc_references(Path("db.dump"), entries)
+
+        assert refs["index_table"] == {"public.Line Items_sku_idx": "public.Line Items"}
+        assert refs["table_sequences"] == {
+            "public.Line Items": {"public.Line Items_id_seq"},
+            'My.Schema.T"q': {"My.Schema.seq"},
+        }
+
+    def test_three_phase_restore(self, temp_backup_dir):
+        """Test data and post-data run in parallel after the schema."""
+        _, lists, commands = self.run_selective(temp_backup_dir, tables=["public.orders"])
+
+        phases = commands[-3:]
+        assert [c[c.index("-L") + 2] for c in phases] == [
+            "--section=pre-data", "--section=data", "--section=post-data"
+        ]
+        assert [c[c.index("-j") + 1] for c in phases] == ["1", "4", "4"]
+        assert len(set(lists[-3:])) == 1
+
+    def test_skips_dangling_foreign_keys(self, temp_backup_dir, capsys):
+        """Test foreign keys to unselected tables are left out."""
+        _, lists, _ = self.run_selective(temp_backup_dir, tables=["orders"])
+
+        assert "orders_customer_fkey" not in lists[-1]
+        assert "Skipping foreign key public.orders orders_customer_fkey" in capsys.readouterr().out
+
+    def test_schema_selection(self, temp_backup_dir):
+        """Test a schema restores its entry and all its tables."""
+        _, lists, _ = self.run_selective(temp_backup_dir, schemas=["sales"])
+
+        assert "SCHEMA - sales" in lists[-1]
+        assert "TABLE DATA sales regions" in lists[-1]
+        assert "public" not in lists[-1]
+
+    def test_no_match(self, temp_backup_dir):
+        """Test unknown tables fail before restoring anything."""
+        result, _, commands = self.run_selective(temp_backup_dir, tables=["missing"])
+
+        assert result is False
+        assert len(commands) == 1
+
+    def test_plain_sql_rejected(self, temp_backup_dir):
+        """Test plain SQL dumps cannot be restored selectively."""
+        manager = BackupManager("postgres", temp_backup_dir)
+        (Path(temp_backup_dir) / "db.sql").write_text("CREATE TABLE t ();")
+
+        with patch("subprocess.run") as mock_run:
+            assert manager.restore_backup(
+                "db.sql", "postgresql://localhost/db", tables=["t"]
+            ) is False
+        mock_run.assert_not_called()
+
+
+class FakeS3Client:
+    """In-memory stand-in for an S3-compatible server (MinIO-like)."""
+
+    def __init__(self, part_delay=0.0):
+        self.objects = {}
+        self.uploads = {}
+        self.part_delay = part_delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.aborted = 0
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.part_delay)
+        self.uploads[UploadId][PartNumber] = Body
+        with self.lock:
+            self.in_flight -= 1
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        numbers = [p["PartNumber"] for p in MultipartUpload["Parts"]]
+        assert numbers == sorted(parts)
+        self.objects[(Bucket, Key)] = b"".join(parts[n] for n in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.aborted += 1
+
+    def _get(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            error = Exception("Not Found")
+            error.response = {"Error": {"Code": "404"}}
+            raise error
+        return self.objects[(Bucket, Key)]
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self._get(Bucket, Key))}
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self._get(Bucket, Key))}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+class TestS3Storage:
+    """Test streaming backups to S3-compatible storage."""
+
+    def test_multipart_bounded_in_flight(self):
+        """Test parts upload concurrently but never above the limit."""
+        client = FakeS3Client(part_delay=0.01)
+        storage = S3Storage("s3://backups/prod", part_size=1000, max_in_flight=2, client=client)
+        data = os.urandom(10500)
+
+        writer = storage.open_writer("db.sql.gz")
+        for i in range(0, len(data), 300):
+            writer.write(data[i:i + 300])
+        writer.close()
+
+        assert client.objects[("backups", "prod/db.sql.gz")] == data
+        assert client.max_in_flight == 2
+        assert storage.location("db.sql.gz") == "s3://backups/prod/db.sql.gz"
+
+    def test_part_size_grows_to_stay_under_part_limit(self):
+        """Test parts double in size and the part limit fails fast."""
+        client = FakeS3Client()
+        storage = S3Storage("s3://backups", part_size=10, client=client)
+
+        with patch("db_backup.S3_PARTS_PER_SIZE_STEP", 2), patch("db_backup.S3_MAX_PARTS", 6):
+            writer = storage.open_writer("db.sql")
+            writer.write(b"x" * (10 + 10 + 20 + 20 + 40 + 40))
+            parts = client.uploads[writer.upload_id]
+            for future in writer.parts:
+                future.result()
+            assert [len(parts[n]) for n in sorted(parts)] == [10, 10, 20, 20, 40, 40]
+
+            with pytest.raises(ValueError, match="6-part limit"):
+                writer.write(b"x" * 80)
+            writer.abort()
+
+        assert client.aborted == 1
+
+    def test_small_object_single_put(self):
+        """Test streams under one part skip multipart upload."""
+        client = FakeS3Client()
+        storage = S3Storage("s3://backups", part_size=1000, client=client)
+
+        writer = storage.open_writer("small")
+        writer.write(b"tiny")
+        writer.close()
+
+        assert client.objects[("backups", "small")] == b"tiny"
+        assert not client.uploads
+        assert storage.exists("small") and not storage.exists("other")
+
+    def test_incomplete_backend_rejected(self):
+        """Test a backend missing methods fails when created, not mid-upload."""
+        class WriteOnly(StorageBackend):
+            def open_writer(self, name):
+                return None
+
+        with pytest.raises(TypeError):
+            WriteOnly()
+
+    def test_invalid_url(self):
+        """Test non-S3 URLs are rejected."""
+        with pytest.raises(ValueError):
+            S3Storage("/local/path", client=FakeS3Client())
+
+    def test_stream_backup_to_s3(self, temp_backup_dir):
+        """Test a compressed dump streams to the bucket with nothing written locally."""
+        import gzip
+
+        client = FakeS3Client()
+        storage = S3Storage("s3://backups/pg", part_size=64, client=client)
+        manager = BackupManager("postgres", temp_backup_dir, storage)
+        output = Path(temp_backup_dir) / "db.sql.gz"
+
+        checksum, intact = manager._stream_to_file(
+            ["seq", "2000"], output, compress_command("gzip"), check_codec="gzip"
+        )
+
+        body = client.objects[("backups", "pg/db.sql.gz")]
+        assert gzip.decompress(body) == "".join(f"{i}\n" for i in range(1, 2001)).encode()
+        assert checksum == hashlib.sha256(body).hexdigest()
+        assert intact is True
+        assert not output.exists()
+
+    def test_failed_dump_aborts_upload(self, temp_backup_dir):
+        """Test a failed producer aborts the multipart upload."""
+        client = FakeS3Client()
+        storage = S3Storage("s3://backups", part_size=64, client=client)
+        manager = BackupManager("postgres", temp_backup_dir, storage)
+
+        result = manager._stream_to_file(
+            ["sh", "-c", "seq 5000; exit 1"], Path(temp_backup_dir) / "db.sql"
+        )
+
+        assert result is None
+        assert client.aborted == 1
+        assert not client.objects
+
+    def test_rejects_directory_and_dedup(self, temp_backup_dir):
+        """Test backups that need local files are refused for remote storage."""
+        storage = S3Storage("s3://backups", client=FakeS3Client())
+        manager = BackupManager("postgres", temp_backup_dir, storage)
+
+        with patch("subprocess.run") as mock_run, patch("subprocess.Popen") as mock_popen:
+            assert manager.create_backup("postgresql://localhost/db", "db", jobs=4) is None
+            assert manager.create_backup("postgresql://localhost/db", "db", dedup=True) is None
+        mock_run.assert_not_called()
+        mock_popen.assert_not_called()
+
+    def test_restore_streams_from_s3(self, temp_backup_dir):
+        """Test restore pipes the object through the decompressor into psql."""
+        import gzip
+
+        sql = sql_dump(500)
+        client = FakeS3Client()
+        client.objects[("backups", "postgres_db_20250101_120000.sql.gz")] = gzip.compress(sql)
+        storage = S3Storage("s3://backups", client=client)
+        manager = BackupManager("postgres", temp_backup_dir, storage)
+        restored = Path(temp_backup_dir) / "restored.sql"
+        real_popen = subprocess.Popen
+
+        def fake_popen(cmd, **kwargs):
+            if cmd[0] == "psql":
+                cmd = ["sh", "-c", f"cat > {restored}"]
+            return real_popen(cmd, **kwargs)
+
+        with patch("subprocess.Popen", side_effect=fake_popen):
+            assert manager.restore_backup(
+                "postgres_db_20250101_120000.sql.gz", "postgresql://localhost/db"
+            ) is True
+
+        assert restored.read_bytes() == sql
+        assert not (Path(temp_backup_dir) / "postgres_db_20250101_120000.sql.gz").exists()
+
+    def test_verify_and_remove_remote(self, temp_backup_dir):
+        """Test checksum verification reads and removal deletes the object."""
+        client = FakeS3Client()
+        client.objects[("backups", "db.sql")] = b"data"
+        storage = S3Storage("s3://backups", client=client)
+        manager = BackupManager("postgres", temp_backup_dir, storage)
+        manager._save_metadata(BackupInfo(
+            filename="db.sql", database_type="postgres", database_name="db",
+            timestamp=datetime.now(), size_bytes=4, compressed=False,
+            codec="none", sha256=hashlib.sha256(b"data").hexdigest()
+        ))
+
+        assert manager.verify_backups()[0]["ok"] is True
+        client.objects[("backups", "db.sql")] = b"dat4"
+        assert manager.verify_backups()[0]["detail"] == "checksum mismatch"
+
+        manager._remove_backup("db.sql")
+        assert not client.objects
 
 
 class TestBackupManager:
@@ -68,10 +736,11 @@ class TestBackupManager:
         assert manager.db_type == "mongodb"
         assert Path(temp_backup_dir).exists()
 
-    @patch('subprocess.run')
-    def test_backup_mongodb(self, mock_run, temp_backup_dir):
+    @patch('subprocess.Popen')
+    def test_backup_mongodb(self, mock_popen, temp_backup_dir):
         """Test MongoDB backup creation."""
-        mock_run.return_value = Mock(returncode=0, stderr="")
+        mock_popen.return_value.stdout = io.BytesIO(b"archive data")
+        mock_popen.return_value.wait.return_value = 0
 
         manager = BackupManager("mongodb", temp_backup_dir)
         backup_info = manager.create_backup(
@@ -84,7 +753,8 @@ class TestBackupManager:
         assert backup_info is not None
         assert backup_info.database_type == "mongodb"
         assert backup_info.database_name == "testdb"
-        mock_run.assert_called_once()
+        assert backup_info.sha256 == hashlib.sha256(b"archive data").hexdigest()
+        mock_popen.assert_called_once()
 
     @patch('subprocess.run')
     def test_backup_postgres(self, mock_run, temp_backup_dir):
@@ -119,26 +789,61 @@ class TestBackupManager:
 
         assert backup_info is None
 
-    @patch('subprocess.run')
-    def test_backup_with_compression(self, mock_run, temp_backup_dir):
+    @patch('subprocess.Popen')
+    def test_backup_with_compression(self, mock_popen, temp_backup_dir):
         """Test backup with compression."""
-        mock_run.return_value = Mock(returncode=0, stderr="")
+        mock_popen.return_value.stdout = io.BytesIO(b"archive data")
+        mock_popen.return_value.wait.return_value = 0
 
         manager = BackupManager("mongodb", temp_backup_dir)
 
-        with patch('shutil.make_archive') as mock_archive, \
-             patch('shutil.rmtree') as mock_rmtree:
+        backup_info = manager.create_backup(
+            "mongodb://localhost",
+            "testdb",
+            compress=True,
+            verify=False,
+            jobs=4
+        )
 
-            backup_info = manager.create_backup(
-                "mongodb://localhost",
-                "testdb",
-                compress=True,
-                verify=False
-            )
+        assert backup_info is not None
+        assert backup_info.compressed
+        assert backup_info.format == "archive"
+        assert backup_info.filename.endswith(".archive.gz")
+        cmd = mock_popen.call_args[0][0]
+        assert "--archive" in cmd
+        assert "--gzip" in cmd
+        assert cmd[cmd.index("--numParallelCollections") + 1] == "4"
 
-            assert backup_info is not None
-            assert backup_info.compressed
-            mock_archive.assert_called_once()
+    @patch('subprocess.run')
+    @patch('subprocess.Popen')
+    def test_restore_mongodb_archive_streams(self, mock_popen, mock_run, temp_backup_dir):
+        """Test zstd archives are decompressed straight into mongorestore."""
+        mock_run.return_value = Mock(returncode=0, stderr="")
+        mock_popen.return_value.wait.return_value = 0
+
+        manager = BackupManager("mongodb", temp_backup_dir)
+        info = BackupInfo(
+            filename="mongodb_testdb.archive.zst",
+            database_type="mongodb",
+            database_name="testdb",
+            timestamp=datetime.now(),
+            size_bytes=4,
+            compressed=True,
+            format="archive",
+            codec="zstd"
+        )
+        (Path(temp_backup_dir) / info.filename).write_bytes(b"data")
+        manager._save_metadata(info)
+
+        with patch('shutil.unpack_archive') as mock_unpack:
+            result = manager.restore_backup(info.filename, "mongodb://localhost", jobs=3)
+
+        assert result is True
+        mock_unpack.assert_not_called()
+        assert mock_popen.call_args[0][0] == decompress_command("zstd")
+        cmd = mock_run.call_args[0][0]
+        assert cmd[-1] == "--archive"
+        assert cmd[cmd.index("--numInsertionWorkersPerCollection") + 1] == "3"
 
     def test_save_and_load_metadata(self, temp_backup_dir, sample_backup_info):
         """Test saving and loading backup metadata."""
@@ -243,30 +948,36 @@ class TestBackupManager:
         """Test cleaning up old backups."""
         manager = BackupManager("mongodb", temp_backup_dir)
 
-        # Create old backup file (simulate by setting mtime)
+        # Create backup recorded 10 days ago
+        register_backup(manager, "old_backup.dump", datetime.now() - timedelta(days=10))
         old_backup = Path(temp_backup_dir) / "old_backup.dump"
-        old_backup.touch()
-
-        # Set mtime to 10 days ago
-        old_time = datetime.now().timestamp() - (10 * 24 * 3600)
-        os.utime(old_backup, (old_time, old_time))
 
         # Cleanup with 7-day retention
         removed = manager.cleanup_old_backups(retention_days=7)
 
         assert removed == 1
         assert not old_backup.exists()
+        assert manager.list_backups() == []
+
+    def test_cleanup_uses_recorded_timestamp(self, temp_backup_dir):
+        """Test retention ignores file mtime."""
+        manager = BackupManager("mongodb", temp_backup_dir)
+
+        register_backup(manager, "recent.dump", datetime.now())
+        recent = Path(temp_backup_dir) / "recent.dump"
+        old_time = datetime.now().timestamp() - (10 * 24 * 3600)
+        os.utime(recent, (old_time, old_time))
+
+        assert manager.cleanup_old_backups(retention_days=7) == 0
+        assert recent.exists()
 
     def test_cleanup_dry_run(self, temp_backup_dir):
         """Test cleanup in dry-run mode."""
         manager = BackupManager("mongodb", temp_backup_dir)
 
-        # Create old backup file
+        # Create old backup
+        register_backup(manager, "old_backup.dump", datetime.now() - timedelta(days=10))
         old_backup = Path(temp_backup_dir) / "old_backup.dump"
-        old_backup.touch()
-
-        old_time = datetime.now().timestamp() - (10 * 24 * 3600)
-        os.utime(old_backup, (old_time, old_time))
 
         # Cleanup with dry-run
         removed = manager.cleanup_old_backups(retention_days=7, dry_run=True)
@@ -274,6 +985,44 @@ class TestBackupManager:
         assert removed == 1
         assert old_backup.exists()  # File should still exist
 
+    def test_gfs_retention(self, temp_backup_dir):
+        """Test GFS keeps the newest backup per hour/day bucket."""
+        manager = BackupManager("postgres", temp_backup_dir)
+        now = datetime(2025, 6, 15, 12, 30)
+        for hours in range(0, 72, 6):
+            register_backup(manager, f"db_{hours:02d}.sql", now - timedelta(hours=hours))
+        register_backup(manager, "other.sql", now - timedelta(days=30), database="otherdb")
+
+        removed = manager.apply_retention(hourly=2, daily=3)
+
+        kept = sorted(b.filename for b in manager.list_backups("testdb"))
+        # 2 newest hours, plus the newest of each of the last 3 days
+        assert kept == ["db_00.sql", "db_06.sql", "db_18.sql", "db_42.sql"]
+        assert removed == 8
+        assert [b.filename for b in manager.list_backups("otherdb")] == ["other.sql"]
+
+    def test_gfs_weekly_spans_new_year(self, temp_backup_dir):
+        """Test the ISO week crossing New Year is a single weekly bucket."""
+        manager = BackupManager("postgres", temp_backup_dir)
+        # Mon 2024-12-30 to Sun 2025-01-05 is ISO week 2025-W01
+        for day in (datetime(2024, 12, 22), datetime(2024, 12, 30), datetime(2025, 1, 2)):
+            register_backup(manager, f"db_{day:%m%d}.sql", day)
+
+        manager.apply_retention(weekly=2)
+
+        kept = sorted(b.filename for b in manager.list_backups("testdb"))
+        assert kept == ["db_0102.sql", "db_1222.sql"]
+
+    def test_catalog_rebuilt_from_metadata(self, temp_backup_dir, sample_backup_info):
+        """Test a missing catalog is rebuilt from metadata files."""
+        manager = BackupManager("mongodb", temp_backup_dir)
+        manager._save_metadata(sample_backup_info)
+        (Path(temp_backup_dir) / "catalog.db").unlink()
+
+        rebuilt = BackupManager("mongodb", temp_backup_dir)
+
+        assert [b.filename for b in rebuilt.list_backups()] == [sample_backup_info.filename]
+
     def test_verify_backup(self, temp_backup_dir, sample_backup_info):
         """Test backup verification."""
         manager = BackupManager("mongodb", temp_backup_dir)
@@ -298,6 +1047,445 @@ class TestBackupManager:
 
         assert result is False
 
+    @patch('subprocess.run')
+    def test_backup_postgres_parallel(self, mock_run, temp_backup_dir):
+        """Test parallel directory-format PostgreSQL backup."""
+        def fake_dump(cmd, **kwargs):
+            out = Path(cmd[cmd.index("-f") + 1])
+            out.mkdir()
+            (out / "toc.dat").write_bytes(b"toc")
+            return Mock(returncode=0, stderr="")
+        mock_run.side_effect = fake_dump
+
+        manager = BackupManager("postgres", temp_backup_dir)
+        backup_info = manager.create_backup(
+            "postgresql://localhost/testdb",
+            "testdb",
+            jobs=4
+        )
+
+        assert backup_info is not None
+        assert backup_info.format == "directory"
+        assert backup_info.filename.endswith(".dir")
+        assert backup_info.verified
+        cmd = mock_run.call_args[0][0]
+        assert cmd[:4] == ["pg_dump", "-Fd", "-j", "4"]
+
+        metadata = manager._load_metadata(backup_info.filename)
+        assert metadata["format"] == "directory"
+
+    @patch('subprocess.run')
+    def test_restore_postgres_parallel(self, mock_run, temp_backup_dir):
+        """Test directory-format restore uses pg_restore -j."""
+        mock_run.return_value = Mock(returncode=0, stderr="")
+
+        manager = BackupManager("postgres", temp_backup_dir)
+        backup_dir = Path(temp_backup_dir) / "postgres_testdb.dir"
+        backup_dir.mkdir()
+        (backup_dir / "toc.dat").write_bytes(b"toc")
+
+        result = manager.restore_backup(
+            "postgres_testdb.dir",
+            "postgresql://localhost/testdb",
+            jobs=8
+        )
+
+        assert result is True
+        cmd = mock_run.call_args[0][0]
+        assert cmd[:3] == ["pg_restore", "-j", "8"]
+
+    def test_cleanup_directory_backup(self, temp_backup_dir):
+        """Test cleanup removes directory backups and their metadata."""
+        manager = BackupManager("postgres", temp_backup_dir)
+
+        backup_dir = Path(temp_backup_dir) / "postgres_testdb.dir"
+        backup_dir.mkdir()
+        (backup_dir / "toc.dat").write_bytes(b"toc")
+        manager._save_metadata(BackupInfo(
+            filename="postgres_testdb.dir",
+            database_type="postgres",
+            database_name="testdb",
+            timestamp=datetime.now() - timedelta(days=10),
+            size_bytes=3,
+            compressed=False,
+            format="directory"
+        ))
+        metadata_file = Path(temp_backup_dir) / "postgres_testdb.dir.json"
+
+        removed = manager.cleanup_old_backups(retention_days=7)
+
+        assert removed == 1
+        assert not backup_dir.exists()
+        assert not metadata_file.exists()
+
+    def test_benchmark(self, temp_backup_dir):
+        """Test benchmark reports throughput per format and cleans up."""
+        manager = BackupManager("postgres", temp_backup_dir)
+
+        def fake_backup(uri, database, compress, verify, jobs, compression):
+            info = BackupInfo(
+                filename=f"bench_{jobs}_{compression}.sql",
+                database_type="postgres",
+                database_name=database,
+                timestamp=datetime.now(),
+                size_bytes=1024 * 1024,
+                compressed=compress
+            )
+            (Path(temp_backup_dir) / info.filename).write_text("data")
+            return info
+
+        with patch.object(manager, "_database_size", return_value=10 * 1024 * 1024), \
+             patch.object(manager, "create_backup", side_effect=fake_backup):
+            results = manager.benchmark("postgresql://localhost/testdb", "testdb")
+
+        assert [r["format"] for r in results] == [
+            "plain", "plain+gzip", "plain+zstd", "directory"
+        ]
+        assert all(r["mb_per_sec"] > 0 for r in results)
+        assert not list(Path(temp_backup_dir).glob("bench_*"))
+
+    @patch('db_backup.MONGO_AVAILABLE', True)
+    @patch('db_backup.MongoClient', create=True)
+    def test_benchmark_mongodb_uses_uncompressed_size(self, mock_client_cls, temp_backup_dir):
+        """Test MongoDB throughput is based on dataSize, not the archive size."""
+        client = mock_client_cls.return_value
+        client["shop"].command.return_value = {"dataSize": 100 * 1024 * 1024, "storageSize": 1}
+        manager = BackupManager("mongodb", temp_backup_dir)
+
+        def fake_backup(uri, database, compress, verify, jobs, compression):
+            return BackupInfo(
+                filename=f"bench_{jobs}_{compression}.archive", database_type="mongodb",
+                database_name=database, timestamp=datetime.now(),
+                size_bytes=1024 * 1024, compressed=compress
+            )
+
+        with patch.object(manager, "create_backup", side_effect=fake_backup), \
+             patch("db_backup.time.perf_counter", side_effect=[0.0, 10.0] * 10):
+            results = manager.benchmark("mongodb://localhost/shop", "shop")
+
+        client["shop"].command.assert_called_with("dbStats")
+        assert results and all(r["mb_per_sec"] == 10.0 for r in results)
+
+    def test_benchmark_without_source_size(self, temp_backup_dir, capsys):
+        """Test benchmark refuses to report throughput it cannot compare."""
+        manager = BackupManager("postgres", temp_backup_dir)
+
+        with patch.object(manager, "_database_size", return_value=None), \
+             patch.object(manager, "create_backup") as create:
+            assert manager.benchmark("postgresql://localhost/testdb", "testdb") == []
+
+        create.assert_not_called()
+        assert "source database size" in capsys.readouterr().out
+
+    def test_stream_to_file(self, temp_backup_dir):
+        """Test streaming through a compressor records checksum and integrity."""
+        import gzip
+
+        manager = BackupManager("postgres", temp_backup_dir)
+        output = Path(temp_backup_dir) / "out.gz"
+
+        checksum, intact = manager._stream_to_file(
+            ["echo", "hello"], output, compress_command("gzip"), check_codec="gzip"
+        )
+
+        assert gzip.decompress(output.read_bytes()) == b"hello\n"
+        assert checksum == hashlib.sha256(output.read_bytes()).hexdigest()
+        assert intact is True
+
+    def test_stream_to_file_truncated(self, temp_backup_dir):
+        """Test a truncated compressed stream fails the integrity check."""
+        manager = BackupManager("postgres", temp_backup_dir)
+        output = Path(temp_backup_dir) / "out.gz"
+
+        _, intact = manager._stream_to_file(
+            ["seq", "100000"], output, ["sh", "-c", "gzip -c | head -c 1000"],
+            check_codec="gzip"
+        )
+
+        assert intact is False
+
+    def test_stream_to_file_failure(self, temp_backup_dir):
+        """Test failed producers leave no partial file."""
+        manager = BackupManager("postgres", temp_backup_dir)
+        output = Path(temp_backup_dir) / "out.gz"
+
+        assert manager._stream_to_file(["false"], output, compress_command("gzip")) is None
+        assert not output.exists()
+
+    def test_verify_backups(self, temp_backup_dir):
+        """Test parallel verification detects corrupted backups."""
+        manager = BackupManager("postgres", temp_backup_dir)
+        for name in ("good.sql", "bad.sql"):
+            data = f"-- {name}\n".encode()
+            (Path(temp_backup_dir) / name).write_bytes(data)
+            manager._save_metadata(BackupInfo(
+                filename=name,
+                database_type="postgres",
+                database_name="testdb",
+                timestamp=datetime.now(),
+                size_bytes=len(data),
+                compressed=False,
+                verified=True,
+                sha256=hashlib.sha256(data).hexdigest()
+            ))
+        (Path(temp_backup_dir) / "bad.sql").write_bytes(b"-- tampered\n")
+
+        results = {r["filename"]: r for r in manager.verify_backups(workers=2)}
+
+        assert results["good.sql"]["ok"]
+        assert not results["bad.sql"]["ok"]
+        assert results["bad.sql"]["detail"] == "checksum mismatch"
+        assert manager._load_metadata("bad.sql")["verified"] is False
+
+    def test_verify_legacy_backup_stream(self, temp_backup_dir):
+        """Test backups without a checksum get a decompression check."""
+        manager = BackupManager("postgres", temp_backup_dir)
+        (Path(temp_backup_dir) / "old.sql.gz").write_bytes(b"not gzip")
+        manager._save_metadata(BackupInfo(
+            filename="old.sql.gz",
+            database_type="postgres",
+            database_name="testdb",
+            timestamp=datetime.now(),
+            size_bytes=8,
+            compressed=True
+        ))
+
+        results = manager.verify_backups(["old.sql.gz"])
+
+        assert not results[0]["ok"]
+        assert results[0]["detail"] == "gzip stream corrupt"
+
+    def test_verify_unknown_backup(self, temp_backup_dir):
+        """Test requested files missing from the catalog are reported, not skipped."""
+        manager = BackupManager("postgres", temp_backup_dir)
+        (Path(temp_backup_dir) / "stray.sql").write_bytes(b"-- no metadata\n")
+
+        results = manager.verify_backups(["stray.sql"])
+
+        assert len(results) == 1
+        assert results[0]["filename"] == "stray.sql"
+        assert not results[0]["ok"]
+        assert "unverified" in results[0]["detail"]
+
+    def test_backup_unknown_codec(self, temp_backup_dir):
+        """Test unsupported compression is rejected."""
+        manager = BackupManager("postgres", temp_backup_dir)
+
+        assert manager.create_backup(
+            "postgresql://localhost/testdb", "testdb", compression="lzma"
+        ) is None
+
+    @patch('subprocess.run')
+    @patch('subprocess.Popen')
+    def test_restore_uses_recorded_codec(self, mock_popen, mock_run, temp_backup_dir):
+        """Test restore picks the decompressor recorded in metadata."""
+        mock_run.return_value = Mock(returncode=0, stderr="")
+        mock_popen.return_value.wait.return_value = 0
+
+        manager = BackupManager("postgres", temp_backup_dir)
+        info = BackupInfo(
+            filename="postgres_testdb.sql.zst",
+            database_type="postgres",
+            database_name="testdb",
+            timestamp=datetime.now(),
+            size_bytes=4,
+            compressed=True,
+            codec="zstd"
+        )
+        (Path(temp_backup_dir) / info.filename).write_bytes(b"data")
+        manager._save_metadata(info)
+
+        result = manager.restore_backup(info.filename, "postgresql://localhost/testdb")
+
+        assert result is True
+        assert mock_popen.call_args[0][0] == decompress_command("zstd")
+        assert mock_run.call_args[0][0][0] == "psql"
+
+    @patch('subprocess.Popen')
+    def test_dedup_backup_and_restore(self, mock_popen, temp_backup_dir):
+        """Test repeated dedup backups share chunks and restore losslessly."""
+        dump = sql_dump(200000)
+        manager = BackupManager("postgres", temp_backup_dir)
+
+        mock_popen.return_value.stdout = io.BytesIO(dump)
+        mock_popen.return_value.wait.return_value = 0
+        first = manager.create_backup("postgresql://localhost/testdb", "testdb", dedup=True)
+
+        assert first.format == "dedup"
+        assert first.verified
+        assert first.size_bytes == len(dump)
+        assert manager.verify_backups([first.filename])[0]["ok"]
+        chunk_count = len(list((Path(temp_backup_dir) / ".dedup" / "chunks").glob("*/*")))
+
+        mock_popen.return_value.stdout = io.BytesIO(dump + sql_dump(10, start=200000))
+        with patch('db_backup.datetime') as mock_dt:
+            mock_dt.now.return_value = datetime(2030, 1, 1)
+            second = manager.create_backup("postgresql://localhost/testdb", "testdb", dedup=True)
+
+        assert second.filename != first.filename
+        new_count = len(list((Path(temp_backup_dir) / ".dedup" / "chunks").glob("*/*")))
+        assert new_count - chunk_count <= 2
+
+        restored = io.BytesIO()
+        restored.close = lambda: None
+        mock_popen.return_value.stdin = restored
+        assert manager.restore_backup(first.filename, "postgresql://localhost/testdb")
+        assert mock_popen.call_args[0][0] == ["psql", "postgresql://localhost/testdb"]
+        assert restored.getvalue() == dump
+
+    def test_cleanup_prunes_chunks(self, temp_backup_dir):
+        """Test cleanup keeps the chunk store and prunes orphaned chunks."""
+        manager = BackupManager("postgres", temp_backup_dir)
+        digest, _ = manager.chunk_store.put(b"data")
+
+        snapshot = Path(temp_backup_dir) / "postgres_testdb.snapshot"
+        snapshot.write_text(json.dumps({"chunks": [[digest, 4]]}))
+        manager._save_metadata(BackupInfo(
+            filename=snapshot.name,
+            database_type="postgres",
+            database_name="testdb",
+            timestamp=datetime.now() - timedelta(days=10),
+            size_bytes=4,
+            compressed=True,
+            format="dedup"
+        ))
+
+        removed = manager.cleanup_old_backups(retention_days=7)
+
+        assert removed == 1
+        assert (Path(temp_backup_dir) / ".dedup").exists()
+        assert not manager.chunk_store.has(digest)
+
+    @patch('subprocess.run')
+    def test_row_counts_postgres(self, mock_run, temp_backup_dir):
+        """Test per-table counts are parsed from one psql session."""
+        mock_run.return_value = Mock(
+            returncode=0, stdout="public.orders\t120\npublic.users\t7\n", stderr=""
+        )
+        manager = BackupManager("postgres", temp_backup_dir)
+
+        counts = manager._row_counts("postgresql://localhost/testdb")
+
+        assert counts == {"public.orders": 120, "public.users": 7}
+        assert "\\gexec" in mock_run.call_args.kwargs["input"]
+
+    @patch('db_backup.MONGO_AVAILABLE', True)
+    @patch('db_backup.MongoClient', create=True)
+    def test_row_counts_mongodb(self, mock_client_cls, temp_backup_dir):
+        """Test document counts are exact, not metadata estimates."""
+        client = mock_client_cls.return_value
+        client["shop"].list_collection_names.return_value = ["orders", "system.views"]
+        client["shop"]["orders"].count_documents.return_value = 42
+        manager = BackupManager("mongodb", temp_backup_dir)
+
+        counts = manager._row_counts("mongodb://localhost/shop", "shop")
+
+        assert counts == {"shop.orders": 42}
+        client["shop"]["orders"].count_documents.assert_called_once_with({})
+        client["shop"]["orders"].estimated_document_count.assert_not_called()
+
+    def test_capture_counts_in_dump_snapshot(self, temp_backup_dir):
+        """Test PostgreSQL counts come from the snapshot pg_dump reads."""
+        manager = BackupManager("postgres", temp_backup_dir)
+        psql = MagicMock(returncode=0)
+        psql.poll.return_value = 0
+        psql.stdout.readline.return_value = "00000003-0000001B-1\n"
+        psql.communicate.return_value = ("public.orders\t120\n", "")
+        dumps = []
+
+        def create(*args):
+            dumps.append(manager._pg_dump_command("postgresql://localhost/testdb"))
+            return BackupInfo(
+                filename="postgres_testdb.sql.gz", database_type="postgres",
+                database_name="testdb", timestamp=datetime.now(),
+                size_bytes=1, compressed=True
+            )
+
+        with patch("subprocess.Popen", return_value=psql) as mock_popen, \
+                patch.object(manager, "_create_backup", side_effect=create):
+            backup_info = manager.create_backup(
+                "postgresql://localhost/testdb", "testdb", capture_counts=True
+            )
+
+        begin = psql.stdin.write.call_args[0][0]
+        assert "REPEATABLE READ" in begin and "pg_export_snapshot()" in begin
+        assert mock_popen.call_args[0][0][0] == "psql"
+        assert dumps == [["pg_dump", "--snapshot=00000003-0000001B-1", "postgresql://localhost/testdb"]]
+        counting = psql.communicate.call_args[0][0]
+        assert "\\gexec" in counting and counting.endswith("COMMIT;\n")
+        assert backup_info.row_counts == {"public.orders": 120}
+        assert manager._pg_dump_command("x") == ["pg_dump", "x"]
+
+    def test_capture_counts_mongodb_before_dump(self, temp_backup_dir):
+        """Test MongoDB counts are taken before the dump starts."""
+        manager = BackupManager("mongodb", temp_backup_dir)
+        events = []
+
+        def counts(uri, database):
+            events.append("count")
+            return {"shop.orders": 3}
+
+        def create(*args):
+            events.append("dump")
+            return BackupInfo(
+                filename="mongodb_shop.archive.gz", database_type="mongodb",
+                database_name="shop", timestamp=datetime.now(),
+                size_bytes=1, compressed=True
+            )
+
+        with patch.object(manager, "_row_counts", side_effect=counts), \
+                patch.object(manager, "_create_backup", side_effect=create):
+            backup_info = manager.create_backup("mongodb://localhost", "shop", capture_counts=True)
+
+        assert events == ["count", "dump"]
+        assert backup_info.row_counts == {"shop.orders": 3}
+
+    def test_restore_verify_counts(self, temp_backup_dir):
+        """Test restore verification compares captured row counts."""
+        from contextlib import contextmanager
+
+        manager = BackupManager("postgres", temp_backup_dir)
+        (Path(temp_backup_dir) / "db.sql").write_text("SELECT 1;")
+        manager._save_metadata(BackupInfo(
+            filename="db.sql",
+            database_type="postgres",
+            database_name="testdb",
+            timestamp=datetime.now(),
+            size_bytes=9,
+            compressed=False,
+            row_counts={"public.users": 7, "public.orders": 120}
+        ))
+
+        @contextmanager
+        def fake_instance(workdir):
+            yield "postgresql://postgres@/verify?host=/tmp&port=5999"
+
+        with patch.object(manager, "_ephemeral_postgres", fake_instance), \
+             patch.object(manager, "restore_backup", return_value=True) as mock_restore, \
+             patch.object(manager, "_row_counts",
+                          return_value={"public.users": 7, "public.orders": 119}):
+            result = manager.restore_verify("db.sql", jobs=4)
+
+        assert not result["ok"]
+        assert result["mismatches"] == {"public.orders": (120, 119)}
+        assert mock_restore.call_args.kwargs == {"jobs": 4, "no_owner": True}
+
+    @patch('subprocess.run')
+    def test_ephemeral_postgres_offline(self, mock_run, temp_backup_dir, tmp_path):
+        """Test the throwaway cluster listens on a Unix socket only."""
+        mock_run.return_value = Mock(returncode=0)
+        manager = BackupManager("postgres", temp_backup_dir)
+
+        with patch('db_backup._pg_bin', side_effect=lambda name: name):
+            with manager._ephemeral_postgres(tmp_path) as uri:
+                assert uri.startswith("postgresql://postgres@/verify?host=")
+
+        commands = [c[0][0] for c in mock_run.call_args_list]
+        assert commands[0][0] == "initdb"
+        start = commands[1]
+        assert "listen_addresses=''" in start[start.index("-o") + 1]
+        assert commands[-1][-1] == "stop"
+
     def test_format_size(self, temp_backup_dir):
         """Test size formatting."""
         manager = BackupManager("mongodb", temp_backup_dir)
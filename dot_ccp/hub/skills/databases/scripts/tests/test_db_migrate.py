@@ -12,7 +12,19 @@ import pytest
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from db_migrate import Migration, MigrationManager
+import db_migrate
+from db_migrate import (
+    MIGRATION_LOCK_KEY,
+    SNAPSHOT_QUERIES,
+    Migration,
+    MigrationFleetRunner,
+    MigrationManager,
+    classify_statement,
+    diff_mongo_indexes,
+    diff_postgres_schema,
+    latency_summary,
+    split_statements,
+)
 
 
 @pytest.fixture
@@ -243,6 +255,849 @@ class TestMigrationManager:
         assert result is False
 
 
+def make_migrations(count, database_type="postgres"):
+    """Build numbered Postgres migrations."""
+    return [
+        Migration(
+            id=f"2025010112{i:04d}",
+            name=f"migration_{i}",
+            timestamp=datetime.now(),
+            database_type=database_type,
+            up_sql=f"CREATE TABLE t{i} (id INT);"
+        )
+        for i in range(count)
+    ]
+
+
+class TestBatchApply:
+    """Test batched, transactional apply."""
+
+    @patch("db_migrate.execute_values", create=True)
+    def test_single_transaction(self, mock_execute_values, temp_migrations_dir, mock_postgres_conn):
+        """Test all migrations commit together with one bookkeeping insert."""
+        mock_conn, mock_cursor = mock_postgres_conn
+        manager = MigrationManager("postgres", "postgresql://localhost", temp_migrations_dir)
+        manager.conn = mock_conn
+
+        assert manager.apply_batch(make_migrations(200)) is True
+
+        assert mock_cursor.execute.call_count == 200
+        assert mock_conn.commit.call_count == 1
+        rows = mock_execute_values.call_args[0][2]
+        assert len(rows) == 200 and rows[0] == ("20250101120000", "migration_0", None)
+
+    @patch("db_migrate.execute_values", create=True)
+    def test_groups(self, mock_execute_values, temp_migrations_dir, mock_postgres_conn):
+        """Test group size splits commits."""
+        mock_conn, _ = mock_postgres_conn
+        manager = MigrationManager("postgres", "postgresql://localhost", temp_migrations_dir)
+        manager.conn = mock_conn
+
+        assert manager.apply_batch(make_migrations(5), group_size=2) is True
+
+        assert mock_conn.commit.call_count == 3
+        assert [len(c[0][2]) for c in mock_execute_values.call_args_list] == [2, 2, 1]
+
+    @patch("db_migrate.execute_values", create=True)
+    def test_failure_rolls_back_group(self, mock_execute_values, temp_migrations_dir,
+                                      mock_postgres_conn, capsys):
+        """Test a failing migration rolls back only its group."""
+        mock_conn, mock_cursor = mock_postgres_conn
+        mock_cursor.execute.side_effect = [None, None, Exception("syntax error"), None]
+        manager = MigrationManager("postgres", "postgresql://localhost", temp_migrations_dir)
+        manager.conn = mock_conn
+
+        assert manager.apply_batch(make_migrations(4), group_size=2) is False
+
+        assert mock_conn.commit.call_count == 1
+        mock_conn.rollback.assert_called_once()
+        assert mock_execute_values.call_count == 1
+        assert "migration_2" in capsys.readouterr().out
+
+    def test_migration_lock_waits(self, temp_migrations_dir, mock_postgres_conn, capsys):
+        """Test the advisory lock blocks when another deployer holds it."""
+        mock_conn, mock_cursor = mock_postgres_conn
+        mock_cursor.fetchone.return_value = (False, 42)
+        manager = MigrationManager("postgres", "postgresql://localhost", temp_migrations_dir)
+        manager.conn = mock_conn
+
+        with manager.migration_lock():
+            pass
+
+        calls = mock_cursor.execute.call_args_list
+        assert "pg_try_advisory_lock(%s, k)" in calls[0][0][0]
+        assert "hashtext(COALESCE(current_schema(), ''))" in calls[0][0][0]
+        assert calls[0][0][1] == (MIGRATION_LOCK_KEY,)
+        assert calls[1][0] == ("SELECT pg_advisory_lock(%s, %s)", (MIGRATION_LOCK_KEY, 42))
+        assert calls[2][0] == ("SELECT pg_advisory_unlock(%s, %s)", (MIGRATION_LOCK_KEY, 42))
+        assert "Waiting" in capsys.readouterr().out
+
+    def test_mongodb_falls_back(self, temp_migrations_dir):
+        """Test MongoDB applies migrations one at a time."""
+        manager = MigrationManager("mongodb", "mongodb://localhost", temp_migrations_dir)
+        manager.db = MagicMock()
+
+        with manager.migration_lock():
+            assert manager.apply_batch(make_migrations(3, "mongodb")) is True
+
+        assert manager.db.migrations.insert_one.call_count == 3
+
+
+def lock_timeout_error():
+    """Error as raised by psycopg2 when lock_timeout expires."""
+    error = Exception("canceling statement due to lock timeout")
+    error.pgcode = "55P03"
+    return error
+
+
+class TestOnlineMigrations:
+    """Test lock-aware online migration steps."""
+
+    def test_split_statements(self):
+        """Test splitting ignores semicolons in quotes, bodies and comments."""
+        script = """
+            -- leading comment; not a statement
+            CREATE TABLE t (note TEXT DEFAULT 'a;b');
+            CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $body$ LANGUAGE sql;
+            /* block; comment */ CREATE INDEX CONCURRENTLY i ON t (note);
+            -- trailing comment
+        """
+
+        statements = split_statements(script)
+
+        assert len(statements) == 3
+        assert statements[0].endswith("DEFAULT 'a;b')")
+        assert "$body$ SELECT 1; $body$" in statements[1]
+        assert statements[2].endswith("CREATE INDEX CONCURRENTLY i ON t (note)")
+        assert split_statements("-- Add your SQL here\n") == []
+
+    def online_manager(self, temp_migrations_dir, mock_postgres_conn):
+        """Manager with a mock connection and no retry delay."""
+        mock_conn, mock_cursor = mock_postgres_conn
+        manager = MigrationManager("postgres", "postgresql://localhost", temp_migrations_dir)
+        manager.conn = mock_conn
+        manager.online_defaults["retry_delay"] = 0
+        return manager, mock_conn, mock_cursor
+
+    def test_statements_run_with_timeouts(self, temp_migrations_dir, mock_postgres_conn):
+        """Test each statement gets its own timed transaction."""
+        manager, mock_conn, mock_cursor = self.online_manager(temp_migrations_dir, mock_postgres_conn)
+        migration = make_migrations(1)[0]
+        migration.up_sql = "ALTER TABLE t ADD COLUMN a INT; ALTER TABLE t ADD COLUMN b INT;"
+
+        assert manager.apply_migration(migration, online=True) is True
+
+        statements = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        assert statements[:3] == [
+            "SET LOCAL lock_timeout = %s", "SET LOCAL statement_timeout = %s",
+            "ALTER TABLE t ADD COLUMN a INT"
+        ]
+        assert statements[-1].startswith("INSERT INTO migrations")
+        assert mock_conn.commit.call_count == 3
+
+    def test_lock_timeout_retries(self, temp_migrations_dir, mock_postgres_conn):
+        """Test lock timeouts are retried and other errors are not."""
+        manager, mock_conn, mock_cursor = self.online_manager(temp_migrations_dir, mock_postgres_conn)
+        mock_cursor.execute.side_effect = [
+            None, None, lock_timeout_error(),
+            None, None, lock_timeout_error(),
+            None, None, None,
+            None
+        ]
+        migration = make_migrations(1)[0]
+        migration.steps = [{"sql": "ALTER TABLE t ADD COLUMN a INT", "retries": 2}]
+
+        assert manager.apply_migration(migration) is True
+        assert mock_conn.rollback.call_count == 2
+
+        mock_cursor.execute.side_effect = [None, None, lock_timeout_error()] * 3
+        assert manager.apply_migration(migration) is False
+
+    def test_concurrently_runs_in_autocommit(self, temp_migrations_dir, mock_postgres_conn):
+        """Test CONCURRENTLY statements run outside a transaction."""
+        manager, mock_conn, mock_cursor = self.online_manager(temp_migrations_dir, mock_postgres_conn)
+        modes = []
+        mock_cursor.execute.side_effect = lambda *a: modes.append((a[0], mock_conn.autocommit))
+        migration = make_migrations(1)[0]
+        migration.steps = [{"sql": "CREATE INDEX CONCURRENTLY i ON t (a)"}]
+
+        assert manager.apply_migration(migration) is True
+
+        assert ("CREATE INDEX CONCURRENTLY i ON t (a)", True) in modes
+        assert mock_conn.autocommit is False
+
+    def test_concurrently_retries_after_dropping_invalid_index(
+        self, temp_migrations_dir, mock_postgres_conn
+    ):
+        """Test a timed-out CREATE INDEX CONCURRENTLY is cleaned up and retried."""
+        manager, mock_conn, mock_cursor = self.online_manager(temp_migrations_dir, mock_postgres_conn)
+        statement = "CREATE INDEX CONCURRENTLY IF NOT EXISTS i ON app.t (a)"
+        executed = []
+        failures = [lock_timeout_error()]
+
+        def execute(sql, *args):
+            executed.append(sql)
+            if sql == statement and failures:
+                raise failures.pop()
+
+        mock_cursor.execute.side_effect = execute
+        migration = make_migrations(1)[0]
+        migration.steps = [{"sql": statement}]
+
+        assert manager.apply_migration(migration) is True
+
+        attempts = [i for i, sql in enumerate(executed) if sql == statement]
+        drop = executed.index("DROP INDEX CONCURRENTLY IF EXISTS app.i")
+        assert len(attempts) == 2
+        assert attempts[0] < drop < attempts[1]
+
+    def test_backfill_batches(self, temp_migrations_dir, mock_postgres_conn):
+        """Test backfill walks the key in batches until no rows remain."""
+        manager, mock_conn, mock_cursor = self.online_manager(temp_migrations_dir, mock_postgres_conn)
+        mock_cursor.fetchone.side_effect = [(1000, 1000), (1000, 2004), (0, None)]
+        migration = make_migrations(1)[0]
+        migration.steps = [{
+            "type": "backfill", "table": "users", "set": "email_lower = lower(email)",
+            "where": "email_lower IS NULL", "batch_size": 1000
+        }]
+
+        assert manager.apply_migration(migration) is True
+
+        batches = [c[0] for c in mock_cursor.execute.call_args_list if "WITH batch" in c[0][0]]
+        assert len(batches) == 3
+        assert batches[0][1] == (1000,)
+        assert "AND id > %s" in batches[1][0] and batches[1][1] == (1000, 1000)
+        assert batches[2][1] == (2004, 1000)
+        assert "SET email_lower = lower(email)" in batches[0][0]
+
+    def test_online_not_batched(self, temp_migrations_dir, mock_postgres_conn):
+        """Test migrations with steps are refused in batch mode."""
+        manager, _, mock_cursor = self.online_manager(temp_migrations_dir, mock_postgres_conn)
+        migrations = make_migrations(2)
+        migrations[1].steps = [{"sql": "SELECT 1"}]
+
+        assert manager.apply_batch(migrations) is False
+        mock_cursor.execute.assert_not_called()
+
+
+def mongo_migration(*operations):
+    """Build a MongoDB migration with the given operations."""
+    return Migration(
+        id="20250101120000",
+        name="mongo_ops",
+        timestamp=datetime.now(),
+        database_type="mongodb",
+        mongodb_operations=list(operations)
+    )
+
+
+class TestMongoOperations:
+    """Test MongoDB operation handlers."""
+
+    def mongo_manager(self, temp_migrations_dir):
+        """Manager with mock client and database."""
+        manager = MigrationManager("mongodb", "mongodb://localhost", temp_migrations_dir)
+        manager.client = MagicMock()
+        manager.db = MagicMock()
+        manager.poll_interval = 0.01
+        return manager
+
+    def test_create_indexes_single_build(self, temp_migrations_dir, capsys):
+        """Test indexes are built in one command with progress reported."""
+        import time
+
+        manager = self.mongo_manager(temp_migrations_dir)
+        manager.db.command.side_effect = lambda *a, **k: time.sleep(0.05)
+        manager.client.admin.command.return_value = {
+            "inprog": [{"progress": {"done": 500, "total": 1000}, "msg": "Index Build: scanning"}]
+        }
+        migration = mongo_migration({
+            "operation": "createIndexes",
+            "collection": "users",
+            "indexes": [{"key": {"email": 1}, "unique": True}, {"key": {"org": 1, "created": -1}}]
+        })
+
+        assert manager.apply_migration(migration) is True
+
+        manager.db.command.assert_called_once()
+        indexes = manager.db.command.call_args.kwargs["indexes"]
+        assert [i["name"] for i in indexes] == ["email_1", "org_1_created_-1"]
+        assert indexes[0]["unique"] is True
+        assert "50.0% (500/1,000)" in capsys.readouterr().out
+
+    def test_create_indexes_failure(self, temp_migrations_dir):
+        """Test build errors fail the migration without recording it."""
+        manager = self.mongo_manager(temp_migrations_dir)
+        manager.db.command.side_effect = Exception("E11000 duplicate key")
+        migration = mongo_migration({
+            "operation": "createIndexes", "collection": "users",
+            "indexes": [{"key": {"email": 1}, "unique": True}]
+        })
+
+        assert manager.apply_migration(migration) is False
+        manager.db.migrations.insert_one.assert_not_called()
+
+    def test_update_many_batched(self, temp_migrations_dir):
+        """Test batched updates walk _id ranges until no documents match."""
+        manager = self.mongo_manager(temp_migrations_dir)
+        collection = manager.db["users"]
+        batches = [[{"_id": 1}, {"_id": 2}], [{"_id": 3}], []]
+        collection.find.return_value.sort.return_value.limit.side_effect = batches
+        collection.update_many.return_value.modified_count = 2
+        migration = mongo_migration({
+            "operation": "updateMany", "collection": "users",
+            "filter": {"status": {"$exists": False}},
+            "update": {"$set": {"status": "active"}},
+            "batch_size": 2
+        })
+
+        assert manager.apply_migration(migration) is True
+
+        queries = [c[0][0] for c in collection.find.call_args_list]
+        assert queries[0] == {"status": {"$exists": False}}
+        assert queries[1] == {"$and": [{"status": {"$exists": False}}, {"_id": {"$gt": 2}}]}
+        assert collection.update_many.call_args_list[1][0][0] == {"_id": {"$in": [3]}}
+
+    def test_unknown_operation(self, temp_migrations_dir):
+        """Test unsupported operations fail instead of being skipped."""
+        manager = self.mongo_manager(temp_migrations_dir)
+
+        assert manager.apply_migration(mongo_migration({"operation": "shardCollection"})) is False
+
+
+def write_migration(directory, migration_id, name, **fields):
+    """Write a migration file and return its path."""
+    path = Path(directory) / f"{migration_id}_{name}.json"
+    path.write_text(json.dumps({
+        "id": migration_id,
+        "name": name,
+        "timestamp": datetime.now().isoformat(),
+        "database_type": "postgres",
+        "up_sql": fields.pop("up_sql", "SELECT 1;"),
+        **fields
+    }))
+    return path
+
+
+class TestManifest:
+    """Test the cached migration index and checksum verification."""
+
+    def test_manifest_incremental(self, temp_migrations_dir):
+        """Test unchanged files are not re-read and changes are picked up."""
+        first = write_migration(temp_migrations_dir, "20250101120000", "first")
+        write_migration(temp_migrations_dir, "20250101120001", "second")
+        manager = MigrationManager("postgres", "postgresql://localhost", temp_migrations_dir)
+
+        manifest = manager.load_manifest()
+        assert sorted(e["id"] for e in manifest.values()) == ["20250101120000", "20250101120001"]
+        checksum = manifest[first.name]["checksum"]
+
+        # Same size and mtime: served from the cache without reading the file
+        stat = first.stat()
+        first.write_text(first.read_text().replace("first", "FIRST"))
+        os.utime(first, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert manager.load_manifest()[first.name]["checksum"] == checksum
+
+        # A real edit changes the size and is re-hashed
+        first.write_text(first.read_text().replace("SELECT 1;", "SELECT 1, 2;"))
+        assert manager.load_manifest()[first.name]["checksum"] != checksum
+
+        (Path(temp_migrations_dir) / "20250101120001_second.json").unlink()
+        assert list(manager.load_manifest()) == [first.name]
+
+    def test_pending_reads_only_pending_files(self, temp_migrations_dir, mock_postgres_conn):
+        """Test applied migrations are skipped by id without parsing the file."""
+        mock_conn, mock_cursor = mock_postgres_conn
+        write_migration(temp_migrations_dir, "20250101120000", "applied")
+        write_migration(temp_migrations_dir, "20250101120001", "pending", up_sql="CREATE TABLE t ();")
+        manager = MigrationManager("postgres", "postgresql://localhost", temp_migrations_dir)
+        manager.conn = mock_conn
+        mock_cursor.fetchall.return_value = [("20250101120000", "abc")]
+        manager.load_manifest()
+
+        with patch.object(manager, "_load_migration", wraps=manager._load_migration) as load:
+            pending = manager.get_pending_migrations()
+
+        assert [m.id for m in pending] == ["20250101120001"]
+        assert load.call_count == 1
+        assert pending[0].checksum == manager.load_manifest()["20250101120001_pending.json"]["checksum"]
+
+    def test_verify(self, temp_migrations_dir, mock_postgres_conn):
+        """Test modified, missing and legacy migrations are reported."""
+        mock_conn, mock_cursor = mock_postgres_conn
+        write_migration(temp_migrations_dir, "20250101120000", "ok")
+        write_migration(temp_migrations_dir, "20250101120001", "edited")
+        write_migration(temp_migrations_dir, "20250101120002", "legacy")
+        manager = MigrationManager("postgres", "postgresql://localhost", temp_migrations_dir)
+        manager.conn = mock_conn
+        manifest = manager.load_manifest()
+        mock_cursor.fetchall.return_value = [
+            ("20250101120000", manifest["20250101120000_ok.json"]["checksum"]),
+            ("20250101120001", "0" * 64),
+            ("20250101120002", None),
+            ("20250101115959", "f" * 64),
+        ]
+
+        result = manager.verify_migrations()
+
+        assert result == {
+            "modified": ["20250101120001"],
+            "missing": ["20250101115959"],
+            "unverified": ["20250101120002"],
+        }
+
+    def test_apply_records_checksum(self, temp_migrations_dir, mock_postgres_conn):
+        """Test the checksum is stored with the applied migration."""
+        mock_conn, mock_cursor = mock_postgres_conn
+        manager = MigrationManager("postgres", "postgresql://localhost", temp_migrations_dir)
+        manager.conn = mock_conn
+        migration = make_migrations(1)[0]
+        migration.checksum = "c" * 64
+
+        assert manager.apply_migration(migration) is True
+
+        assert mock_cursor.execute.call_args[0][1] == (migration.id, migration.name, "c" * 64)
+
+
+class TestMigrationFleet:
+    """Test concurrent multi-target migration."""
+
+    def fleet_config(self, count, **extra):
+        """Fleet config with `count` tenant targets."""
+        return {
+            "targets": [
+                {"name": f"tenant{i}", "uri": f"postgresql://db/tenant{i}"}
+                for i in range(count)
+            ],
+            **extra
+        }
+
+    def run_fleet(self, temp_migrations_dir, config, fail_uris=(), delay=0.0, **kwargs):
+        """Run a fleet with connection and migration steps mocked."""
+        import threading
+        import time
+
+        lock = threading.Lock()
+        active = {"now": 0, "peak": 0}
+
+        def fake_connect(manager):
+            manager.conn = MagicMock()
+            cursor = manager.conn.cursor.return_value.__enter__.return_value
+            cursor.fetchone.return_value = (True, 1)
+            return True
+
+        def fake_apply(manager, migration, dry_run=False, online=False):
+            with lock:
+                active["now"] += 1
+                active["peak"] = max(active["peak"], active["now"])
+            time.sleep(delay)
+            with lock:
+                active["now"] -= 1
+            return manager.connection_string not in fail_uris
+
+        with patch.object(MigrationManager, "connect", fake_connect), \
+                patch.object(MigrationManager, "_ensure_migrations_table"), \
+                patch.object(MigrationManager, "get_pending_migrations",
+                             return_value=make_migrations(1)), \
+                patch.object(MigrationManager, "apply_migration", fake_apply):
+            runner = MigrationFleetRunner(config, temp_migrations_dir, "postgres", **kwargs)
+            results = runner.run()
+        return results, active["peak"]
+
+    def test_bounded_concurrency(self, temp_migrations_dir):
+        """Test targets run concurrently up to the pool size."""
+        results, peak = self.run_fleet(
+            temp_migrations_dir, self.fleet_config(8), delay=0.05, max_concurrent=3
+        )
+
+        assert peak == 3
+        assert [r["status"] for r in results] == ["applied"] * 8
+        assert all(r["applied"] == 1 and r["seconds"] >= 0.05 for r in results)
+
+    def test_continue_policy(self, temp_migrations_dir):
+        """Test failures are recorded and other targets still run."""
+        results, _ = self.run_fleet(
+            temp_migrations_dir, self.fleet_config(4), fail_uris={"postgresql://db/tenant1"},
+            max_concurrent=1
+        )
+
+        assert [r["status"] for r in results] == ["applied", "failed", "applied", "applied"]
+        assert results[1]["error"] == "migration failed"
+
+    def test_fail_fast_policy(self, temp_migrations_dir):
+        """Test fail-fast skips targets not yet started."""
+        results, _ = self.run_fleet(
+            temp_migrations_dir, self.fleet_config(4, policy="fail-fast"),
+            fail_uris={"postgresql://db/tenant1"}, max_concurrent=1
+        )
+
+        assert [r["status"] for r in results] == ["applied", "failed", "skipped", "skipped"]
+
+    def test_schema_per_tenant(self, temp_migrations_dir):
+        """Test schema targets set search_path before migrating."""
+        config = {"targets": [{"name": "acme", "uri": "postgresql://db/app", "schema": "acme"}]}
+        conn = MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (True, 123)
+
+        def fake_connect(manager):
+            manager.conn = conn
+            return True
+
+        with patch.object(MigrationManager, "connect", fake_connect), \
+                patch.object(MigrationManager, "_ensure_migrations_table"), \
+                patch.object(MigrationManager, "get_pending_migrations", return_value=[]):
+            results = MigrationFleetRunner(config, temp_migrations_dir, "postgres").run()
+
+        assert results[0]["status"] == "up-to-date"
+        statements = [c[0][0] for c in cursor.execute.call_args_list]
+        # The schema is set before the lock, so the lock is keyed by it
+        assert statements[0] == "SET search_path TO %s"
+        assert "current_schema()" in statements[1]
+        cursor.execute.assert_any_call("SELECT pg_advisory_unlock(%s, %s)", (MIGRATION_LOCK_KEY, 123))
+
+    def test_latency_summary(self):
+        """Test percentiles ignore skipped targets."""
+        results = [{"status": "applied", "seconds": float(s)} for s in range(1, 21)]
+        results.append({"status": "skipped", "seconds": 0.0})
+
+        summary = latency_summary(results)
+
+        assert summary == {"p50": 11.0, "p95": 19.0, "max": 20.0}
+        assert latency_summary([])["max"] == 0.0
+
+
+class TestMigrationPlanner:
+    """Test the dry-run lock and cost planner."""
+
+    def test_classify_locks(self):
+        """Test lock levels per statement kind."""
+        assert classify_statement("CREATE INDEX CONCURRENTLY i ON users (email)")["lock"] == \
+            "SHARE UPDATE EXCLUSIVE"
+        assert classify_statement("CREATE UNIQUE INDEX i ON public.users (email)") == {
+            "table": "public.users", "lock": "SHARE", "operation": "index build", "notes": []
+        }
+        assert classify_statement("ALTER TABLE users DROP COLUMN legacy")["lock"] == "ACCESS EXCLUSIVE"
+        assert classify_statement("UPDATE users SET active = true")["lock"] == "ROW EXCLUSIVE"
+        assert classify_statement("DROP INDEX CONCURRENTLY i")["lock"] == "SHARE UPDATE EXCLUSIVE"
+
+    def test_classify_rewrites_and_scans(self):
+        """Test statements that rewrite or scan the table."""
+        ops = {
+            "ALTER TABLE users ALTER COLUMN id TYPE bigint": "rewrite",
+            "ALTER TABLE users ADD COLUMN token uuid DEFAULT gen_random_uuid()": "rewrite",
+            "ALTER TABLE users ADD COLUMN active boolean DEFAULT false": "metadata",
+            "ALTER TABLE users ALTER COLUMN email SET NOT NULL": "scan",
+            "ALTER TABLE orders ADD CONSTRAINT fk FOREIGN KEY (u) REFERENCES users (id)": "scan",
+            "ALTER TABLE orders ADD CONSTRAINT fk FOREIGN KEY (u) REFERENCES users (id) NOT VALID":
+                "metadata",
+            "ALTER TABLE users ADD PRIMARY KEY (id)": "index build",
+        }
+        for statement, operation in ops.items():
+            assert classify_statement(statement)["operation"] == operation, statement
+
+    def test_plan_flags_large_rewrite(self, temp_migrations_dir):
+        """Test a rewrite of a large table is flagged high risk."""
+        manager = MigrationManager("postgres", "postgresql://localhost/test", str(temp_migrations_dir))
+        manager.conn = MagicMock()
+        cursor = manager.conn.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [("users", 8 * 1024 ** 3, 2 * 1024 ** 3, 50_000_000)]
+        cursor.fetchone.return_value = ([{"Plan": {"Plan Rows": 1200}}],)
+
+        migration = Migration(
+            id="20250101000000", name="widen", timestamp=datetime.now(), database_type="postgres",
+            up_sql=(
+                "ALTER TABLE users ALTER COLUMN id TYPE bigint;"
+                "CREATE INDEX CONCURRENTLY idx_users_email ON users (email);"
+                "UPDATE users SET active = true WHERE active IS NULL;"
+            )
+        )
+        rewrite, index, update = manager.plan_migration(migration)
+
+        stats_call = cursor.execute.call_args_list[0]
+        assert "pg_stat_user_tables" in stats_call[0][0]
+        assert stats_call[0][1] == (["users"],)
+        assert rewrite.risk == "high"
+        assert rewrite.est_seconds == pytest.approx(10 * 1024 / 60)
+        assert "rewrites a large table" in rewrite.notes
+        assert index.risk == "medium"
+        assert index.est_seconds == pytest.approx(2 * 8 * 1024 / 40)
+        assert update.rows == 1200
+        assert cursor.execute.call_args_list[1][0][0].startswith("EXPLAIN (FORMAT JSON) UPDATE")
+        manager.conn.commit.assert_not_called()
+
+    def test_plan_small_table_ddl(self, temp_migrations_dir):
+        """Test cheap DDL on small tables stays low risk."""
+        manager = MigrationManager("postgres", "postgresql://localhost/test", str(temp_migrations_dir))
+        manager.conn = MagicMock()
+        cursor = manager.conn.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [("flags", 16384, 8192, 10)]
+
+        migration = Migration(
+            id="20250101000000", name="flags", timestamp=datetime.now(), database_type="postgres",
+            up_sql="ALTER TABLE flags ADD COLUMN note text; ALTER TABLE flags ALTER COLUMN id SET NOT NULL;"
+        )
+        plans = manager.plan_migration(migration)
+
+        assert [p.risk for p in plans] == ["low", "medium"]
+        assert plans[1].est_seconds < 0.01
+
+    def test_dry_run_prints_plan(self, temp_migrations_dir, capsys):
+        """Test dry-run apply prints the plan instead of executing."""
+        manager = MigrationManager("postgres", "postgresql://localhost/test", str(temp_migrations_dir))
+        manager.conn = MagicMock()
+        cursor = manager.conn.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = []
+
+        migration = Migration(
+            id="20250101000000", name="drop", timestamp=datetime.now(), database_type="postgres",
+            up_sql="DROP INDEX idx_old;"
+        )
+        assert manager.apply_migration(migration, dry_run=True) is True
+
+        output = capsys.readouterr().out
+        assert "Lock: ACCESS EXCLUSIVE" in output
+        assert "DROP INDEX CONCURRENTLY" in output
+        manager.conn.commit.assert_not_called()
+
+    def test_dry_run_plans_online_steps(self, temp_migrations_dir, capsys):
+        """Test dry-run plans steps and backfills instead of echoing them."""
+        manager = MigrationManager("postgres", "postgresql://localhost/test", str(temp_migrations_dir))
+        manager.conn = MagicMock()
+        cursor = manager.conn.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [("users", 4 * 1024 ** 3, 0, 20_000_000)]
+
+        migration = Migration(
+            id="20250101000000", name="email", timestamp=datetime.now(), database_type="postgres",
+            steps=[
+                {"sql": "ALTER TABLE users ADD COLUMN email_lower text"},
+                {"type": "backfill", "table": "users", "set": "email_lower = lower(email)"},
+            ]
+        )
+        assert manager.apply_migration(migration, dry_run=True) is True
+
+        output = capsys.readouterr().out
+        assert "Online steps:" not in output
+        assert "backfill users SET email_lower = lower(email)" in output
+        assert "~20,000,000 rows" in output
+        manager.conn.commit.assert_not_called()
+
+    def test_dry_run_apply_skips_lock(self, temp_migrations_dir):
+        """Test apply --dry-run neither takes nor waits for the migration lock."""
+        with patch.object(MigrationManager, "connect", return_value=True), \
+                patch.object(MigrationManager, "_ensure_migrations_table"), \
+                patch.object(MigrationManager, "disconnect"), \
+                patch.object(MigrationManager, "migration_lock") as lock, \
+                patch.object(MigrationManager, "get_pending_migrations", return_value=[]), \
+                patch("sys.argv", ["db_migrate.py", "--db", "postgres", "--uri", "postgresql://x",
+                                   "--migrations-dir", str(temp_migrations_dir),
+                                   "apply", "--dry-run"]):
+            db_migrate.main()
+
+        lock.assert_not_called()
+
+
+def pg_table(columns, indexes=None, constraints=None):
+    """Snapshot entry for one table; columns map name -> (type, nullable, default)."""
+    return {
+        "columns": {
+            name: {"type": t, "nullable": nullable, "default": default}
+            for name, (t, nullable, default) in columns.items()
+        },
+        "indexes": indexes or {},
+        "constraints": constraints or {},
+    }
+
+
+class TestSchemaDiff:
+    """Test snapshot-driven migration generation."""
+
+    def schemas(self):
+        """Current and desired snapshots exercising every phase."""
+        current = {"database_type": "postgres", "tables": {
+            "public.users": pg_table(
+                {"id": ("integer", False, None), "email": ("text", True, None),
+                 "legacy": ("text", True, None)},
+                indexes={"idx_users_legacy": "CREATE INDEX idx_users_legacy ON public.users USING btree (legacy)"},
+                constraints={"users_pkey": {"type": "p", "definition": "PRIMARY KEY (id)"}}
+            ),
+            "public.audit": pg_table({"id": ("integer", False, None)}),
+        }}
+        desired = {"database_type": "postgres", "tables": {
+            "public.users": pg_table(
+                {"id": ("bigint", False, None), "email": ("text", False, None),
+                 "created_at": ("timestamp with time zone", False, "now()")},
+                indexes={"idx_users_email": "CREATE INDEX idx_users_email ON public.users USING btree (email)"},
+                constraints={"users_pkey": {"type": "p", "definition": "PRIMARY KEY (id)"}}
+            ),
+            "public.orders": pg_table(
+                {"id": ("bigint", False, "nextval('orders_id_seq'::regclass)"),
+                 "user_id": ("bigint", False, None)},
+                constraints={
+                    "orders_user_fk": {"type": "f", "definition": "FOREIGN KEY (user_id) REFERENCES users(id)"},
+                    "orders_pkey": {"type": "p", "definition": "PRIMARY KEY (id)"},
+                }
+            ),
+        }}
+        return current, desired
+
+    def test_diff_order(self):
+        """Test drops, creates and alters come out in dependency order."""
+        current, desired = self.schemas()
+        statements = diff_postgres_schema(current, desired)
+
+        assert statements == [
+            "DROP INDEX public.idx_users_legacy",
+            "CREATE TABLE public.orders (\n    id bigserial NOT NULL,\n    user_id bigint NOT NULL\n)",
+            "ALTER TABLE public.users\n    ALTER COLUMN id TYPE bigint,\n    ALTER COLUMN email SET NOT NULL,\n"
+            "    ADD COLUMN created_at timestamp with time zone DEFAULT now() NOT NULL",
+            "CREATE INDEX idx_users_email ON public.users USING btree (email)",
+            "ALTER TABLE public.orders ADD CONSTRAINT orders_pkey PRIMARY KEY (id)",
+            "ALTER TABLE public.orders ADD CONSTRAINT orders_user_fk FOREIGN KEY (user_id) REFERENCES users(id)",
+            "ALTER TABLE public.users\n    DROP COLUMN legacy",
+            "DROP TABLE public.audit",
+        ]
+
+    def test_diff_down_reverses(self):
+        """Test the reverse diff drops foreign keys before their tables."""
+        current, desired = self.schemas()
+        statements = diff_postgres_schema(desired, current)
+
+        assert statements[0] == "DROP INDEX public.idx_users_email"
+        assert "CREATE TABLE public.audit (\n    id integer NOT NULL\n)" in statements
+        assert statements[-1] == "DROP TABLE public.orders"
+        assert diff_postgres_schema(current, current) == []
+
+    def test_diff_drops_tables_in_fk_order(self):
+        """Test dropped tables go before the tables they reference."""
+        current = {"tables": {
+            "public.users": pg_table({"id": ("bigint", False, None)}),
+            "public.orders": pg_table({"id": ("bigint", False, None)}, constraints={
+                "orders_user_fk": {"type": "f", "definition": "FOREIGN KEY (id) REFERENCES users(id)"}
+            }),
+            "public.zz_lines": pg_table({"id": ("bigint", False, None)}, constraints={
+                "lines_order_fk": {"type": "f", "definition": "FOREIGN KEY (id) REFERENCES public.orders(id)"}
+            }),
+            "app.A": pg_table({"id": ("bigint", False, None)}, constraints={
+                "a_b": {"type": "f", "definition": 'FOREIGN KEY (id) REFERENCES app."B"(id)'}
+            }),
+            "app.B": pg_table({"id": ("bigint", False, None)}, constraints={
+                "b_a": {"type": "f", "definition": 'FOREIGN KEY (id) REFERENCES "A"(id)'}
+            }),
+        }}
+
+        statements = diff_postgres_schema(current, {"tables": {}})
+
+        assert statements == [
+            'ALTER TABLE app."A" DROP CONSTRAINT a_b',
+            'ALTER TABLE app."B" DROP CONSTRAINT b_a',
+            "DROP TABLE public.zz_lines",
+            "DROP TABLE public.orders",
+            "DROP TABLE public.users",
+            'DROP TABLE app."B"',
+            'DROP TABLE app."A"',
+        ]
+
+    def test_snapshot_skips_partitions(self):
+        """Test partitions are not snapshotted as tables of their own."""
+        assert all("NOT t.relispartition" in query for query in SNAPSHOT_QUERIES.values())
+
+    def test_diff_changed_constraint_and_quoting(self):
+        """Test changed constraints are recreated and names quoted."""
+        current = {"tables": {"app.Users": pg_table(
+            {"id": ("integer", False, None)},
+            constraints={"age check": {"type": "c", "definition": "CHECK ((id > 0))"}}
+        )}}
+        desired = {"tables": {"app.Users": pg_table(
+            {"id": ("integer", False, None)},
+            constraints={"age check": {"type": "c", "definition": "CHECK ((id > 10))"}}
+        )}}
+
+        assert diff_postgres_schema(current, desired) == [
+            'ALTER TABLE app."Users" DROP CONSTRAINT "age check"',
+            'ALTER TABLE app."Users" ADD CONSTRAINT "age check" CHECK ((id > 10))',
+        ]
+
+    def test_mongo_index_diff(self):
+        """Test index changes group new indexes per collection."""
+        current = {"collections": {"users": {"indexes": {
+            "_id_": {"key": {"_id": 1}},
+            "email_1": {"key": {"email": 1}},
+            "name_1": {"key": {"name": 1}},
+        }}}}
+        desired = {"collections": {
+            "users": {"indexes": {
+                "_id_": {"key": {"_id": 1}},
+                "email_1": {"key": {"email": 1}, "unique": True},
+                "age_1": {"key": {"age": 1}},
+            }},
+            "events": {"indexes": {"ts_1": {"key": {"ts": -1}, "expireAfterSeconds": 3600}}},
+        }}
+
+        assert diff_mongo_indexes(current, desired) == [
+            {"operation": "createIndexes", "collection": "events",
+             "indexes": [{"key": {"ts": -1}, "expireAfterSeconds": 3600, "name": "ts_1"}]},
+            {"operation": "dropIndex", "collection": "users", "name": "email_1"},
+            {"operation": "dropIndex", "collection": "users", "name": "name_1"},
+            {"operation": "createIndexes", "collection": "users", "indexes": [
+                {"key": {"age": 1}, "name": "age_1"},
+                {"key": {"email": 1}, "unique": True, "name": "email_1"},
+            ]},
+        ]
+
+    def test_snapshot_one_query_per_type(self, temp_migrations_dir):
+        """Test a 5,000-table snapshot runs three catalog queries."""
+        manager = MigrationManager("postgres", "postgresql://localhost/test", str(temp_migrations_dir))
+        manager.conn = MagicMock()
+        cursor = manager.conn.cursor.return_value.__enter__.return_value
+        tables = [f"public.t{i:04d}" for i in range(5000)]
+        cursor.fetchall.side_effect = [
+            [(t, c, "integer", c != "id", None) for t in tables for c in ("id", "a", "b")],
+            [(t, f"{t[7:]}_a", f"CREATE INDEX {t[7:]}_a ON {t} USING btree (a)") for t in tables],
+            [(t, f"{t[7:]}_pkey", "p", "PRIMARY KEY (id)") for t in tables],
+        ]
+
+        snapshot = manager.snapshot_schema()
+
+        assert cursor.execute.call_count == 3
+        assert len(snapshot["tables"]) == 5000
+        assert snapshot["tables"]["public.t0042"] == pg_table(
+            {"id": ("integer", False, None), "a": ("integer", True, None), "b": ("integer", True, None)},
+            indexes={"t0042_a": "CREATE INDEX t0042_a ON public.t0042 USING btree (a)"},
+            constraints={"t0042_pkey": {"type": "p", "definition": "PRIMARY KEY (id)"}}
+        )
+        assert diff_postgres_schema(snapshot, snapshot) == []
+
+    def test_generate_from_schema(self, temp_migrations_dir):
+        """Test the generated migration holds the up and down SQL."""
+        current, desired = self.schemas()
+        manager = MigrationManager("postgres", "", str(temp_migrations_dir))
+
+        assert manager.generate_from_schema("sync", desired, current) is True
+
+        files = list(Path(temp_migrations_dir).glob("*_sync.json"))
+        data = json.loads(files[0].read_text())
+        assert data["up_sql"].startswith("DROP INDEX public.idx_users_legacy;\n")
+        assert data["down_sql"].endswith("DROP TABLE public.orders;\n")
+
+        assert manager.generate_from_schema("noop", desired, desired) is True
+        assert not list(Path(temp_migrations_dir).glob("*_noop.json"))
+        assert manager.generate_from_schema("bad", {"database_type": "mongodb"}, current) is False
+
+    def test_mongo_rollback_runs_down_operations(self, temp_migrations_dir):
+        """Test a generated Mongo migration rolls back its index changes."""
+        manager = MigrationManager("mongodb", "", str(temp_migrations_dir))
+        desired = {"collections": {"users": {"indexes": {"email_1": {"key": {"email": 1}}}}}}
+        assert manager.generate_from_schema("idx", desired, {"collections": {}})
+
+        migration_id = next(Path(temp_migrations_dir).glob("*_idx.json")).name.split("_")[0]
+        manager.db = MagicMock()
+        assert manager.rollback_migration(migration_id) is True
+
+        manager.db["users"].drop_index.assert_called_once_with("email_1")
+        manager.db.migrations.delete_one.assert_called_once_with({"id": migration_id})
+
+
 def test_migration_sorting(temp_migrations_dir):
     """Test that migrations are applied in correct order."""
     manager = MigrationManager("mongodb", "mongodb://localhost", temp_migrations_dir)
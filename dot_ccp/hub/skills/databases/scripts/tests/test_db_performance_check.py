@@ -11,8 +11,10 @@ import pytest
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+import db_performance_check
 from db_performance_check import (
-    SlowQuery, IndexRecommendation, PerformanceReport, PerformanceAnalyzer
+    SlowQuery, IndexRecommendation, PerformanceReport, PerformanceAnalyzer,
+    QueryHistory, parse_duration, percentile, query_shape
 )
 
 
@@ -330,6 +332,230 @@ class TestPerformanceAnalyzer:
         assert report is None
 
 
+class TestQueryHistory:
+    """Test the sampled pg_stat_statements history."""
+
+    @pytest.fixture
+    def history(self, tmp_path):
+        """Open a history store in a temporary file."""
+        store = QueryHistory(str(tmp_path / "history.db"))
+        yield store
+        store.close()
+
+    def samples(self, history):
+        """Stored (queryid, calls, total_exec_time) deltas."""
+        return history.conn.execute(
+            "SELECT queryid, calls, total_exec_time FROM samples ORDER BY ts, queryid"
+        ).fetchall()
+
+    def test_parse_duration(self):
+        """Test duration suffixes."""
+        assert parse_duration("90") == 90
+        assert parse_duration("15m") == 900
+        assert parse_duration("1.5h") == 5400
+        assert parse_duration("7d") == 7 * 86400
+        with pytest.raises(ValueError):
+            parse_duration("soon")
+
+    def test_deltas(self, history):
+        """Test first samples set baselines and later ones store deltas."""
+        assert history.record([("10:1:q1", "q1", 100, 500.0, 100)], ts=1) == 0
+        history.record([("10:1:q1", "q1", 150, 1000.0, 150), ("10:1:q2", "q2", 5, 5.0, 5)], ts=2)
+        history.record([("10:1:q1", "q1", 150, 1000.0, 150), ("10:1:q2", "q2", 9, 13.0, 9)], ts=3)
+
+        assert self.samples(history) == [("q1", 50, 500.0), ("q2", 4, 8.0)]
+
+    def test_entry_reset(self, history):
+        """Test a counter going backwards counts from zero."""
+        history.record([("10:1:q1", "q1", 100, 500.0, 100)], ts=1)
+        history.record([("10:1:q1", "q1", 7, 70.0, 7)], ts=2)
+
+        assert self.samples(history) == [("q1", 7, 70.0)]
+
+    def test_stats_reset(self, history):
+        """Test a changed stats_reset treats all counters as fresh."""
+        history.record([("10:1:q1", "q1", 100, 500.0, 100)], "2025-01-01", ts=1)
+        history.record([("10:1:q1", "q1", 120, 600.0, 120)], "2025-01-01", ts=2)
+        history.record([("10:1:q1", "q1", 130, 650.0, 130), ("10:1:q2", "q2", 3, 3.0, 3)],
+                       "2025-01-02", ts=3)
+
+        assert self.samples(history) == [("q1", 20, 100.0), ("q1", 130, 650.0), ("q2", 3, 3.0)]
+
+    def test_regressions(self, history):
+        """Test queries slower in the current window are reported."""
+        history.record([("k1", "q1", 0, 0.0, 0), ("k2", "q2", 0, 0.0, 0)], ts=0)
+        history.record([("k1", "q1", 100, 200.0, 0), ("k2", "q2", 100, 1000.0, 0)], ts=1800)
+        history.record([("k1", "q1", 200, 1200.0, 0), ("k2", "q2", 200, 2100.0, 0)], ts=5400)
+        history.record([("k1", "q1", 200, 1200.0, 0), ("k2", "q2", 200, 2100.0, 0)],
+                       texts={"q1": "SELECT * FROM orders WHERE user_id = $1"}, ts=5500)
+
+        regressions = history.regressions(window=3600, now=6000)
+
+        assert len(regressions) == 1
+        r = regressions[0]
+        assert (r.queryid, r.baseline_ms, r.current_ms) == ("q1", 2.0, 10.0)
+        assert r.ratio == 5.0
+        assert r.added_ms == 800.0
+        assert r.query == "SELECT * FROM orders WHERE user_id = $1"
+        assert history.regressions(window=3600, min_calls=500, now=6000) == []
+        assert history.regressions(window=3600, min_mean_ms=20, now=6000) == []
+
+    def test_regressions_cli_ignores_slow_query_threshold(self, tmp_path):
+        """Test --regressions uses --min-mean-ms, not the slow-query --threshold."""
+        argv = ["db_performance_check.py", "--db", "postgres", "--history", str(tmp_path / "h.db"),
+                "--regressions", "1h"]
+
+        with patch("db_performance_check.QueryHistory") as history_cls, \
+                patch("sys.argv", argv), pytest.raises(SystemExit):
+            history_cls.return_value.regressions.return_value = []
+            db_performance_check.main()
+        assert history_cls.return_value.regressions.call_args[0][4] == 0
+
+        with patch("db_performance_check.QueryHistory") as history_cls, \
+                patch("sys.argv", argv + ["--min-mean-ms", "5"]), pytest.raises(SystemExit):
+            history_cls.return_value.regressions.return_value = []
+            db_performance_check.main()
+        assert history_cls.return_value.regressions.call_args[0][4] == 5
+
+    def test_prune(self, history):
+        """Test old samples are pruned."""
+        history.record([("k1", "q1", 1, 1.0, 1)], ts=1)
+        history.record([("k1", "q1", 2, 2.0, 2)], ts=2)
+        history.record([("k1", "q1", 3, 3.0, 3)], ts=3)
+
+        assert history.prune(3) == 1
+        assert self.samples(history) == [("q1", 1, 1.0)]
+
+    def test_sample_postgres(self, history, mock_postgres_conn):
+        """Test sampling reads counters without text and fetches new text once."""
+        mock_conn, mock_cursor = mock_postgres_conn
+        counters = [("10:1:42", "42", 10, 50.0, 10)]
+        mock_cursor.fetchall.side_effect = [counters, [("42", "SELECT 1")], counters]
+        mock_cursor.fetchone.return_value = ("2025-01-01",)
+
+        analyzer = PerformanceAnalyzer("postgres", "postgresql://localhost")
+        analyzer.conn = mock_conn
+        analyzer.sample(history, interval=0, count=2)
+
+        queries = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        assert "pg_stat_statements(false)" in queries[0]
+        assert sum("WHERE queryid::text = ANY" in q for q in queries) == 1
+        assert history.known_queries() == {"42"}
+
+
+def profile_doc(millis, filter_, docs=100, returned=1, **extra):
+    """system.profile document for a find on users."""
+    return {
+        "op": "query", "ns": "testdb.users", "millis": millis,
+        "command": {"find": "users", "filter": filter_, "lsid": {"id": millis}, "$db": "testdb", **extra},
+        "docsExamined": docs, "keysExamined": 0, "nreturned": returned,
+        "planSummary": "COLLSCAN",
+    }
+
+
+class TestQueryShapes:
+    """Test MongoDB slow query aggregation by shape."""
+
+    def test_shape_replaces_literals(self):
+        """Test literals, key order and session fields do not change the shape."""
+        a = query_shape(profile_doc(5, {"age": {"$gte": 18}, "status": {"$in": ["a", "b"]}}))
+        b = query_shape(profile_doc(9, {"status": {"$in": ["c"]}, "age": {"$gte": 65}}))
+        c = query_shape(profile_doc(9, {"age": {"$lt": 65}}))
+
+        assert a == b
+        assert a != c
+        assert json.loads(a)["command"] == {
+            "filter": {"age": {"$gte": "?"}, "status": {"$in": ["?"]}}, "find": "users"
+        }
+
+    def test_nested_fields_named_like_command_fields(self):
+        """Test user fields named key, count or comment are still normalized."""
+        a = query_shape(profile_doc(1, {"key": "abc-123", "comment": "x"}))
+        b = query_shape(profile_doc(1, {"key": "zzz-999", "comment": "y"}))
+        assert a == b
+        assert json.loads(a)["command"]["filter"] == {"comment": "?", "key": "?"}
+
+        update = json.loads(query_shape({"ns": "testdb.users", "op": "update", "command": {
+            "q": {"_id": 7}, "u": {"$set": {"count": 5, "sort": "name"}}
+        }}))
+        assert update["command"]["u"] == {"$set": {"count": "?", "sort": "?"}}
+
+    def test_shape_keeps_sort_and_pipeline_order(self):
+        """Test sort specs stay verbatim and pipeline stages keep order."""
+        asc = query_shape(profile_doc(1, {"a": 1}, sort={"a": 1}))
+        desc = query_shape(profile_doc(1, {"a": 1}, sort={"a": -1}))
+        assert asc != desc
+
+        pipeline = json.loads(query_shape({"ns": "testdb.users", "op": "command", "command": {
+            "aggregate": "users", "pipeline": [{"$match": {"a": 1}}, {"$limit": 5}]
+        }}))
+        assert pipeline["command"]["pipeline"] == [{"$match": {"a": "?"}}, {"$limit": "?"}]
+
+        stages = json.loads(query_shape({"ns": "testdb.users", "op": "command", "command": {
+            "aggregate": "users", "pipeline": [{"$match": {"a": 1}}, {"$sort": {"a": -1}}]
+        }}))["command"]["pipeline"]
+        assert stages[1] == {"$sort": {"a": -1}}
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 51
+        assert percentile(values, 99) == 99
+        assert percentile([], 95) == 0.0
+
+    def test_aggregate_profile(self):
+        """Test repeats of a shape collapse into one SlowQuery."""
+        docs = [profile_doc(ms, {"user_id": ms}, docs=1000, returned=2) for ms in range(101, 201)]
+        docs.append(profile_doc(5000, {"email": "a@example.com"}, docs=10, returned=1))
+
+        analyzer = PerformanceAnalyzer("mongodb", "mongodb://localhost")
+        by_user, by_email = analyzer.aggregate_profile(iter(docs))
+
+        assert by_user.count == 100
+        assert by_user.execution_time_ms == 150.5
+        assert (by_user.p50_ms, by_user.p95_ms, by_user.p99_ms, by_user.max_ms) == (151, 195, 199, 200)
+        assert by_user.docs_examined_per_returned == 500.0
+        assert by_user.collection_or_table == "users"
+        assert by_user.index_used == "COLLSCAN"
+        assert len(by_user.fingerprint) == 16
+        assert by_email.count == 1
+        assert by_email.max_ms == 5000
+
+    def test_analyze_streams_whole_profile(self, mock_mongo_client):
+        """Test system.profile is read with a projection and no limit."""
+        mock_client, mock_db = mock_mongo_client
+        mock_db.command.return_value = {"was": 1}
+        mock_db.system.profile.find.return_value.batch_size.return_value = iter(
+            [profile_doc(200, {"user_id": i}) for i in range(30)]
+        )
+        mock_db.list_collection_names.return_value = []
+
+        analyzer = PerformanceAnalyzer("mongodb", "mongodb://localhost")
+        analyzer.client, analyzer.db = mock_client, mock_db
+        report = analyzer.analyze()
+
+        args, kwargs = mock_db.system.profile.find.call_args
+        assert "limit" not in kwargs
+        assert "millis" in args[1]
+        assert len(report.slow_queries) == 1
+        assert report.slow_queries[0].count == 30
+
+    def test_print_percentiles(self, capsys):
+        """Test aggregated queries print latency percentiles."""
+        analyzer = PerformanceAnalyzer("mongodb", "mongodb://localhost")
+        [query] = analyzer.aggregate_profile([profile_doc(120, {"a": 1}, docs=50, returned=5)])
+        report = PerformanceReport(
+            database_type="mongodb", database_name="testdb", timestamp=datetime.now(),
+            slow_queries=[query], index_recommendations=[], database_metrics={}
+        )
+
+        analyzer.print_report(report)
+
+        out = capsys.readouterr().out
+        assert "p50 120ms | p95 120ms | p99 120ms | max 120ms" in out
+        assert "Examined/Returned: 10.0 docs" in out
+
+
 class TestIntegration:
     """Integration tests."""
 
@@ -0,0 +1,276 @@
+"""Tests for db_pitr.py"""
+
+import gzip
+import io
+import json
+import sys
+import tarfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from db_pitr import (
+    BaseBackup,
+    OplogSegmentWriter,
+    PITRManager,
+    load_state,
+    parse_segment_name,
+    read_partial_wal,
+    segment_name,
+)
+
+
+@pytest.fixture
+def archive_dir(tmp_path):
+    """Create temporary archive directory."""
+    return str(tmp_path / "pitr")
+
+
+def make_tar(path, files):
+    """Write a gzip tarball containing the given name -> bytes entries."""
+    with tarfile.open(path, "w:gz") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def add_base(manager, name, end, files=None, oplog_ts=None):
+    """Register a base backup finished at `end`."""
+    path = manager.base_dir / name
+    path.mkdir(parents=True)
+    for filename, data in (files or {}).items():
+        make_tar(path / filename, data)
+    base = BaseBackup(name, path, manager.db_type, end - timedelta(minutes=5), end, oplog_ts)
+    manager._save_base(base)
+    return base
+
+
+class TestSegments:
+    """Test oplog segment naming and writing."""
+
+    def test_segment_name_roundtrip(self):
+        """Test names encode first and last timestamps and sort by time."""
+        name = segment_name((1700000000, 3), (1700000300, 12))
+
+        assert parse_segment_name(name) == ((1700000000, 3), (1700000300, 12))
+        assert segment_name((999999999, 1), (999999999, 2)) < name
+        assert parse_segment_name("state.json") is None
+
+    def test_rotate_on_size(self, tmp_path):
+        """Test segments close at the size limit and record state."""
+        writer = OplogSegmentWriter(tmp_path, max_bytes=100, max_seconds=3600)
+        entries = [((1000 + i, 1), bytes([i]) * 30) for i in range(7)]
+
+        for ts, raw in entries:
+            writer.write(ts, raw)
+        writer.close()
+
+        segments = sorted(tmp_path.glob("oplog_*.bson.gz"))
+        assert [parse_segment_name(p.name) for p in segments] == [
+            ((1000, 1), (1003, 1)), ((1004, 1), (1006, 1))
+        ]
+        data = b"".join(gzip.decompress(p.read_bytes()) for p in segments)
+        assert data == b"".join(raw for _, raw in entries)
+        assert load_state(tmp_path) == (1006, 1)
+
+    def test_rotate_on_age(self, tmp_path):
+        """Test idle segments close after max_seconds."""
+        writer = OplogSegmentWriter(tmp_path, max_seconds=0)
+
+        writer.write((1000, 1), b"x")
+
+        assert writer.maybe_rotate() is not None
+        assert writer.maybe_rotate() is None
+
+    def test_discards_unfinished_segment(self, tmp_path):
+        """Test a leftover temp segment is dropped on startup."""
+        (tmp_path / "current.bson.gz.tmp").write_bytes(b"partial")
+
+        OplogSegmentWriter(tmp_path)
+
+        assert not (tmp_path / "current.bson.gz.tmp").exists()
+
+
+class TestBaseBackup:
+    """Test base backup creation."""
+
+    @patch("subprocess.run")
+    def test_postgres_base_backup(self, mock_run, archive_dir):
+        """Test pg_basebackup writes compressed tar with streamed WAL."""
+        mock_run.return_value = MagicMock(returncode=0)
+        manager = PITRManager("postgres", archive_dir)
+
+        base = manager.base_backup("postgresql://localhost/db")
+
+        cmd = mock_run.call_args[0][0]
+        assert cmd[0] == "pg_basebackup"
+        assert ["-Ft", "-z", "-X", "stream"] == cmd[cmd.index("-Ft"):cmd.index("stream") + 1]
+        assert manager.list_base_backups()[0].name == base.name
+
+    def test_mongodb_oplog_ts_read_before_dump(self, archive_dir):
+        """Test the resume point is taken before mongodump so no ops are missed."""
+        events = []
+        manager = PITRManager("mongodb", archive_dir)
+
+        def dump(cmd, **kwargs):
+            events.append(cmd[0])
+            return MagicMock(returncode=0)
+
+        def latest(uri):
+            events.append("oplog_ts")
+            return (1700000000, 7)
+
+        with patch("subprocess.run", side_effect=dump), \
+                patch.object(manager, "_latest_oplog_ts", side_effect=latest):
+            base = manager.base_backup("mongodb://localhost")
+
+        assert events == ["oplog_ts", "mongodump"]
+        assert base.oplog_ts == (1700000000, 7)
+
+    @patch("subprocess.run")
+    def test_base_backup_failure(self, mock_run, archive_dir):
+        """Test failed base backups leave nothing behind."""
+        mock_run.return_value = MagicMock(returncode=1, stderr="connection refused")
+        manager = PITRManager("mongodb", archive_dir)
+
+        assert manager.base_backup("mongodb://localhost") is None
+        assert not list(manager.base_dir.iterdir())
+
+
+class TestRestore:
+    """Test point-in-time restore."""
+
+    def test_postgres_recovery_config(self, archive_dir, tmp_path):
+        """Test base unpacking, partial WAL and recovery settings."""
+        manager = PITRManager("postgres", archive_dir)
+        now = datetime.now(timezone.utc)
+        add_base(manager, "old", now - timedelta(days=2),
+                 {"base.tar.gz": {"PG_VERSION": b"15"}})
+        add_base(manager, "new", now - timedelta(hours=2), {
+            "base.tar.gz": {"PG_VERSION": b"16"},
+            "pg_wal.tar.gz": {"000000010000000000000001": b"wal"}
+        })
+        add_base(manager, "future", now, {"base.tar.gz": {"PG_VERSION": b"17"}})
+        manager.wal_dir.mkdir()
+        (manager.wal_dir / "000000010000000000000005.gz.partial").write_bytes(
+            gzip.compress(b"partial wal")
+        )
+        data_dir = tmp_path / "data"
+
+        assert manager.restore(now - timedelta(hours=1), data_dir=str(data_dir)) is True
+
+        assert (data_dir / "PG_VERSION").read_text() == "16"
+        assert (data_dir / "pg_wal" / "000000010000000000000001").exists()
+        partial = (data_dir / "pg_wal" / "000000010000000000000005").read_bytes()
+        assert partial.startswith(b"partial wal")
+        assert len(partial) == 16 * 1024 * 1024
+        assert (data_dir / "recovery.signal").exists()
+        conf = (data_dir / "postgresql.auto.conf").read_text()
+        assert "recovery_target_time = '" in conf
+        assert f'gunzip -c "$f.gz"' in conf and str(manager.wal_dir.resolve()) in conf
+
+    def test_truncated_partial_wal(self, tmp_path):
+        """Test an unterminated gzip partial segment is read and padded."""
+        # Long page header with xlp_seg_size = 1MB at offset 32
+        header = bytes(32) + (1024 * 1024).to_bytes(4, "little") + bytes(4)
+        payload = header + b"record" * 1000
+        compressed = gzip.compress(payload)
+        path = tmp_path / "000000010000000000000007.gz.partial"
+        # Drop the gzip trailer, as while pg_receivewal is still writing
+        path.write_bytes(compressed[:-8])
+
+        data = read_partial_wal(path)
+
+        assert data.startswith(payload)
+        assert len(data) == 1024 * 1024
+        assert data[len(payload):] == bytes(1024 * 1024 - len(payload))
+
+    def test_unreadable_partial_wal_skipped(self, archive_dir, tmp_path, capsys):
+        """Test a corrupt partial segment is skipped after the base is unpacked."""
+        manager = PITRManager("postgres", archive_dir)
+        now = datetime.now(timezone.utc)
+        add_base(manager, "base", now - timedelta(hours=2),
+                 {"base.tar.gz": {"PG_VERSION": b"16"}})
+        manager.wal_dir.mkdir()
+        (manager.wal_dir / "000000010000000000000005.gz.partial").write_bytes(b"not gzip")
+        data_dir = tmp_path / "data"
+
+        assert manager.restore(now - timedelta(hours=1), data_dir=str(data_dir)) is True
+
+        assert not (data_dir / "pg_wal" / "000000010000000000000005").exists()
+        assert "last complete segment" in capsys.readouterr().out
+
+    def test_no_base_before_target(self, archive_dir, tmp_path):
+        """Test targets older than every base backup are rejected."""
+        manager = PITRManager("postgres", archive_dir)
+        now = datetime.now(timezone.utc)
+        add_base(manager, "b", now)
+
+        assert manager.restore(now - timedelta(days=1), data_dir=str(tmp_path / "d")) is False
+
+    def test_postgres_data_dir_not_empty(self, archive_dir, tmp_path):
+        """Test recovery refuses to overwrite an existing data directory."""
+        manager = PITRManager("postgres", archive_dir)
+        add_base(manager, "b", datetime.now(timezone.utc) - timedelta(hours=1))
+        (tmp_path / "data").mkdir()
+        (tmp_path / "data" / "PG_VERSION").write_text("16")
+
+        assert manager.restore(datetime.now(), data_dir=str(tmp_path / "data")) is False
+
+    def test_mongodb_oplog_replay(self, archive_dir):
+        """Test segments after the base and up to the target are replayed."""
+        manager = PITRManager("mongodb", archive_dir)
+        base_end = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        epoch = int(base_end.timestamp())
+        add_base(manager, "b", base_end, oplog_ts=(epoch, 5))
+        manager.oplog_dir.mkdir()
+        spans = [
+            ((epoch - 600, 1), (epoch - 1, 1)),      # before the base
+            ((epoch, 1), (epoch + 299, 1)),          # overlaps the base
+            ((epoch + 300, 1), (epoch + 599, 1)),    # up to the target
+            ((epoch + 900, 1), (epoch + 1200, 1)),   # after the target
+        ]
+        for i, (first, last) in enumerate(spans):
+            (manager.oplog_dir / segment_name(first, last)).write_bytes(
+                gzip.compress(f"seg{i};".encode())
+            )
+        replayed = []
+
+        def fake_run(cmd, **kwargs):
+            if "--oplogLimit" in cmd:
+                replayed.append((Path(cmd[-1]) / "oplog.bson").read_bytes())
+            return MagicMock(returncode=0)
+
+        target = base_end + timedelta(minutes=10)
+        with patch("subprocess.run", side_effect=fake_run) as mock_run:
+            assert manager.restore(target, uri="mongodb://localhost") is True
+
+        base_cmd, replay_cmd = [c[0][0] for c in mock_run.call_args_list]
+        assert "--oplogReplay" in base_cmd and "--gzip" in base_cmd
+        assert replay_cmd[replay_cmd.index("--oplogLimit") + 1] == f"{epoch + 601}:0"
+        assert replayed == [b"seg1;seg2;"]
+
+    def test_status(self, archive_dir):
+        """Test the recovery window spans base backups to the newest segment."""
+        manager = PITRManager("mongodb", archive_dir)
+        base_end = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        add_base(manager, "b", base_end)
+        manager.oplog_dir.mkdir()
+        last = int(base_end.timestamp()) + 600
+        (manager.oplog_dir / segment_name((last - 60, 1), (last, 1))).write_bytes(b"")
+
+        status = manager.status()
+
+        assert status["base_backups"] == ["b"]
+        assert status["segments"] == 1
+        assert status["newest"] == (base_end + timedelta(minutes=10)).isoformat()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
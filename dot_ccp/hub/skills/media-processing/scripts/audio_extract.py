@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Single-pass audio extraction into transcription-ready chunks.
+
+Decodes the input once with FFmpeg to 16 kHz mono PCM on a pipe, splits the
+stream at silences into chunks of bounded length, and encodes the chunks to
+FLAC or Opus concurrently. Writes a JSON index of chunk offsets.
+"""
+
+import argparse
+import json
+import math
+import operator
+import subprocess
+import sys
+import tempfile
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from media_calibrate import get_default_parallelism
+
+
+SAMPLE_WIDTH = 2  # s16le
+
+CODECS = {
+    'flac': ('.flac', ['-c:a', 'flac']),
+    'opus': ('.opus', ['-c:a', 'libopus', '-application', 'voip']),
+}
+
+
+@dataclass
+class Chunk:
+    """A chunk of PCM cut from the stream."""
+    index: int
+    start_sample: int
+    pcm: bytes
+    voiced: bool
+
+
+@dataclass
+class ChunkInfo:
+    """Index entry for a written chunk."""
+    index: int
+    file: str
+    start: float
+    end: float
+    duration: float
+
+
+def frame_rms(frame: bytes) -> float:
+    """Root mean square of a little-endian s16 frame."""
+    samples = array('h', frame)
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(map(operator.mul, samples, samples)) / len(samples))
+
+
+class SilenceChunker:
+    """
+    Incrementally split a PCM stream at silences.
+
+    Once a chunk reaches `target_seconds` it is cut in the middle of the next
+    silence of at least `min_silence_seconds`. At `max_seconds` it is cut at
+    the latest such silence seen, or hard-cut if there was none.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        target_seconds: float = 20.0,
+        max_seconds: float = 30.0,
+        min_seconds: float = 2.0,
+        silence_db: float = -40.0,
+        min_silence_seconds: float = 0.3,
+        frame_ms: int = 30
+    ):
+        if not 0 < min_seconds <= target_seconds <= max_seconds:
+            raise ValueError("Require 0 < min_seconds <= target_seconds <= max_seconds")
+
+        self.sample_rate = sample_rate
+        bytes_per_second = sample_rate * SAMPLE_WIDTH
+        self.frame_bytes = sample_rate * frame_ms // 1000 * SAMPLE_WIDTH
+        self.target_bytes = int(target_seconds * bytes_per_second)
+        self.max_bytes = int(max_seconds * bytes_per_second)
+        self.min_bytes = int(min_seconds * bytes_per_second)
+        self.min_silence_bytes = int(min_silence_seconds * bytes_per_second)
+        self.threshold = 32768 * 10 ** (silence_db / 20)
+
+        self.buffer = bytearray()
+        self.analyzed = 0
+        self.silence_start: Optional[int] = None
+        self.best_cut: Optional[int] = None
+        self.voiced_until = 0
+        self.chunk_start = 0
+        self.index = 0
+
+    def _cut(self, offset: int) -> Chunk:
+        offset -= offset % SAMPLE_WIDTH
+        chunk = Chunk(
+            index=self.index,
+            start_sample=self.chunk_start,
+            pcm=bytes(self.buffer[:offset]),
+            voiced=self.voiced_until > 0
+        )
+        del self.buffer[:offset]
+        self.index += 1
+        self.chunk_start += offset // SAMPLE_WIDTH
+        self.analyzed -= offset
+        self.voiced_until = max(0, self.voiced_until - offset)
+        if self.silence_start is not None:
+            self.silence_start = max(0, self.silence_start - offset)
+        self.best_cut = None
+        return chunk
+
+    def feed(self, data: bytes) -> List[Chunk]:
+        """Add PCM data and return any chunks that are complete."""
+        self.buffer.extend(data)
+        chunks = []
+
+        while self.analyzed + self.frame_bytes <= len(self.buffer):
+            frame_end = self.analyzed + self.frame_bytes
+            frame = self.buffer[self.analyzed:frame_end]
+            self.analyzed = frame_end
+
+            if frame_rms(frame) < self.threshold:
+                if self.silence_start is None:
+                    self.silence_start = frame_end - self.frame_bytes
+                run = frame_end - self.silence_start
+                if run >= self.min_silence_bytes:
+                    candidate = self.silence_start + run // 2
+                    if candidate >= self.min_bytes:
+                        self.best_cut = candidate
+            else:
+                # A qualifying silence past the target just ended: cut in its middle
+                silence_end = frame_end - self.frame_bytes
+                if (self.silence_start is not None and self.best_cut is not None
+                        and self.best_cut > self.silence_start
+                        and silence_end >= self.target_bytes):
+                    chunks.append(self._cut(self.best_cut))
+                self.silence_start = None
+                self.voiced_until = self.analyzed
+
+            if self.analyzed >= self.max_bytes:
+                chunks.append(self._cut(self.best_cut or self.max_bytes))
+
+        return chunks
+
+    def flush(self) -> List[Chunk]:
+        """Return the trailing partial chunk, if any."""
+        if len(self.buffer) < SAMPLE_WIDTH:
+            return []
+        return [self._cut(len(self.buffer))]
+
+
+class AudioExtractor:
+    """Stream audio out of media files into encoded chunks."""
+
+    def __init__(self, verbose: bool = False, dry_run: bool = False):
+        self.verbose = verbose
+        self.dry_run = dry_run
+
+    def build_decode_command(self, input_path: Path, sample_rate: int) -> List[str]:
+        """FFmpeg command decoding the first audio stream to mono s16le on stdout."""
+        return [
+            'ffmpeg', '-v', 'error', '-i', str(input_path),
+            '-vn', '-map', '0:a:0',
+            '-ac', '1', '-ar', str(sample_rate),
+            '-f', 's16le', '-'
+        ]
+
+    def build_encode_command(
+        self,
+        output_path: Path,
+        codec: str,
+        sample_rate: int,
+        bitrate: str
+    ) -> List[str]:
+        """FFmpeg command encoding raw PCM from stdin."""
+        cmd = [
+            'ffmpeg', '-v', 'error',
+            '-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', '-'
+        ]
+        cmd.extend(CODECS[codec][1])
+        if codec == 'opus':
+            cmd.extend(['-b:a', bitrate])
+        cmd.extend(['-y', str(output_path)])
+        return cmd
+
+    def extract(
+        self,
+        input_path: Path,
+        output_dir: Path,
+        codec: str = 'flac',
+        sample_rate: int = 16000,
+        bitrate: str = '24k',
+        workers: int = 4,
+        drop_silent: bool = False,
+        chunker: Optional[SilenceChunker] = None
+    ) -> Optional[List[ChunkInfo]]:
+        """Extract input_path into chunks and write the JSON index."""
+        chunker = chunker or SilenceChunker(sample_rate=sample_rate)
+        decode_cmd = self.build_decode_command(input_path, sample_rate)
+
+        if self.verbose or self.dry_run:
+            print(f"Command: {' '.join(decode_cmd)}")
+        if self.dry_run:
+            return []
+
+        output_dir.mkdir(parents=True, exist_ok=True)
+        suffix = CODECS[codec][0]
+        stem = input_path.stem
+        entries: List[ChunkInfo] = []
+        errors: List[str] = []
+        # Bound memory: at most two pending chunks per encoder thread
+        slots = threading.BoundedSemaphore(workers * 2)
+
+        def encode(chunk: Chunk, output_path: Path) -> None:
+            try:
+                subprocess.run(
+                    self.build_encode_command(output_path, codec, sample_rate, bitrate),
+                    input=chunk.pcm,
+                    capture_output=True,
+                    check=True
+                )
+            except (subprocess.CalledProcessError, OSError) as e:
+                errors.append(f"{output_path.name}: {e}")
+            finally:
+                slots.release()
+
+        def submit(chunk: Chunk) -> None:
+            if drop_silent and not chunk.voiced:
+                return
+            start = chunk.start_sample / sample_rate
+            duration = len(chunk.pcm) / SAMPLE_WIDTH / sample_rate
+            output_path = output_dir / f'{stem}_{len(entries):04d}{suffix}'
+            entries.append(ChunkInfo(
+                index=len(entries),
+                file=output_path.name,
+                start=round(start, 3),
+                end=round(start + duration, 3),
+                duration=round(duration, 3)
+            ))
+            slots.acquire()
+            executor.submit(encode, chunk, output_path)
+
+        with tempfile.TemporaryFile() as stderr, \
+                ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            proc = subprocess.Popen(decode_cmd, stdout=subprocess.PIPE, stderr=stderr)
+            read_size = sample_rate * SAMPLE_WIDTH  # one second per read
+            while True:
+                data = proc.stdout.read(read_size)
+                if not data:
+                    break
+                for chunk in chunker.feed(data):
+                    submit(chunk)
+            for chunk in chunker.flush():
+                submit(chunk)
+            proc.stdout.close()
+            returncode = proc.wait()
+
+            if returncode != 0:
+                stderr.seek(0)
+                print(f"Error decoding {input_path}: {stderr.read().decode(errors='replace')}",
+                      file=sys.stderr)
+                return None
+
+        if errors:
+            for error in errors:
+                print(f"Error encoding {error}", file=sys.stderr)
+            return None
+
+        index = {
+            'source': str(input_path),
+            'sample_rate': sample_rate,
+            'channels': 1,
+            'codec': codec,
+            'chunks': [asdict(e) for e in entries]
+        }
+        with open(output_dir / f'{stem}_chunks.json', 'w') as f:
+            json.dump(index, f, indent=2)
+
+        return entries
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description='Extract audio into silence-aligned, transcription-ready chunks.'
+    )
+    parser.add_argument(
+        'inputs',
+        nargs='+',
+        type=Path,
+        help='Input media file(s)'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        type=Path,
+        required=True,
+        help='Output directory'
+    )
+    parser.add_argument(
+        '-c', '--codec',
+        choices=list(CODECS),
+        default='flac',
+        help='Chunk codec (default: flac)'
+    )
+    parser.add_argument(
+        '--sample-rate',
+        type=int,
+        default=16000,
+        help='Output sample rate (default: 16000)'
+    )
+    parser.add_argument(
+        '--bitrate',
+        default='24k',
+        help='Opus bitrate (default: 24k)'
+    )
+    parser.add_argument(
+        '--target',
+        type=float,
+        default=20.0,
+        help='Cut at the first silence after this many seconds (default: 20)'
+    )
+    parser.add_argument(
+        '--max',
+        type=float,
+        default=30.0,
+        help='Maximum chunk length in seconds (default: 30)'
+    )
+    parser.add_argument(
+        '--min',
+        type=float,
+        default=2.0,
+        help='Minimum chunk length in seconds (default: 2)'
+    )
+    parser.add_argument(
+        '--silence-db',
+        type=float,
+        default=-40.0,
+        help='Silence threshold in dBFS (default: -40)'
+    )
+    parser.add_argument(
+        '--min-silence',
+        type=float,
+        default=0.3,
+        help='Minimum silence length in seconds (default: 0.3)'
+    )
+    parser.add_argument(
+        '--drop-silent',
+        action='store_true',
+        help='Skip chunks that contain only silence'
+    )
+    parser.add_argument(
+        '-p', '--parallel',
+        type=int,
+        default=get_default_parallelism('audio', 4),
+        help='Concurrent chunk encoders (default: calibrated for this host, else 4)'
+    )
+    parser.add_argument(
+        '-n', '--dry-run',
+        action='store_true',
+        help='Show commands without executing'
+    )
+    parser.add_argument(
+        '-v', '--verbose',
+        action='store_true',
+        help='Verbose output'
+    )
+
+    args = parser.parse_args()
+
+    extractor = AudioExtractor(verbose=args.verbose, dry_run=args.dry_run)
+    fail = 0
+
+    for input_path in args.inputs:
+        if not input_path.exists():
+            print(f"Error: {input_path} not found", file=sys.stderr)
+            fail += 1
+            continue
+
+        try:
+            chunker = SilenceChunker(
+                sample_rate=args.sample_rate,
+                target_seconds=args.target,
+                max_seconds=args.max,
+                min_seconds=args.min,
+                silence_db=args.silence_db,
+                min_silence_seconds=args.min_silence
+            )
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+
+        print(f"Extracting {input_path.name}...")
+        entries = extractor.extract(
+            input_path,
+            args.output,
+            args.codec,
+            args.sample_rate,
+            args.bitrate,
+            args.parallel,
+            args.drop_silent,
+            chunker
+        )
+        if entries is None:
+            fail += 1
+        elif not args.dry_run:
+            print(f"  {len(entries)} chunk(s) -> {args.output / f'{input_path.stem}_chunks.json'}")
+
+    print(f"\nResults: {len(args.inputs) - fail} succeeded, {fail} failed")
+    sys.exit(0 if fail == 0 else 1)
+
+
+if __name__ == '__main__':
+    main()
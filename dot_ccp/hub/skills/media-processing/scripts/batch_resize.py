@@ -13,6 +13,8 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import List, Optional, Tuple
 
+from media_calibrate import get_default_parallelism
+
 
 class ImageResizer:
     """Handle image resizing operations using ImageMagick."""
@@ -274,8 +276,8 @@ def main():
     parser.add_argument(
         '-p', '--parallel',
         type=int,
-        default=1,
-        help='Number of parallel processes (default: 1)'
+        default=get_default_parallelism('image', 1),
+        help='Number of parallel processes (default: calibrated for this host, else 1)'
     )
     parser.add_argument(
         '-r', '--recursive',
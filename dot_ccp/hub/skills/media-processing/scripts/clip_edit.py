@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+Fast clip trimming and concatenation without full re-encodes.
+
+Uses the ffprobe keyframe index to stream-copy whole GOPs and re-encodes only
+the partial GOPs at the cut boundaries (smart render). Pieces are joined with
+the FFmpeg concat demuxer.
+"""
+
+import argparse
+import bisect
+import json
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+# Encoders able to re-encode boundary GOPs so they concat with copied ones
+SMART_RENDER_ENCODERS = {
+    'h264': 'libx264',
+    'hevc': 'libx265',
+}
+
+# Keyframe timestamps closer than this to a cut point count as on it
+EPSILON = 0.001
+
+# Extra seconds of packets probed past the cut range
+PROBE_MARGIN = 1.0
+
+
+def encoder_profile(codec: str, profile: Optional[str]) -> Optional[str]:
+    """Map an ffprobe profile name ('High', 'Main 10') to the encoder's name."""
+    if not profile:
+        return None
+    name = profile.lower().replace('constrained ', '').replace(' intra', '').replace(' ', '')
+    known = {
+        'h264': {'baseline', 'main', 'high', 'high10', 'high422', 'high444'},
+        'hevc': {'main', 'main10', 'mainstillpicture'},
+    }
+    return name if name in known.get(codec, set()) else None
+
+
+def encoder_level(codec: str, level: Optional[int]) -> Optional[str]:
+    """ffprobe level (41 for H.264, 123 for HEVC) as a level string ('4.1')."""
+    if not level or level < 0:
+        return None
+    scale = 30 if codec == 'hevc' else 10
+    return f'{level / scale:.1f}'
+
+
+@dataclass
+class Segment:
+    """A piece of the output: either stream-copied or re-encoded."""
+    start: float
+    end: float
+    copy: bool
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+def parse_time(value: str) -> float:
+    """Parse seconds ('90.5') or [HH:]MM:SS[.ms] into seconds."""
+    parts = value.split(':')
+    if len(parts) > 3:
+        raise ValueError(f"Invalid time: {value}")
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def plan_trim(keyframes: List[float], start: float, end: float) -> List[Segment]:
+    """
+    Split [start, end) into copy and re-encode segments.
+
+    Whole GOPs between the first keyframe at/after `start` and the last
+    keyframe at/before `end` are copied; the partial GOPs before and after
+    are re-encoded.
+    """
+    if end <= start:
+        raise ValueError("End must be after start")
+
+    first = bisect.bisect_left(keyframes, start - EPSILON)
+    last = bisect.bisect_right(keyframes, end + EPSILON) - 1
+    inner = keyframes[first:last + 1]
+
+    if not inner:
+        return [Segment(start, end, copy=False)]
+
+    copy_start = inner[0]
+    copy_end = inner[-1]
+    segments = []
+
+    if copy_start - start > EPSILON:
+        segments.append(Segment(start, copy_start, copy=False))
+    if copy_end - copy_start > EPSILON:
+        segments.append(Segment(copy_start, copy_end, copy=True))
+    # The GOP starting at the last keyframe runs past `end` unless `end` is
+    # itself a keyframe
+    if end - copy_end > EPSILON:
+        segments.append(Segment(copy_end, end, copy=False))
+
+    return segments
+
+
+def _concat_list_line(path: Path) -> str:
+    escaped = str(path.resolve()).replace("'", "'\\''")
+    return f"file '{escaped}'\n"
+
+
+class ClipEditor:
+    """Keyframe-aware trimming and concatenation using FFmpeg."""
+
+    def __init__(self, verbose: bool = False, dry_run: bool = False):
+        self.verbose = verbose
+        self.dry_run = dry_run
+
+    def _run(self, cmd: List[str]) -> None:
+        if self.verbose or self.dry_run:
+            print(f"Command: {' '.join(cmd)}")
+        if not self.dry_run:
+            subprocess.run(cmd, check=True, capture_output=not self.verbose)
+
+    def get_keyframes(
+        self,
+        input_path: Path,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        start_time: float = 0.0
+    ) -> List[float]:
+        """
+        Read keyframe timestamps from packet flags (demux only, no decode).
+
+        Timestamps are returned relative to the stream start (start_time
+        is subtracted), matching what ffmpeg's -ss expects. With start and
+        end, only packets around that range are read.
+        """
+        cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0']
+        if start is not None or end is not None:
+            low = '' if start is None else f'{start_time + start:.6f}'
+            high = '' if end is None else f'{start_time + end + PROBE_MARGIN:.6f}'
+            cmd.extend(['-read_intervals', f'{low}%{high}'])
+        cmd.extend(['-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', str(input_path)])
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+
+        keyframes = []
+        for line in result.stdout.splitlines():
+            pts, _, flags = line.partition(',')
+            if 'K' in flags and pts not in ('', 'N/A'):
+                keyframes.append(float(pts) - start_time)
+        return sorted(keyframes)
+
+    def get_stream_info(self, input_path: Path) -> Dict[str, Optional[str]]:
+        """Collect the stream parameters that must match for stream-copy concat."""
+        result = subprocess.run(
+            ['ffprobe', '-v', 'quiet', '-print_format', 'json',
+             '-show_streams', '-show_format', str(input_path)],
+            capture_output=True, check=True
+        )
+        data = json.loads(result.stdout)
+
+        fmt = data.get('format', {})
+        info = {'duration': fmt.get('duration'), 'start_time': fmt.get('start_time')}
+        for stream in data.get('streams', []):
+            if stream.get('codec_type') == 'video' and 'video_codec' not in info:
+                info.update({
+                    'video_codec': stream.get('codec_name'),
+                    'width': stream.get('width'),
+                    'height': stream.get('height'),
+                    'pix_fmt': stream.get('pix_fmt'),
+                    'profile': stream.get('profile'),
+                    'level': stream.get('level'),
+                    'fps': stream.get('r_frame_rate'),
+                })
+                if stream.get('start_time') not in (None, 'N/A'):
+                    info['start_time'] = stream['start_time']
+            elif stream.get('codec_type') == 'audio' and 'audio_codec' not in info:
+                info.update({
+                    'audio_codec': stream.get('codec_name'),
+                    'sample_rate': stream.get('sample_rate'),
+                    'channels': stream.get('channels'),
+                })
+        return info
+
+    def _encode_args(self, info: Dict, crf: int, preset: str) -> List[str]:
+        """Encoder args matching the source's profile and level so SPS stay compatible."""
+        codec = info['video_codec']
+        args = [
+            '-c:v', SMART_RENDER_ENCODERS[codec],
+            '-crf', str(crf),
+            '-preset', preset,
+            '-pix_fmt', info.get('pix_fmt') or 'yuv420p',
+        ]
+        profile = encoder_profile(codec, info.get('profile'))
+        if profile:
+            args.extend(['-profile:v', profile])
+        level = encoder_level(codec, info.get('level'))
+        if level and codec == 'hevc':
+            args.extend(['-x265-params', f'level-idc={level}'])
+        elif level:
+            args.extend(['-level:v', level])
+        return args
+
+    def trim(
+        self,
+        input_path: Path,
+        output_path: Path,
+        start: float,
+        end: Optional[float] = None,
+        mode: str = 'smart',
+        crf: int = 18,
+        preset: str = 'fast'
+    ) -> bool:
+        """
+        Cut [start, end) out of input_path.
+
+        Modes:
+            smart: copy whole GOPs, re-encode only the boundary GOPs
+            keyframe: copy only, snapping the start back to a keyframe
+            reencode: full re-encode of the range
+        """
+        try:
+            info = self.get_stream_info(input_path)
+            if end is None:
+                end = float(info['duration'])
+
+            if mode == 'smart' and info.get('video_codec') not in SMART_RENDER_ENCODERS:
+                print(f"Warning: smart render unsupported for {info.get('video_codec')}, "
+                      f"re-encoding", file=sys.stderr)
+                mode = 'reencode'
+
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+
+            if mode == 'keyframe':
+                self._run([
+                    'ffmpeg', '-ss', f'{start:.6f}', '-i', str(input_path),
+                    '-t', f'{end - start:.6f}',
+                    '-map', '0', '-c', 'copy',
+                    '-avoid_negative_ts', 'make_zero',
+                    '-y', str(output_path)
+                ])
+            elif mode == 'reencode':
+                self._run([
+                    'ffmpeg', '-ss', f'{start:.6f}', '-i', str(input_path),
+                    '-t', f'{end - start:.6f}',
+                    '-c:v', 'libx264', '-crf', str(crf), '-preset', preset,
+                    '-c:a', 'aac', '-movflags', '+faststart',
+                    '-y', str(output_path)
+                ])
+            elif mode == 'smart':
+                self._smart_trim(input_path, output_path, start, end, info, crf, preset)
+            else:
+                raise ValueError(f"Unknown trim mode: {mode}")
+
+            return True
+
+        except subprocess.CalledProcessError as e:
+            print(f"Error trimming {input_path}: {e}", file=sys.stderr)
+            if not self.verbose and e.stderr:
+                print(e.stderr.decode(errors='replace'), file=sys.stderr)
+            return False
+        except Exception as e:
+            print(f"Error trimming {input_path}: {e}", file=sys.stderr)
+            return False
+
+    def _smart_trim(
+        self,
+        input_path: Path,
+        output_path: Path,
+        start: float,
+        end: float,
+        info: Dict,
+        crf: int,
+        preset: str
+    ) -> None:
+        start_time = float(info.get('start_time') or 0)
+        keyframes = self.get_keyframes(input_path, start, end, start_time)
+        segments = plan_trim(keyframes, start, end)
+
+        if self.verbose or self.dry_run:
+            for seg in segments:
+                action = 'copy' if seg.copy else 're-encode'
+                print(f"  {seg.start:10.3f} - {seg.end:10.3f}  {action}")
+
+        with tempfile.TemporaryDirectory(prefix='clip-edit-', dir=output_path.parent) as tmp:
+            tmp_dir = Path(tmp)
+            parts = []
+
+            # Video pieces go through MPEG-TS so every piece carries its own
+            # in-band parameter sets and can be concatenated by stream copy
+            for i, seg in enumerate(segments):
+                part = tmp_dir / f'part{i:03d}.ts'
+                cmd = [
+                    'ffmpeg', '-ss', f'{seg.start:.6f}', '-i', str(input_path),
+                    '-t', f'{seg.duration:.6f}',
+                    '-map', '0:v:0', '-an',
+                ]
+                if seg.copy:
+                    cmd.extend(['-c:v', 'copy'])
+                else:
+                    cmd.extend(self._encode_args(info, crf, preset))
+                cmd.extend(['-muxdelay', '0', '-y', str(part)])
+                self._run(cmd)
+                parts.append(part)
+
+            list_file = tmp_dir / 'parts.txt'
+            list_file.write_text(''.join(_concat_list_line(p) for p in parts))
+
+            # Audio has no GOP structure, so it is copied straight from the source
+            self._run([
+                'ffmpeg',
+                '-f', 'concat', '-safe', '0', '-i', str(list_file),
+                '-ss', f'{start:.6f}', '-t', f'{end - start:.6f}', '-i', str(input_path),
+                '-map', '0:v:0', '-map', '1:a?',
+                '-c', 'copy',
+                '-movflags', '+faststart',
+                '-y', str(output_path)
+            ])
+
+    def concat(self, input_paths: List[Path], output_path: Path) -> bool:
+        """Join clips by stream copy; all inputs must share codec parameters."""
+        try:
+            keys = ('video_codec', 'width', 'height', 'pix_fmt', 'fps',
+                    'audio_codec', 'sample_rate', 'channels')
+            reference = None
+            for path in input_paths:
+                info = self.get_stream_info(path)
+                params = {k: info.get(k) for k in keys}
+                if reference is None:
+                    reference = params
+                elif params != reference:
+                    diff = [k for k in keys if params[k] != reference[k]]
+                    print(f"Error: {path} differs from {input_paths[0]} in "
+                          f"{', '.join(diff)}; normalize with media_convert.py first",
+                          file=sys.stderr)
+                    return False
+
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+                f.write(''.join(_concat_list_line(p) for p in input_paths))
+                list_file = Path(f.name)
+
+            try:
+                self._run([
+                    'ffmpeg', '-f', 'concat', '-safe', '0', '-i', str(list_file),
+                    '-c', 'copy', '-movflags', '+faststart',
+                    '-y', str(output_path)
+                ])
+            finally:
+                list_file.unlink(missing_ok=True)
+
+            return True
+
+        except subprocess.CalledProcessError as e:
+            print(f"Error concatenating clips: {e}", file=sys.stderr)
+            return False
+        except Exception as e:
+            print(f"Error concatenating clips: {e}", file=sys.stderr)
+            return False
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description='Trim and concatenate clips without full re-encodes.'
+    )
+    parser.add_argument(
+        '-n', '--dry-run',
+        action='store_true',
+        help='Show commands without executing'
+    )
+    parser.add_argument(
+        '-v', '--verbose',
+        action='store_true',
+        help='Verbose output'
+    )
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    trim_parser = subparsers.add_parser('trim', help='Cut a time range')
+    trim_parser.add_argument('input', type=Path, help='Input video file')
+    trim_parser.add_argument('-o', '--output', type=Path, required=True,
+                             help='Output video file')
+    trim_parser.add_argument('-s', '--start', default='0',
+                             help='Start time (seconds or HH:MM:SS.ms, default: 0)')
+    trim_parser.add_argument('-e', '--end',
+                             help='End time (default: end of input)')
+    trim_parser.add_argument('-m', '--mode',
+                             choices=['smart', 'keyframe', 'reencode'],
+                             default='smart',
+                             help='Cut mode (default: smart)')
+    trim_parser.add_argument('--crf', type=int, default=18,
+                             help='CRF for re-encoded boundaries (default: 18)')
+
+    concat_parser = subparsers.add_parser('concat', help='Join clips by stream copy')
+    concat_parser.add_argument('inputs', nargs='+', type=Path, help='Input clips in order')
+    concat_parser.add_argument('-o', '--output', type=Path, required=True,
+                               help='Output video file')
+
+    kf_parser = subparsers.add_parser('keyframes', help='List keyframe timestamps')
+    kf_parser.add_argument('input', type=Path, help='Input video file')
+
+    args = parser.parse_args()
+    editor = ClipEditor(verbose=args.verbose, dry_run=args.dry_run)
+
+    inputs = args.inputs if args.command == 'concat' else [args.input]
+    for path in inputs:
+        if not path.exists():
+            print(f"Error: Input file not found: {path}", file=sys.stderr)
+            sys.exit(1)
+
+    if args.command == 'keyframes':
+        start_time = float(editor.get_stream_info(args.input).get('start_time') or 0)
+        for ts in editor.get_keyframes(args.input, start_time=start_time):
+            print(f"{ts:.6f}")
+        sys.exit(0)
+
+    if args.command == 'trim':
+        try:
+            start = parse_time(args.start)
+            end = parse_time(args.end) if args.end else None
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        success = editor.trim(args.input, args.output, start, end, args.mode, args.crf)
+    else:
+        success = editor.concat(args.inputs, args.output)
+
+    if not success:
+        sys.exit(1)
+
+    if not args.dry_run:
+        print(f"Saved to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
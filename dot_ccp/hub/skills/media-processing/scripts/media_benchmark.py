@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Quality regression benchmark for media presets.
+
+Generates deterministic synthetic media (FFmpeg testsrc/sine, ImageMagick
+seeded plasma), runs every QUALITY_PRESETS entry plus VideoOptimizer defaults,
+and records wall time, peak RSS, output size and SSIM/PSNR. Results are
+compared against a stored baseline and the run fails on regressions beyond
+the configured thresholds.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from media_convert import (
+    QUALITY_PRESETS,
+    build_audio_command,
+    build_image_command,
+    build_video_command,
+)
+
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = SCRIPT_DIR / 'benchmark_baseline.json'
+
+# Relative increase allowed before a metric counts as a regression
+DEFAULT_THRESHOLDS = {
+    'wall_time_s': 0.25,
+    'peak_rss_kb': 0.20,
+    'output_bytes': 0.05,
+    # Absolute drops allowed for quality metrics
+    'ssim': 0.005,
+    'psnr': 0.5,
+}
+
+
+@dataclass
+class BenchmarkCase:
+    """A single command to benchmark."""
+    name: str
+    kind: str
+    command: List[str]
+    output: Path
+    reference: Path
+
+
+@dataclass
+class BenchmarkResult:
+    """Measurements for one case."""
+    case: str
+    wall_time_s: float
+    peak_rss_kb: Optional[int]
+    output_bytes: int
+    ssim: Optional[float] = None
+    psnr: Optional[float] = None
+
+
+def generate_fixtures(
+    workdir: Path,
+    duration: int = 5,
+    size: str = '1280x720'
+) -> Dict[str, Path]:
+    """Create deterministic synthetic source media."""
+    fixtures = {
+        'video': workdir / 'source_video.mkv',
+        'audio': workdir / 'source_audio.wav',
+        'image': workdir / 'source_image.png',
+    }
+
+    commands = [
+        # Lossless H.264 so quality metrics compare against a pristine source
+        ['ffmpeg', '-v', 'error',
+         '-f', 'lavfi', '-i', f'testsrc2=duration={duration}:size={size}:rate=30',
+         '-f', 'lavfi', '-i', f'sine=frequency=1000:duration={duration}',
+         '-c:v', 'libx264', '-preset', 'ultrafast', '-qp', '0',
+         '-c:a', 'flac', '-shortest', '-y', str(fixtures['video'])],
+        ['ffmpeg', '-v', 'error',
+         '-f', 'lavfi', '-i', f'sine=frequency=440:beep_factor=4:duration={duration}',
+         '-c:a', 'pcm_s16le', '-y', str(fixtures['audio'])],
+        ['magick', '-size', size, '-seed', '42', 'plasma:fractal',
+         '(', '-size', size, 'pattern:checkerboard', ')',
+         '-compose', 'overlay', '-composite', str(fixtures['image'])],
+    ]
+
+    for cmd in commands:
+        subprocess.run(cmd, check=True, capture_output=True)
+
+    return fixtures
+
+
+def build_cases(fixtures: Dict[str, Path], workdir: Path) -> List[BenchmarkCase]:
+    """Build one case per preset and media type, plus VideoOptimizer defaults."""
+    cases = []
+    outputs = workdir / 'out'
+    outputs.mkdir(parents=True, exist_ok=True)
+
+    for preset in QUALITY_PRESETS:
+        video_out = outputs / f'{preset}_video.mp4'
+        audio_out = outputs / f'{preset}_audio.m4a'
+        image_out = outputs / f'{preset}_image.jpg'
+        cases.extend([
+            BenchmarkCase(
+                f'{preset}/video', 'video',
+                build_video_command(fixtures['video'], video_out, preset),
+                video_out, fixtures['video']
+            ),
+            BenchmarkCase(
+                f'{preset}/audio', 'audio',
+                build_audio_command(fixtures['audio'], audio_out, preset),
+                audio_out, fixtures['audio']
+            ),
+            BenchmarkCase(
+                f'{preset}/image', 'image',
+                build_image_command(fixtures['image'], image_out, preset),
+                image_out, fixtures['image']
+            ),
+        ])
+
+    optimized = outputs / 'optimizer_default.mp4'
+    cases.append(BenchmarkCase(
+        'video_optimize/default', 'video',
+        [sys.executable, str(SCRIPT_DIR / 'video_optimize.py'),
+         str(fixtures['video']), '-o', str(optimized)],
+        optimized, fixtures['video']
+    ))
+
+    return cases
+
+
+def measure_command(cmd: List[str]) -> Tuple[float, Optional[int], int]:
+    """
+    Run a command and return (wall seconds, peak RSS in KiB, return code).
+
+    Peak RSS comes from wait4(), which covers the process and the children
+    it waited for, so wrapper scripts report their ffmpeg's footprint.
+    """
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        peak_rss = usage.ru_maxrss
+        if sys.platform == 'darwin':
+            peak_rss //= 1024  # macOS reports bytes
+        return wall, peak_rss, proc.returncode
+
+    proc.wait()
+    return time.perf_counter() - start, None, proc.returncode
+
+
+def parse_ffmpeg_ssim(stderr: str) -> Optional[float]:
+    """Extract the overall SSIM from ffmpeg's ssim filter summary."""
+    match = re.search(r'SSIM .*All:([\d.]+)', stderr)
+    return float(match.group(1)) if match else None
+
+
+def parse_ffmpeg_psnr(stderr: str) -> Optional[float]:
+    """Extract the average PSNR from ffmpeg's psnr filter summary."""
+    match = re.search(r'PSNR .*average:([\d.]+|inf)', stderr)
+    return float(match.group(1)) if match else None
+
+
+def parse_magick_metric(stderr: str) -> Optional[float]:
+    """Extract the leading value printed by `magick compare -metric`."""
+    match = re.match(r'\s*([\d.]+|inf)', stderr)
+    return float(match.group(1)) if match else None
+
+
+def measure_quality(case: BenchmarkCase) -> Tuple[Optional[float], Optional[float]]:
+    """Compute (SSIM, PSNR) of a case's output against its reference."""
+    if case.kind == 'video':
+        result = subprocess.run(
+            ['ffmpeg', '-i', str(case.output), '-i', str(case.reference),
+             '-lavfi', '[0:v]split[a0][a1];[1:v]split[b0][b1];'
+                       '[a0][b0]ssim;[a1][b1]psnr',
+             '-f', 'null', '-'],
+            capture_output=True, text=True
+        )
+        return parse_ffmpeg_ssim(result.stderr), parse_ffmpeg_psnr(result.stderr)
+
+    if case.kind == 'image':
+        metrics = []
+        for metric in ('SSIM', 'PSNR'):
+            result = subprocess.run(
+                ['magick', 'compare', '-metric', metric,
+                 str(case.output), str(case.reference), 'null:'],
+                capture_output=True, text=True
+            )
+            metrics.append(parse_magick_metric(result.stderr))
+        return metrics[0], metrics[1]
+
+    # No perceptual metric for audio; size and speed are still tracked
+    return None, None
+
+
+def run_case(case: BenchmarkCase) -> Optional[BenchmarkResult]:
+    """Run and measure one case."""
+    wall, peak_rss, returncode = measure_command(case.command)
+    if returncode != 0 or not case.output.exists():
+        print(f"Error: {case.name} failed (exit {returncode})", file=sys.stderr)
+        return None
+
+    ssim, psnr = measure_quality(case)
+    return BenchmarkResult(
+        case=case.name,
+        wall_time_s=round(wall, 3),
+        peak_rss_kb=peak_rss,
+        output_bytes=case.output.stat().st_size,
+        ssim=ssim,
+        psnr=psnr
+    )
+
+
+def compare_to_baseline(
+    results: List[BenchmarkResult],
+    baseline: Dict[str, Dict],
+    thresholds: Optional[Dict[str, float]] = None
+) -> List[str]:
+    """Return human-readable regressions of results versus the baseline."""
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    regressions = []
+
+    for result in results:
+        base = baseline.get(result.case)
+        if not base:
+            continue
+
+        for metric in ('wall_time_s', 'peak_rss_kb', 'output_bytes'):
+            current, previous = getattr(result, metric), base.get(metric)
+            if current is None or not previous:
+                continue
+            change = current / previous - 1
+            if change > thresholds[metric]:
+                regressions.append(
+                    f"{result.case}: {metric} {previous} -> {current} ({change:+.1%})"
+                )
+
+        for metric in ('ssim', 'psnr'):
+            current, previous = getattr(result, metric), base.get(metric)
+            if current is None or previous is None:
+                continue
+            if previous - current > thresholds[metric]:
+                regressions.append(
+                    f"{result.case}: {metric} {previous} -> {current} ({current - previous:+.4f})"
+                )
+
+    return regressions
+
+
+def print_results(results: List[BenchmarkResult]) -> None:
+    """Print a results table."""
+    print(f"\n{'Case':<26} {'Time (s)':>9} {'RSS (MB)':>9} {'Size (KB)':>10} {'SSIM':>8} {'PSNR':>7}")
+    print("-" * 74)
+    for r in results:
+        rss = f"{r.peak_rss_kb / 1024:.1f}" if r.peak_rss_kb else '-'
+        ssim = f"{r.ssim:.4f}" if r.ssim is not None else '-'
+        psnr = f"{r.psnr:.2f}" if r.psnr is not None else '-'
+        print(f"{r.case:<26} {r.wall_time_s:>9.2f} {rss:>9} "
+              f"{r.output_bytes / 1024:>10.1f} {ssim:>8} {psnr:>7}")
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description='Benchmark media presets against a stored baseline.'
+    )
+    parser.add_argument(
+        '--baseline',
+        type=Path,
+        default=DEFAULT_BASELINE,
+        help=f'Baseline JSON file (default: {DEFAULT_BASELINE.name})'
+    )
+    parser.add_argument(
+        '--update-baseline',
+        action='store_true',
+        help='Write this run as the new baseline'
+    )
+    parser.add_argument(
+        '--duration',
+        type=int,
+        default=5,
+        help='Synthetic clip duration in seconds (default: 5)'
+    )
+    parser.add_argument(
+        '--size',
+        default='1280x720',
+        help='Synthetic frame/image size (default: 1280x720)'
+    )
+    parser.add_argument(
+        '--only',
+        help='Comma-separated case name filter, e.g. "web,video_optimize"'
+    )
+    parser.add_argument(
+        '--size-threshold',
+        type=float,
+        default=DEFAULT_THRESHOLDS['output_bytes'],
+        help='Allowed relative output size increase (default: 0.05)'
+    )
+    parser.add_argument(
+        '--time-threshold',
+        type=float,
+        default=DEFAULT_THRESHOLDS['wall_time_s'],
+        help='Allowed relative wall time increase (default: 0.25)'
+    )
+    parser.add_argument(
+        '--workdir',
+        type=Path,
+        help='Keep fixtures and outputs in this directory'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        type=Path,
+        help='Save results to JSON file'
+    )
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='media-bench-') as tmp:
+        workdir = args.workdir or Path(tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+
+        print("Generating synthetic fixtures...")
+        try:
+            fixtures = generate_fixtures(workdir, args.duration, args.size)
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            print(f"Error: Could not generate fixtures: {e}", file=sys.stderr)
+            sys.exit(1)
+
+        cases = build_cases(fixtures, workdir)
+        if args.only:
+            filters = [f.strip() for f in args.only.split(',')]
+            cases = [c for c in cases if any(f in c.name for f in filters)]
+
+        results = []
+        failed = 0
+        for case in cases:
+            print(f"Running {case.name}...")
+            result = run_case(case)
+            if result:
+                results.append(result)
+            else:
+                failed += 1
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({r.case: asdict(r) for r in results}, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to: {args.baseline}")
+        sys.exit(0 if failed == 0 else 1)
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline first")
+        sys.exit(0 if failed == 0 else 1)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = compare_to_baseline(results, baseline, {
+        'output_bytes': args.size_threshold,
+        'wall_time_s': args.time_threshold,
+    })
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):")
+        for line in regressions:
+            print(f"  ✗ {line}")
+    else:
+        print("\n✓ No regressions against baseline")
+
+    sys.exit(0 if not regressions and failed == 0 else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Per-host calibration of parallelism defaults for the media scripts.
+
+Runs short probe workloads (image resize, x264 encode, audio encode) at
+increasing concurrency, finds the throughput knee, and stores the optimal
+worker count per job type. The other media scripts read these values as
+their default parallelism.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+
+JOB_TYPES = ('image', 'video', 'audio')
+
+
+def config_path() -> Path:
+    """Location of the calibration file (MEDIA_PARALLELISM_CONFIG overrides)."""
+    override = os.environ.get('MEDIA_PARALLELISM_CONFIG')
+    if override:
+        return Path(override)
+    base = os.environ.get('XDG_CONFIG_HOME') or Path.home() / '.config'
+    return Path(base) / 'media-processing' / 'parallelism.json'
+
+
+def load_config(path: Optional[Path] = None) -> Dict:
+    """Load the calibration file; missing or unreadable files yield {}."""
+    path = path or config_path()
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_default_parallelism(job_type: str, fallback: int = 1, path: Optional[Path] = None) -> int:
+    """Calibrated worker count for this host and job type, or `fallback`."""
+    host = load_config(path).get('hosts', {}).get(socket.gethostname(), {})
+    workers = host.get('workers', {}).get(job_type)
+    return workers if isinstance(workers, int) and workers > 0 else fallback
+
+
+def save_calibration(
+    workers: Dict[str, int],
+    measurements: Dict[str, Dict[int, float]],
+    path: Optional[Path] = None
+) -> Path:
+    """Merge this host's results into the calibration file."""
+    path = path or config_path()
+    config = load_config(path)
+    hosts = config.setdefault('hosts', {})
+    host = hosts.setdefault(socket.gethostname(), {})
+    host.setdefault('workers', {}).update(workers)
+    host.setdefault('throughput', {}).update({
+        job: {str(level): round(tps, 3) for level, tps in levels.items()}
+        for job, levels in measurements.items()
+    })
+    host['cpu_count'] = os.cpu_count()
+    host['calibrated_at'] = datetime.now().isoformat(timespec='seconds')
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(config, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+    return path
+
+
+def concurrency_levels(max_workers: int) -> List[int]:
+    """1, 2, 4, ... up to max_workers (always included)."""
+    levels = []
+    level = 1
+    while level < max_workers:
+        levels.append(level)
+        level *= 2
+    levels.append(max_workers)
+    return levels
+
+
+def find_knee(throughput: Dict[int, float], tolerance: float = 0.1) -> int:
+    """Smallest concurrency reaching (1 - tolerance) of the best throughput."""
+    best = max(throughput.values())
+    for level in sorted(throughput):
+        if throughput[level] >= best * (1 - tolerance):
+            return level
+    return max(throughput)
+
+
+class Calibrator:
+    """Measure throughput of probe workloads at increasing concurrency."""
+
+    def __init__(self, workdir: Path, rounds: int = 3, verbose: bool = False):
+        self.workdir = workdir
+        self.rounds = rounds
+        self.verbose = verbose
+
+    def prepare(self) -> Dict[str, Path]:
+        """Generate small synthetic inputs for each probe workload."""
+        fixtures = {
+            'image': self.workdir / 'probe.png',
+            'video': self.workdir / 'probe.mkv',
+            'audio': self.workdir / 'probe.wav',
+        }
+        commands = [
+            ['magick', '-size', '2400x1600', '-seed', '7', 'plasma:fractal',
+             str(fixtures['image'])],
+            ['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc2=duration=2:size=1280x720:rate=30',
+             '-c:v', 'libx264', '-preset', 'ultrafast', '-qp', '0', '-y', str(fixtures['video'])],
+            ['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'sine=frequency=440:duration=30',
+             '-c:a', 'pcm_s16le', '-y', str(fixtures['audio'])],
+        ]
+        for cmd in commands:
+            subprocess.run(cmd, check=True, capture_output=True)
+        return fixtures
+
+    def probe_command(self, job_type: str, source: Path, index: int) -> List[str]:
+        """Probe task built with the same command builders the scripts use."""
+        # Imported here: these scripts import this module for their defaults
+        from batch_resize import ImageResizer
+        from media_convert import build_audio_command, build_video_command
+
+        out = self.workdir / f'{job_type}_{index}'
+        if job_type == 'image':
+            return ImageResizer().build_resize_command(
+                source, out.with_suffix('.jpg'), 800, None, 'fit', 85
+            )
+        if job_type == 'video':
+            return build_video_command(source, out.with_suffix('.mp4'), 'web')
+        return build_audio_command(source, out.with_suffix('.flac'), 'web')
+
+    def measure(self, run_task: Callable[[int], None], level: int) -> float:
+        """Tasks per second with `level` concurrent workers."""
+        tasks = level * self.rounds
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as executor:
+            list(executor.map(run_task, range(tasks)))
+        return tasks / (time.perf_counter() - start)
+
+    def calibrate(
+        self,
+        job_type: str,
+        source: Path,
+        max_workers: int,
+        tolerance: float = 0.1
+    ) -> Dict[int, float]:
+        """Throughput per concurrency level, stopping once it falls off."""
+        def run_task(index: int) -> None:
+            subprocess.run(
+                self.probe_command(job_type, source, index),
+                check=True, capture_output=True
+            )
+
+        throughput: Dict[int, float] = {}
+        for level in concurrency_levels(max_workers):
+            throughput[level] = self.measure(run_task, level)
+            if self.verbose:
+                print(f"  {job_type} x{level}: {throughput[level]:.2f} tasks/s")
+            if throughput[level] < max(throughput.values()) * (1 - tolerance):
+                break  # past the knee
+        return throughput
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description='Calibrate default parallelism for media scripts on this host.'
+    )
+    parser.add_argument(
+        '--jobs',
+        default=','.join(JOB_TYPES),
+        help=f'Comma-separated job types to calibrate (default: {",".join(JOB_TYPES)})'
+    )
+    parser.add_argument(
+        '--max-workers',
+        type=int,
+        default=(os.cpu_count() or 1) * 2,
+        help='Highest concurrency to probe (default: 2x CPU count)'
+    )
+    parser.add_argument(
+        '--rounds',
+        type=int,
+        default=3,
+        help='Tasks per worker at each level (default: 3)'
+    )
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.1,
+        help='Accept the smallest level within this fraction of peak (default: 0.1)'
+    )
+    parser.add_argument(
+        '--config',
+        type=Path,
+        help=f'Calibration file (default: {config_path()})'
+    )
+    parser.add_argument(
+        '--show',
+        action='store_true',
+        help='Print the current calibration for this host and exit'
+    )
+    parser.add_argument(
+        '-v', '--verbose',
+        action='store_true',
+        help='Verbose output'
+    )
+
+    args = parser.parse_args()
+
+    if args.show:
+        host = load_config(args.config).get('hosts', {}).get(socket.gethostname())
+        if not host:
+            print("No calibration for this host")
+            sys.exit(1)
+        print(json.dumps(host, indent=2, sort_keys=True))
+        sys.exit(0)
+
+    jobs = [j.strip() for j in args.jobs.split(',') if j.strip()]
+    unknown = set(jobs) - set(JOB_TYPES)
+    if unknown:
+        print(f"Error: Unknown job type(s): {', '.join(sorted(unknown))}", file=sys.stderr)
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory(prefix='media-calibrate-') as tmp:
+        calibrator = Calibrator(Path(tmp), args.rounds, args.verbose)
+        try:
+            fixtures = calibrator.prepare()
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            print(f"Error: Could not generate probe inputs: {e}", file=sys.stderr)
+            sys.exit(1)
+
+        workers = {}
+        measurements = {}
+        for job in jobs:
+            print(f"Calibrating {job}...")
+            try:
+                throughput = calibrator.calibrate(
+                    job, fixtures[job], args.max_workers, args.tolerance
+                )
+            except subprocess.CalledProcessError as e:
+                print(f"Error: {job} probe failed: {e}", file=sys.stderr)
+                continue
+            measurements[job] = throughput
+            workers[job] = find_knee(throughput, args.tolerance)
+            print(f"  -> {workers[job]} worker(s)")
+
+    if not workers:
+        sys.exit(1)
+
+    path = save_calibration(workers, measurements, args.config)
+    print(f"\nSaved to: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,9 +9,12 @@ Supports quality presets, batch processing, and dry-run mode.
 import argparse
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Optional, Tuple
 
+from media_calibrate import get_default_parallelism
+
 
 # Format mappings
 VIDEO_FORMATS = {'.mp4', '.mkv', '.avi', '.mov', '.webm', '.flv', '.wmv', '.m4v'}
@@ -195,17 +198,18 @@ def batch_convert(
     output_format: Optional[str] = None,
     preset: str = 'web',
     dry_run: bool = False,
-    verbose: bool = False
+    verbose: bool = False,
+    parallel: int = 1
 ) -> Tuple[int, int]:
     """Convert multiple files."""
     success_count = 0
     fail_count = 0
 
-    for input_path in input_paths:
+    def process_file(input_path: Path) -> bool:
+        """Convert single file for parallel execution."""
         if not input_path.exists():
             print(f"Error: {input_path} not found", file=sys.stderr)
-            fail_count += 1
-            continue
+            return False
 
         # Determine output path
         if output_dir:
@@ -219,19 +223,38 @@ def batch_convert(
                 output_path = input_path.with_suffix(f".{output_format.lstrip('.')}")
             else:
                 print(f"Error: No output format specified for {input_path}", file=sys.stderr)
-                fail_count += 1
-                continue
+                return False
 
         print(f"Converting {input_path.name} -> {output_path.name}")
 
-        if convert_file(input_path, output_path, preset, dry_run, verbose):
-            success_count += 1
-        else:
-            fail_count += 1
+        return convert_file(input_path, output_path, preset, dry_run, verbose)
+
+    if parallel > 1:
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            for success in executor.map(process_file, input_paths):
+                if success:
+                    success_count += 1
+                else:
+                    fail_count += 1
+    else:
+        for input_path in input_paths:
+            if process_file(input_path):
+                success_count += 1
+            else:
+                fail_count += 1
 
     return success_count, fail_count
 
 
+def default_parallelism(input_paths: List[Path]) -> int:
+    """Calibrated worker count for the most expensive media type in the batch."""
+    media_types = {detect_media_type(p) for p in input_paths}
+    for job_type in ('video', 'audio', 'image'):
+        if job_type in media_types:
+            return get_default_parallelism(job_type, 1)
+    return 1
+
+
 def main():
     """Main entry point."""
     parser = argparse.ArgumentParser(
@@ -258,6 +281,11 @@ def main():
         default='web',
         help='Quality preset (default: web)'
     )
+    parser.add_argument(
+        '-j', '--parallel',
+        type=int,
+        help='Number of parallel conversions (default: calibrated for this host, else 1)'
+    )
     parser.add_argument(
         '-n', '--dry-run',
         action='store_true',
@@ -300,7 +328,8 @@ def main():
             args.format,
             args.preset,
             args.dry_run,
-            args.verbose
+            args.verbose,
+            args.parallel or default_parallelism(args.inputs)
         )
 
         print(f"\nResults: {success} succeeded, {fail} failed")
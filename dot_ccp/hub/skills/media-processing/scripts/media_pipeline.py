@@ -0,0 +1,670 @@
+#!/usr/bin/env python3
+"""
+Declarative multi-step media pipelines.
+
+Runs a per-asset DAG (probe, transcode, thumbnail, sprite, manifest, ...)
+described in a JSON or YAML file. Nodes are scheduled concurrently across
+assets, intermediates live in a tmpfs work directory and are removed as soon
+as their last consumer finishes, and node outputs are cached by a hash of
+their inputs and parameters.
+
+Example pipeline:
+
+    {
+      "nodes": [
+        {"id": "probe", "op": "probe"},
+        {"id": "transcode", "op": "transcode", "params": {"preset": "web"}},
+        {"id": "thumbnail", "op": "thumbnail", "needs": ["transcode"]},
+        {"id": "sprite", "op": "sprite", "needs": ["transcode"]},
+        {"id": "manifest", "op": "manifest",
+         "needs": ["probe", "transcode", "thumbnail", "sprite"]}
+      ]
+    }
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    YAML_AVAILABLE = False
+
+from batch_resize import ImageResizer
+from media_calibrate import get_default_parallelism
+from media_convert import (
+    build_audio_command,
+    build_image_command,
+    build_video_command,
+    detect_media_type,
+)
+from video_optimize import VideoOptimizer
+
+
+# Bump when op implementations change in a way that invalidates cached outputs
+CACHE_VERSION = 1
+
+SOURCE = 'source'
+
+
+@dataclass
+class NodeSpec:
+    """A single step of the per-asset DAG."""
+    id: str
+    op: str
+    needs: List[str] = field(default_factory=list)
+    params: Dict[str, Any] = field(default_factory=dict)
+    input: Optional[str] = None
+    keep: Optional[bool] = None
+
+
+@dataclass
+class NodeResult:
+    """Result of a node: an optional output file plus JSON-serialisable data."""
+    path: Optional[Path] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    cached: bool = False
+
+
+@dataclass
+class NodeContext:
+    """Everything an operation needs to run for one asset."""
+    asset: Path
+    input_path: Path
+    output_path: Optional[Path]
+    params: Dict[str, Any]
+    deps: Dict[str, NodeResult]
+    run: Callable[[List[str]], None]
+    verbose: bool = False
+
+
+def op_probe(ctx: NodeContext) -> Dict[str, Any]:
+    """Collect container and stream information with ffprobe."""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'quiet', '-print_format', 'json',
+         '-show_format', '-show_streams', str(ctx.input_path)],
+        capture_output=True,
+        check=True
+    )
+    data = json.loads(result.stdout)
+    fmt = data.get('format', {})
+
+    streams = []
+    for stream in data.get('streams', []):
+        entry = {
+            'type': stream.get('codec_type'),
+            'codec': stream.get('codec_name'),
+        }
+        if stream.get('codec_type') == 'video':
+            entry['width'] = stream.get('width')
+            entry['height'] = stream.get('height')
+            entry['fps'] = stream.get('r_frame_rate')
+        streams.append(entry)
+
+    return {
+        'duration': float(fmt.get('duration', 0)),
+        'size': int(fmt.get('size', 0)),
+        'bitrate': int(fmt.get('bit_rate', 0)),
+        'format': fmt.get('format_name'),
+        'streams': streams
+    }
+
+
+def op_transcode(ctx: NodeContext) -> Dict[str, Any]:
+    """Convert with a media_convert quality preset."""
+    builders = {
+        'video': build_video_command,
+        'audio': build_audio_command,
+        'image': build_image_command
+    }
+    media_type = detect_media_type(ctx.input_path)
+    if media_type not in builders:
+        raise RuntimeError(f"Unsupported format for {ctx.input_path}")
+
+    preset = ctx.params.get('preset', 'web')
+    ctx.run(builders[media_type](ctx.input_path, ctx.output_path, preset))
+    return {'preset': preset}
+
+
+def op_optimize(ctx: NodeContext) -> Dict[str, Any]:
+    """Size-optimize a video with VideoOptimizer."""
+    optimizer = VideoOptimizer(verbose=ctx.verbose)
+    if not optimizer.optimize_video(ctx.input_path, ctx.output_path, **ctx.params):
+        raise RuntimeError(f"Optimization failed for {ctx.input_path}")
+    return {}
+
+
+def op_resize(ctx: NodeContext) -> Dict[str, Any]:
+    """Resize an image with ImageResizer."""
+    resizer = ImageResizer(verbose=ctx.verbose)
+    if not resizer.resize_image(
+        ctx.input_path,
+        ctx.output_path,
+        ctx.params.get('width'),
+        ctx.params.get('height'),
+        ctx.params.get('strategy', 'fit'),
+        ctx.params.get('quality', 85)
+    ):
+        raise RuntimeError(f"Resize failed for {ctx.input_path}")
+    return {}
+
+
+def op_thumbnail(ctx: NodeContext) -> Dict[str, Any]:
+    """Extract a single scaled frame."""
+    at = ctx.params.get('at', 1)
+    width = ctx.params.get('width', 320)
+    ctx.run([
+        'ffmpeg', '-ss', str(at), '-i', str(ctx.input_path),
+        '-frames:v', '1',
+        '-vf', f'scale={width}:-2',
+        '-y', str(ctx.output_path)
+    ])
+    return {'at': at, 'width': width}
+
+
+def op_sprite(ctx: NodeContext) -> Dict[str, Any]:
+    """Tile frames sampled every `interval` seconds into one sprite sheet."""
+    interval = ctx.params.get('interval', 10)
+    columns = ctx.params.get('columns', 5)
+    rows = ctx.params.get('rows', 5)
+    width = ctx.params.get('width', 160)
+    ctx.run([
+        'ffmpeg', '-i', str(ctx.input_path),
+        '-vf', f'fps=1/{interval},scale={width}:-2,tile={columns}x{rows}',
+        '-frames:v', '1',
+        '-y', str(ctx.output_path)
+    ])
+    return {'interval': interval, 'columns': columns, 'rows': rows, 'width': width}
+
+
+def op_manifest(ctx: NodeContext) -> Dict[str, Any]:
+    """Write a JSON manifest of all upstream outputs for upload."""
+    base = ctx.output_path.parent
+    entries = {}
+    for dep_id, dep in ctx.deps.items():
+        entry = dict(dep.data)
+        if dep.path:
+            entry['path'] = os.path.relpath(dep.path, base)
+            entry['bytes'] = dep.path.stat().st_size
+        entries[dep_id] = entry
+
+    manifest = {'asset': ctx.asset.name, 'outputs': entries}
+    with open(ctx.output_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return {}
+
+
+# op name -> (default output suffix, implementation). A suffix of None means the
+# node produces data only; 'source' keeps the suffix of the node's input.
+OPERATIONS: Dict[str, Tuple[Optional[str], Callable[[NodeContext], Dict[str, Any]]]] = {
+    'probe': (None, op_probe),
+    'transcode': (SOURCE, op_transcode),
+    'optimize': ('.mp4', op_optimize),
+    'resize': (SOURCE, op_resize),
+    'thumbnail': ('.jpg', op_thumbnail),
+    'sprite': ('.jpg', op_sprite),
+    'manifest': ('.json', op_manifest),
+}
+
+# Ops whose output refers to upstream files by path, so those files must be kept
+REFERENCING_OPS = {'manifest'}
+
+
+def load_pipeline(path: Path) -> Dict[str, Any]:
+    """Load a pipeline definition from JSON or YAML."""
+    with open(path) as f:
+        if path.suffix.lower() in ('.yml', '.yaml'):
+            if not YAML_AVAILABLE:
+                raise ValueError("PyYAML not installed; use a JSON pipeline file")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def parse_nodes(definition: Dict[str, Any]) -> List[NodeSpec]:
+    """Validate node definitions and return them in topological order."""
+    nodes = {}
+    for raw in definition.get('nodes', []):
+        node = NodeSpec(
+            id=raw['id'],
+            op=raw['op'],
+            needs=list(raw.get('needs', [])),
+            params=dict(raw.get('params', {})),
+            input=raw.get('input'),
+            keep=raw.get('keep')
+        )
+        if node.id == SOURCE or node.id in nodes:
+            raise ValueError(f"Duplicate or reserved node id: {node.id}")
+        if node.op not in OPERATIONS:
+            raise ValueError(f"Unknown op '{node.op}' in node {node.id}")
+        nodes[node.id] = node
+
+    if not nodes:
+        raise ValueError("Pipeline has no nodes")
+
+    for node in nodes.values():
+        for dep in node.needs:
+            if dep not in nodes:
+                raise ValueError(f"Node {node.id} needs unknown node {dep}")
+        if node.input is None:
+            # Default input: first upstream node that produces a file
+            producers = [d for d in node.needs if OPERATIONS[nodes[d].op][0]]
+            node.input = producers[0] if producers else SOURCE
+        elif node.input != SOURCE and node.input not in node.needs:
+            raise ValueError(f"Node {node.id} input {node.input} must be listed in needs")
+        if node.input != SOURCE and OPERATIONS[nodes[node.input].op][0] is None:
+            raise ValueError(f"Node {node.id} input {node.input} produces no file")
+
+    # Kahn's algorithm, preserving declaration order among ready nodes
+    order = []
+    remaining = dict(nodes)
+    while remaining:
+        ready = [n for n in remaining.values()
+                 if all(d not in remaining for d in n.needs)]
+        if not ready:
+            raise ValueError(f"Cycle detected among nodes: {', '.join(remaining)}")
+        for node in ready:
+            order.append(node)
+            del remaining[node.id]
+
+    consumed = {d for n in order for d in n.needs}
+    for node in order:
+        if node.keep is None:
+            node.keep = node.id not in consumed
+
+    # Files a kept manifest points at go to the output dir too (and are cached)
+    for node in reversed(order):
+        if node.keep and node.op in REFERENCING_OPS:
+            for dep in node.needs:
+                if OPERATIONS[nodes[dep].op][0]:
+                    nodes[dep].keep = True
+
+    return order
+
+
+def hash_file(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def default_workdir() -> Path:
+    """Prefer a tmpfs mount for intermediates when one is available."""
+    shm = Path('/dev/shm')
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        return shm
+    return Path(tempfile.gettempdir())
+
+
+def default_cache_dir() -> Path:
+    """Per-user cache directory for node outputs."""
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'media-pipeline'
+
+
+class PipelineRunner:
+    """Schedule pipeline nodes across assets with caching."""
+
+    def __init__(
+        self,
+        nodes: List[NodeSpec],
+        output_dir: Path,
+        cache_dir: Optional[Path] = None,
+        workdir: Optional[Path] = None,
+        workers: int = 4,
+        verbose: bool = False,
+        dry_run: bool = False
+    ):
+        self.nodes = nodes
+        self.by_id = {n.id: n for n in nodes}
+        self.output_dir = output_dir
+        self.cache_dir = cache_dir
+        self.workdir = workdir or default_workdir()
+        self.workers = max(1, workers)
+        self.verbose = verbose
+        self.dry_run = dry_run
+
+    def _run_command(self, cmd: List[str]) -> None:
+        if self.verbose:
+            print(f"Command: {' '.join(cmd)}")
+        subprocess.run(cmd, check=True, capture_output=not self.verbose)
+
+    def _suffix(self, node: NodeSpec, asset: Path) -> Optional[str]:
+        if 'format' in node.params:
+            return f".{node.params['format'].lstrip('.')}"
+        suffix = OPERATIONS[node.op][0]
+        if suffix != SOURCE:
+            return suffix
+        if node.input == SOURCE:
+            return asset.suffix
+        return self._suffix(self.by_id[node.input], asset)
+
+    def compute_keys(self, source_hash: str, asset: Path) -> Dict[str, str]:
+        """Derive cache keys for every node from the source hash and node specs."""
+        keys = {SOURCE: source_hash}
+        for node in self.nodes:
+            params = {k: v for k, v in node.params.items() if k != 'format'}
+            payload = json.dumps({
+                'version': CACHE_VERSION,
+                'op': node.op,
+                'params': params,
+                'suffix': self._suffix(node, asset),
+                'input': keys[node.input],
+                'needs': [keys[d] for d in node.needs]
+            }, sort_keys=True, default=str)
+            keys[node.id] = hashlib.sha256(payload.encode()).hexdigest()
+        return keys
+
+    def _cacheable(self, node: NodeSpec) -> bool:
+        # Intermediate files stay in tmpfs; only kept outputs and data are persisted
+        return self.cache_dir is not None and (node.keep or OPERATIONS[node.op][0] is None)
+
+    def _cache_entry(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def _cache_lookup(self, node: NodeSpec, key: str) -> Optional[NodeResult]:
+        if not self._cacheable(node):
+            return None
+        entry = self._cache_entry(key)
+        meta = entry / 'result.json'
+        if not meta.exists():
+            return None
+        with open(meta) as f:
+            stored = json.load(f)
+        path = entry / stored['file'] if stored.get('file') else None
+        return NodeResult(path=path, data=stored.get('data', {}), cached=True)
+
+    def _cache_store(self, node: NodeSpec, key: str, result: NodeResult) -> None:
+        if not self._cacheable(node):
+            return
+        entry = self._cache_entry(key)
+        if entry.exists():
+            return
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=f'.{key[:8]}-', dir=entry.parent))
+        try:
+            stored = {'data': result.data, 'file': None}
+            if result.path:
+                stored['file'] = f'output{result.path.suffix}'
+                _link_or_copy(result.path, staging / stored['file'])
+            with open(staging / 'result.json', 'w') as f:
+                json.dump(stored, f)
+            os.replace(staging, entry)
+        except OSError:
+            # Another worker stored the same key first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _output_path(self, node: NodeSpec, asset: Path, scratch: Path) -> Optional[Path]:
+        suffix = self._suffix(node, asset)
+        if suffix is None:
+            return None
+        base = self.output_dir / asset.stem if node.keep else scratch
+        base.mkdir(parents=True, exist_ok=True)
+        path = base / f'{node.id}{suffix}'
+        # A kept output from an earlier run may be a hard link to a cache
+        # entry; ops rewrite in place, so give them a fresh inode
+        path.unlink(missing_ok=True)
+        return path
+
+    def plan(self, asset: Path, keys: Dict[str, str]) -> Tuple[Set[str], Dict[str, NodeResult]]:
+        """Work out which nodes must run and which are satisfied from cache."""
+        to_run: Set[str] = set()
+        cached: Dict[str, NodeResult] = {}
+
+        def resolve(node_id: str) -> None:
+            if node_id in to_run or node_id in cached:
+                return
+            node = self.by_id[node_id]
+            hit = self._cache_lookup(node, keys[node_id])
+            if hit:
+                cached[node_id] = hit
+                return
+            to_run.add(node_id)
+            for dep in node.needs:
+                resolve(dep)
+
+        for node in self.nodes:
+            if node.keep:
+                resolve(node.id)
+
+        return to_run, cached
+
+    def _materialize(self, node: NodeSpec, asset: Path, result: NodeResult) -> NodeResult:
+        """Place a cached kept output at its final location."""
+        if result.path and node.keep:
+            target = self.output_dir / asset.stem / f'{node.id}{result.path.suffix}'
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.unlink(missing_ok=True)
+            _link_or_copy(result.path, target)
+            result = NodeResult(path=target, data=result.data, cached=True)
+        return result
+
+    def _execute(
+        self,
+        node: NodeSpec,
+        asset: Path,
+        scratch: Path,
+        deps: Dict[str, NodeResult]
+    ) -> NodeResult:
+        input_path = asset if node.input == SOURCE else deps[node.input].path
+        output_path = self._output_path(node, asset, scratch)
+        ctx = NodeContext(
+            asset=asset,
+            input_path=input_path,
+            output_path=output_path,
+            params={k: v for k, v in node.params.items() if k != 'format'},
+            deps=deps,
+            run=self._run_command,
+            verbose=self.verbose
+        )
+        data = OPERATIONS[node.op][1](ctx)
+        return NodeResult(path=output_path, data=data or {})
+
+    def run(self, assets: List[Path]) -> Tuple[int, int]:
+        """Run the pipeline for every asset. Returns (succeeded, failed) asset counts."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            hashes = list(executor.map(hash_file, assets))
+
+            plans = []
+            for asset, source_hash in zip(assets, hashes):
+                keys = self.compute_keys(source_hash, asset)
+                to_run, cached = self.plan(asset, keys)
+                plans.append((keys, to_run, cached))
+                if self.verbose or self.dry_run:
+                    run_ids = [n.id for n in self.nodes if n.id in to_run]
+                    print(f"{asset.name}: run [{', '.join(run_ids)}], "
+                          f"cached [{', '.join(cached)}]")
+
+            if self.dry_run:
+                return len(assets), 0
+
+            return self._schedule(executor, assets, plans)
+
+    def _schedule(self, executor, assets, plans) -> Tuple[int, int]:
+        results: Dict[Tuple[int, str], NodeResult] = {}
+        pending: Dict[Tuple[int, str], NodeSpec] = {}
+        consumers: Dict[Tuple[int, str], int] = {}
+        scratch_dirs: Dict[int, Path] = {}
+        failed: Set[int] = set()
+
+        for idx, (asset, (keys, to_run, cached)) in enumerate(zip(assets, plans)):
+            for node_id, hit in cached.items():
+                results[(idx, node_id)] = self._materialize(self.by_id[node_id], asset, hit)
+            for node in self.nodes:
+                if node.id in to_run:
+                    pending[(idx, node.id)] = node
+                    for dep in node.needs:
+                        consumers[(idx, dep)] = consumers.get((idx, dep), 0) + 1
+            if to_run:
+                scratch_dirs[idx] = Path(tempfile.mkdtemp(prefix='media-pipeline-', dir=self.workdir))
+
+        running = {}
+        try:
+            while pending or running:
+                # Submit every node whose dependencies are satisfied
+                for task, node in list(pending.items()):
+                    idx = task[0]
+                    if idx in failed:
+                        del pending[task]
+                        continue
+                    if all((idx, d) in results for d in node.needs):
+                        deps = {d: results[(idx, d)] for d in node.needs}
+                        future = executor.submit(
+                            self._execute, node, assets[idx], scratch_dirs[idx], deps
+                        )
+                        running[future] = task
+                        del pending[task]
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx, node_id = running.pop(future)
+                    node = self.by_id[node_id]
+                    asset = assets[idx]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print(f"Error in {asset.name}:{node_id}: {e}", file=sys.stderr)
+                        failed.add(idx)
+                        continue
+
+                    results[(idx, node_id)] = result
+                    self._cache_store(node, plans[idx][0][node_id], result)
+                    if self.verbose:
+                        print(f"✓ {asset.name}:{node_id}")
+
+                    # Free intermediates as soon as their last consumer is done
+                    for dep in node.needs:
+                        consumers[(idx, dep)] -= 1
+                        dep_result = results[(idx, dep)]
+                        if (consumers[(idx, dep)] == 0 and not self.by_id[dep].keep
+                                and dep_result.path and not dep_result.cached):
+                            dep_result.path.unlink(missing_ok=True)
+        finally:
+            for scratch in scratch_dirs.values():
+                shutil.rmtree(scratch, ignore_errors=True)
+
+        return len(assets) - len(failed), len(failed)
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    """Hard-link when possible (same filesystem), otherwise copy."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description='Run declarative multi-step media pipelines.'
+    )
+    parser.add_argument(
+        'pipeline',
+        type=Path,
+        help='Pipeline definition (JSON or YAML)'
+    )
+    parser.add_argument(
+        'inputs',
+        nargs='+',
+        type=Path,
+        help='Input asset(s)'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        type=Path,
+        default=Path('.'),
+        help='Output directory (default: current directory)'
+    )
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        help='Concurrent nodes across all assets '
+             '(default: pipeline "workers", else calibrated video workers, else 4)'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        type=Path,
+        help='Node output cache (default: ~/.cache/media-pipeline)'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Disable node output caching'
+    )
+    parser.add_argument(
+        '--workdir',
+        type=Path,
+        help='Directory for intermediates (default: /dev/shm when available)'
+    )
+    parser.add_argument(
+        '-n', '--dry-run',
+        action='store_true',
+        help='Show which nodes would run or hit the cache'
+    )
+    parser.add_argument(
+        '-v', '--verbose',
+        action='store_true',
+        help='Verbose output'
+    )
+
+    args = parser.parse_args()
+
+    try:
+        definition = load_pipeline(args.pipeline)
+        nodes = parse_nodes(definition)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: Invalid pipeline {args.pipeline}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    assets = [p for p in args.inputs if p.is_file()]
+    for missing in set(args.inputs) - set(assets):
+        print(f"Error: {missing} not found", file=sys.stderr)
+    if not assets:
+        sys.exit(1)
+
+    cache_dir = None
+    if not args.no_cache:
+        cache_dir = args.cache_dir or Path(definition.get('cache_dir', default_cache_dir()))
+
+    runner = PipelineRunner(
+        nodes,
+        args.output,
+        cache_dir=cache_dir,
+        workdir=args.workdir,
+        workers=args.workers or definition.get('workers') or get_default_parallelism('video', 4),
+        verbose=args.verbose,
+        dry_run=args.dry_run
+    )
+
+    print(f"Running {len(nodes)} node(s) over {len(assets)} asset(s)")
+    success, fail = runner.run(assets)
+    fail += len(args.inputs) - len(assets)
+
+    print(f"\nResults: {success} succeeded, {fail} failed")
+    sys.exit(0 if fail == 0 else 1)
+
+
+if __name__ == '__main__':
+    main()
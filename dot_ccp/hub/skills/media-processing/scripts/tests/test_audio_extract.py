@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Tests for audio_extract.py"""
+
+import io
+import json
+import math
+import struct
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from audio_extract import AudioExtractor, SilenceChunker, frame_rms
+
+
+RATE = 16000
+
+
+def tone(seconds, amplitude=10000, freq=440):
+    """Generate a sine tone as s16le PCM."""
+    n = int(seconds * RATE)
+    return struct.pack(
+        f"<{n}h",
+        *(int(amplitude * math.sin(2 * math.pi * freq * i / RATE)) for i in range(n))
+    )
+
+
+def silence(seconds):
+    """Generate digital silence as s16le PCM."""
+    return b"\x00\x00" * int(seconds * RATE)
+
+
+def chunk_all(chunker, pcm, step=RATE * 2):
+    """Feed PCM in one-second pieces and flush."""
+    chunks = []
+    for i in range(0, len(pcm), step):
+        chunks.extend(chunker.feed(pcm[i:i + step]))
+    chunks.extend(chunker.flush())
+    return chunks
+
+
+class TestFrameRms:
+    """Test RMS computation."""
+
+    def test_silence(self):
+        """Test RMS of silence is zero."""
+        assert frame_rms(silence(0.03)) == 0
+
+    def test_tone(self):
+        """Test RMS of a sine is amplitude / sqrt(2)."""
+        assert frame_rms(tone(0.1)) == pytest.approx(10000 / math.sqrt(2), rel=0.02)
+
+
+class TestSilenceChunker:
+    """Test silence-aligned chunking."""
+
+    def test_cut_in_silence_after_target(self):
+        """Test cut lands in the middle of the first silence past target."""
+        chunker = SilenceChunker(RATE, target_seconds=5, max_seconds=15, min_seconds=1)
+        pcm = tone(6) + silence(1) + tone(6)
+
+        chunks = chunk_all(chunker, pcm)
+
+        assert len(chunks) == 2
+        first_duration = len(chunks[0].pcm) / 2 / RATE
+        assert 6.2 < first_duration < 6.8
+        assert chunks[1].start_sample == len(chunks[0].pcm) // 2
+
+    def test_hard_cut_without_silence(self):
+        """Test continuous audio is cut at max length."""
+        chunker = SilenceChunker(RATE, target_seconds=2, max_seconds=3, min_seconds=1)
+
+        chunks = chunk_all(chunker, tone(7))
+
+        assert [len(c.pcm) // 2 for c in chunks] == [3 * RATE, 3 * RATE, 1 * RATE]
+
+    def test_cut_at_latest_silence_before_max(self):
+        """Test short silences before target are used when max is reached."""
+        chunker = SilenceChunker(RATE, target_seconds=8, max_seconds=10, min_seconds=1)
+        pcm = tone(3) + silence(0.5) + tone(9)
+
+        chunks = chunk_all(chunker, pcm)
+
+        assert 3.1 < len(chunks[0].pcm) / 2 / RATE < 3.4
+
+    def test_chunks_cover_stream(self):
+        """Test chunks are contiguous and lossless."""
+        chunker = SilenceChunker(RATE, target_seconds=2, max_seconds=4, min_seconds=1)
+        pcm = tone(3) + silence(0.5) + tone(5) + silence(0.4) + tone(1)
+
+        chunks = chunk_all(chunker, pcm, step=1234)
+
+        assert b"".join(c.pcm for c in chunks) == pcm
+        for prev, cur in zip(chunks, chunks[1:]):
+            assert cur.start_sample == prev.start_sample + len(prev.pcm) // 2
+
+    def test_voiced_flag(self):
+        """Test silent-only chunks are flagged."""
+        chunker = SilenceChunker(RATE, target_seconds=2, max_seconds=3, min_seconds=1)
+
+        chunks = chunk_all(chunker, tone(2) + silence(5))
+
+        assert chunks[0].voiced
+        assert not chunks[-1].voiced
+
+    def test_invalid_lengths(self):
+        """Test inconsistent length limits are rejected."""
+        with pytest.raises(ValueError):
+            SilenceChunker(RATE, target_seconds=40, max_seconds=30)
+
+
+class TestAudioExtractor:
+    """Test AudioExtractor class."""
+
+    def test_decode_command(self):
+        """Test decode command streams mono PCM to stdout."""
+        cmd = AudioExtractor().build_decode_command(Path("in.mp4"), 16000)
+
+        assert cmd[-3:] == ["-f", "s16le", "-"]
+        assert "-ac" in cmd and "1" in cmd
+        assert "16000" in cmd
+
+    def test_encode_command_opus(self):
+        """Test Opus encoding options."""
+        cmd = AudioExtractor().build_encode_command(Path("o.opus"), "opus", 16000, "24k")
+
+        assert "libopus" in cmd
+        assert "24k" in cmd
+        assert cmd[cmd.index("-i") + 1] == "-"
+
+    @patch("subprocess.run")
+    @patch("subprocess.Popen")
+    def test_extract_writes_index(self, mock_popen, mock_run, tmp_path):
+        """Test a single decode feeds concurrent encoders and the index."""
+        pcm = tone(3) + silence(0.5) + tone(3)
+        proc = MagicMock()
+        proc.stdout = io.BytesIO(pcm)
+        proc.wait.return_value = 0
+        mock_popen.return_value = proc
+        mock_run.return_value = MagicMock(returncode=0)
+
+        extractor = AudioExtractor()
+        chunker = SilenceChunker(RATE, target_seconds=2, max_seconds=5, min_seconds=1)
+        entries = extractor.extract(Path("talk.mp4"), tmp_path, chunker=chunker)
+
+        assert len(entries) == 2
+        assert mock_popen.call_count == 1
+        assert mock_run.call_count == 2
+        fed = b"".join(c.kwargs["input"] for c in mock_run.call_args_list)
+        assert sorted(fed) == sorted(pcm)
+
+        index = json.loads((tmp_path / "talk_chunks.json").read_text())
+        assert index["sample_rate"] == 16000
+        assert index["chunks"][1]["start"] == entries[0].end
+        assert index["chunks"][0]["file"] == "talk_0000.flac"
+
+    @patch("subprocess.run")
+    @patch("subprocess.Popen")
+    def test_extract_decode_failure(self, mock_popen, mock_run, tmp_path):
+        """Test decoder errors are reported."""
+        proc = MagicMock()
+        proc.stdout = io.BytesIO(b"")
+        proc.wait.return_value = 1
+        mock_popen.return_value = proc
+
+        assert AudioExtractor().extract(Path("bad.mp4"), tmp_path) is None
+
+    @patch("subprocess.Popen")
+    def test_dry_run(self, mock_popen, tmp_path):
+        """Test dry-run does not decode."""
+        assert AudioExtractor(dry_run=True).extract(Path("a.mp4"), tmp_path) == []
+        mock_popen.assert_not_called()
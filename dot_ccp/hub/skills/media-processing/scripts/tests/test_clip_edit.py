@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""Tests for clip_edit.py"""
+
+import json
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from clip_edit import ClipEditor, Segment, parse_time, plan_trim
+
+
+KEYFRAMES = [0.0, 2.0, 4.0, 6.0, 8.0, 10.0]
+
+STREAM_INFO = {
+    "streams": [
+        {"codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080,
+         "pix_fmt": "yuv420p", "r_frame_rate": "30/1", "profile": "High", "level": 41},
+        {"codec_type": "audio", "codec_name": "aac", "sample_rate": "48000", "channels": 2}
+    ],
+    "format": {"duration": "12.0"}
+}
+
+
+def ffprobe_side_effect(stream_info=STREAM_INFO, keyframes=KEYFRAMES, offset=0.0):
+    """Return ffprobe output depending on the query."""
+    def run(cmd, **kwargs):
+        if cmd[0] == "ffprobe" and "packet=pts_time,flags" in cmd:
+            lines = []
+            for ts in keyframes:
+                lines.append(f"{ts + offset:.6f},K__")
+                lines.append(f"{ts + offset + 1:.6f},___")
+            return MagicMock(stdout="\n".join(lines))
+        if cmd[0] == "ffprobe":
+            return MagicMock(stdout=json.dumps(stream_info).encode())
+        return MagicMock(returncode=0)
+    return run
+
+
+class TestParseTime:
+    """Test time parsing."""
+
+    def test_seconds(self):
+        """Test plain seconds."""
+        assert parse_time("90.5") == 90.5
+
+    def test_clock(self):
+        """Test clock formats."""
+        assert parse_time("01:30") == 90
+        assert parse_time("01:00:01.5") == 3601.5
+
+    def test_invalid(self):
+        """Test malformed values."""
+        with pytest.raises(ValueError):
+            parse_time("1:2:3:4")
+
+
+class TestPlanTrim:
+    """Test smart-render planning."""
+
+    def test_unaligned_cut(self):
+        """Test boundary GOPs are re-encoded and the middle copied."""
+        segments = plan_trim(KEYFRAMES, 1.5, 7.0)
+
+        assert segments == [
+            Segment(1.5, 2.0, copy=False),
+            Segment(2.0, 6.0, copy=True),
+            Segment(6.0, 7.0, copy=False),
+        ]
+
+    def test_aligned_cut(self):
+        """Test keyframe-aligned cuts need no re-encoding."""
+        assert plan_trim(KEYFRAMES, 2.0, 8.0) == [Segment(2.0, 8.0, copy=True)]
+
+    def test_within_single_gop(self):
+        """Test a cut inside one GOP is fully re-encoded."""
+        assert plan_trim(KEYFRAMES, 2.5, 3.5) == [Segment(2.5, 3.5, copy=False)]
+
+    def test_start_on_keyframe(self):
+        """Test no head segment when starting on a keyframe."""
+        segments = plan_trim(KEYFRAMES, 4.0, 9.0)
+        assert segments[0] == Segment(4.0, 8.0, copy=True)
+        assert segments[-1] == Segment(8.0, 9.0, copy=False)
+
+    def test_single_keyframe_inside(self):
+        """Test a range containing exactly one keyframe."""
+        assert plan_trim(KEYFRAMES, 3.0, 5.0) == [
+            Segment(3.0, 4.0, copy=False),
+            Segment(4.0, 5.0, copy=False),
+        ]
+
+    def test_invalid_range(self):
+        """Test end before start."""
+        with pytest.raises(ValueError):
+            plan_trim(KEYFRAMES, 5.0, 4.0)
+
+
+class TestClipEditor:
+    """Test ClipEditor class."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.editor = ClipEditor(verbose=False, dry_run=False)
+
+    @patch("subprocess.run")
+    def test_get_keyframes(self, mock_run):
+        """Test keyframe parsing from packet flags."""
+        mock_run.side_effect = ffprobe_side_effect()
+        assert self.editor.get_keyframes(Path("in.mp4")) == KEYFRAMES
+
+    @patch("subprocess.run")
+    def test_smart_trim_commands(self, mock_run, tmp_path):
+        """Test smart trim copies the middle and re-encodes boundaries."""
+        mock_run.side_effect = ffprobe_side_effect()
+
+        result = self.editor.trim(Path("in.mp4"), tmp_path / "out.mp4", 1.5, 7.0)
+
+        assert result is True
+        ffmpeg_cmds = [c[0][0] for c in mock_run.call_args_list if c[0][0][0] == "ffmpeg"]
+        assert len(ffmpeg_cmds) == 4
+        assert "libx264" in ffmpeg_cmds[0]
+        assert ffmpeg_cmds[1][ffmpeg_cmds[1].index("-c:v") + 1] == "copy"
+        assert "libx264" in ffmpeg_cmds[2]
+        final = ffmpeg_cmds[3]
+        assert "concat" in final
+        assert final[final.index("-c") + 1] == "copy"
+
+    @patch("subprocess.run")
+    def test_smart_trim_matches_profile_level(self, mock_run, tmp_path):
+        """Test boundary re-encodes use the source profile and level."""
+        mock_run.side_effect = ffprobe_side_effect()
+
+        self.editor.trim(Path("in.mp4"), tmp_path / "out.mp4", 1.5, 7.0)
+
+        encode = [c[0][0] for c in mock_run.call_args_list if c[0][0][0] == "ffmpeg"][0]
+        assert encode[encode.index("-profile:v") + 1] == "high"
+        assert encode[encode.index("-level:v") + 1] == "4.1"
+
+    @patch("subprocess.run")
+    def test_smart_trim_nonzero_start_time(self, mock_run, tmp_path):
+        """Test MPEG-TS style start offsets are removed from keyframe times."""
+        info = json.loads(json.dumps(STREAM_INFO))
+        info["streams"][0]["start_time"] = "1.400000"
+        mock_run.side_effect = ffprobe_side_effect(stream_info=info, offset=1.4)
+
+        self.editor.trim(Path("in.ts"), tmp_path / "out.mp4", 1.5, 7.0)
+
+        probe = next(c[0][0] for c in mock_run.call_args_list if "packet=pts_time,flags" in c[0][0])
+        assert probe[probe.index("-read_intervals") + 1] == "2.900000%9.400000"
+        copy = [c[0][0] for c in mock_run.call_args_list if c[0][0][0] == "ffmpeg"][1]
+        assert copy[copy.index("-ss") + 1] == "2.000000"
+        assert copy[copy.index("-c:v") + 1] == "copy"
+
+    @patch("subprocess.run")
+    def test_smart_trim_unsupported_codec(self, mock_run, tmp_path):
+        """Test fallback to full re-encode for codecs without smart render."""
+        info = json.loads(json.dumps(STREAM_INFO))
+        info["streams"][0]["codec_name"] = "vp9"
+        mock_run.side_effect = ffprobe_side_effect(stream_info=info)
+
+        result = self.editor.trim(Path("in.webm"), tmp_path / "out.mp4", 1.5, 7.0)
+
+        assert result is True
+        ffmpeg_cmds = [c[0][0] for c in mock_run.call_args_list if c[0][0][0] == "ffmpeg"]
+        assert len(ffmpeg_cmds) == 1
+        assert "libx264" in ffmpeg_cmds[0]
+
+    @patch("subprocess.run")
+    def test_keyframe_trim(self, mock_run, tmp_path):
+        """Test copy-only trim."""
+        mock_run.side_effect = ffprobe_side_effect()
+
+        assert self.editor.trim(Path("in.mp4"), tmp_path / "out.mp4", 2.0, mode="keyframe")
+
+        cmd = mock_run.call_args[0][0]
+        assert cmd[cmd.index("-c") + 1] == "copy"
+        assert cmd[cmd.index("-t") + 1] == "10.000000"
+
+    @patch("subprocess.run")
+    def test_concat(self, mock_run, tmp_path):
+        """Test concat uses the demuxer with stream copy."""
+        mock_run.side_effect = ffprobe_side_effect()
+
+        result = self.editor.concat([Path("a.mp4"), Path("b.mp4")], tmp_path / "out.mp4")
+
+        assert result is True
+        cmd = mock_run.call_args[0][0]
+        assert cmd[:3] == ["ffmpeg", "-f", "concat"]
+
+    @patch("subprocess.run")
+    def test_concat_mismatch(self, mock_run, tmp_path):
+        """Test concat refuses clips with different parameters."""
+        other = json.loads(json.dumps(STREAM_INFO))
+        other["streams"][0]["width"] = 1280
+        infos = iter([STREAM_INFO, other])
+        mock_run.side_effect = lambda cmd, **kw: MagicMock(stdout=json.dumps(next(infos)).encode())
+
+        result = self.editor.concat([Path("a.mp4"), Path("b.mp4")], tmp_path / "out.mp4")
+
+        assert result is False
+
+    @patch("subprocess.run")
+    def test_dry_run(self, mock_run, tmp_path, capsys):
+        """Test dry-run only probes."""
+        mock_run.side_effect = ffprobe_side_effect()
+        editor = ClipEditor(dry_run=True)
+
+        assert editor.trim(Path("in.mp4"), tmp_path / "out.mp4", 1.5, 7.0)
+
+        assert all(c[0][0][0] == "ffprobe" for c in mock_run.call_args_list)
+        assert "re-encode" in capsys.readouterr().out
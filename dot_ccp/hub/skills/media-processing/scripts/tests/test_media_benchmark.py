@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Tests for media_benchmark.py"""
+
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from media_benchmark import (
+    BenchmarkCase,
+    BenchmarkResult,
+    build_cases,
+    compare_to_baseline,
+    measure_command,
+    measure_quality,
+    parse_ffmpeg_psnr,
+    parse_ffmpeg_ssim,
+    parse_magick_metric,
+)
+from media_convert import QUALITY_PRESETS
+
+
+def make_result(**overrides):
+    """Create a benchmark result with sensible defaults."""
+    values = dict(
+        case="web/video",
+        wall_time_s=1.0,
+        peak_rss_kb=100000,
+        output_bytes=1000000,
+        ssim=0.98,
+        psnr=42.0
+    )
+    values.update(overrides)
+    return BenchmarkResult(**values)
+
+
+class TestParsing:
+    """Test metric parsing."""
+
+    def test_parse_ffmpeg_ssim(self):
+        """Test SSIM summary parsing."""
+        stderr = "[Parsed_ssim_4 @ 0x1] SSIM Y:0.991 (20.4) U:0.99 V:0.99 All:0.987654 (19.1)"
+        assert parse_ffmpeg_ssim(stderr) == pytest.approx(0.987654)
+
+    def test_parse_ffmpeg_psnr(self):
+        """Test PSNR summary parsing."""
+        stderr = "[Parsed_psnr_5 @ 0x1] PSNR y:45.1 u:47.0 v:47.2 average:45.67 min:40.1 max:50.2"
+        assert parse_ffmpeg_psnr(stderr) == pytest.approx(45.67)
+
+    def test_parse_missing_metric(self):
+        """Test parsing when the filter printed nothing."""
+        assert parse_ffmpeg_ssim("") is None
+        assert parse_ffmpeg_psnr("") is None
+
+    def test_parse_magick_metric(self):
+        """Test ImageMagick compare output parsing."""
+        assert parse_magick_metric("0.9731") == pytest.approx(0.9731)
+        assert parse_magick_metric("38.12 (0.3812)") == pytest.approx(38.12)
+        assert parse_magick_metric("") is None
+
+
+class TestBuildCases:
+    """Test case generation."""
+
+    def test_every_preset_covered(self, tmp_path):
+        """Test one case per preset and media type plus optimizer defaults."""
+        fixtures = {
+            "video": tmp_path / "v.mkv",
+            "audio": tmp_path / "a.wav",
+            "image": tmp_path / "i.png"
+        }
+        cases = build_cases(fixtures, tmp_path)
+        names = {c.name for c in cases}
+
+        for preset in QUALITY_PRESETS:
+            assert f"{preset}/video" in names
+            assert f"{preset}/audio" in names
+            assert f"{preset}/image" in names
+        assert "video_optimize/default" in names
+        assert len(cases) == len(QUALITY_PRESETS) * 3 + 1
+
+
+class TestMeasurement:
+    """Test command measurement."""
+
+    def test_measure_command(self):
+        """Test timing and RSS capture of a real process."""
+        wall, rss, code = measure_command([sys.executable, "-c", "x = bytearray(10_000_000)"])
+
+        assert code == 0
+        assert wall > 0
+        if rss is not None:
+            assert rss > 10000
+
+    def test_measure_command_failure(self):
+        """Test non-zero exit codes are reported."""
+        _, _, code = measure_command([sys.executable, "-c", "raise SystemExit(3)"])
+        assert code == 3
+
+    @patch("subprocess.run")
+    def test_measure_quality_audio(self, mock_run):
+        """Test audio cases have no perceptual metrics."""
+        case = BenchmarkCase("web/audio", "audio", [], Path("o.m4a"), Path("r.wav"))
+        assert measure_quality(case) == (None, None)
+        mock_run.assert_not_called()
+
+    @patch("subprocess.run")
+    def test_measure_quality_video(self, mock_run):
+        """Test video quality uses ffmpeg ssim and psnr filters."""
+        mock_run.return_value = MagicMock(
+            stderr="SSIM Y:0.99 All:0.98 (17.0)\nPSNR y:44 average:43.5 min:40"
+        )
+        case = BenchmarkCase("web/video", "video", [], Path("o.mp4"), Path("r.mkv"))
+
+        ssim, psnr = measure_quality(case)
+
+        assert ssim == pytest.approx(0.98)
+        assert psnr == pytest.approx(43.5)
+        assert "ssim" in " ".join(mock_run.call_args[0][0])
+
+
+class TestCompareToBaseline:
+    """Test regression detection."""
+
+    def test_no_regression(self):
+        """Test identical results pass."""
+        baseline = {"web/video": make_result().__dict__}
+        assert compare_to_baseline([make_result()], baseline) == []
+
+    def test_size_regression(self):
+        """Test output growth beyond threshold is flagged."""
+        baseline = {"web/video": make_result().__dict__}
+        regressions = compare_to_baseline([make_result(output_bytes=1100000)], baseline)
+
+        assert len(regressions) == 1
+        assert "output_bytes" in regressions[0]
+
+    def test_quality_regression(self):
+        """Test SSIM/PSNR drops are flagged."""
+        baseline = {"web/video": make_result().__dict__}
+        regressions = compare_to_baseline([make_result(ssim=0.95, psnr=40.0)], baseline)
+
+        assert len(regressions) == 2
+
+    def test_within_threshold(self):
+        """Test small changes are tolerated."""
+        baseline = {"web/video": make_result().__dict__}
+        result = make_result(output_bytes=1020000, wall_time_s=1.1, ssim=0.978)
+        assert compare_to_baseline([result], baseline) == []
+
+    def test_custom_threshold(self):
+        """Test thresholds can be overridden."""
+        baseline = {"web/video": make_result().__dict__}
+        result = make_result(output_bytes=1020000)
+        assert compare_to_baseline([result], baseline, {"output_bytes": 0.01})
+
+    def test_new_case_ignored(self):
+        """Test cases missing from the baseline are not regressions."""
+        assert compare_to_baseline([make_result(case="new/case")], {}) == []
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Tests for media_calibrate.py"""
+
+import json
+import socket
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from media_calibrate import (
+    Calibrator,
+    concurrency_levels,
+    config_path,
+    find_knee,
+    get_default_parallelism,
+    save_calibration,
+)
+from media_convert import batch_convert, default_parallelism
+
+
+class TestKnee:
+    """Test throughput knee detection."""
+
+    def test_concurrency_levels(self):
+        """Test doubling levels include the maximum."""
+        assert concurrency_levels(1) == [1]
+        assert concurrency_levels(8) == [1, 2, 4, 8]
+        assert concurrency_levels(12) == [1, 2, 4, 8, 12]
+
+    def test_knee_at_plateau(self):
+        """Test the smallest level near peak throughput wins."""
+        assert find_knee({1: 1.0, 2: 1.9, 4: 3.5, 8: 3.6, 16: 3.4}) == 4
+
+    def test_knee_linear_scaling(self):
+        """Test linear scaling picks the highest level."""
+        assert find_knee({1: 1.0, 2: 2.0, 4: 4.0}) == 4
+
+    def test_knee_tolerance(self):
+        """Test a looser tolerance accepts fewer workers."""
+        assert find_knee({1: 1.0, 2: 1.8, 4: 2.0}, tolerance=0.25) == 2
+
+
+class TestConfig:
+    """Test calibration persistence."""
+
+    def test_config_path_override(self, tmp_path, monkeypatch):
+        """Test environment override of the config location."""
+        monkeypatch.setenv("MEDIA_PARALLELISM_CONFIG", str(tmp_path / "p.json"))
+        assert config_path() == tmp_path / "p.json"
+
+    def test_save_and_read(self, tmp_path):
+        """Test saved worker counts are read back for this host."""
+        path = tmp_path / "parallelism.json"
+        save_calibration({"image": 6, "video": 2}, {"image": {1: 2.0, 8: 9.5}}, path)
+
+        assert get_default_parallelism("image", 1, path) == 6
+        assert get_default_parallelism("video", 1, path) == 2
+        data = json.loads(path.read_text())
+        assert data["hosts"][socket.gethostname()]["throughput"]["image"]["8"] == 9.5
+
+    def test_merge_keeps_other_jobs(self, tmp_path):
+        """Test recalibrating one job type keeps the others."""
+        path = tmp_path / "parallelism.json"
+        save_calibration({"image": 6, "video": 2}, {}, path)
+        save_calibration({"video": 3}, {}, path)
+
+        assert get_default_parallelism("image", 1, path) == 6
+        assert get_default_parallelism("video", 1, path) == 3
+
+    def test_fallback(self, tmp_path):
+        """Test missing files, hosts and jobs fall back."""
+        path = tmp_path / "missing.json"
+        assert get_default_parallelism("video", 4, path) == 4
+
+        path.write_text(json.dumps({"hosts": {"other-host": {"workers": {"video": 9}}}}))
+        assert get_default_parallelism("video", 4, path) == 4
+
+    def test_corrupt_file(self, tmp_path):
+        """Test unreadable files fall back."""
+        path = tmp_path / "bad.json"
+        path.write_text("{not json")
+        assert get_default_parallelism("image", 2, path) == 2
+
+
+class TestCalibrator:
+    """Test probe measurements."""
+
+    def test_probe_commands(self, tmp_path):
+        """Test probes use the scripts' own command builders."""
+        calibrator = Calibrator(tmp_path)
+
+        assert calibrator.probe_command("image", Path("p.png"), 0)[0] == "magick"
+        assert "libx264" in calibrator.probe_command("video", Path("p.mkv"), 0)
+        assert "flac" in calibrator.probe_command("audio", Path("p.wav"), 0)
+
+    @patch("subprocess.run")
+    def test_calibrate_stops_past_knee(self, mock_run, tmp_path):
+        """Test calibration stops once throughput falls off."""
+        calibrator = Calibrator(tmp_path, rounds=1)
+        rates = iter([1.0, 2.0, 1.0, 5.0])
+
+        with patch.object(Calibrator, "measure", side_effect=lambda fn, level: next(rates)):
+            result = calibrator.calibrate("image", Path("p.png"), max_workers=8)
+
+        assert result == {1: 1.0, 2: 2.0, 4: 1.0}
+
+
+class TestScriptDefaults:
+    """Test scripts consume calibrated defaults."""
+
+    def test_media_convert_default(self, tmp_path, monkeypatch):
+        """Test media_convert picks the most expensive media type."""
+        path = tmp_path / "parallelism.json"
+        save_calibration({"image": 8, "video": 2}, {}, path)
+        monkeypatch.setenv("MEDIA_PARALLELISM_CONFIG", str(path))
+
+        assert default_parallelism([Path("a.jpg"), Path("b.mp4")]) == 2
+        assert default_parallelism([Path("a.jpg")]) == 8
+        assert default_parallelism([Path("a.txt")]) == 1
+
+    @patch("media_convert.convert_file")
+    def test_batch_convert_parallel(self, mock_convert, tmp_path):
+        """Test parallel batch conversion counts results."""
+        inputs = []
+        for i in range(4):
+            path = tmp_path / f"in{i}.png"
+            path.touch()
+            inputs.append(path)
+        mock_convert.side_effect = [True, True, False, True]
+
+        success, fail = batch_convert(inputs, tmp_path / "out", "jpg", parallel=3)
+
+        assert (success, fail) == (3, 1)
+        assert mock_convert.call_count == 4
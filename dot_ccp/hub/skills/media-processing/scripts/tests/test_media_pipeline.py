@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""Tests for media_pipeline.py"""
+
+import json
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import media_pipeline
+from media_pipeline import (
+    PipelineRunner,
+    hash_file,
+    load_pipeline,
+    parse_nodes,
+)
+
+
+DEFINITION = {
+    "nodes": [
+        {"id": "probe", "op": "probe"},
+        {"id": "transcode", "op": "transcode", "params": {"preset": "web"}},
+        {"id": "thumbnail", "op": "thumbnail", "needs": ["transcode"]},
+        {"id": "manifest", "op": "manifest", "needs": ["probe", "transcode", "thumbnail"]}
+    ]
+}
+
+
+def fake_operations(calls):
+    """Replace ops with fast fakes that record calls and write their outputs."""
+    def make(name):
+        def op(ctx):
+            calls.append((ctx.asset.name, name))
+            assert ctx.input_path.exists()
+            if ctx.output_path:
+                ctx.output_path.write_text(f"{name}:{ctx.input_path.name}")
+            return {"op": name}
+        return op
+
+    ops = dict(media_pipeline.OPERATIONS)
+    for name, (suffix, _) in media_pipeline.OPERATIONS.items():
+        ops[name] = (suffix, make(name))
+    return ops
+
+
+@pytest.fixture
+def assets(tmp_path):
+    """Create two small source assets."""
+    paths = []
+    for name in ("a.mp4", "b.mp4"):
+        path = tmp_path / "src" / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(name.encode() * 100)
+        paths.append(path)
+    return paths
+
+
+class TestParseNodes:
+    """Test pipeline validation."""
+
+    def test_topological_order_and_defaults(self):
+        """Test node ordering, default inputs and kept outputs."""
+        nodes = parse_nodes(DEFINITION)
+        ids = [n.id for n in nodes]
+
+        assert ids.index("transcode") < ids.index("thumbnail") < ids.index("manifest")
+        by_id = {n.id: n for n in nodes}
+        assert by_id["transcode"].input == "source"
+        assert by_id["thumbnail"].input == "transcode"
+        assert by_id["manifest"].keep is True
+        # Outputs the manifest points at are kept with it
+        assert by_id["thumbnail"].keep is True
+        assert by_id["transcode"].keep is True
+
+    def test_consumed_intermediate_not_kept(self):
+        """Test an output only used as another node's input is not kept."""
+        nodes = parse_nodes({"nodes": [
+            {"id": "transcode", "op": "transcode"},
+            {"id": "thumbnail", "op": "thumbnail", "needs": ["transcode"]}
+        ]})
+
+        assert [n.keep for n in nodes] == [False, True]
+
+    def test_unknown_op(self):
+        """Test rejection of unknown operations."""
+        with pytest.raises(ValueError, match="Unknown op"):
+            parse_nodes({"nodes": [{"id": "x", "op": "explode"}]})
+
+    def test_unknown_dependency(self):
+        """Test rejection of missing dependencies."""
+        with pytest.raises(ValueError, match="unknown node"):
+            parse_nodes({"nodes": [{"id": "x", "op": "probe", "needs": ["y"]}]})
+
+    def test_cycle(self):
+        """Test cycle detection."""
+        with pytest.raises(ValueError, match="Cycle"):
+            parse_nodes({"nodes": [
+                {"id": "a", "op": "transcode", "needs": ["b"]},
+                {"id": "b", "op": "transcode", "needs": ["a"]}
+            ]})
+
+    def test_input_must_produce_file(self):
+        """Test that a data-only node cannot be used as file input."""
+        with pytest.raises(ValueError, match="produces no file"):
+            parse_nodes({"nodes": [
+                {"id": "probe", "op": "probe"},
+                {"id": "thumb", "op": "thumbnail", "needs": ["probe"], "input": "probe"}
+            ]})
+
+    def test_load_json(self, tmp_path):
+        """Test loading a JSON pipeline file."""
+        path = tmp_path / "pipeline.json"
+        path.write_text(json.dumps(DEFINITION))
+        assert load_pipeline(path) == DEFINITION
+
+
+class TestCacheKeys:
+    """Test input-hash cache keys."""
+
+    def test_keys_change_with_params(self, tmp_path):
+        """Test that parameter changes invalidate downstream keys only."""
+        nodes = parse_nodes(DEFINITION)
+        runner = PipelineRunner(nodes, tmp_path)
+        keys = runner.compute_keys("abc", Path("a.mp4"))
+
+        changed = json.loads(json.dumps(DEFINITION))
+        changed["nodes"][2]["params"] = {"at": 5}
+        runner2 = PipelineRunner(parse_nodes(changed), tmp_path)
+        keys2 = runner2.compute_keys("abc", Path("a.mp4"))
+
+        assert keys["transcode"] == keys2["transcode"]
+        assert keys["thumbnail"] != keys2["thumbnail"]
+        assert keys["manifest"] != keys2["manifest"]
+
+    def test_keys_change_with_source(self, tmp_path):
+        """Test that different sources get different keys."""
+        runner = PipelineRunner(parse_nodes(DEFINITION), tmp_path)
+        assert runner.compute_keys("abc", Path("a.mp4")) != runner.compute_keys("def", Path("a.mp4"))
+
+    def test_hash_file(self, tmp_path):
+        """Test content hashing."""
+        path = tmp_path / "f.bin"
+        path.write_bytes(b"data")
+        assert hash_file(path) == hash_file(path)
+        assert len(hash_file(path)) == 64
+
+
+class TestPipelineRunner:
+    """Test scheduling and caching."""
+
+    def test_run_all_nodes(self, tmp_path, assets):
+        """Test every node runs once per asset and outputs land in output dir."""
+        calls = []
+        runner = PipelineRunner(
+            parse_nodes(DEFINITION), tmp_path / "out",
+            cache_dir=tmp_path / "cache", workdir=tmp_path, workers=4
+        )
+
+        ops = fake_operations(calls)
+        ops["manifest"] = media_pipeline.OPERATIONS["manifest"]
+
+        with patch.dict(media_pipeline.OPERATIONS, ops):
+            success, fail = runner.run(assets)
+
+        assert (success, fail) == (2, 0)
+        assert len(calls) == 6
+        manifest = tmp_path / "out" / "a" / "manifest.json"
+        assert manifest.exists()
+        # Files the manifest references are kept beside it
+        outputs = json.loads(manifest.read_text())["outputs"]
+        assert outputs["transcode"]["path"] == "transcode.mp4"
+        assert outputs["thumbnail"]["path"] == "thumbnail.jpg"
+        for entry in ("transcode", "thumbnail"):
+            assert (manifest.parent / outputs[entry]["path"]).exists()
+
+    def test_intermediates_cleaned_up(self, tmp_path, assets):
+        """Test scratch directories are removed after the run."""
+        calls = []
+        runner = PipelineRunner(
+            parse_nodes(DEFINITION), tmp_path / "out", workdir=tmp_path / "work"
+        )
+        (tmp_path / "work").mkdir()
+
+        with patch.dict(media_pipeline.OPERATIONS, fake_operations(calls)):
+            runner.run(assets)
+
+        assert list((tmp_path / "work").iterdir()) == []
+
+    def test_cache_hit_skips_work(self, tmp_path, assets):
+        """Test a second run is served entirely from cache."""
+        calls = []
+        kwargs = dict(cache_dir=tmp_path / "cache", workdir=tmp_path)
+
+        with patch.dict(media_pipeline.OPERATIONS, fake_operations(calls)):
+            PipelineRunner(parse_nodes(DEFINITION), tmp_path / "out1", **kwargs).run(assets)
+            calls.clear()
+            success, fail = PipelineRunner(
+                parse_nodes(DEFINITION), tmp_path / "out2", **kwargs
+            ).run(assets)
+
+        assert calls == []
+        assert (success, fail) == (2, 0)
+        assert (tmp_path / "out2" / "b" / "manifest.json").exists()
+
+    def test_rerun_with_new_params_keeps_old_cache_entry(self, tmp_path, assets):
+        """Test rewriting a kept output does not clobber the linked cache entry."""
+        calls = []
+        ops = fake_operations(calls)
+
+        def transcode(ctx):
+            with open(ctx.output_path, "w") as f:
+                f.write(ctx.params["preset"])
+            return {}
+
+        ops["transcode"] = (".mp4", transcode)
+        kwargs = dict(cache_dir=tmp_path / "cache", workdir=tmp_path)
+
+        def run(preset):
+            definition = json.loads(json.dumps(DEFINITION))
+            definition["nodes"][1]["params"]["preset"] = preset
+            runner = PipelineRunner(parse_nodes(definition), tmp_path / "out", **kwargs)
+            runner.run(assets[:1])
+            return (tmp_path / "out" / "a" / "transcode.mp4").read_text()
+
+        with patch.dict(media_pipeline.OPERATIONS, ops):
+            assert run("web") == "web"
+            assert run("mobile") == "mobile"
+            assert run("web") == "web"
+
+        cached = {p.read_text() for p in (tmp_path / "cache").rglob("output.mp4")}
+        assert cached == {"web", "mobile"}
+
+    def test_failure_skips_downstream(self, tmp_path, assets):
+        """Test a failed node stops its asset but not others."""
+        calls = []
+        ops = fake_operations(calls)
+
+        def failing(ctx):
+            if ctx.asset.name == "a.mp4":
+                raise RuntimeError("boom")
+            ctx.output_path.write_text("ok")
+            return {}
+
+        ops["thumbnail"] = (".jpg", failing)
+        runner = PipelineRunner(parse_nodes(DEFINITION), tmp_path / "out", workdir=tmp_path)
+
+        with patch.dict(media_pipeline.OPERATIONS, ops):
+            success, fail = runner.run(assets)
+
+        assert (success, fail) == (1, 1)
+        assert ("a.mp4", "manifest") not in calls
+        assert ("b.mp4", "manifest") in calls
+
+    def test_dry_run(self, tmp_path, assets):
+        """Test dry-run plans without executing."""
+        calls = []
+        runner = PipelineRunner(
+            parse_nodes(DEFINITION), tmp_path / "out", workdir=tmp_path, dry_run=True
+        )
+
+        with patch.dict(media_pipeline.OPERATIONS, fake_operations(calls)):
+            runner.run(assets)
+
+        assert calls == []
+
+
+class TestOperations:
+    """Test individual operations."""
+
+    @patch("subprocess.run")
+    def test_thumbnail_command(self, mock_run, tmp_path):
+        """Test thumbnail ffmpeg command."""
+        runner = PipelineRunner(parse_nodes(DEFINITION), tmp_path)
+        ctx = media_pipeline.NodeContext(
+            asset=Path("a.mp4"),
+            input_path=Path("in.mp4"),
+            output_path=Path("thumb.jpg"),
+            params={"at": 3, "width": 200},
+            deps={},
+            run=runner._run_command
+        )
+
+        media_pipeline.op_thumbnail(ctx)
+
+        cmd = mock_run.call_args[0][0]
+        assert cmd[:3] == ["ffmpeg", "-ss", "3"]
+        assert "scale=200:-2" in cmd
+
+    @patch("subprocess.run")
+    def test_probe(self, mock_run):
+        """Test probe summarises ffprobe output."""
+        mock_run.return_value = MagicMock(stdout=json.dumps({
+            "format": {"duration": "10.0", "size": "1000", "bit_rate": "800"},
+            "streams": [{"codec_type": "video", "codec_name": "h264", "width": 640, "height": 360}]
+        }).encode())
+        ctx = media_pipeline.NodeContext(
+            asset=Path("a.mp4"), input_path=Path("a.mp4"), output_path=None,
+            params={}, deps={}, run=lambda cmd: None
+        )
+
+        data = media_pipeline.op_probe(ctx)
+
+        assert data["duration"] == 10.0
+        assert data["streams"][0]["width"] == 640